@@ -0,0 +1,122 @@
+"""
+Configuración del backend (variables de entorno)
+"""
+
+import os
+import tempfile
+
+
+def _env_int(name: str, default: int) -> int:
+    """Lee un entero de una variable de entorno"""
+    value = os.getenv(name)
+    if not value:
+        return default
+    try:
+        return int(value)
+    except ValueError:
+        return default
+
+
+def _env_float(name: str, default: float) -> float:
+    """Lee un número decimal de una variable de entorno"""
+    value = os.getenv(name)
+    if not value:
+        return default
+    try:
+        return float(value)
+    except ValueError:
+        return default
+
+
+# === POOL DE WORKERS ===
+# Modo de ejecución: "process" (usa todos los núcleos) o "thread"
+POOL_MODE = os.getenv("FACTURAVIEW_POOL_MODE", "process").lower()
+# Número de workers (0 = uno por núcleo)
+POOL_SIZE = _env_int("FACTURAVIEW_POOL_SIZE", 0) or os.cpu_count() or 1
+# Método de arranque de procesos ("forkserver", "spawn", "fork")
+POOL_START_METHOD = os.getenv("FACTURAVIEW_POOL_START_METHOD", "forkserver")
+# Tiempo máximo por trabajo en segundos
+JOB_TIMEOUT = _env_float("FACTURAVIEW_JOB_TIMEOUT", 30.0)
+
+# === VALIDACIÓN DE FIRMA ===
+# Tamaño máximo por archivo subido
+MAX_UPLOAD_SIZE = _env_int("FACTURAVIEW_MAX_UPLOAD_SIZE", 10 * 1024 * 1024)
+# Tamaño a partir del cual una subida se vuelca a un archivo temporal
+UPLOAD_SPOOL_THRESHOLD = _env_int("FACTURAVIEW_UPLOAD_SPOOL_THRESHOLD", 1024 * 1024)
+# Directorio de los temporales de subida (vacío = el del sistema)
+UPLOAD_SPOOL_DIR = os.getenv("FACTURAVIEW_UPLOAD_SPOOL_DIR", "")
+# Número máximo de archivos por lote
+BATCH_MAX_FILES = _env_int("FACTURAVIEW_BATCH_MAX_FILES", 1000)
+# Entradas máximas en la caché de resultados de validación
+RESULT_CACHE_SIZE = _env_int("FACTURAVIEW_RESULT_CACHE_SIZE", 256)
+# Segundos que se reutiliza un estado de revocación cacheado
+REVOCATION_CACHE_TTL = _env_float("FACTURAVIEW_REVOCATION_CACHE_TTL", 3600.0)
+# Segundos que se reutiliza un resultado cuya revocación no se pudo comprobar
+# (p.ej. el servidor OCSP/CRL no respondió): pasado ese plazo se vuelve a consultar
+REVOCATION_RETRY_TTL = _env_float("FACTURAVIEW_REVOCATION_RETRY_TTL", 60.0)
+# Certificados parseados que se mantienen en memoria (por worker)
+CERT_CACHE_SIZE = _env_int("FACTURAVIEW_CERT_CACHE_SIZE", 128)
+# Parseo de documentos firmados: "tree", "stream" o "auto"
+PARSE_MODE = os.getenv("FACTURAVIEW_PARSE_MODE", "auto").lower()
+# En modo "auto", tamaño a partir del cual se parsea en streaming
+STREAM_THRESHOLD = _env_int("FACTURAVIEW_STREAM_THRESHOLD", 4 * 1024 * 1024)
+# En streaming, salida canonicalizada que se guarda en memoria (después en un
+# temporal en disco) hasta leer el DigestMethod de la firma
+STREAM_SPOOL_BYTES = _env_int("FACTURAVIEW_STREAM_SPOOL_BYTES", 2 * 1024 * 1024)
+# Quitar los límites de libxml2 (profundidad, nodos de texto > 10 MB)
+XML_HUGE_TREE = os.getenv("FACTURAVIEW_XML_HUGE_TREE", "").lower() in ("1", "true", "yes")
+
+# === EXPORTACIÓN A EXCEL ===
+# Motor por defecto: "openpyxl" (referencia) o "xlsxwriter" (requiere XlsxWriter)
+EXCEL_ENGINE = os.getenv("FACTURAVIEW_EXCEL_ENGINE", "openpyxl").lower()
+# Líneas a partir de las cuales la hoja se escribe en streaming (write-only)
+EXCEL_WRITE_ONLY_LINES = _env_int("FACTURAVIEW_EXCEL_WRITE_ONLY_LINES", 2000)
+# Tamaño a partir del cual un Excel generado se vuelca a un temporal en disco
+EXCEL_SPOOL_THRESHOLD = _env_int("FACTURAVIEW_EXCEL_SPOOL_THRESHOLD", 8 * 1024 * 1024)
+# Facturas máximas por libro en la exportación de lotes
+EXCEL_BATCH_MAX_INVOICES = _env_int("FACTURAVIEW_EXCEL_BATCH_MAX_INVOICES", 1000)
+# Caché de Excel generados: bytes máximos en memoria y en disco (0 desactiva
+# cada nivel), directorio y segundos que se reutiliza cada archivo
+EXPORT_CACHE_MEMORY_SIZE = _env_int("FACTURAVIEW_EXPORT_CACHE_MEMORY_SIZE", 64 * 1024 * 1024)
+EXPORT_CACHE_DISK_SIZE = _env_int("FACTURAVIEW_EXPORT_CACHE_DISK_SIZE", 512 * 1024 * 1024)
+EXPORT_CACHE_DIR = os.getenv(
+    "FACTURAVIEW_EXPORT_CACHE_DIR", os.path.join(tempfile.gettempdir(), "facturaview-export")
+)
+EXPORT_CACHE_TTL = _env_float("FACTURAVIEW_EXPORT_CACHE_TTL", 3600.0)
+
+# === CADENA DE CONFIANZA ===
+# Directorio de certificados de confianza (PEM/DER o TSL en XML); vacío = sin
+# validación de cadena (chain_valid queda a None)
+TRUST_STORE_DIR = os.getenv("FACTURAVIEW_TRUST_STORE_DIR", "")
+# Cadenas validadas que se memorizan (por worker)
+CHAIN_CACHE_SIZE = _env_int("FACTURAVIEW_CHAIN_CACHE_SIZE", 1024)
+
+# === REVOCACIÓN ===
+# Plazo máximo total de cada consulta OCSP/descarga (segundos)
+OCSP_TIMEOUT = _env_float("FACTURAVIEW_OCSP_TIMEOUT", 5.0)
+# Respuestas OCSP cacheadas (por worker, hasta su nextUpdate)
+OCSP_CACHE_SIZE = _env_int("FACTURAVIEW_OCSP_CACHE_SIZE", 1024)
+# Conexiones HTTP reutilizables por host
+HTTP_POOL_SIZE = _env_int("FACTURAVIEW_HTTP_POOL_SIZE", 10)
+# Directorio de los índices de CRL (compartido entre workers)
+CRL_CACHE_DIR = os.getenv(
+    "FACTURAVIEW_CRL_CACHE_DIR", os.path.join(tempfile.gettempdir(), "facturaview-crl")
+)
+# Plazo máximo de descarga de una CRL (segundos); muy por debajo de
+# JOB_TIMEOUT, para que una descarga lenta acabe en aviso y no en un 504
+CRL_TIMEOUT = _env_float("FACTURAVIEW_CRL_TIMEOUT", 8.0)
+# Tamaño máximo de una CRL descargada
+CRL_MAX_SIZE = _env_int("FACTURAVIEW_CRL_MAX_SIZE", 64 * 1024 * 1024)
+# Segundos antes de nextUpdate en que se renueva la CRL en segundo plano
+CRL_REFRESH_MARGIN = _env_float("FACTURAVIEW_CRL_REFRESH_MARGIN", 3600.0)
+
+# === PERFILADO ===
+# Token que debe llevar la cabecera X-Profile para perfilar la petición con
+# cProfile; vacío = desactivado
+PROFILE_TOKEN = os.getenv("FACTURAVIEW_PROFILE_TOKEN", "")
+# Directorio de los perfiles (.pstats y pilas colapsadas)
+PROFILE_DIR = os.getenv(
+    "FACTURAVIEW_PROFILE_DIR", os.path.join(tempfile.gettempdir(), "facturaview-profiles")
+)
+# Perfiles que se conservan (se borran los más antiguos)
+PROFILE_RETAIN = _env_int("FACTURAVIEW_PROFILE_RETAIN", 20)
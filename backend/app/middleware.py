@@ -0,0 +1,134 @@
+"""
+Middlewares ASGI de la aplicación
+"""
+
+import asyncio
+import cProfile
+import hmac
+import time
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from . import config
+from .services.metrics import format_server_timing, observe_request, request_timings
+from .services.profiling import profile_name, thread_profiles, write_profile
+
+
+class MetricsMiddleware:
+    """
+    Cuenta las peticiones y mide su latencia por ruta.
+
+    Se etiqueta con la plantilla de la ruta (p.ej. /api/export/excel) y no
+    con la URL, para no crear una serie por cada ruta desconocida; la
+    latencia incluye el envío del cuerpo completo (también en streaming).
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        status = 500
+
+        async def send_with_status(message: Message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            # El router deja en el scope la ruta que atendió la petición
+            route = getattr(scope.get("route"), "path", None) or "unmatched"
+            observe_request(scope["method"], route, status, time.perf_counter() - start)
+
+
+class ServerTimingMiddleware:
+    """
+    Añade a cada respuesta la cabecera Server-Timing con las etapas
+    registradas durante la petición (observe_stages) y el total hasta
+    empezar a responder.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        timings: dict[str, float] = {}
+        token = request_timings.set(timings)
+
+        async def send_with_timing(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                headers = MutableHeaders(scope=message)
+                elapsed = time.perf_counter() - start
+                headers.append("Server-Timing", format_server_timing(timings, elapsed))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            request_timings.reset(token)
+
+
+class ProfilerMiddleware:
+    """
+    Perfila con cProfile las peticiones que traen en X-Profile el token
+    configurado y guarda el resultado en PROFILE_DIR (la respuesta indica
+    el nombre en X-Profile-Id).
+
+    Sin token configurado no se mira ni la cabecera. Solo se perfila una
+    petición a la vez, y solo lo que corre en el proceso principal (en el
+    event loop o en hilos lanzados con profiling.to_thread): la validación
+    de firmas ocurre en el pool de workers y aparece como espera.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+        self._busy = asyncio.Lock()
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        token = config.PROFILE_TOKEN
+        if not token or scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        requested = Headers(scope=scope).get("x-profile")
+        if requested is None or not hmac.compare_digest(requested.encode(), token.encode()):
+            await self.app(scope, receive, send)
+            return
+        if self._busy.locked():
+            # cProfile no admite dos perfiles simultáneos en el mismo hilo
+            await self.app(scope, receive, send)
+            return
+
+        async with self._busy:
+            name = profile_name(scope["method"], scope["path"])
+
+            async def send_with_id(message: Message) -> None:
+                if message["type"] == "http.response.start":
+                    MutableHeaders(scope=message).append("X-Profile-Id", name)
+                await send(message)
+
+            threads: list[cProfile.Profile] = []
+            threads_token = thread_profiles.set(threads)
+            profiler = cProfile.Profile()
+            profiler.enable()
+            try:
+                await self.app(scope, receive, send_with_id)
+            finally:
+                profiler.disable()
+                thread_profiles.reset(threads_token)
+                await asyncio.to_thread(
+                    write_profile, profiler, config.PROFILE_DIR, name, config.PROFILE_RETAIN,
+                    tuple(threads),
+                )
@@ -1 +1,7 @@
-from .response import SignatureResponse, SignerInfo, CertificateInfo
\ No newline at end of file
+from .response import (
+    SignatureResponse,
+    SignerInfo,
+    CertificateInfo,
+    BatchSignatureItem,
+    BatchSummary,
+)
@@ -36,4 +36,18 @@ class SignatureResponse(BaseModel):
     timestamp: Optional[datetime] = None
     signature_type: Optional[str] = None  # XAdES-BES, XAdES-T, etc.
     errors: list[str] = []
-    warnings: list[str] = []
\ No newline at end of file
+    warnings: list[str] = []
+    level: str = "full"  # inspect, crypto o full
+    stages: list[str] = []  # etapas ejecutadas (parse, signature, chain...)
+
+class BatchSignatureItem(SignatureResponse):
+    """Resultado de validación de un archivo dentro de un lote"""
+    filename: str
+
+
+class BatchSummary(BaseModel):
+    """Resumen final de la validación por lotes"""
+    total: int = 0
+    valid: int = 0
+    invalid: int = 0
+    unsigned: int = 0
@@ -2,12 +2,38 @@
 Rutas de exportación de facturas
 """
 
-from fastapi import APIRouter, HTTPException, Query
-from fastapi.responses import Response
+import asyncio
+import os
+import time
+from collections import deque
+
+from fastapi import APIRouter, Header, HTTPException, Query
+from fastapi.responses import Response, StreamingResponse
 from pydantic import BaseModel
-from typing import Any
+from typing import Any, Awaitable, BinaryIO, Iterator, Optional
 
-from ..services.excel_generator import generate_excel
+from .. import config
+from ..services.excel_batch import (
+    RenderedSheet,
+    render_invoice_sheet,
+    unique_sheet_names,
+    write_batch_workbook,
+)
+from ..services.excel_generator import (
+    TRANSLATIONS,
+    ExcelEngineError,
+    ExcelLimitError,
+    check_sheet_rows,
+    generate_excel,
+    resolve_engine,
+    write_excel,
+)
+from ..services.export_cache import export_cache_key, export_etag, get_export_cache
+from ..services.metrics import observe_stages, record_stages
+from ..services.profiling import to_thread
+from ..services.result_cache import etag_matches
+from ..services.worker_pool import JobTimeoutError, WorkerPool, get_worker_pool
+from ..services.zip_stream import ZipStreamWriter
 
 
 router = APIRouter(tags=["export"])
@@ -20,19 +46,42 @@ class ExportExcelRequest(BaseModel):
     invoice_index: int = 0
     lang: str = "es"
     filename: str | None = None
+    engine: str | None = None
+
+
+class ExportBatchRequest(BaseModel):
+    """Request body para exportar un lote completo a un único Excel"""
+
+    data: dict[str, Any]
+    lang: str = "es"
+    filename: str | None = None
+
+
+class ExportZipRequest(ExportBatchRequest):
+    """Request body para exportar un lote como ZIP con un Excel por factura"""
+
+    engine: str | None = None
+
+
+XLSX_MEDIA_TYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+# Tamaño de los trozos al enviar un Excel generado
+STREAM_CHUNK_SIZE = 64 * 1024
 
 
 @router.post("/api/export/excel")
-async def export_to_excel(request: ExportExcelRequest):
+async def export_to_excel(request: ExportExcelRequest, if_none_match: Optional[str] = Header(None)):
     """
     Genera un archivo Excel con diseño profesional para una factura.
 
     Recibe los datos parseados de la factura y devuelve el archivo Excel.
+    Los archivos generados se cachean (memoria y disco) por el hash de la
+    petición, que es también su ETag: con If-None-Match se responde 304.
 
     - **data**: Datos de la factura (formato del parser frontend)
     - **invoice_index**: Índice de la factura en lotes (default: 0)
     - **lang**: Idioma ('es' o 'en', default: 'es')
     - **filename**: Nombre del archivo (opcional)
+    - **engine**: Motor de Excel ('openpyxl' o 'xlsxwriter', default: según configuración)
     """
     # Validar datos mínimos
     if not request.data:
@@ -48,36 +97,284 @@ async def export_to_excel(request: ExportExcelRequest):
             detail=f"Índice de factura inválido: {request.invoice_index}"
         )
 
-    # Validar idioma
+    # Validar idioma y motor
     lang = request.lang if request.lang in ("es", "en") else "es"
+    engine = _excel_engine(request.engine)
 
+    # Nombre del archivo
+    filename = request.filename or _invoice_filename(invoices[request.invoice_index])
+
+    cache = get_export_cache()
+    key = export_cache_key(request.data, request.invoice_index, lang, filename, engine)
+    etag = export_etag(key)
+    if etag_matches(if_none_match, etag):
+        cache.record_not_modified()
+        return Response(status_code=304, headers={"ETag": etag})
+
+    # La caché lee y escribe en disco: fuera del event loop
+    cached = await asyncio.to_thread(cache.get, key)
+    if cached is None:
+        try:
+            # Construir y guardar el libro lleva de milisegundos a segundos:
+            # en un hilo, para no bloquear el event loop
+            excel_file, timings = await to_thread(
+                record_stages, write_excel, request.data, request.invoice_index, lang, None, engine
+            )
+        except ExcelLimitError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        except Exception as e:
+            raise HTTPException(
+                status_code=500,
+                detail=f"Error generando Excel: {str(e)}"
+            )
+        observe_stages("excel", timings)
+        await asyncio.to_thread(cache.put, key, excel_file)
+        size = excel_file.seek(0, os.SEEK_END)
+        excel_file.seek(0)
+    else:
+        excel_file, size = cached
+
+    # Se envía por trozos desde el temporal (o el archivo de la caché), sin
+    # copiarlo a un bytes
+    return StreamingResponse(
+        _iter_file(excel_file),
+        media_type=XLSX_MEDIA_TYPE,
+        headers={
+            "Content-Disposition": f'attachment; filename="{_sanitize_filename(filename)}"',
+            "Content-Length": str(size),
+            "ETag": etag,
+        },
+    )
+
+
+@router.post("/api/export/excel/batch")
+async def export_batch_to_excel(request: ExportBatchRequest):
+    """
+    Genera un único Excel con todas las facturas del lote: una hoja de
+    resumen y una hoja de detalle por factura.
+
+    Las hojas de detalle se generan en paralelo en el pool de workers (a
+    cada uno solo se le envía su factura, y como mucho tantas a la vez como
+    workers) y se combinan en el libro final, que se envía por trozos.
+
+    - **data**: Datos del lote (formato del parser frontend)
+    - **lang**: Idioma ('es' o 'en', default: 'es')
+    - **filename**: Nombre del archivo (opcional)
+    """
+    invoices = _batch_invoices(request)
+    lang = request.lang if request.lang in ("es", "en") else "es"
+    sheet_names = unique_sheet_names(invoices, reserved=(TRANSLATIONS[lang]["summary_sheet"],))
+
+    pool = get_worker_pool()
     try:
-        excel_bytes = generate_excel(request.data, request.invoice_index, lang)
+        start = time.perf_counter()
+        sheets = await _render_sheets(pool, request.data, invoices, lang)
+        rendered = time.perf_counter()
+        path = await pool.run(write_batch_workbook, request.data, lang, sheet_names, sheets)
+    except JobTimeoutError:
+        raise HTTPException(status_code=504, detail="Tiempo de generación agotado")
     except Exception as e:
         raise HTTPException(
             status_code=500,
             detail=f"Error generando Excel: {str(e)}"
         )
+    assembled = time.perf_counter()
+    observe_stages("excel_batch", {"render": rendered - start, "assemble": assembled - rendered})
 
-    # Nombre del archivo
-    invoice = invoices[request.invoice_index]
-    if request.filename:
-        filename = request.filename
-    else:
-        series = invoice.get("series", "")
-        number = invoice.get("number", "")
-        invoice_num = f"{series}{series and '-' or ''}{number}" if (series or number) else "factura"
-        filename = f"factura-{invoice_num}.xlsx"
-
-    # Sanitizar nombre de archivo
-    filename = "".join(c for c in filename if c.isalnum() or c in ".-_").strip()
-    if not filename.endswith(".xlsx"):
-        filename += ".xlsx"
-
-    return Response(
-        content=excel_bytes,
-        media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    # El libro se envía por trozos desde el temporal que dejó el worker;
+    # abrirlo y borrarlo tocan el disco: fuera del event loop
+    excel_file, size = await asyncio.to_thread(_open_spooled, path)
+    filename = _sanitize_filename(request.filename or "facturas.xlsx")
+    return StreamingResponse(
+        _iter_file(excel_file),
+        media_type=XLSX_MEDIA_TYPE,
         headers={
-            "Content-Disposition": f'attachment; filename="{filename}"'
+            "Content-Disposition": f'attachment; filename="{filename}"',
+            "Content-Length": str(size),
         },
     )
+
+
+async def _render_sheets(
+    pool: WorkerPool, data: dict[str, Any], invoices: list[dict[str, Any]], lang: str
+) -> list[RenderedSheet]:
+    """
+    XML de la hoja de detalle de cada factura, en orden. Como en el ZIP, hay
+    como mucho tantos trabajos en el pool como workers: un lote grande no
+    llena la cola ni agota el tiempo de los trabajos de otros clientes.
+    """
+    sheets: list[RenderedSheet] = []
+    pending: deque = deque()
+    try:
+        for invoice in invoices:
+            pending.append(asyncio.ensure_future(
+                pool.run(render_invoice_sheet, {**data, "invoices": [invoice]}, 0, lang)
+            ))
+            if len(pending) >= pool.size:
+                sheets.append(await pending.popleft())
+        while pending:
+            sheets.append(await pending.popleft())
+    finally:
+        # Si falla una hoja, no dejar trabajos huérfanos
+        for task in pending:
+            task.cancel()
+    return sheets
+
+
+@router.post("/api/export/excel/zip")
+async def export_zip(request: ExportZipRequest):
+    """
+    Genera un ZIP con un Excel por factura del lote (como /api/export/excel).
+
+    El ZIP se envía por trozos según se genera cada Excel en el pool de
+    workers: como mucho hay tantos Excel en memoria como workers, nunca el
+    lote ni el archivo completos. Los nombres siguen el formato
+    factura-{serie}-{número}.xlsx y los repetidos se numeran. Si una
+    factura falla (p.ej. tiempo agotado) cuando la respuesta ya ha
+    empezado, en su lugar va factura-{serie}-{número}.error.txt con el motivo.
+
+    - **data**: Datos del lote (formato del parser frontend)
+    - **lang**: Idioma ('es' o 'en', default: 'es')
+    - **filename**: Nombre del ZIP (opcional)
+    - **engine**: Motor de Excel ('openpyxl' o 'xlsxwriter', default: según configuración)
+    """
+    invoices = _batch_invoices(request)
+    lang = request.lang if request.lang in ("es", "en") else "es"
+    engine = _excel_engine(request.engine)
+    names = unique_filenames([_invoice_filename(invoice) for invoice in invoices])
+    pool = get_worker_pool()
+
+    async def chunks():
+        writer = ZipStreamWriter()
+        pending: deque = deque()
+        try:
+            for name, invoice in zip(names, invoices):
+                single = {**request.data, "invoices": [invoice]}
+                pending.append((name, asyncio.ensure_future(
+                    pool.run(generate_excel, single, 0, lang, None, engine)
+                )))
+                # Ventana de tantos trabajos como workers; se escriben en orden
+                if len(pending) < pool.size:
+                    continue
+                for chunk in writer.add(*await _zip_entry(*pending.popleft())):
+                    yield chunk
+            while pending:
+                for chunk in writer.add(*await _zip_entry(*pending.popleft())):
+                    yield chunk
+            for chunk in writer.close():
+                yield chunk
+        finally:
+            # Cliente desconectado o error a mitad: no dejar trabajos huérfanos
+            for _, task in pending:
+                task.cancel()
+
+    filename = _sanitize_filename(request.filename or "facturas.zip", ".zip")
+    return StreamingResponse(
+        chunks(),
+        media_type="application/zip",
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+
+async def _zip_entry(name: str, task: Awaitable[bytes]) -> tuple[str, bytes]:
+    """
+    Nombre y contenido de la entrada del ZIP. Con la respuesta ya enviada
+    (200) un error no puede cambiar el código: se escribe como una entrada
+    de texto con el motivo, en lugar de cortar el ZIP a medias.
+    """
+    try:
+        return name, await task
+    except JobTimeoutError:
+        message = "Tiempo de generación agotado"
+    except Exception as e:
+        message = f"Error generando el Excel: {e}"
+    return f"{name.removesuffix('.xlsx')}.error.txt", message.encode("utf-8")
+
+
+def _open_spooled(path: str) -> tuple[BinaryIO, int]:
+    """
+    Abre un temporal para enviarlo y borra ya su ruta (el archivo abierto
+    sigue legible hasta cerrarlo). Devuelve el archivo y su tamaño.
+    """
+    file = open(path, "rb")
+    try:
+        os.unlink(path)
+        size = file.seek(0, os.SEEK_END)
+        file.seek(0)
+    except BaseException:
+        file.close()
+        raise
+    return file, size
+
+
+def _iter_file(file: BinaryIO) -> Iterator[bytes]:
+    """Lee el archivo por trozos (en el threadpool de Starlette) y lo cierra al terminar"""
+    try:
+        while chunk := file.read(STREAM_CHUNK_SIZE):
+            yield chunk
+    finally:
+        file.close()
+
+
+def _batch_invoices(request: ExportBatchRequest) -> list[dict[str, Any]]:
+    """Facturas del lote tras comprobar que existen y caben en Excel"""
+    if not request.data:
+        raise HTTPException(status_code=400, detail="No se proporcionaron datos")
+
+    invoices = request.data.get("invoices", [])
+    if not invoices:
+        raise HTTPException(status_code=400, detail="No hay facturas en los datos")
+    if len(invoices) > config.EXCEL_BATCH_MAX_INVOICES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Demasiadas facturas ({len(invoices)}, máx {config.EXCEL_BATCH_MAX_INVOICES})"
+        )
+    try:
+        for invoice in invoices:
+            check_sheet_rows(invoice)
+    except ExcelLimitError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return invoices
+
+
+def _excel_engine(engine: str | None) -> str:
+    """Motor de Excel de la petición (o el de configuración), ya comprobado"""
+    try:
+        return resolve_engine(engine)
+    except ExcelEngineError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+def _invoice_filename(invoice: dict[str, Any]) -> str:
+    """factura-{serie}-{número}.xlsx (sin sanitizar)"""
+    series = invoice.get("series", "")
+    number = invoice.get("number", "")
+    invoice_num = f"{series}{series and '-' or ''}{number}" if (series or number) else "factura"
+    return f"factura-{invoice_num}.xlsx"
+
+
+def unique_filenames(filenames: list[str]) -> list[str]:
+    """
+    Sanitiza los nombres y numera los repetidos (factura-1.xlsx,
+    factura-1-2.xlsx...), sin distinguir mayúsculas
+    """
+    used: set[str] = set()
+    result = []
+    for filename in filenames:
+        stem = _sanitize_filename(filename)[:-len(".xlsx")]
+        name = f"{stem}.xlsx"
+        copy_number = 2
+        while name.lower() in used:
+            name = f"{stem}-{copy_number}.xlsx"
+            copy_number += 1
+        used.add(name.lower())
+        result.append(name)
+    return result
+
+
+def _sanitize_filename(filename: str, extension: str = ".xlsx") -> str:
+    """Deja solo caracteres seguros en el nombre y asegura la extensión"""
+    filename = "".join(c for c in filename if c.isalnum() or c in ".-_").strip()
+    if not filename.endswith(extension):
+        filename += extension
+    return filename
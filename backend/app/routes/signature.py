@@ -2,15 +2,68 @@
 Rutas de validación de firma digital
 """
 
-from fastapi import APIRouter, UploadFile, File, HTTPException
-from ..services.validator import validate_xades_signature
-from ..models.response import SignatureResponse
+import asyncio
+import time
+import zipfile
+from typing import AsyncIterator, Awaitable, Callable, Literal, Optional, Union
+
+from fastapi import APIRouter, UploadFile, File, Header, HTTPException, Query, Request, Response
+from fastapi.responses import StreamingResponse
+
+from .. import config
+from ..services.ingest import (
+    FileTooLargeError,
+    MissingFileError,
+    UnsupportedFileError,
+    UploadError,
+    ingest_upload,
+)
+from ..services.metrics import observe_stages, observe_upload, record_stages
+from ..services.result_cache import (
+    content_digest,
+    etag_matches,
+    get_validation_cache,
+    validation_etag,
+)
+from ..services.validator import LEVEL_FULL, validate_xades_signature
+from ..services.worker_pool import JobTimeoutError, get_worker_pool
+from ..models.response import SignatureResponse, BatchSignatureItem, BatchSummary
 
 router = APIRouter(tags=["signature"])
 
+SUPPORTED_EXTENSIONS = (".xml", ".xsig")
+
+# Lectura diferida del contenido de un archivo del lote
+BatchReader = Callable[[], Awaitable[bytes]]
+
+# El cuerpo se lee a mano (ingest_upload): se documenta el formulario aquí
+UPLOAD_OPENAPI = {
+    "requestBody": {
+        "required": True,
+        "content": {
+            "multipart/form-data": {
+                "schema": {
+                    "type": "object",
+                    "required": ["file"],
+                    "properties": {"file": {"type": "string", "format": "binary"}},
+                }
+            }
+        },
+    }
+}
 
-@router.post("/api/validate-signature", response_model=SignatureResponse)
-async def validate_signature(file: UploadFile = File(...)):
+
+@router.post(
+    "/api/validate-signature",
+    response_model=SignatureResponse,
+    openapi_extra=UPLOAD_OPENAPI,
+)
+async def validate_signature(
+    request: Request,
+    response: Response,
+    level: Literal["inspect", "crypto", "full"] = Query("full"),
+    if_none_match: Optional[str] = Header(None),
+):
     """
     Valida la firma XAdES de una factura Facturae.
 
@@ -20,29 +73,235 @@ async def validate_signature(file: UploadFile = File(...)):
     - Datos del certificado (emisor, validez, serial)
     - Estado de revocación (OCSP/CRL cuando es posible)
 
-    El archivo se procesa en memoria y NO se almacena.
-    """
-    if not file.filename:
-        raise HTTPException(status_code=400, detail="No se proporcionó archivo")
+    Con level se puede parar antes: "inspect" solo extrae firmante,
+    certificado y tipo XAdES (sin verificar nada) y "crypto" verifica la
+    firma y las referencias pero no la cadena ni la revocación.
 
-    # Validar extensión
-    if not file.filename.lower().endswith((".xml", ".xsig")):
+    El archivo NO se almacena: se lee en streaming (los grandes pasan por
+    un temporal que se borra al terminar) y solo se guarda el resultado,
+    indexado por el SHA-256 calculado durante la lectura. La respuesta
+    lleva un ETag y se honra If-None-Match (304).
+    """
+    # Leer el archivo por bloques: extensión y tamaño se comprueban sobre
+    # la marcha, sin esperar a recibir todo el cuerpo
+    try:
+        upload = await ingest_upload(request, "file", SUPPORTED_EXTENSIONS)
+    except FileTooLargeError:
+        raise HTTPException(status_code=413, detail="Archivo demasiado grande (máx 10 MB)")
+    except UnsupportedFileError:
         raise HTTPException(
             status_code=400,
             detail="Formato no soportado. Solo se aceptan archivos .xml o .xsig"
         )
+    except MissingFileError:
+        raise HTTPException(status_code=422, detail="No se proporcionó archivo")
+    except UploadError as e:
+        raise HTTPException(status_code=400, detail=f"Error leyendo archivo: {str(e)}")
 
-    # Leer contenido
+    observe_upload("/api/validate-signature", upload.size)
+    digest = upload.digest
     try:
-        content = await file.read()
+        result = await _validate_cached(digest, upload.source, level)
+    except JobTimeoutError:
+        raise HTTPException(status_code=504, detail="Tiempo de validación agotado")
+    finally:
+        upload.close()
+
+    etag = validation_etag(digest, result)
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers={"ETag": etag})
+    response.headers["ETag"] = etag
+    return result
+
+
+async def _validate_cached(
+    digest: str, content: Union[bytes, str], level: str = LEVEL_FULL
+) -> SignatureResponse:
+    """
+    Valida la firma en el pool de workers salvo que el resultado esté
+    cacheado (content puede ser la ruta de un temporal). Cada nivel de
+    validación se cachea por separado.
+    """
+    cache = get_validation_cache()
+    key = digest if level == LEVEL_FULL else f"{digest}:{level}"
+    result = cache.get(key)
+    if result is None:
+        # Validar firma en el pool de workers (no bloquea el event loop)
+        # Los tiempos de cada etapa se miden en el worker y vuelven con el
+        # resultado; "worker" incluye además la espera en la cola del pool
+        start = time.perf_counter()
+        result, timings = await get_worker_pool().run(
+            record_stages, validate_xades_signature, content, None, level
+        )
+        timings["worker"] = time.perf_counter() - start
+        observe_stages("validation", timings)
+        cache.put(key, result, ttl=_cache_ttl(result, level))
+    return result
+
+
+def _cache_ttl(result: SignatureResponse, level: str) -> Optional[float]:
+    """
+    Segundos que se reutiliza un resultado validado (None: mientras no se
+    expulse). El estado de revocación caduca; si no se pudo comprobar (un
+    servidor OCSP/CRL caído o lento), se vuelve a consultar enseguida.
+    """
+    if result.revocation_checked:
+        return config.REVOCATION_CACHE_TTL
+    if level == LEVEL_FULL:
+        return config.REVOCATION_RETRY_TTL
+    return None
+
+
+@router.post("/api/validate-signature/batch")
+async def validate_signature_batch(files: list[UploadFile] = File(...)):
+    """
+    Valida en paralelo la firma de varias facturas.
+
+    Acepta una lista de archivos .xml/.xsig o un único .zip que los contenga.
+    La respuesta es NDJSON: una línea por archivo (en orden de finalización)
+    con el resultado de la validación y una última línea con el resumen:
+
+        {"filename": "a.xsig", "valid": true, ...}
+        {"summary": {"total": 1, "valid": 1, "invalid": 0, "unsigned": 0}}
+
+    Solo hay tantos archivos en memoria como workers de validación.
+    """
+    if not files or not all(f.filename for f in files):
+        raise HTTPException(status_code=400, detail="No se proporcionó archivo")
+
+    if len(files) == 1 and files[0].filename.lower().endswith(".zip"):
+        try:
+            archive = zipfile.ZipFile(files[0].file)
+        except zipfile.BadZipFile:
+            raise HTTPException(status_code=400, detail="Archivo ZIP no válido")
+        entries = [
+            info for info in archive.infolist()
+            if not info.is_dir() and not info.filename.startswith("__MACOSX/")
+        ]
+        if len(entries) > config.BATCH_MAX_FILES:
+            archive.close()
+            raise HTTPException(
+                status_code=400,
+                detail=f"Demasiados archivos en el lote (máx {config.BATCH_MAX_FILES})"
+            )
+        stream = _stream_zip_batch(archive, entries)
+    else:
+        if len(files) > config.BATCH_MAX_FILES:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Demasiados archivos en el lote (máx {config.BATCH_MAX_FILES})"
+            )
+        stream = _stream_batch([(f.filename, _upload_reader(f)) for f in files])
+
+    return StreamingResponse(stream, media_type="application/x-ndjson")
+
+
+def _upload_reader(file: UploadFile) -> BatchReader:
+    """Lectura diferida de un archivo subido (limitada al tamaño máximo)"""
+    async def read() -> bytes:
+        await file.seek(0)
+        content = await file.read(config.MAX_UPLOAD_SIZE + 1)
+        if len(content) > config.MAX_UPLOAD_SIZE:
+            raise FileTooLargeError()
+        return content
+    return read
+
+
+def _zip_entry_reader(archive: zipfile.ZipFile, info: zipfile.ZipInfo) -> BatchReader:
+    """Lectura diferida de una entrada del ZIP (limitada al tamaño máximo)"""
+    def read_entry() -> bytes:
+        if info.file_size > config.MAX_UPLOAD_SIZE:
+            raise FileTooLargeError()
+        # No fiarse de file_size: limitar lo que se descomprime
+        with archive.open(info) as entry:
+            content = entry.read(config.MAX_UPLOAD_SIZE + 1)
+        if len(content) > config.MAX_UPLOAD_SIZE:
+            raise FileTooLargeError()
+        return content
+
+    async def read() -> bytes:
+        return await asyncio.to_thread(read_entry)
+    return read
+
+
+def _batch_error(filename: str, message: str) -> BatchSignatureItem:
+    return BatchSignatureItem(filename=filename, valid=False, errors=[message])
+
+
+async def _validate_batch_item(filename: str, read: BatchReader) -> BatchSignatureItem:
+    """Valida un archivo del lote; los errores se devuelven en el propio resultado"""
+    if not filename.lower().endswith(SUPPORTED_EXTENSIONS):
+        return _batch_error(filename, "Formato no soportado. Solo se aceptan archivos .xml o .xsig")
+
+    try:
+        content = await read()
+    except FileTooLargeError:
+        return _batch_error(filename, "Archivo demasiado grande (máx 10 MB)")
     except Exception as e:
-        raise HTTPException(status_code=400, detail=f"Error leyendo archivo: {str(e)}")
+        return _batch_error(filename, f"Error leyendo archivo: {str(e)}")
+
+    try:
+        result = await _validate_cached(content_digest(content), content)
+    except JobTimeoutError:
+        return _batch_error(filename, "Tiempo de validación agotado")
+
+    return BatchSignatureItem(filename=filename, **result.model_dump())
+
+
+async def _stream_zip_batch(
+    archive: zipfile.ZipFile, entries: list[zipfile.ZipInfo]
+) -> AsyncIterator[str]:
+    """Valida las entradas del ZIP y lo cierra al terminar (o si el cliente se desconecta)"""
+    with archive:
+        sources = [(info.filename, _zip_entry_reader(archive, info)) for info in entries]
+        async for line in _stream_batch(sources):
+            yield line
 
-    # Validar tamaño (máx 10 MB)
-    if len(content) > 10 * 1024 * 1024:
-        raise HTTPException(status_code=400, detail="Archivo demasiado grande (máx 10 MB)")
 
-    # Validar firma
-    result = validate_xades_signature(content)
+async def _stream_batch(sources: list[tuple[str, BatchReader]]) -> AsyncIterator[str]:
+    """
+    Lanza las validaciones con como mucho tantos trabajos en curso como
+    workers tiene el pool y emite cada resultado según termina.
+    """
+    max_in_flight = get_worker_pool().size
+    summary = BatchSummary()
+    pending: set[asyncio.Task] = set()
+    filenames: dict[asyncio.Task, str] = {}
+
+    def record(task: asyncio.Task) -> str:
+        filename = filenames.pop(task)
+        try:
+            item = task.result()
+        except Exception as e:
+            # Error inesperado (p.ej. el pool de workers se ha roto): va en
+            # la línea del archivo y la respuesta sigue con el resto
+            item = _batch_error(filename, f"Error validando archivo: {str(e)}")
+        summary.total += 1
+        if item.valid is None:
+            summary.unsigned += 1
+        elif item.valid:
+            summary.valid += 1
+        else:
+            summary.invalid += 1
+        return item.model_dump_json() + "\n"
+
+    try:
+        for filename, read in sources:
+            if len(pending) >= max_in_flight:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    yield record(task)
+            task = asyncio.create_task(_validate_batch_item(filename, read))
+            filenames[task] = filename
+            pending.add(task)
+
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                yield record(task)
 
-    return result
\ No newline at end of file
+        yield '{"summary": ' + summary.model_dump_json() + "}\n"
+    finally:
+        # Cliente desconectado: no dejar trabajos huérfanos
+        for task in pending:
+            task.cancel()
@@ -1 +1,9 @@
-from .validator import validate_xades_signature
\ No newline at end of file
+from .validator import validate_xades_signature
+from .worker_pool import WorkerPool, JobTimeoutError, get_worker_pool
+from .result_cache import ValidationCache, get_validation_cache
+from .certificates import CertificateRegistry, get_certificate_registry
+from .ocsp import OCSPClient, OCSPError, get_ocsp_client
+from .crl import CRLStore, CRLError, get_crl_store
+from .trust_store import TrustStore, get_trust_store
+from .ingest import IngestedFile, UploadError, ingest_upload
+from .xml_parser import UnsafeXMLError, get_parser, parse_xml
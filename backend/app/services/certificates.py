@@ -0,0 +1,205 @@
+"""
+Registro de certificados ya parseados, indexado por huella del DER
+"""
+
+import base64
+import hashlib
+import re
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Optional
+
+from cryptography import x509
+from cryptography.hazmat.primitives.asymmetric.types import CertificatePublicKeyTypes
+from cryptography.x509.oid import NameOID
+
+from .. import config
+from ..models.response import CertificateInfo, SignerInfo
+
+
+@dataclass
+class ParsedCertificate:
+    """Certificado parseado junto con todo lo que se deriva de él"""
+    fingerprint: str
+    certificate: x509.Certificate
+    info: CertificateInfo
+    signer: SignerInfo
+    public_key: CertificatePublicKeyTypes
+
+
+def certificate_fingerprint(cert_b64: str) -> str:
+    """
+    Huella del contenido de ds:X509Certificate.
+
+    Se calcula sobre el base64 sin espacios, así que no hace falta
+    decodificarlo para saber si el certificado ya está en el registro.
+    """
+    return hashlib.sha256("".join(cert_b64.split()).encode("ascii")).hexdigest()
+
+
+class CertificateRegistry:
+    """
+    LRU acotada de certificados parseados.
+
+    Los proveedores firman siempre con los mismos pocos certificados, así que
+    para un firmante conocido solo queda por hacer la verificación de
+    SignatureValue.
+    """
+
+    def __init__(self, max_entries: int = 128):
+        self.max_entries = max_entries
+        self._entries: OrderedDict[str, ParsedCertificate] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def load(self, cert_b64: str) -> ParsedCertificate:
+        """
+        Devuelve el certificado parseado, parseándolo solo la primera vez.
+
+        Raises:
+            ValueError: si el contenido no es un certificado DER válido
+        """
+        fingerprint = certificate_fingerprint(cert_b64)
+        with self._lock:
+            parsed = self._entries.get(fingerprint)
+            if parsed is not None:
+                self._entries.move_to_end(fingerprint)
+                self.hits += 1
+                return parsed
+            self.misses += 1
+
+        parsed = _parse_certificate(fingerprint, cert_b64)
+
+        if self.max_entries > 0:
+            with self._lock:
+                self._entries[fingerprint] = parsed
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+                    self.evictions += 1
+        return parsed
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict[str, Any]:
+        """Contadores para monitorización"""
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+def _parse_certificate(fingerprint: str, cert_b64: str) -> ParsedCertificate:
+    cert_der = base64.b64decode(cert_b64)
+    cert = x509.load_der_x509_certificate(cert_der)
+    return ParsedCertificate(
+        fingerprint=fingerprint,
+        certificate=cert,
+        info=extract_certificate_info(cert),
+        signer=extract_signer_info(cert),
+        public_key=cert.public_key(),
+    )
+
+
+def find_issuer(
+    cert: x509.Certificate, candidates: list[x509.Certificate]
+) -> Optional[x509.Certificate]:
+    """Entre los certificados dados, el que emitió cert (firma comprobada)"""
+    for candidate in candidates:
+        if candidate.subject != cert.issuer:
+            continue
+        try:
+            cert.verify_directly_issued_by(candidate)
+        except Exception:
+            continue
+        return candidate
+    return None
+
+
+def extract_certificate_info(cert: x509.Certificate) -> CertificateInfo:
+    """Extrae información del certificado X509"""
+    try:
+        issuer = cert.issuer.get_attributes_for_oid(NameOID.COMMON_NAME)
+        issuer_name = issuer[0].value if issuer else str(cert.issuer)
+
+        subject = cert.subject.get_attributes_for_oid(NameOID.COMMON_NAME)
+        subject_name = subject[0].value if subject else str(cert.subject)
+
+        return CertificateInfo(
+            issuer=issuer_name,
+            subject=subject_name,
+            serial=str(cert.serial_number),
+            valid_from=cert.not_valid_before_utc,
+            valid_to=cert.not_valid_after_utc,
+            is_expired=False
+        )
+    except Exception:
+        return CertificateInfo()
+
+
+def extract_signer_info(cert: x509.Certificate) -> SignerInfo:
+    """Extrae información del firmante del certificado"""
+    try:
+        # Nombre común
+        cn = cert.subject.get_attributes_for_oid(NameOID.COMMON_NAME)
+        name = cn[0].value if cn else None
+
+        # Organización
+        org = cert.subject.get_attributes_for_oid(NameOID.ORGANIZATION_NAME)
+        organization = org[0].value if org else None
+
+        # NIF/CIF - buscar en varios campos
+        tax_id = None
+        serial_number = cert.subject.get_attributes_for_oid(NameOID.SERIAL_NUMBER)
+        if serial_number:
+            # El serialNumber suele contener el NIF en certificados españoles
+            sn = serial_number[0].value
+            # Extraer NIF (formato: IDCES-12345678A o similar)
+            nif_match = re.search(r"[A-Z]?\d{7,8}[A-Z]", sn)
+            if nif_match:
+                tax_id = nif_match.group()
+            else:
+                tax_id = sn
+
+        # Email
+        email = None
+        try:
+            san = cert.extensions.get_extension_for_oid(
+                x509.oid.ExtensionOID.SUBJECT_ALTERNATIVE_NAME
+            )
+            for name_entry in san.value:
+                if isinstance(name_entry, x509.RFC822Name):
+                    email = name_entry.value
+                    break
+        except x509.ExtensionNotFound:
+            pass
+
+        return SignerInfo(
+            name=name,
+            tax_id=tax_id,
+            organization=organization,
+            email=email
+        )
+    except Exception:
+        return SignerInfo()
+
+
+_registry: Optional[CertificateRegistry] = None
+_registry_lock = threading.Lock()
+
+
+def get_certificate_registry() -> CertificateRegistry:
+    """Devuelve el registro del proceso actual"""
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = CertificateRegistry(max_entries=config.CERT_CACHE_SIZE)
+        return _registry
@@ -0,0 +1,359 @@
+"""
+Listas de revocación (CRL) compiladas en un índice binario en disco
+
+Cada CRL se descarga y verifica una sola vez; sus números de serie revocados
+se guardan ordenados y con ancho fijo en un archivo que todos los workers
+mapean en memoria (solo lectura) y consultan con búsqueda binaria.
+"""
+
+import fcntl
+import hashlib
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Any, Optional
+
+import requests
+from cryptography import x509
+
+from .. import config
+from .http_client import FetchError, fetch, get_http_session
+from .ocsp import CLOCK_SKEW, RevocationError, issuer_key_hash
+
+
+# Cabecera del índice: magic, ancho en bytes de cada serial, número de
+# seriales, thisUpdate y nextUpdate (epoch) y hash de la clave del emisor
+_HEADER = struct.Struct("<8sHQdd20s")
+_MAGIC = b"FVCRL\x00\x00\x01"
+
+
+class CRLError(RevocationError):
+    """No se pudo obtener una CRL vigente y válida"""
+
+
+class CRLIndex:
+    """
+    Índice de seriales revocados mapeado en memoria.
+
+    Los seriales se guardan en big-endian con el mismo ancho, así que el
+    orden de bytes coincide con el numérico y basta una búsqueda binaria
+    sobre el mmap: O(log n) sin cargar la lista en el heap del proceso.
+    """
+
+    def __init__(self, path: str):
+        with open(path, "rb") as f:
+            self.inode = os.fstat(f.fileno()).st_ino
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self._mmap) < _HEADER.size:
+            raise CRLError("Índice de CRL corrupto")
+        magic, width, count, this_update, next_update, key_hash = _HEADER.unpack_from(self._mmap, 0)
+        if magic != _MAGIC or width == 0 or len(self._mmap) != _HEADER.size + width * count:
+            raise CRLError("Índice de CRL corrupto")
+        self.path = path
+        self.width = width
+        self.count = count
+        self.this_update = this_update
+        self.next_update = next_update
+        self.issuer_key_hash = key_hash
+
+    def __contains__(self, serial: int) -> bool:
+        width = self.width
+        if serial < 0 or serial.bit_length() > width * 8:
+            return False
+        key = serial.to_bytes(width, "big")
+        data = self._mmap
+        base = _HEADER.size
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            start = base + mid * width
+            if data[start:start + width] < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        start = base + lo * width
+        return lo < self.count and data[start:start + width] == key
+
+    def __len__(self) -> int:
+        return self.count
+
+
+def build_index(
+    path: str,
+    serials: list[int],
+    this_update: float,
+    next_update: float,
+    key_hash: bytes,
+) -> None:
+    """
+    Escribe el índice y lo publica de forma atómica (os.replace): los
+    procesos que tengan mapeada la versión anterior siguen leyéndola sin
+    ver nunca un archivo a medias.
+    """
+    serials = sorted(set(serials))
+    width = max(((s.bit_length() + 7) // 8 for s in serials), default=1) or 1
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(_HEADER.pack(_MAGIC, width, len(serials), this_update, next_update, key_hash))
+            f.write(b"".join(s.to_bytes(width, "big") for s in serials))
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+
+
+class CRLStore:
+    """
+    Índices de CRL por URL de distribución.
+
+    - La primera consulta de una URL descarga, verifica y compila la CRL;
+      un flock sobre el directorio hace que entre procesos solo uno la
+      descargue y el resto reutilice su índice.
+    - Antes de nextUpdate (margen configurable) se renueva en segundo plano
+      mientras las consultas siguen usando el índice vigente.
+    - Cada proceso detecta por inodo que otro ha publicado un índice nuevo
+      y lo vuelve a mapear.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        timeout: float = 30.0,
+        max_size: int = 64 * 1024 * 1024,
+        refresh_margin: float = 3600.0,
+        default_ttl: float = 3600.0,
+        retry_interval: float = 300.0,
+        session: Optional[requests.Session] = None,
+    ):
+        self.directory = directory
+        self.timeout = timeout
+        self.max_size = max_size
+        self.refresh_margin = refresh_margin
+        self.default_ttl = default_ttl
+        # Mínimo entre descargas de la misma URL: si la CA aún no ha
+        # publicado una CRL nueva no se vuelve a pedir en cada consulta
+        self.retry_interval = retry_interval
+        self.session = session or get_http_session()
+        self._indexes: dict[str, CRLIndex] = {}
+        self._url_locks: dict[str, threading.Lock] = {}
+        self._refreshing: set[str] = set()
+        self._last_download: dict[str, float] = {}
+        self._lock = threading.Lock()
+        self.lookups = 0
+        self.downloads = 0
+        self.background_refreshes = 0
+        self.errors = 0
+
+    def is_revoked(self, cert: x509.Certificate, issuer: x509.Certificate, urls: list[str]) -> bool:
+        """
+        Comprueba el serial de cert en la primera CRL disponible de urls.
+
+        Raises:
+            CRLError: si ninguna de las URLs ofrece una CRL vigente y válida
+        """
+        failures = []
+        for url in urls:
+            try:
+                index = self._index(url, issuer)
+            except CRLError as e:
+                failures.append(str(e))
+                continue
+            with self._lock:
+                self.lookups += 1
+            return cert.serial_number in index
+        raise CRLError("; ".join(failures) or "El certificado no declara CRL")
+
+    def refresh_pending(self) -> bool:
+        """Hay alguna renovación en segundo plano en curso"""
+        with self._lock:
+            return bool(self._refreshing)
+
+    def stats(self) -> dict[str, Any]:
+        """Contadores para monitorización"""
+        with self._lock:
+            return {
+                "indexes": len(self._indexes),
+                "lookups": self.lookups,
+                "downloads": self.downloads,
+                "background_refreshes": self.background_refreshes,
+                "errors": self.errors,
+            }
+
+    def _index(self, url: str, issuer: x509.Certificate) -> CRLIndex:
+        key_hash = issuer_key_hash(issuer)
+        index = self._current(url)
+        now = time.time()
+
+        if index is not None and index.issuer_key_hash == key_hash and now < index.next_update:
+            if now >= self._refresh_at(index):
+                self._refresh_in_background(url, issuer)
+            return index
+
+        # Sin índice vigente: hay que descargar antes de responder
+        self._refresh(url, issuer)
+        index = self._current(url)
+        if index is None or index.issuer_key_hash != key_hash or time.time() >= index.next_update:
+            raise CRLError(f"No hay CRL vigente en {url}")
+        return index
+
+    def _path(self, url: str) -> str:
+        name = hashlib.sha256(url.encode()).hexdigest()[:32] + ".crlidx"
+        return os.path.join(self.directory, name)
+
+    def _current(self, url: str) -> Optional[CRLIndex]:
+        """Índice mapeado de la URL, volviendo a mapearlo si el archivo cambió"""
+        path = self._path(url)
+        with self._lock:
+            index = self._indexes.get(url)
+        try:
+            inode = os.stat(path).st_ino
+        except FileNotFoundError:
+            return None
+        if index is not None and index.inode == inode:
+            return index
+        # Nuevo índice publicado (por este u otro proceso); el mapeo anterior
+        # se libera cuando ninguna consulta en curso lo use
+        try:
+            index = CRLIndex(path)
+        except (OSError, CRLError):
+            return None
+        with self._lock:
+            self._indexes[url] = index
+        return index
+
+    def _refresh_at(self, index: CRLIndex) -> float:
+        validity = max(index.next_update - index.this_update, 0.0)
+        return index.next_update - min(self.refresh_margin, validity / 2)
+
+    def _refresh_in_background(self, url: str, issuer: x509.Certificate) -> None:
+        with self._lock:
+            if url in self._refreshing:
+                return
+            if time.monotonic() - self._last_download.get(url, float("-inf")) < self.retry_interval:
+                return
+            self._refreshing.add(url)
+            self.background_refreshes += 1
+
+        def run() -> None:
+            try:
+                self._refresh(url, issuer)
+            except CRLError:
+                # El índice actual sigue siendo válido hasta su nextUpdate
+                pass
+            finally:
+                with self._lock:
+                    self._refreshing.discard(url)
+
+        threading.Thread(target=run, name="crl-refresh", daemon=True).start()
+
+    def _refresh(self, url: str, issuer: x509.Certificate) -> None:
+        """Descarga, verifica y compila la CRL (una sola vez entre procesos)"""
+        with self._lock:
+            url_lock = self._url_locks.setdefault(url, threading.Lock())
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._path(url)
+        key_hash = issuer_key_hash(issuer)
+
+        with url_lock, open(path + ".lock", "w") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            # Otro hilo o proceso puede haberla renovado mientras esperábamos
+            index = self._current(url)
+            if index is not None and index.issuer_key_hash == key_hash \
+                    and time.time() < self._refresh_at(index):
+                return
+
+            with self._lock:
+                self.downloads += 1
+                self._last_download[url] = time.monotonic()
+            try:
+                body = fetch(self.session, "GET", url, self.timeout, self.max_size)
+                crl = _load_crl(body)
+                _verify_crl(crl, issuer)
+            except (FetchError, CRLError) as e:
+                with self._lock:
+                    self.errors += 1
+                raise CRLError(str(e))
+
+            this_update = crl.last_update_utc.timestamp()
+            if crl.next_update_utc is not None:
+                next_update = crl.next_update_utc.timestamp()
+            else:
+                next_update = time.time() + self.default_ttl
+            serials = [entry.serial_number for entry in crl]
+            build_index(path, serials, this_update, next_update, key_hash)
+
+
+def _load_crl(body: bytes) -> x509.CertificateRevocationList:
+    try:
+        return x509.load_der_x509_crl(body)
+    except ValueError:
+        try:
+            return x509.load_pem_x509_crl(body)
+        except ValueError:
+            raise CRLError("CRL no válida")
+
+
+def _verify_crl(crl: x509.CertificateRevocationList, issuer: x509.Certificate) -> None:
+    """La CRL es del emisor (con cRLSign), está firmada por él y no ha caducado"""
+    if crl.issuer != issuer.subject:
+        raise CRLError("La CRL no corresponde al emisor del certificado")
+    if not _can_sign_crl(issuer):
+        raise CRLError("El emisor no está autorizado a firmar CRL (keyUsage sin cRLSign)")
+    if not crl.is_signature_valid(issuer.public_key()):
+        raise CRLError("Firma de la CRL no válida")
+    next_update = crl.next_update_utc
+    if next_update is not None and next_update < datetime.now(timezone.utc) - CLOCK_SKEW:
+        raise CRLError("CRL caducada")
+
+
+def _can_sign_crl(issuer: x509.Certificate) -> bool:
+    """
+    Si issuer puede firmar CRL: sin extensión keyUsage su uso no está
+    restringido; con ella, tiene que incluir cRLSign (RFC 5280, 4.2.1.3)
+    """
+    try:
+        return issuer.extensions.get_extension_for_class(x509.KeyUsage).value.crl_sign
+    except x509.ExtensionNotFound:
+        return True
+
+
+def crl_distribution_points(cert: x509.Certificate) -> list[str]:
+    """URLs HTTP(S) de los puntos de distribución de CRL del certificado"""
+    try:
+        points = cert.extensions.get_extension_for_class(x509.CRLDistributionPoints).value
+    except x509.ExtensionNotFound:
+        return []
+    urls = []
+    for point in points:
+        for name in point.full_name or []:
+            if not isinstance(name, x509.UniformResourceIdentifier):
+                continue
+            if name.value.startswith(("http://", "https://")):
+                urls.append(name.value)
+    return urls
+
+
+_store: Optional[CRLStore] = None
+_store_lock = threading.Lock()
+
+
+def get_crl_store() -> CRLStore:
+    """Devuelve el almacén de CRL del proceso actual (el directorio es compartido)"""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = CRLStore(
+                directory=config.CRL_CACHE_DIR,
+                timeout=config.CRL_TIMEOUT,
+                max_size=config.CRL_MAX_SIZE,
+                refresh_margin=config.CRL_REFRESH_MARGIN,
+                default_ttl=config.REVOCATION_CACHE_TTL,
+            )
+        return _store
@@ -0,0 +1,255 @@
+"""
+Exportación de un lote completo a un único libro de Excel
+
+El libro tiene una hoja de resumen (número, fecha, receptor y total de cada
+factura) y una hoja de detalle por factura, idéntica a la de
+generate_excel. Las hojas de detalle se renderizan por separado, cada una
+en su propio libro (en paralelo, en el pool de workers), y se combinan
+después: openpyxl escribe los textos en línea y todos los libros registran
+los estilos en el mismo orden (CELL_STYLES), así que el XML de cada hoja
+vale tal cual en el libro final. Cada hoja lleva la huella de la tabla de
+estilos de su libro y se comprueba que coincide con la del libro final: los
+índices de estilo (s="N") de una hoja solo valen con su propia tabla.
+"""
+
+import hashlib
+import os
+import re
+import tempfile
+import zipfile
+from io import BytesIO
+from typing import Any, BinaryIO, Iterator, NamedTuple
+
+from openpyxl import Workbook
+from openpyxl.styles.stylesheet import write_stylesheet
+from openpyxl.xml.functions import tostring
+
+from .. import config
+from .excel_generator import (
+    INFO_STYLE,
+    LINE_CENTER_STYLE,
+    LINE_NUMBER_STYLE,
+    LINE_TEXT_STYLE,
+    TABLE_HEADER_STYLE,
+    TITLE_STYLE,
+    TOTAL_AMOUNT_STYLE,
+    TOTAL_FILL_STYLE,
+    TOTAL_LABEL_STYLE,
+    TRANSLATIONS,
+    ColumnWidths,
+    LayoutRow,
+    StyleCache,
+    build_invoice_workbook,
+    fill_sheet,
+    get_workbook_template,
+)
+from .metrics import stage
+
+
+# Límites de Excel para los nombres de hoja
+SHEET_NAME_MAX_LENGTH = 31
+INVALID_SHEET_CHARS = re.compile(r"[\[\]:*?/\\]")
+# Nombre reservado por Excel (no distingue mayúsculas)
+RESERVED_SHEET_NAMES = {"history"}
+
+# Columnas del resumen y sus anchos mínimos
+SUMMARY_COLUMNS = 5
+SUMMARY_MIN_WIDTHS = {1: 16, 3: 30}
+
+# Ruta de cada hoja dentro del .xlsx (openpyxl numera en orden desde 1)
+SHEET_PART = "xl/worksheets/sheet{}.xml"
+
+
+class ExcelStyleError(ValueError):
+    """Una hoja renderizada usa una tabla de estilos distinta de la del libro final"""
+
+
+class RenderedSheet(NamedTuple):
+    """XML de una hoja de detalle y la huella de la tabla de estilos a la que apunta"""
+    xml: bytes
+    styles: str
+
+
+def style_signature(wb: Workbook) -> str:
+    """Huella de las tablas de estilos del libro (lo que escribe en xl/styles.xml)"""
+    return hashlib.sha256(tostring(write_stylesheet(wb))).hexdigest()
+
+
+# Huella de la plantilla de cada idioma: los libros que la usan sin añadir
+# estilos (template.matches) tienen exactamente sus tablas
+_template_signatures: dict[str, str] = {}
+
+
+def unique_sheet_names(invoices: list[dict[str, Any]], reserved: tuple[str, ...] = ()) -> list[str]:
+    """
+    Un nombre de hoja por factura («serie-número»), válido en Excel: sin
+    caracteres prohibidos, de 31 caracteres como máximo y único sin
+    distinguir mayúsculas (los repetidos llevan « (2)», « (3)»...).
+    """
+    used = {name.lower() for name in reserved} | RESERVED_SHEET_NAMES
+    names = []
+    for position, invoice in enumerate(invoices, start=1):
+        parts = (str(invoice.get("series") or ""), str(invoice.get("number") or ""))
+        base = INVALID_SHEET_CHARS.sub("_", "-".join(p for p in parts if p)).strip().strip("'")
+        base = base[:SHEET_NAME_MAX_LENGTH] or str(position)
+
+        name = base
+        copy_number = 2
+        while name.lower() in used:
+            suffix = f" ({copy_number})"
+            name = base[:SHEET_NAME_MAX_LENGTH - len(suffix)] + suffix
+            copy_number += 1
+        used.add(name.lower())
+        names.append(name)
+    return names
+
+
+def render_invoice_sheet(data: dict[str, Any], invoice_index: int, lang: str) -> RenderedSheet:
+    """
+    XML de la hoja de detalle de una factura (la parte
+    xl/worksheets/sheet1.xml de su propio libro; sin guardar el libro
+    entero salvo en modo write-only) y la huella de sus estilos. Se ejecuta
+    en los workers.
+    """
+    wb = build_invoice_workbook(data, invoice_index, lang)
+    template = get_workbook_template(lang)
+    with stage("save"):
+        if template.matches(wb):
+            signature = _template_signatures.get(lang)
+            if signature is None:
+                signature = _template_signatures[lang] = style_signature(template.new_workbook())
+            return RenderedSheet(template.sheet_xml(wb), signature)
+        output = BytesIO()
+        wb.save(output)
+    with zipfile.ZipFile(output) as archive:
+        return RenderedSheet(archive.read(SHEET_PART.format(1)), style_signature(wb))
+
+
+def _invoice_total(invoice: dict[str, Any]) -> float:
+    totals = invoice.get("totals", {})
+    return totals.get("invoiceTotal", totals.get("totalToPay", 0)) or 0
+
+
+def _summary_layout(data: dict[str, Any], lang: str, sheet_names: list[str]) -> Iterator[LayoutRow]:
+    """Filas de la hoja de resumen"""
+    t = TRANSLATIONS.get(lang, TRANSLATIONS["es"])
+    invoices = data["invoices"]
+    currency = data.get("fileHeader", {}).get("currencyCode", "EUR")
+    full_width = ((1, SUMMARY_COLUMNS),)
+
+    yield LayoutRow(((1, t["batch_summary"], TITLE_STYLE),), full_width, 30)
+    info_text = (
+        f"{t['invoices_count']}: {len(invoices)}    |    {t['currency']}: {currency}"
+        f"    |    Facturae: {data.get('version', '')}"
+    )
+    yield LayoutRow(((1, info_text, INFO_STYLE),), full_width, 22)
+    yield LayoutRow()
+
+    headers = [
+        t["invoice_number"], t["date"], t["buyer_name"], f"{t['total']} ({currency})", t["sheet"]
+    ]
+    yield LayoutRow(tuple(
+        (col, header, TABLE_HEADER_STYLE) for col, header in enumerate(headers, start=1)
+    ))
+
+    file_buyer = data.get("buyer", {})
+    for invoice, sheet_name in zip(invoices, sheet_names):
+        series = invoice.get("series", "")
+        number = f"{series}{series and '/' or ''}{invoice.get('number', '')}"
+        yield LayoutRow((
+            (1, number, LINE_TEXT_STYLE),
+            (2, invoice.get("issueDate", ""), LINE_CENTER_STYLE),
+            (3, (invoice.get("buyer") or file_buyer).get("name", ""), LINE_TEXT_STYLE),
+            (4, _invoice_total(invoice), LINE_NUMBER_STYLE),
+            (5, sheet_name, LINE_TEXT_STYLE),
+        ))
+    yield LayoutRow()
+
+    yield LayoutRow((
+        (1, t["total"], TOTAL_LABEL_STYLE),
+        (2, None, TOTAL_FILL_STYLE),
+        (3, None, TOTAL_FILL_STYLE),
+        (4, round(sum(_invoice_total(invoice) for invoice in invoices), 2), TOTAL_AMOUNT_STYLE),
+        (5, None, TOTAL_FILL_STYLE),
+    ), ((1, 3),))
+
+
+def assemble_batch_workbook(
+    data: dict[str, Any],
+    lang: str,
+    sheet_names: list[str],
+    sheets: list[RenderedSheet],
+    output: BinaryIO,
+) -> None:
+    """
+    Escribe en output el libro final: la hoja de resumen y, tras ella, las
+    hojas ya renderizadas (render_invoice_sheet) con los nombres de
+    sheet_names.
+
+    Raises:
+        ExcelStyleError: si alguna hoja se renderizó con otra tabla de estilos
+    """
+    t = TRANSLATIONS.get(lang, TRANSLATIONS["es"])
+    with stage("build"):
+        wb = Workbook()
+        ws = wb.active
+        ws.title = t["summary_sheet"]
+        widths = ColumnWidths(SUMMARY_MIN_WIDTHS)
+        fill_sheet(ws, _summary_layout(data, lang, sheet_names), widths, StyleCache(ws))
+        widths.apply(ws)
+        # Hojas vacías cuyo XML se sustituye después
+        for name in sheet_names:
+            wb.create_sheet(name)
+
+    signature = style_signature(wb)
+    for name, sheet in zip(sheet_names, sheets):
+        if sheet.styles != signature:
+            raise ExcelStyleError(
+                f"La hoja «{name}» usa una tabla de estilos distinta de la del libro"
+            )
+
+    with stage("save"):
+        skeleton = BytesIO()
+        wb.save(skeleton)
+
+    with stage("merge"):
+        replacements = {SHEET_PART.format(i): sheet.xml for i, sheet in enumerate(sheets, start=2)}
+        with zipfile.ZipFile(skeleton) as source, \
+                zipfile.ZipFile(output, "w", zipfile.ZIP_DEFLATED) as target:
+            for info in source.infolist():
+                target.writestr(info, replacements.get(info.filename) or source.read(info.filename))
+
+
+def write_batch_workbook(
+    data: dict[str, Any], lang: str, sheet_names: list[str], sheets: list[RenderedSheet]
+) -> str:
+    """
+    Como assemble_batch_workbook, pero deja el libro en un archivo temporal
+    en disco y devuelve su ruta: se ejecuta en los workers y así el libro
+    no vuelve al proceso principal como un bytes. Quien recibe la ruta debe
+    borrar el archivo.
+    """
+    with tempfile.NamedTemporaryFile(
+        prefix="facturaview-batch-",
+        suffix=".xlsx",
+        dir=config.UPLOAD_SPOOL_DIR or None,
+        delete=False,
+    ) as output:
+        try:
+            assemble_batch_workbook(data, lang, sheet_names, sheets, output)
+        except BaseException:
+            output.close()
+            os.unlink(output.name)
+            raise
+    return output.name
+
+
+def generate_batch_excel(data: dict[str, Any], lang: str = "es") -> bytes:
+    """Libro del lote completo renderizando las hojas en serie (sin pool)"""
+    invoices = data["invoices"]
+    summary_sheet = TRANSLATIONS.get(lang, TRANSLATIONS["es"])["summary_sheet"]
+    names = unique_sheet_names(invoices, reserved=(summary_sheet,))
+    sheets = [render_invoice_sheet(data, index, lang) for index in range(len(invoices))]
+    output = BytesIO()
+    assemble_batch_workbook(data, lang, names, sheets, output)
+    return output.getvalue()
@@ -2,13 +2,39 @@
 Generador de Excel con diseño mejorado usando openpyxl
 """
 
+import importlib.util
+import tempfile
+import threading
+import zipfile
+from copy import copy
+from dataclasses import dataclass
+from datetime import datetime, timezone
 from io import BytesIO
-from typing import Any
+from typing import Any, BinaryIO, Iterable, Iterator, NamedTuple, Optional
 
 from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
 from openpyxl.styles import Font, PatternFill, Border, Side, Alignment
 from openpyxl.utils import get_column_letter
-from openpyxl.worksheet.worksheet import Worksheet
+from openpyxl.utils.indexed_list import IndexedList
+from openpyxl.worksheet._writer import WorksheetWriter
+from openpyxl.worksheet.cell_range import CellRange
+from openpyxl.xml.functions import tostring
+
+from .. import config
+from .metrics import stage
+
+
+class ExcelLimitError(ValueError):
+    """Los datos no caben en los límites de un archivo de Excel"""
+
+
+class ExcelEngineError(ValueError):
+    """Motor de Excel desconocido o no instalado"""
+
+
+# Motores de Excel: openpyxl (referencia) y XlsxWriter (opcional, más rápido)
+EXCEL_ENGINES = ("openpyxl", "xlsxwriter")
 
 
 # Estilos
@@ -36,12 +62,28 @@ WRAP_ALIGN = Alignment(horizontal="left", vertical="center", wrap_text=True)
 WRAP_CENTER_ALIGN = Alignment(horizontal="center", vertical="center", wrap_text=True)
 WRAP_RIGHT_ALIGN = Alignment(horizontal="right", vertical="center", wrap_text=True)
 
+# Límites de Excel
+EXCEL_MAX_ROWS = 1_048_576
+
 # Anchos mínimos y máximos de columna
 MIN_COL_WIDTH = 8
 MAX_COL_WIDTH = 50
+# Anchos mínimos específicos por columna (para labels y descripciones)
+MIN_COL_WIDTH_BY_COLUMN = {
+    1: 16,  # Columna de labels (Nombre, Dirección, etc.)
+    2: 35,  # Columna de valores/descripciones
+    4: 14,  # Columna de labels receptor
+    5: 30,  # Columna de valores receptor
+}
 
 
-def generate_excel(data: dict[str, Any], invoice_index: int = 0, lang: str = "es") -> bytes:
+def generate_excel(
+    data: dict[str, Any],
+    invoice_index: int = 0,
+    lang: str = "es",
+    write_only: Optional[bool] = None,
+    engine: Optional[str] = None,
+) -> bytes:
     """
     Genera un archivo Excel con diseño profesional para una factura.
 
@@ -49,10 +91,214 @@ def generate_excel(data: dict[str, Any], invoice_index: int = 0, lang: str = "es
         data: Datos parseados de la factura (formato del parser frontend)
         invoice_index: Índice de la factura (para lotes)
         lang: Idioma ('es' o 'en')
+        write_only: escribir la hoja en streaming; por defecto, solo si la
+            factura tiene al menos EXCEL_WRITE_ONLY_LINES líneas
+        engine: "openpyxl" o "xlsxwriter" (por defecto, EXCEL_ENGINE)
 
     Returns:
         Contenido del archivo Excel como bytes
     """
+    output = BytesIO()
+    render_excel(data, invoice_index, lang, output, write_only, engine)
+    return output.getvalue()
+
+
+def write_excel(
+    data: dict[str, Any],
+    invoice_index: int = 0,
+    lang: str = "es",
+    write_only: Optional[bool] = None,
+    engine: Optional[str] = None,
+) -> BinaryIO:
+    """
+    Como generate_excel, pero deja el libro en un archivo temporal (en
+    memoria hasta EXCEL_SPOOL_THRESHOLD bytes; por encima, en disco)
+    posicionado al principio, para enviarlo por trozos sin copiarlo entero
+    a un bytes. Quien lo recibe debe cerrarlo.
+    """
+    output = tempfile.SpooledTemporaryFile(
+        max_size=config.EXCEL_SPOOL_THRESHOLD, dir=config.UPLOAD_SPOOL_DIR or None
+    )
+    try:
+        render_excel(data, invoice_index, lang, output, write_only, engine)
+    except BaseException:
+        output.close()
+        raise
+    output.seek(0)
+    return output
+
+
+def render_excel(
+    data: dict[str, Any],
+    invoice_index: int,
+    lang: str,
+    output: BinaryIO,
+    write_only: Optional[bool] = None,
+    engine: Optional[str] = None,
+) -> None:
+    """
+    Escribe el .xlsx de la factura en output con el motor indicado
+
+    Raises:
+        ExcelEngineError: si el motor no existe o no está instalado
+        ExcelLimitError: si la factura no cabe en una hoja de Excel
+    """
+    if resolve_engine(engine) == "xlsxwriter":
+        # Importación diferida: el motor de XlsxWriter usa este módulo
+        from .excel_xlsxwriter import render_xlsxwriter
+
+        render_xlsxwriter(data, invoice_index, lang, output, write_only)
+        return
+
+    wb = build_invoice_workbook(data, invoice_index, lang, write_only)
+
+    # Guardar (en modo write-only, aquí se escriben las filas)
+    with stage("save"):
+        save_workbook(wb, output, lang)
+
+
+def resolve_engine(engine: Optional[str] = None) -> str:
+    """
+    Nombre del motor a usar (engine o, si no se indica, EXCEL_ENGINE)
+
+    Raises:
+        ExcelEngineError: si el motor no existe o no está instalado
+    """
+    name = (engine or config.EXCEL_ENGINE).lower()
+    if name not in EXCEL_ENGINES:
+        available = ", ".join(EXCEL_ENGINES)
+        raise ExcelEngineError(f"Motor de Excel desconocido: {name} (disponibles: {available})")
+    if not engine_available(name):
+        raise ExcelEngineError(f"El motor de Excel {name} no está instalado")
+    return name
+
+
+def engine_available(name: str) -> bool:
+    """El motor está instalado (openpyxl siempre lo está)"""
+    return name == "openpyxl" or importlib.util.find_spec(name) is not None
+
+
+def build_invoice_workbook(
+    data: dict[str, Any],
+    invoice_index: int = 0,
+    lang: str = "es",
+    write_only: Optional[bool] = None,
+) -> Workbook:
+    """
+    Libro con la hoja de una factura, listo para guardar (ver generate_excel)
+
+    Raises:
+        ExcelLimitError: si la factura no cabe en una hoja de Excel
+    """
+    invoice = data["invoices"][invoice_index]
+    check_sheet_rows(invoice)
+    if write_only is None:
+        write_only = len(invoice.get("lines", [])) >= config.EXCEL_WRITE_ONLY_LINES
+
+    widths = ColumnWidths()
+    if write_only:
+        # Los anchos se escriben antes que las filas: pasada previa sobre la
+        # maquetación, sin crear celdas
+        with stage("auto_fit"):
+            for layout_row in invoice_layout(data, invoice_index, lang):
+                widths.add_row(layout_row)
+        with stage("build"):
+            return _build_write_only_workbook(data, invoice_index, lang, widths)
+
+    with stage("build"):
+        wb = _build_workbook(data, invoice_index, lang, widths)
+
+    # Aplicar los anchos acumulados al escribir las celdas
+    with stage("auto_fit"):
+        widths.apply(wb.active)
+    return wb
+
+
+def check_sheet_rows(invoice: dict[str, Any]) -> None:
+    """
+    Raises:
+        ExcelLimitError: si las filas de la factura superan EXCEL_MAX_ROWS
+    """
+    rows = len(invoice.get("lines", [])) + len(invoice.get("taxes", [])) + FIXED_ROWS
+    if rows > EXCEL_MAX_ROWS:
+        raise ExcelLimitError(
+            f"La factura {invoice.get('number', '')} no cabe en una hoja de Excel "
+            f"({rows} filas, máx {EXCEL_MAX_ROWS})"
+        )
+
+
+# === MAQUETACIÓN ===
+# La hoja se describe como una secuencia de filas (LayoutRow) que luego
+# escribe el motor normal de openpyxl o el de streaming (write-only); así
+# ambos producen la misma hoja.
+
+
+@dataclass(frozen=True, eq=False)
+class CellStyle:
+    """Formato de una celda (se compara por identidad: son constantes)"""
+
+    font: Optional[Font] = None
+    fill: Optional[PatternFill] = None
+    border: Optional[Border] = None
+    alignment: Optional[Alignment] = None
+    number_format: Optional[str] = None
+
+
+TITLE_STYLE = CellStyle(font=WHITE_FONT, fill=BLUE_FILL, alignment=CENTER_ALIGN)
+INFO_STYLE = CellStyle(fill=LIGHT_GRAY_FILL, alignment=CENTER_ALIGN)
+SECTION_STYLE = CellStyle(font=TITLE_FONT, fill=GRAY_FILL, alignment=CENTER_ALIGN)
+LABEL_STYLE = CellStyle(font=BOLD_FONT, alignment=WRAP_ALIGN)
+VALUE_STYLE = CellStyle(alignment=WRAP_ALIGN)
+TABLE_HEADER_STYLE = CellStyle(
+    font=HEADER_FONT, fill=LIGHT_GRAY_FILL, border=THIN_BORDER, alignment=CENTER_ALIGN
+)
+LINE_CENTER_STYLE = CellStyle(border=THIN_BORDER, alignment=CENTER_ALIGN)
+LINE_TEXT_STYLE = CellStyle(border=THIN_BORDER, alignment=WRAP_ALIGN)
+LINE_NUMBER_STYLE = CellStyle(border=THIN_BORDER, alignment=RIGHT_ALIGN, number_format="#,##0.00")
+AMOUNT_STYLE = CellStyle(alignment=RIGHT_ALIGN)
+TOTAL_LABEL_STYLE = CellStyle(font=TOTAL_FONT, fill=LIGHT_GRAY_FILL)
+TOTAL_VALUE_STYLE = CellStyle(font=TOTAL_FONT, fill=LIGHT_GRAY_FILL, alignment=RIGHT_ALIGN)
+TOTAL_FILL_STYLE = CellStyle(fill=LIGHT_GRAY_FILL)
+TOTAL_AMOUNT_STYLE = CellStyle(
+    font=TOTAL_FONT, fill=LIGHT_GRAY_FILL, alignment=RIGHT_ALIGN, number_format="#,##0.00"
+)
+
+# Número de columnas de la hoja
+SHEET_COLUMNS = 6
+# Filas de la hoja además de las líneas y los impuestos (cabeceras, totales, pago)
+FIXED_ROWS = 25
+
+# Todos los estilos, en el orden en que se registran en cada libro: así
+# cualquier libro generado asigna los mismos índices de estilo y las hojas
+# renderizadas por separado se pueden combinar en un mismo archivo
+CELL_STYLES = (
+    TITLE_STYLE,
+    INFO_STYLE,
+    SECTION_STYLE,
+    LABEL_STYLE,
+    VALUE_STYLE,
+    TABLE_HEADER_STYLE,
+    LINE_CENTER_STYLE,
+    LINE_TEXT_STYLE,
+    LINE_NUMBER_STYLE,
+    AMOUNT_STYLE,
+    TOTAL_LABEL_STYLE,
+    TOTAL_VALUE_STYLE,
+    TOTAL_FILL_STYLE,
+    TOTAL_AMOUNT_STYLE,
+)
+
+
+class LayoutRow(NamedTuple):
+    """Una fila de la hoja: celdas (columna, valor, estilo), rangos combinados y alto"""
+
+    cells: tuple[tuple[int, Any, Optional[CellStyle]], ...] = ()
+    merges: tuple[tuple[int, int], ...] = ()
+    height: Optional[float] = None
+
+
+def invoice_layout(data: dict[str, Any], invoice_index: int, lang: str) -> Iterator[LayoutRow]:
+    """Filas de la hoja de una factura, de arriba abajo"""
     # Traducciones
     t = TRANSLATIONS.get(lang, TRANSLATIONS["es"])
 
@@ -60,202 +306,370 @@ def generate_excel(data: dict[str, Any], invoice_index: int = 0, lang: str = "es
     seller = data.get("seller", {})
     buyer = data.get("buyer", {})
     currency = data.get("fileHeader", {}).get("currencyCode", "EUR")
-
-    wb = Workbook()
-    ws = wb.active
-    ws.title = t["sheet_name"]
-
-    row = 1
+    full_width = ((1, SHEET_COLUMNS),)
 
     # === TÍTULO ===
     invoice_number = f"{invoice.get('series', '')}{invoice.get('series') and '/' or ''}{invoice.get('number', '')}"
-    ws.merge_cells(start_row=row, start_column=1, end_row=row, end_column=6)
-    title_cell = ws.cell(row=row, column=1, value=f"{t['invoice']} {invoice_number}")
-    title_cell.font = WHITE_FONT
-    title_cell.fill = BLUE_FILL
-    title_cell.alignment = CENTER_ALIGN
-    ws.row_dimensions[row].height = 30
-    row += 1
+    yield LayoutRow(((1, f"{t['invoice']} {invoice_number}", TITLE_STYLE),), full_width, 30)
 
     # === DATOS BÁSICOS ===
-    ws.merge_cells(start_row=row, start_column=1, end_row=row, end_column=6)
     info_text = f"{t['date']}: {invoice.get('issueDate', '')}    |    {t['currency']}: {currency}    |    Facturae: {data.get('version', '')}"
-    info_cell = ws.cell(row=row, column=1, value=info_text)
-    info_cell.fill = LIGHT_GRAY_FILL
-    info_cell.alignment = CENTER_ALIGN
-    ws.row_dimensions[row].height = 22
-    row += 2
+    yield LayoutRow(((1, info_text, INFO_STYLE),), full_width, 22)
+    yield LayoutRow()
 
     # === EMISOR Y RECEPTOR ===
-    # Headers
-    ws.merge_cells(start_row=row, start_column=1, end_row=row, end_column=3)
-    ws.merge_cells(start_row=row, start_column=4, end_row=row, end_column=6)
-    seller_header = ws.cell(row=row, column=1, value=t["seller"])
-    buyer_header = ws.cell(row=row, column=4, value=t["buyer"])
-    for cell in [seller_header, buyer_header]:
-        cell.font = TITLE_FONT
-        cell.fill = GRAY_FILL
-        cell.alignment = CENTER_ALIGN
-    row += 1
-
-    # Datos emisor/receptor
+    yield LayoutRow(
+        ((1, t["seller"], SECTION_STYLE), (4, t["buyer"], SECTION_STYLE)), ((1, 3), (4, 6))
+    )
+
     party_data = [
         (t["name"], seller.get("name", ""), buyer.get("name", "")),
         (t["tax_id"], seller.get("taxId", ""), buyer.get("taxId", "")),
         (t["address"], _format_address(seller.get("address")), _format_address(buyer.get("address"))),
     ]
-
     for label, seller_val, buyer_val in party_data:
-        label_cell1 = ws.cell(row=row, column=1, value=label)
-        label_cell1.font = BOLD_FONT
-        label_cell1.alignment = WRAP_ALIGN
-        ws.merge_cells(start_row=row, start_column=2, end_row=row, end_column=3)
-        value_cell1 = ws.cell(row=row, column=2, value=seller_val)
-        value_cell1.alignment = WRAP_ALIGN
-        label_cell2 = ws.cell(row=row, column=4, value=label)
-        label_cell2.font = BOLD_FONT
-        label_cell2.alignment = WRAP_ALIGN
-        ws.merge_cells(start_row=row, start_column=5, end_row=row, end_column=6)
-        value_cell2 = ws.cell(row=row, column=5, value=buyer_val)
-        value_cell2.alignment = WRAP_ALIGN
-        row += 1
-
-    row += 1
+        yield LayoutRow(
+            (
+                (1, label, LABEL_STYLE),
+                (2, seller_val, VALUE_STYLE),
+                (4, label, LABEL_STYLE),
+                (5, buyer_val, VALUE_STYLE),
+            ),
+            ((2, 3), (5, 6)),
+        )
+    yield LayoutRow()
 
     # === LÍNEAS DE DETALLE ===
-    ws.merge_cells(start_row=row, start_column=1, end_row=row, end_column=6)
-    lines_header = ws.cell(row=row, column=1, value=t["lines"])
-    lines_header.font = TITLE_FONT
-    lines_header.fill = GRAY_FILL
-    lines_header.alignment = CENTER_ALIGN
-    row += 1
+    yield LayoutRow(((1, t["lines"], SECTION_STYLE),), full_width)
 
     # Cabecera tabla
     line_headers = [t["line_num"], t["description"], t["quantity"], t["unit_price"], t["vat"], t["amount"]]
-
-    for col, header in enumerate(line_headers, start=1):
-        cell = ws.cell(row=row, column=col, value=header)
-        cell.font = HEADER_FONT
-        cell.fill = LIGHT_GRAY_FILL
-        cell.border = THIN_BORDER
-        cell.alignment = CENTER_ALIGN
-    row += 1
+    yield LayoutRow(tuple(
+        (col, header, TABLE_HEADER_STYLE) for col, header in enumerate(line_headers, start=1)
+    ))
 
     # Filas de líneas
-    lines = invoice.get("lines", [])
-    for idx, line in enumerate(lines, start=1):
-        ws.cell(row=row, column=1, value=idx).alignment = CENTER_ALIGN
-        desc_cell = ws.cell(row=row, column=2, value=line.get("description", ""))
-        desc_cell.alignment = WRAP_ALIGN
-        ws.cell(row=row, column=3, value=line.get("quantity", 0)).alignment = RIGHT_ALIGN
-        ws.cell(row=row, column=4, value=line.get("unitPrice", 0)).alignment = RIGHT_ALIGN
-        ws.cell(row=row, column=5, value=f"{line.get('taxRate', 0)}%").alignment = CENTER_ALIGN
-        ws.cell(row=row, column=6, value=line.get("grossAmount") or line.get("totalAmount", 0)).alignment = RIGHT_ALIGN
-
-        # Aplicar bordes
-        for col in range(1, 7):
-            ws.cell(row=row, column=col).border = THIN_BORDER
-
-        # Formato número para columnas numéricas
-        ws.cell(row=row, column=3).number_format = "#,##0.00"
-        ws.cell(row=row, column=4).number_format = "#,##0.00"
-        ws.cell(row=row, column=6).number_format = "#,##0.00"
-        row += 1
-
-    row += 1
+    for idx, line in enumerate(invoice.get("lines", []), start=1):
+        yield LayoutRow((
+            (1, idx, LINE_CENTER_STYLE),
+            (2, line.get("description", ""), LINE_TEXT_STYLE),
+            (3, line.get("quantity", 0), LINE_NUMBER_STYLE),
+            (4, line.get("unitPrice", 0), LINE_NUMBER_STYLE),
+            (5, f"{line.get('taxRate', 0)}%", LINE_CENTER_STYLE),
+            (6, line.get("grossAmount") or line.get("totalAmount", 0), LINE_NUMBER_STYLE),
+        ))
+    yield LayoutRow()
 
     # === IMPUESTOS Y TOTALES ===
-    ws.merge_cells(start_row=row, start_column=1, end_row=row, end_column=6)
-    totals_header = ws.cell(row=row, column=1, value=t["totals"])
-    totals_header.font = TITLE_FONT
-    totals_header.fill = GRAY_FILL
-    totals_header.alignment = CENTER_ALIGN
-    row += 1
+    yield LayoutRow(((1, t["totals"], SECTION_STYLE),), full_width)
 
     totals = invoice.get("totals", {})
-    taxes = invoice.get("taxes", [])
+    split = ((1, 4), (5, 6))
 
     # Desglose de impuestos
-    for tax in taxes:
+    for tax in invoice.get("taxes", []):
         tax_type = _get_tax_type_label(tax.get("type", ""), lang)
         tax_label = f"{tax_type} {tax.get('rate', 0)}%"
-        ws.merge_cells(start_row=row, start_column=1, end_row=row, end_column=4)
-        ws.cell(row=row, column=1, value=f"  {t['tax_base']}: {_format_currency(tax.get('base', 0), currency)}")
-        ws.merge_cells(start_row=row, start_column=5, end_row=row, end_column=6)
-        ws.cell(row=row, column=5, value=f"{tax_label}: {_format_currency(tax.get('amount', 0), currency)}").alignment = RIGHT_ALIGN
-        row += 1
+        yield LayoutRow((
+            (1, f"  {t['tax_base']}: {_format_currency(tax.get('base', 0), currency)}", None),
+            (5, f"{tax_label}: {_format_currency(tax.get('amount', 0), currency)}", AMOUNT_STYLE),
+        ), split)
 
     # Retenciones
     if totals.get("taxesWithheld", 0) != 0:
-        ws.merge_cells(start_row=row, start_column=1, end_row=row, end_column=4)
-        ws.cell(row=row, column=1, value=f"  {t['withholdings']}")
-        ws.merge_cells(start_row=row, start_column=5, end_row=row, end_column=6)
-        ws.cell(row=row, column=5, value=_format_currency(-abs(totals.get("taxesWithheld", 0)), currency)).alignment = RIGHT_ALIGN
-        row += 1
-
-    row += 1
-
-    # Total a pagar
-    ws.merge_cells(start_row=row, start_column=1, end_row=row, end_column=4)
-    total_label = ws.cell(row=row, column=1, value=t["total_to_pay"])
-    total_label.font = TOTAL_FONT
-    ws.merge_cells(start_row=row, start_column=5, end_row=row, end_column=6)
-    total_value = ws.cell(row=row, column=5, value=_format_currency(totals.get("totalToPay", 0), currency))
-    total_value.font = TOTAL_FONT
-    total_value.alignment = RIGHT_ALIGN
-    for col in range(1, 7):
-        ws.cell(row=row, column=col).fill = LIGHT_GRAY_FILL
-    row += 2
+        yield LayoutRow((
+            (1, f"  {t['withholdings']}", None),
+            (5, _format_currency(-abs(totals.get("taxesWithheld", 0)), currency), AMOUNT_STYLE),
+        ), split)
+    yield LayoutRow()
+
+    # Total a pagar (el fondo cubre también las celdas combinadas)
+    yield LayoutRow((
+        (1, t["total_to_pay"], TOTAL_LABEL_STYLE),
+        (2, None, TOTAL_FILL_STYLE),
+        (3, None, TOTAL_FILL_STYLE),
+        (4, None, TOTAL_FILL_STYLE),
+        (5, _format_currency(totals.get("totalToPay", 0), currency), TOTAL_VALUE_STYLE),
+        (6, None, TOTAL_FILL_STYLE),
+    ), split)
+    yield LayoutRow()
 
     # === INFORMACIÓN DE PAGO ===
     payment = invoice.get("payment", {})
     if payment:
-        ws.merge_cells(start_row=row, start_column=1, end_row=row, end_column=6)
-        payment_header = ws.cell(row=row, column=1, value=t["payment"])
-        payment_header.font = TITLE_FONT
-        payment_header.fill = GRAY_FILL
-        payment_header.alignment = CENTER_ALIGN
-        row += 1
-
-        if payment.get("paymentMeans"):
-            label_cell = ws.cell(row=row, column=1, value=t["payment_method"])
-            label_cell.font = BOLD_FONT
-            label_cell.alignment = WRAP_ALIGN
-            ws.merge_cells(start_row=row, start_column=2, end_row=row, end_column=6)
-            ws.cell(row=row, column=2, value=_get_payment_means_label(payment.get("paymentMeans"), lang))
-            row += 1
-
-        if payment.get("dueDate"):
-            label_cell = ws.cell(row=row, column=1, value=t["due_date"])
-            label_cell.font = BOLD_FONT
-            label_cell.alignment = WRAP_ALIGN
-            ws.merge_cells(start_row=row, start_column=2, end_row=row, end_column=6)
-            ws.cell(row=row, column=2, value=payment.get("dueDate"))
-            row += 1
-
-        if payment.get("iban"):
-            label_cell = ws.cell(row=row, column=1, value="IBAN")
-            label_cell.font = BOLD_FONT
-            label_cell.alignment = WRAP_ALIGN
-            ws.merge_cells(start_row=row, start_column=2, end_row=row, end_column=6)
-            ws.cell(row=row, column=2, value=payment.get("iban"))
-            row += 1
-
-        if payment.get("bic"):
-            label_cell = ws.cell(row=row, column=1, value="BIC")
-            label_cell.font = BOLD_FONT
-            label_cell.alignment = WRAP_ALIGN
-            ws.merge_cells(start_row=row, start_column=2, end_row=row, end_column=6)
-            ws.cell(row=row, column=2, value=payment.get("bic"))
-
-    # Auto-ajustar anchos de columna
-    _auto_fit_columns(ws)
-
-    # Guardar a bytes
-    output = BytesIO()
-    wb.save(output)
-    output.seek(0)
-    return output.getvalue()
+        yield LayoutRow(((1, t["payment"], SECTION_STYLE),), full_width)
+
+        payment_rows = [
+            (
+                t["payment_method"],
+                payment.get("paymentMeans")
+                and _get_payment_means_label(payment.get("paymentMeans"), lang),
+            ),
+            (t["due_date"], payment.get("dueDate")),
+            ("IBAN", payment.get("iban")),
+            ("BIC", payment.get("bic")),
+        ]
+        for label, value in payment_rows:
+            if value:
+                yield LayoutRow(((1, label, LABEL_STYLE), (2, value, None)), ((2, 6),))
+
+
+class ColumnWidths:
+    """
+    Ancho necesario por columna, acumulado según se escriben las celdas.
+
+    Cada valor ocupa su línea más larga más 2 de margen (un 10 % más en
+    negrita); al aplicarlos, se acotan a MAX_COL_WIDTH y a los mínimos de
+    MIN_COL_WIDTH_BY_COLUMN (o MIN_COL_WIDTH). Las columnas sin ningún
+    valor conservan el ancho por defecto.
+    """
+
+    def __init__(self, min_widths: Optional[dict[int, float]] = None):
+        self._widths: dict[int, float] = {}
+        self._min_widths = MIN_COL_WIDTH_BY_COLUMN if min_widths is None else min_widths
+
+    def add(self, col_idx: int, value: Any, style: Optional[CellStyle] = None) -> None:
+        if value is None:
+            return
+        text = value if isinstance(value, str) else str(value)
+        # Considerar saltos de línea (tomar la línea más larga)
+        length = max(len(line) for line in text.split("\n")) if "\n" in text else len(text)
+        width = length + 2
+        if style is not None and style.font is not None and style.font.bold:
+            width *= 1.1  # Las negritas ocupan más espacio
+        current = self._widths.get(col_idx, MIN_COL_WIDTH)
+        if width > current:
+            current = width
+        self._widths[col_idx] = current
+
+    def add_row(self, layout_row: LayoutRow) -> None:
+        for col_idx, value, style in layout_row.cells:
+            self.add(col_idx, value, style)
+
+    def final(self) -> dict[int, float]:
+        """Anchos con los límites aplicados"""
+        return {
+            col_idx: max(self._min_widths.get(col_idx, MIN_COL_WIDTH), min(MAX_COL_WIDTH, width))
+            for col_idx, width in self._widths.items()
+        }
+
+    def apply(self, ws: Any) -> None:
+        """Fija los anchos en la hoja (normal o write-only, antes de sus filas)"""
+        for col_idx, width in self.final().items():
+            ws.column_dimensions[get_column_letter(col_idx)].width = width
+
+
+class StyleCache:
+    """
+    Registra los estilos en el libro de ws, siempre en el orden de
+    CELL_STYLES, y los aplica a las celdas copiando el StyleArray ya
+    registrado (índices a las tablas de fuentes, rellenos, bordes... del
+    libro) en vez de formatear atributo a atributo.
+
+    Usa internos de openpyxl (_style, _cell_styles), como WorkbookTemplate:
+    por eso pyproject fija openpyxl <3.2, y el test de ida y vuelta con
+    load_workbook comprueba cada formato contra la API pública.
+    """
+
+    def __init__(self, ws: Any):
+        self._arrays: dict[CellStyle, Any] = {}
+        for style in CELL_STYLES:
+            cell = WriteOnlyCell(ws)
+            if style.font is not None:
+                cell.font = style.font
+            if style.fill is not None:
+                cell.fill = style.fill
+            if style.border is not None:
+                cell.border = style.border
+            if style.alignment is not None:
+                cell.alignment = style.alignment
+            if style.number_format is not None:
+                cell.number_format = style.number_format
+            # Formato de celda completo (cellXfs): fija su índice en el libro
+            ws.parent._cell_styles.add(cell._style)
+            self._arrays[style] = cell._style
+
+    def apply(self, cell: Any, style: CellStyle) -> None:
+        cell._style = copy(self._arrays[style])
+
+
+def fill_sheet(
+    ws: Any, rows: Iterable[LayoutRow], widths: ColumnWidths, styles: StyleCache
+) -> None:
+    """Escribe las filas en una hoja normal, acumulando en widths sus anchos"""
+    for row, layout_row in enumerate(rows, start=1):
+        # Se registra solo el rango: ws.merge_cells crearía además una
+        # MergedCell por celda cubierta, que no aporta nada a la hoja
+        for start, end in layout_row.merges:
+            ws.merged_cells.add(CellRange(min_col=start, min_row=row, max_col=end, max_row=row))
+        for col, value, style in layout_row.cells:
+            cell = ws.cell(row=row, column=col, value=value)
+            if style is not None:
+                styles.apply(cell, style)
+            widths.add(col, value, style)
+        if layout_row.height is not None:
+            ws.row_dimensions[row].height = layout_row.height
+
+
+def _build_workbook(
+    data: dict[str, Any], invoice_index: int, lang: str, widths: ColumnWidths
+) -> Workbook:
+    """
+    Construye la hoja de la factura, acumulando en widths el ancho de cada
+    celda escrita (sin aplicar los anchos ni serializar)
+    """
+    template = get_workbook_template(lang)
+    wb = template.new_workbook()
+    fill_sheet(wb.active, invoice_layout(data, invoice_index, lang), widths, template.styles)
+    return wb
+
+
+def _build_write_only_workbook(
+    data: dict[str, Any], invoice_index: int, lang: str, widths: ColumnWidths
+) -> Workbook:
+    """
+    Construye la hoja en modo write-only: las filas se serializan al
+    guardar, una a una, sin crear un objeto Cell persistente por valor. La
+    memoria no crece con el número de líneas más allá de los datos de entrada.
+
+    Los anchos de columna tienen que escribirse antes que las filas: widths
+    ya debe contener toda la maquetación.
+    """
+    t = TRANSLATIONS.get(lang, TRANSLATIONS["es"])
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet(t["sheet_name"])
+    styles = StyleCache(ws)
+
+    widths.apply(ws)
+
+    def rows() -> Iterator[list]:
+        for row, layout_row in enumerate(invoice_layout(data, invoice_index, lang), start=1):
+            for start, end in layout_row.merges:
+                ws.merged_cells.add(CellRange(min_col=start, min_row=row, max_col=end, max_row=row))
+            if layout_row.height is not None:
+                ws.row_dimensions[row].height = layout_row.height
+            cells: list = [None] * SHEET_COLUMNS
+            for col, value, style in layout_row.cells:
+                cell = WriteOnlyCell(ws, value)
+                if style is not None:
+                    styles.apply(cell, style)
+                cells[col - 1] = cell
+            yield cells
+
+    for cells in rows():
+        ws.append(cells)
+    return wb
+
+
+# === PLANTILLAS POR IDIOMA ===
+# Todo lo que no depende de la factura se prepara una vez por idioma: las
+# tablas de estilos del libro y las partes fijas del .xlsx (estilos, tema,
+# workbook.xml, relaciones...). Cada exportación solo escribe su hoja.
+
+# Partes del .xlsx que cambian en cada exportación
+SHEET_PART = "xl/worksheets/sheet1.xml"
+CORE_PART = "docProps/core.xml"
+
+# Tablas de estilos del libro que rellena StyleCache
+STYLE_TABLES = (
+    "_fonts",
+    "_fills",
+    "_borders",
+    "_alignments",
+    "_number_formats",
+    "_protections",
+    "_cell_styles",
+)
+
+
+class WorkbookTemplate:
+    """
+    Libro vacío de un idioma con los estilos de CELL_STYLES registrados.
+
+    new_workbook() da un libro nuevo con copias de sus tablas de estilos
+    (sin volver a registrarlos) y save() lo guarda reutilizando las partes
+    ya serializadas: solo se escriben la hoja y las propiedades del
+    documento (fechas de creación y modificación).
+    """
+
+    def __init__(self, lang: str):
+        self.sheet_name = TRANSLATIONS[lang]["sheet_name"]
+        wb = Workbook()
+        wb.active.title = self.sheet_name
+        self.styles = StyleCache(wb.active)
+        self._style_tables = {name: list(getattr(wb, name)) for name in STYLE_TABLES}
+
+        output = BytesIO()
+        wb.save(output)
+        with zipfile.ZipFile(output) as archive:
+            self._parts = [(name, archive.read(name)) for name in archive.namelist()]
+
+    def new_workbook(self) -> Workbook:
+        wb = Workbook()
+        wb.active.title = self.sheet_name
+        for name, table in self._style_tables.items():
+            setattr(wb, name, IndexedList(table))
+        return wb
+
+    def matches(self, wb: Workbook) -> bool:
+        """El libro solo usa los estilos de la plantilla (sus partes fijas le valen)"""
+        return (
+            not wb.write_only
+            and len(wb.worksheets) == 1
+            and wb.active.title == self.sheet_name
+            and all(
+                len(getattr(wb, name)) == len(table)
+                for name, table in self._style_tables.items()
+            )
+        )
+
+    def sheet_xml(self, wb: Workbook) -> bytes:
+        """XML de la hoja del libro (la parte SHEET_PART)"""
+        writer = WorksheetWriter(wb.active, BytesIO())
+        writer.write()
+        return writer.read()
+
+    def save(self, wb: Workbook, output: BinaryIO) -> None:
+        # Como save_workbook de openpyxl: fecha de modificación en UTC sin zona
+        wb.properties.modified = datetime.now(tz=timezone.utc).replace(tzinfo=None)
+        changed = {SHEET_PART: self.sheet_xml(wb), CORE_PART: tostring(wb.properties.to_tree())}
+        with zipfile.ZipFile(output, "w", zipfile.ZIP_DEFLATED) as archive:
+            for name, content in self._parts:
+                archive.writestr(name, changed.get(name, content))
+
+
+_templates: dict[str, WorkbookTemplate] = {}
+_templates_lock = threading.Lock()
+
+
+def get_workbook_template(lang: str) -> WorkbookTemplate:
+    """Plantilla del idioma (la de español si no hay traducciones para lang)"""
+    lang = lang if lang in TRANSLATIONS else "es"
+    template = _templates.get(lang)
+    if template is None:
+        with _templates_lock:
+            template = _templates.get(lang)
+            if template is None:
+                template = _templates[lang] = WorkbookTemplate(lang)
+    return template
+
+
+def warm_up_templates() -> None:
+    """Prepara las plantillas de todos los idiomas (al arrancar)"""
+    for lang in TRANSLATIONS:
+        get_workbook_template(lang)
+
+
+def save_workbook(wb: Workbook, output: BinaryIO, lang: str) -> None:
+    """
+    Guarda el libro en output: con las partes fijas de la plantilla si solo
+    usa sus estilos y, si no (write-only, estilos añadidos...), con openpyxl
+    """
+    template = get_workbook_template(lang)
+    if template.matches(wb):
+        template.save(wb, output)
+    else:
+        wb.save(output)
 
 
 def _format_address(address: dict | None) -> str:
@@ -278,106 +692,64 @@ def _format_currency(amount: float, currency: str) -> str:
 
 def _get_tax_type_label(code: str, lang: str) -> str:
     """Obtiene la etiqueta del tipo de impuesto"""
-    labels = {
-        "es": {"01": "IVA", "04": "IRPF"},
-        "en": {"01": "VAT", "04": "Income Tax"},
-    }
-    return labels.get(lang, labels["es"]).get(code, code)
+    return TAX_TYPE_LABELS.get(lang, TAX_TYPE_LABELS["es"]).get(code, code)
 
 
 def _get_payment_means_label(code: str, lang: str) -> str:
     """Obtiene la etiqueta del método de pago"""
-    labels = {
-        "es": {
-            "01": "Al contado",
-            "02": "Recibo domiciliado",
-            "03": "Recibo",
-            "04": "Transferencia",
-            "05": "Letra aceptada",
-            "06": "Crédito documentario",
-            "07": "Contrato adjudicación",
-            "08": "Letra de cambio",
-            "09": "Pagaré a la orden",
-            "10": "Pagaré no a la orden",
-            "11": "Cheque",
-            "12": "Reposición",
-            "13": "Especiales",
-            "14": "Compensación",
-            "15": "Giro postal",
-            "16": "Cheque conformado",
-            "17": "Cheque bancario",
-            "18": "Pago contra reembolso",
-            "19": "Pago mediante tarjeta",
-        },
-        "en": {
-            "01": "Cash",
-            "02": "Direct debit",
-            "03": "Receipt",
-            "04": "Bank transfer",
-            "05": "Accepted bill",
-            "06": "Documentary credit",
-            "07": "Award contract",
-            "08": "Bill of exchange",
-            "09": "Promissory note to order",
-            "10": "Promissory note not to order",
-            "11": "Check",
-            "12": "Replacement",
-            "13": "Special",
-            "14": "Compensation",
-            "15": "Postal order",
-            "16": "Certified check",
-            "17": "Bank check",
-            "18": "Cash on delivery",
-            "19": "Card payment",
-        },
-    }
-    return labels.get(lang, labels["es"]).get(code, code)
-
-
-def _auto_fit_columns(ws: Worksheet) -> None:
-    """
-    Auto-ajusta el ancho de las columnas basándose en el contenido.
-    Tiene en cuenta celdas combinadas y aplica límites min/max.
-    """
-    column_widths: dict[int, float] = {}
-
-    for row in ws.iter_rows():
-        for cell in row:
-            if cell.value is None:
-                continue
-
-            col_idx = cell.column
-
-            # Calcular ancho necesario para este valor
-            value_str = str(cell.value)
-            # Considerar saltos de línea (tomar la línea más larga)
-            lines = value_str.split("\n")
-            max_line_len = max(len(line) for line in lines)
-
-            # Añadir padding y ajustar por tipo de fuente
-            width = max_line_len + 2
-            if cell.font and cell.font.bold:
-                width *= 1.1  # Las negritas ocupan más espacio
-
-            # Guardar el máximo para esta columna
-            if col_idx not in column_widths:
-                column_widths[col_idx] = MIN_COL_WIDTH
-            column_widths[col_idx] = max(column_widths[col_idx], width)
-
-    # Anchos mínimos específicos por columna (para labels y descripciones)
-    min_widths_by_col = {
-        1: 16,  # Columna de labels (Nombre, Dirección, etc.)
-        2: 35,  # Columna de valores/descripciones
-        4: 14,  # Columna de labels receptor
-        5: 30,  # Columna de valores receptor
-    }
-
-    # Aplicar anchos con límites
-    for col_idx, width in column_widths.items():
-        # Usar mínimo específico si existe, sino el global
-        col_min = min_widths_by_col.get(col_idx, MIN_COL_WIDTH)
-        final_width = max(col_min, min(MAX_COL_WIDTH, width))
-        ws.column_dimensions[get_column_letter(col_idx)].width = final_width
+    return PAYMENT_MEANS_LABELS.get(lang, PAYMENT_MEANS_LABELS["es"]).get(code, code)
+
+
+# Etiquetas de los códigos Facturae por idioma
+TAX_TYPE_LABELS = {
+    "es": {"01": "IVA", "04": "IRPF"},
+    "en": {"01": "VAT", "04": "Income Tax"},
+}
+
+PAYMENT_MEANS_LABELS = {
+    "es": {
+        "01": "Al contado",
+        "02": "Recibo domiciliado",
+        "03": "Recibo",
+        "04": "Transferencia",
+        "05": "Letra aceptada",
+        "06": "Crédito documentario",
+        "07": "Contrato adjudicación",
+        "08": "Letra de cambio",
+        "09": "Pagaré a la orden",
+        "10": "Pagaré no a la orden",
+        "11": "Cheque",
+        "12": "Reposición",
+        "13": "Especiales",
+        "14": "Compensación",
+        "15": "Giro postal",
+        "16": "Cheque conformado",
+        "17": "Cheque bancario",
+        "18": "Pago contra reembolso",
+        "19": "Pago mediante tarjeta",
+    },
+    "en": {
+        "01": "Cash",
+        "02": "Direct debit",
+        "03": "Receipt",
+        "04": "Bank transfer",
+        "05": "Accepted bill",
+        "06": "Documentary credit",
+        "07": "Award contract",
+        "08": "Bill of exchange",
+        "09": "Promissory note to order",
+        "10": "Promissory note not to order",
+        "11": "Check",
+        "12": "Replacement",
+        "13": "Special",
+        "14": "Compensation",
+        "15": "Postal order",
+        "16": "Certified check",
+        "17": "Bank check",
+        "18": "Cash on delivery",
+        "19": "Card payment",
+    },
+}
 
 
 TRANSLATIONS = {
@@ -405,6 +777,13 @@ TRANSLATIONS = {
         "payment": "INFORMACIÓN DE PAGO",
         "payment_method": "Forma de pago",
         "due_date": "Vencimiento",
+        "summary_sheet": "Resumen",
+        "batch_summary": "RESUMEN DEL LOTE",
+        "invoices_count": "Facturas",
+        "invoice_number": "Factura",
+        "buyer_name": "Receptor",
+        "total": "Total",
+        "sheet": "Hoja",
     },
     "en": {
         "sheet_name": "Invoice",
@@ -430,5 +809,12 @@ TRANSLATIONS = {
         "payment": "PAYMENT INFORMATION",
         "payment_method": "Payment method",
         "due_date": "Due date",
+        "summary_sheet": "Summary",
+        "batch_summary": "BATCH SUMMARY",
+        "invoices_count": "Invoices",
+        "invoice_number": "Invoice",
+        "buyer_name": "Buyer",
+        "total": "Total",
+        "sheet": "Sheet",
     },
 }
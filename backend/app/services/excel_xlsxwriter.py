@@ -0,0 +1,150 @@
+"""
+Motor de Excel basado en XlsxWriter (dependencia opcional)
+
+Escribe la misma maquetación que el motor de openpyxl (invoice_layout),
+pero XlsxWriter serializa cada fila directamente, sin el modelo de objetos
+de openpyxl. openpyxl sigue siendo la referencia: este motor debe producir
+los mismos valores, combinaciones, formatos numéricos y anchos.
+"""
+
+from typing import Any, BinaryIO, Optional
+
+from .. import config
+from .excel_generator import (
+    CELL_STYLES,
+    TRANSLATIONS,
+    CellStyle,
+    ColumnWidths,
+    ExcelEngineError,
+    check_sheet_rows,
+    invoice_layout,
+)
+from .metrics import stage
+
+try:
+    import xlsxwriter
+except ImportError:  # XlsxWriter no instalado: solo queda el motor de openpyxl
+    xlsxwriter = None
+
+
+# XlsxWriter suma al ancho de cada columna el relleno de la celda (5 px, a
+# 7 px por carácter en Calibri 11); se descuenta para que el archivo lleve
+# los mismos anchos que escribe openpyxl
+COLUMN_PADDING = 5 / 7
+
+# Estilos de borde de openpyxl y su índice en XlsxWriter
+BORDER_STYLES = {
+    "thin": 1,
+    "medium": 2,
+    "dashed": 3,
+    "dotted": 4,
+    "thick": 5,
+    "double": 6,
+    "hair": 7,
+}
+
+# Alineaciones verticales de openpyxl y su nombre en XlsxWriter
+VERTICAL_ALIGNMENTS = {"top": "top", "center": "vcenter", "bottom": "bottom", "justify": "vjustify"}
+
+
+def format_properties(style: CellStyle) -> dict[str, Any]:
+    """Propiedades del formato de XlsxWriter equivalente a un CellStyle"""
+    props: dict[str, Any] = {}
+
+    font = style.font
+    if font is not None:
+        if font.b:
+            props["bold"] = True
+        if font.sz is not None:
+            props["font_size"] = font.sz
+        if font.color is not None and isinstance(font.color.rgb, str):
+            props["font_color"] = f"#{font.color.rgb[-6:]}"
+
+    fill = style.fill
+    if fill is not None and fill.fill_type == "solid":
+        props["pattern"] = 1
+        props["fg_color"] = f"#{fill.fgColor.rgb[-6:]}"
+
+    if style.border is not None:
+        for side in ("left", "right", "top", "bottom"):
+            border_style = getattr(style.border, side).style
+            if border_style:
+                props[side] = BORDER_STYLES.get(border_style, 1)
+
+    alignment = style.alignment
+    if alignment is not None:
+        if alignment.horizontal:
+            props["align"] = alignment.horizontal
+        if alignment.vertical:
+            props["valign"] = VERTICAL_ALIGNMENTS.get(alignment.vertical, alignment.vertical)
+        if alignment.wrap_text:
+            props["text_wrap"] = True
+
+    if style.number_format is not None:
+        props["num_format"] = style.number_format
+    return props
+
+
+def render_xlsxwriter(
+    data: dict[str, Any],
+    invoice_index: int,
+    lang: str,
+    output: BinaryIO,
+    write_only: Optional[bool] = None,
+) -> None:
+    """
+    Escribe el .xlsx de la factura en output (ver generate_excel).
+
+    Como en el modo write-only de openpyxl, las filas se escriben en orden
+    y los anchos van antes que ellas. Con write_only (por defecto, a partir
+    de EXCEL_WRITE_ONLY_LINES líneas) XlsxWriter vuelca cada fila a un
+    temporal en vez de guardar la hoja en memoria.
+
+    Raises:
+        ExcelEngineError: si XlsxWriter no está instalado
+        ExcelLimitError: si la factura no cabe en una hoja de Excel
+    """
+    if xlsxwriter is None:
+        raise ExcelEngineError("El motor de Excel xlsxwriter no está instalado")
+
+    invoice = data["invoices"][invoice_index]
+    check_sheet_rows(invoice)
+    if write_only is None:
+        write_only = len(invoice.get("lines", [])) >= config.EXCEL_WRITE_ONLY_LINES
+    t = TRANSLATIONS.get(lang, TRANSLATIONS["es"])
+
+    widths = ColumnWidths()
+    with stage("auto_fit"):
+        for layout_row in invoice_layout(data, invoice_index, lang):
+            widths.add_row(layout_row)
+
+    with stage("build"):
+        options: dict[str, Any] = {
+            # openpyxl no convierte textos en enlaces
+            "strings_to_urls": False,
+            "constant_memory": write_only,
+            "in_memory": not write_only,
+        }
+        if config.UPLOAD_SPOOL_DIR:
+            options["tmpdir"] = config.UPLOAD_SPOOL_DIR
+        wb = xlsxwriter.Workbook(output, options)
+        ws = wb.add_worksheet(t["sheet_name"])
+        formats = {style: wb.add_format(format_properties(style)) for style in CELL_STYLES}
+
+        for col_idx, width in widths.final().items():
+            ws.set_column(col_idx - 1, col_idx - 1, width - COLUMN_PADDING)
+
+        for row, layout_row in enumerate(invoice_layout(data, invoice_index, lang)):
+            if layout_row.height is not None:
+                ws.set_row(row, layout_row.height)
+            cells = {col: (value, style) for col, value, style in layout_row.cells}
+            # El rango combinado lleva el valor y el formato de su primera celda
+            for start, end in layout_row.merges:
+                value, style = cells.pop(start, (None, None))
+                ws.merge_range(row, start - 1, row, end - 1, value, formats.get(style))
+            for col, (value, style) in cells.items():
+                ws.write(row, col - 1, value, formats.get(style))
+
+    # Serializar (con write_only, la hoja ya está en el temporal)
+    with stage("save"):
+        wb.close()
@@ -0,0 +1,337 @@
+"""
+Caché de Excel generados en dos niveles: memoria y disco local
+
+La clave es el SHA-256 de una serialización canónica (JSON con las claves
+ordenadas) de todo lo que determina el archivo: la factura elegida, emisor,
+receptor, fileHeader, versión de Facturae, idioma, nombre y motor. Como la
+clave identifica el contenido, sirve también de ETag: un If-None-Match que
+coincide se responde con 304 sin buscar ni generar nada.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from io import BytesIO
+from typing import Any, BinaryIO, Optional
+
+from .. import config
+
+
+# Forma parte de la clave: subirla al cambiar la maquetación invalida lo
+# que haya en disco de versiones anteriores
+KEY_VERSION = 1
+# Un archivo ocupa como mucho esta fracción del nivel en memoria (los
+# mayores solo se guardan en disco)
+MEMORY_ENTRY_DIVISOR = 4
+FILE_SUFFIX = ".xlsx"
+
+
+def export_cache_key(
+    data: dict[str, Any], invoice_index: int, lang: str, filename: str, engine: str
+) -> str:
+    """SHA-256 de la exportación pedida (no depende del orden de las claves)"""
+    payload = {
+        "key_version": KEY_VERSION,
+        "invoice": data["invoices"][invoice_index],
+        "seller": data.get("seller"),
+        "buyer": data.get("buyer"),
+        "fileHeader": data.get("fileHeader"),
+        "version": data.get("version"),
+        "lang": lang,
+        "filename": filename,
+        "engine": engine,
+    }
+    canonical = json.dumps(
+        payload, sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=str
+    )
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+def export_etag(key: str) -> str:
+    """ETag de la exportación: el propio hash de la petición"""
+    return f'"{key[:32]}"'
+
+
+class ExportCache:
+    """
+    Excel generados por clave de exportación, en dos niveles:
+
+    - memoria: LRU acotada por bytes (max_memory);
+    - disco: un archivo por clave en directory, LRU acotada por bytes
+      (max_disk). Sobrevive a reinicios: el índice se reconstruye desde el
+      directorio en el primer uso.
+
+    Cada archivo se reutiliza ttl segundos desde que se generó: los
+    caducados se descartan al consultarlos y al guardar otro. Un acierto en
+    disco sube el archivo a memoria si cabe.
+    """
+
+    def __init__(self, max_memory: int, max_disk: int, directory: str, ttl: float):
+        self.max_memory = max_memory
+        self.max_disk = max_disk
+        self.directory = directory
+        self.ttl = ttl
+        # clave -> (contenido, time.monotonic() al guardarlo)
+        self._memory: OrderedDict[str, tuple[bytes, float]] = OrderedDict()
+        self._memory_bytes = 0
+        # clave -> (tamaño, time.time() al guardarlo); None hasta leer el directorio
+        self._disk: Optional[OrderedDict[str, tuple[int, float]]] = None
+        self._disk_bytes = 0
+        self._lock = threading.Lock()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.not_modified = 0
+        self.evictions = 0
+        self.bytes_saved = 0
+
+    def get(self, key: str) -> Optional[tuple[BinaryIO, int]]:
+        """
+        Archivo cacheado, posicionado al principio (hay que cerrarlo), y su
+        tamaño, o None. Un acierto en disco devuelve el propio archivo
+        abierto, sin leerlo entero a memoria (salvo que se suba a memoria).
+        Hace E/S de disco: desde el event loop, llamarlo con asyncio.to_thread.
+        """
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                content, stored_at = entry
+                if time.monotonic() - stored_at < self.ttl:
+                    self._memory.move_to_end(key)
+                    self.memory_hits += 1
+                    self.bytes_saved += len(content)
+                    return BytesIO(content), len(content)
+                self._discard_memory(key)
+            on_disk = key in self._disk_index()
+
+        found = self._open_disk(key) if on_disk else None
+        if found is None:
+            with self._lock:
+                self.misses += 1
+            return None
+        file, size, age = found
+        with self._lock:
+            self.disk_hits += 1
+            self.bytes_saved += size
+        if not self._fits_memory(size):
+            return file, size
+        # Los pequeños se suben a memoria, con la edad que ya tenían en disco
+        with file:
+            content = file.read()
+        with self._lock:
+            self._store_memory(key, content, time.monotonic() - age)
+        return BytesIO(content), size
+
+    def put(self, key: str, file: BinaryIO) -> None:
+        """
+        Guarda el Excel de file y lo deja posicionado al principio. Como get,
+        escribe en disco: desde el event loop, con asyncio.to_thread.
+        """
+        size = file.seek(0, os.SEEK_END)
+        file.seek(0)
+        with self._lock:
+            self._expire()
+        if self._fits_memory(size):
+            content = file.read()
+            file.seek(0)
+            with self._lock:
+                self._store_memory(key, content, time.monotonic())
+        if 0 < size <= self.max_disk:
+            stored = self._write_disk(key, file)
+            file.seek(0)
+            if stored:
+                with self._lock:
+                    self._store_disk(key, size)
+
+    def record_not_modified(self) -> None:
+        """Una petición resuelta con 304 por su ETag"""
+        with self._lock:
+            self.not_modified += 1
+
+    def clear(self) -> None:
+        """Vacía ambos niveles (los contadores se conservan)"""
+        with self._lock:
+            self._memory.clear()
+            self._memory_bytes = 0
+            self._disk = OrderedDict()
+            self._disk_bytes = 0
+            try:
+                names = os.listdir(self.directory)
+            except OSError:
+                return
+            for name in names:
+                if name.endswith(FILE_SUFFIX):
+                    self._unlink(os.path.join(self.directory, name))
+
+    def stats(self) -> dict[str, Any]:
+        """Contadores para monitorización"""
+        with self._lock:
+            hits = self.memory_hits + self.disk_hits
+            lookups = hits + self.misses
+            return {
+                "entries": len(self._memory),
+                "bytes": self._memory_bytes,
+                "max_bytes": self.max_memory,
+                "disk_entries": len(self._disk) if self._disk is not None else 0,
+                "disk_bytes": self._disk_bytes,
+                "max_disk_bytes": self.max_disk,
+                "hits": hits,
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "not_modified": self.not_modified,
+                "evictions": self.evictions,
+                "hit_ratio": hits / lookups if lookups else 0.0,
+                "bytes_saved": self.bytes_saved,
+            }
+
+    def _expire(self) -> None:
+        """Descarta lo caducado de ambos niveles (con el lock tomado)"""
+        now = time.monotonic()
+        for key in [k for k, (_, stored_at) in self._memory.items() if now - stored_at >= self.ttl]:
+            self._discard_memory(key)
+            self.evictions += 1
+        now = time.time()
+        index = self._disk_index()
+        for key in [k for k, (_, stored_at) in index.items() if now - stored_at >= self.ttl]:
+            self._discard_disk(key)
+            self.evictions += 1
+
+    # --- memoria ---
+
+    def _fits_memory(self, size: int) -> bool:
+        return self.max_memory > 0 and size <= self.max_memory // MEMORY_ENTRY_DIVISOR
+
+    def _store_memory(self, key: str, content: bytes, stored_at: float) -> None:
+        """(con el lock tomado)"""
+        if not self._fits_memory(len(content)):
+            return
+        self._discard_memory(key)
+        self._memory[key] = (content, stored_at)
+        self._memory_bytes += len(content)
+        while self._memory_bytes > self.max_memory:
+            _, (evicted, _) = self._memory.popitem(last=False)
+            self._memory_bytes -= len(evicted)
+            self.evictions += 1
+
+    def _discard_memory(self, key: str) -> None:
+        entry = self._memory.pop(key, None)
+        if entry is not None:
+            self._memory_bytes -= len(entry[0])
+
+    # --- disco ---
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key + FILE_SUFFIX)
+
+    def _disk_index(self) -> OrderedDict[str, tuple[int, float]]:
+        """Índice del directorio, del más antiguo al más reciente (con el lock tomado)"""
+        if self._disk is None:
+            self._disk = OrderedDict()
+            found = []
+            try:
+                names = os.listdir(self.directory)
+            except OSError:
+                names = []
+            for name in names:
+                if not name.endswith(FILE_SUFFIX):
+                    continue
+                try:
+                    st = os.stat(os.path.join(self.directory, name))
+                except OSError:
+                    continue
+                found.append((st.st_mtime, name[: -len(FILE_SUFFIX)], st.st_size))
+            for mtime, key, size in sorted(found):
+                self._disk[key] = (size, mtime)
+                self._disk_bytes += size
+        return self._disk
+
+    def _open_disk(self, key: str) -> Optional[tuple[BinaryIO, int, float]]:
+        """
+        Archivo en disco abierto, su tamaño y su edad si existe y no ha
+        caducado. Si otra petición lo sustituye o lo expulsa después de
+        abrirlo, el archivo abierto sigue siendo el completo (os.replace)
+        """
+        with self._lock:
+            entry = self._disk_index().get(key)
+        age = time.time() - entry[1] if entry is not None else self.ttl
+        if age < self.ttl:
+            try:
+                file = open(self._path(key), "rb")
+            except OSError:
+                pass
+            else:
+                with self._lock:
+                    if key in self._disk_index():
+                        self._disk_index().move_to_end(key)
+                return file, os.fstat(file.fileno()).st_size, age
+        with self._lock:
+            self._discard_disk(key)
+        return None
+
+    def _write_disk(self, key: str, file: BinaryIO) -> bool:
+        """
+        Publica el archivo de forma atómica (os.replace): quien lo lea a la
+        vez nunca ve uno a medias. Sin disco disponible no se guarda.
+        """
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        except OSError:
+            return False
+        try:
+            with os.fdopen(fd, "wb") as f:
+                shutil.copyfileobj(file, f)
+            os.replace(tmp_path, self._path(key))
+        except OSError:
+            self._unlink(tmp_path)
+            return False
+        return True
+
+    def _store_disk(self, key: str, size: int) -> None:
+        """Añade el archivo al índice y expulsa los más antiguos (con el lock tomado)"""
+        index = self._disk_index()
+        self._disk_bytes -= index.pop(key, (0, 0.0))[0]
+        index[key] = (size, time.time())
+        self._disk_bytes += size
+        while self._disk_bytes > self.max_disk and len(index) > 1:
+            evicted, (evicted_size, _) = index.popitem(last=False)
+            self._disk_bytes -= evicted_size
+            self._unlink(self._path(evicted))
+            self.evictions += 1
+
+    def _discard_disk(self, key: str) -> None:
+        index = self._disk_index()
+        if key in index:
+            self._disk_bytes -= index.pop(key)[0]
+            self._unlink(self._path(key))
+
+    @staticmethod
+    def _unlink(path: str) -> None:
+        try:
+            os.unlink(path)
+        except OSError:
+            pass
+
+
+_cache: Optional[ExportCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_export_cache() -> ExportCache:
+    """Devuelve la caché de exportaciones de la aplicación"""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = ExportCache(
+                max_memory=config.EXPORT_CACHE_MEMORY_SIZE,
+                max_disk=config.EXPORT_CACHE_DISK_SIZE,
+                directory=config.EXPORT_CACHE_DIR,
+                ttl=config.EXPORT_CACHE_TTL,
+            )
+        return _cache
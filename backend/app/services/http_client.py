@@ -0,0 +1,74 @@
+"""
+Sesión HTTP compartida para las consultas de revocación (OCSP, CRL, caIssuers)
+"""
+
+import threading
+import time
+from typing import Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from .. import config
+
+
+class FetchError(Exception):
+    """La descarga falló, superó el plazo o el tamaño máximo"""
+
+
+def create_session(pool_size: int) -> requests.Session:
+    """Sesión con pool de conexiones y sin reintentos (el plazo manda)"""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=0)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def fetch(
+    session: requests.Session,
+    method: str,
+    url: str,
+    timeout: float,
+    max_size: int,
+    **kwargs,
+) -> bytes:
+    """
+    Petición con plazo máximo total (no solo por operación de socket) y
+    tamaño de respuesta limitado.
+
+    Raises:
+        FetchError: si no se obtiene una respuesta 200 completa a tiempo
+    """
+    deadline = time.monotonic() + timeout
+    try:
+        with session.request(
+            method, url, timeout=(timeout, timeout), stream=True, **kwargs
+        ) as response:
+            if response.status_code != 200:
+                raise FetchError(f"{url} respondió HTTP {response.status_code}")
+            chunks = []
+            size = 0
+            for chunk in response.iter_content(chunk_size=64 * 1024):
+                size += len(chunk)
+                if size > max_size:
+                    raise FetchError(f"Respuesta demasiado grande de {url}")
+                if time.monotonic() > deadline:
+                    raise FetchError(f"Tiempo agotado consultando {url}")
+                chunks.append(chunk)
+            return b"".join(chunks)
+    except requests.RequestException as e:
+        raise FetchError(f"Error consultando {url}: {e}")
+
+
+_session: Optional[requests.Session] = None
+_session_lock = threading.Lock()
+
+
+def get_http_session() -> requests.Session:
+    """Devuelve la sesión HTTP del proceso actual"""
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = create_session(config.HTTP_POOL_SIZE)
+        return _session
@@ -0,0 +1,265 @@
+"""
+Ingesta en streaming de archivos subidos (multipart/form-data)
+
+El cuerpo de la petición se procesa por bloques según llega: se calcula el
+SHA-256 sobre la marcha (la clave de la caché de resultados), se corta en
+cuanto se supera el tamaño máximo y lo que no cabe en memoria se vuelca a
+un archivo temporal que lxml puede parsear directamente por ruta.
+"""
+
+import asyncio
+import hashlib
+import os
+import tempfile
+from typing import Optional, Union
+
+from starlette.requests import Request
+
+try:
+    from python_multipart import MultipartParser
+    from python_multipart.multipart import parse_options_header
+except ImportError:  # python-multipart < 0.0.13
+    from multipart.multipart import MultipartParser, parse_options_header
+
+from .. import config
+
+
+# Margen para las cabeceras y delimitadores multipart al comprobar
+# Content-Length antes de leer el cuerpo
+MULTIPART_OVERHEAD = 64 * 1024
+# Tamaño máximo de las cabeceras de una parte
+MAX_PART_HEADER_SIZE = 16 * 1024
+
+
+class UploadError(ValueError):
+    """La petición no contiene un archivo válido"""
+
+
+class FileTooLargeError(UploadError):
+    """El archivo supera el tamaño máximo permitido"""
+
+
+class MissingFileError(UploadError):
+    """La petición no incluye el campo del archivo"""
+
+
+class UnsupportedFileError(UploadError):
+    """La extensión del archivo no está admitida"""
+
+
+class IngestedFile:
+    """
+    Archivo recibido: en memoria si es pequeño, en un temporal si no.
+
+    Hay que llamar a close() al terminar para borrar el temporal.
+    """
+
+    def __init__(self, filename: str, spool_threshold: int, directory: Optional[str] = None):
+        self.filename = filename
+        self.size = 0
+        self._hasher = hashlib.sha256()
+        self._buffer = bytearray()
+        self._spool_threshold = spool_threshold
+        self._directory = directory
+        self._file = None
+        self.path: Optional[str] = None
+
+    @property
+    def digest(self) -> str:
+        """SHA-256 (hex) del contenido"""
+        return self._hasher.hexdigest()
+
+    @property
+    def source(self) -> Union[bytes, str]:
+        """Contenido (bytes) o ruta del temporal si se volcó a disco"""
+        return self.path if self.path is not None else bytes(self._buffer)
+
+    def append(self, data: bytes, max_size: int) -> None:
+        """Añade un bloque (sin E/S); el volcado a disco se hace en flush()"""
+        self.size += len(data)
+        if self.size > max_size:
+            raise FileTooLargeError()
+        self._hasher.update(data)
+        self._buffer += data
+
+    async def flush(self) -> None:
+        """Vuelca a disco lo acumulado si ya no cabe en memoria"""
+        if self._file is None:
+            if len(self._buffer) <= self._spool_threshold:
+                return
+            self._file = await asyncio.to_thread(
+                tempfile.NamedTemporaryFile,
+                prefix="facturaview-",
+                dir=self._directory,
+                delete=False,
+            )
+            self.path = self._file.name
+        if self._buffer:
+            data = bytes(self._buffer)
+            self._buffer.clear()
+            await asyncio.to_thread(self._file.write, data)
+
+    async def finish(self) -> None:
+        """Cierra la escritura: el temporal queda listo para leerse por ruta"""
+        if self._file is not None:
+            await self.flush()
+            await asyncio.to_thread(self._file.close)
+
+    def close(self) -> None:
+        """Libera la memoria y borra el temporal"""
+        self._buffer = bytearray()
+        if self._file is not None:
+            self._file.close()
+            try:
+                os.unlink(self._file.name)
+            except FileNotFoundError:
+                pass
+            self._file = None
+
+
+async def ingest_upload(
+    request: Request,
+    field: str = "file",
+    extensions: tuple[str, ...] = (),
+    max_size: Optional[int] = None,
+    spool_threshold: Optional[int] = None,
+) -> IngestedFile:
+    """
+    Lee del cuerpo multipart el archivo del campo indicado.
+
+    La memoria usada está acotada por spool_threshold más un bloque de red,
+    independientemente de lo que envíe el cliente.
+
+    Raises:
+        FileTooLargeError: en cuanto el archivo supera max_size (o si el
+            Content-Length ya lo anuncia, sin leer el cuerpo)
+        UnsupportedFileError: si la extensión no está en extensions (se
+            comprueba al llegar las cabeceras de la parte)
+        MissingFileError: si no hay un archivo en el campo
+        UploadError: si el cuerpo multipart no es válido
+    """
+    max_size = config.MAX_UPLOAD_SIZE if max_size is None else max_size
+    spool_threshold = config.UPLOAD_SPOOL_THRESHOLD if spool_threshold is None else spool_threshold
+
+    content_length = request.headers.get("content-length")
+    limit = max_size + MULTIPART_OVERHEAD
+    if content_length and content_length.isdigit() and int(content_length) > limit:
+        raise FileTooLargeError()
+
+    content_type, params = parse_options_header(request.headers.get("content-type", ""))
+    boundary = params.get(b"boundary")
+    if content_type != b"multipart/form-data" or not boundary:
+        raise MissingFileError()
+
+    state = _PartState(field, extensions, max_size, spool_threshold)
+    parser = MultipartParser(boundary, state.callbacks())
+    try:
+        async for chunk in request.stream():
+            parser.write(chunk)
+            if state.error is not None:
+                raise state.error
+            if state.upload is not None:
+                await state.upload.flush()
+            if state.done:
+                break
+        else:
+            parser.finalize()
+    except UploadError:
+        if state.upload is not None:
+            state.upload.close()
+        raise
+    except Exception as e:
+        if state.upload is not None:
+            state.upload.close()
+        raise UploadError(f"Cuerpo multipart no válido: {e}")
+
+    if state.upload is None or not state.done:
+        if state.upload is not None:
+            state.upload.close()
+        raise MissingFileError()
+    await state.upload.finish()
+    return state.upload
+
+
+class _PartState:
+    """Estado del parser multipart: solo se conserva la parte del archivo"""
+
+    def __init__(
+        self, field: str, extensions: tuple[str, ...], max_size: int, spool_threshold: int
+    ):
+        self.field = field.encode()
+        self.extensions = extensions
+        self.max_size = max_size
+        self.spool_threshold = spool_threshold
+        self.upload: Optional[IngestedFile] = None
+        self.done = False
+        self.error: Optional[UploadError] = None
+        self._headers: dict[bytes, bytes] = {}
+        self._header_field = bytearray()
+        self._header_value = bytearray()
+        self._header_size = 0
+        self._target: Optional[IngestedFile] = None
+
+    def callbacks(self) -> dict:
+        return {
+            "on_part_begin": self.on_part_begin,
+            "on_header_field": self.on_header_field,
+            "on_header_value": self.on_header_value,
+            "on_header_end": self.on_header_end,
+            "on_headers_finished": self.on_headers_finished,
+            "on_part_data": self.on_part_data,
+            "on_part_end": self.on_part_end,
+        }
+
+    def on_part_begin(self) -> None:
+        self._headers = {}
+        self._header_size = 0
+        self._target = None
+
+    def on_header_field(self, data: bytes, start: int, end: int) -> None:
+        self._grow(end - start)
+        self._header_field += data[start:end]
+
+    def on_header_value(self, data: bytes, start: int, end: int) -> None:
+        self._grow(end - start)
+        self._header_value += data[start:end]
+
+    def on_header_end(self) -> None:
+        self._headers[bytes(self._header_field).lower()] = bytes(self._header_value)
+        self._header_field.clear()
+        self._header_value.clear()
+
+    def on_headers_finished(self) -> None:
+        if self.upload is not None or self.error is not None:
+            return
+        _, options = parse_options_header(self._headers.get(b"content-disposition", b""))
+        if options.get(b"name") != self.field or b"filename" not in options:
+            return
+        filename = options[b"filename"].decode("utf-8", "replace")
+        if not filename:
+            self.error = MissingFileError()
+            return
+        if self.extensions and not filename.lower().endswith(self.extensions):
+            self.error = UnsupportedFileError(filename)
+            return
+        self.upload = self._target = IngestedFile(
+            filename, self.spool_threshold, config.UPLOAD_SPOOL_DIR or None
+        )
+
+    def on_part_data(self, data: bytes, start: int, end: int) -> None:
+        if self._target is not None and self.error is None:
+            try:
+                self._target.append(data[start:end], self.max_size)
+            except FileTooLargeError as e:
+                self.error = e
+                self._target = None
+
+    def on_part_end(self) -> None:
+        if self._target is not None:
+            self.done = True
+            self._target = None
+
+    def _grow(self, size: int) -> None:
+        self._header_size += size
+        if self._header_size > MAX_PART_HEADER_SIZE:
+            raise UploadError("Cabeceras multipart demasiado grandes")
@@ -0,0 +1,310 @@
+"""
+Métricas en formato de exposición de Prometheus (sin dependencias)
+
+- Peticiones y latencia por ruta (MetricsMiddleware).
+- Duración de las etapas internas de cada operación: la validación se
+  ejecuta en los workers, así que sus tiempos se miden allí con
+  record_stages() y vuelven junto al resultado para registrarse aquí.
+- Gauges del pool de workers y de la caché, leídos en cada scrape.
+
+Las etapas registradas durante una petición se acumulan además en
+request_timings para la cabecera Server-Timing.
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Iterator, Optional
+
+
+# Buckets por defecto de los clientes oficiales de Prometheus (segundos)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Etapas internas: más finos, muchas duran menos de un milisegundo
+STAGE_BUCKETS = (
+    0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5
+)
+# Tamaño de los archivos subidos (bytes)
+SIZE_BUCKETS = (
+    1024, 10 * 1024, 100 * 1024, 512 * 1024, 1024 * 1024, 4 * 1024 * 1024, 10 * 1024 * 1024
+)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names: tuple[str, ...], values: tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Metric:
+    """Base: una serie por combinación de valores de las etiquetas"""
+
+    type = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict[str, Any]) -> tuple[str, ...]:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name}: se esperaban las etiquetas {self.labelnames}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def render(self) -> list[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+
+
+class Counter(_Metric):
+    type = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: dict[tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: Any) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels: Any) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0.0)
+
+    def render(self) -> list[str]:
+        with self._lock:
+            values = sorted(self._values.items())
+        return super().render() + [
+            f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(v)}"
+            for key, v in values
+        ]
+
+
+class Gauge(Counter):
+    type = "gauge"
+
+    def set(self, value: float, **labels: Any) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = float(value)
+
+
+class Histogram(_Metric):
+    type = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = LATENCY_BUCKETS,
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+        # Por serie: recuentos por bucket (no acumulados), suma y total
+        self._series: dict[tuple[str, ...], list] = {}
+
+    def observe(self, value: float, **labels: Any) -> None:
+        key = self._key(labels)
+        index = next(i for i, bound in enumerate(self.buckets) if value <= bound)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * len(self.buckets), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def count(self, **labels: Any) -> int:
+        with self._lock:
+            series = self._series.get(self._key(labels))
+            return series[2] if series else 0
+
+    def render(self) -> list[str]:
+        with self._lock:
+            snapshot = sorted((key, (list(s[0]), s[1], s[2])) for key, s in self._series.items())
+        lines = super().render()
+        for key, (counts, total, count) in snapshot:
+            cumulative = 0
+            for bound, n in zip(self.buckets, counts):
+                cumulative += n
+                le = f'le="{_format_value(bound)}"'
+                labels = _format_labels(self.labelnames, key, le)
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+class MetricsRegistry:
+    """Conjunto de métricas que se exponen juntas"""
+
+    def __init__(self):
+        self._metrics: list[_Metric] = []
+        self._collectors: list[Callable[[], None]] = []
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def add_collector(self, collector: Callable[[], None]) -> None:
+        """Función que actualiza gauges justo antes de cada scrape"""
+        self._collectors.append(collector)
+
+    def render(self) -> str:
+        for collector in self._collectors:
+            collector()
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+HTTP_REQUESTS = REGISTRY.register(Counter(
+    "facturaview_http_requests_total",
+    "Peticiones HTTP atendidas",
+    ("method", "route", "status"),
+))
+HTTP_LATENCY = REGISTRY.register(Histogram(
+    "facturaview_http_request_duration_seconds",
+    "Latencia de las peticiones HTTP hasta enviar la respuesta completa",
+    ("method", "route"),
+))
+STAGE_LATENCY = REGISTRY.register(Histogram(
+    "facturaview_stage_duration_seconds",
+    "Duración de las etapas internas de cada operación",
+    ("operation", "stage"),
+    buckets=STAGE_BUCKETS,
+))
+UPLOAD_SIZE = REGISTRY.register(Histogram(
+    "facturaview_upload_size_bytes",
+    "Tamaño de los archivos subidos",
+    ("route",),
+    buckets=SIZE_BUCKETS,
+))
+LAST_UPLOAD_SIZE = REGISTRY.register(Gauge(
+    "facturaview_upload_last_size_bytes",
+    "Tamaño del último archivo subido",
+    ("route",),
+))
+POOL_GAUGE = REGISTRY.register(Gauge(
+    "facturaview_worker_pool",
+    "Estado del pool de workers (workers, in_flight, queue_depth, stuck)",
+    ("state",),
+))
+CACHE_GAUGE = REGISTRY.register(Gauge(
+    "facturaview_cache",
+    "Estado de las cachés (entries, hit_ratio; en export, también bytes y bytes_saved)",
+    ("cache", "field"),
+))
+
+
+# === ETAPAS ===
+
+_local = threading.local()
+
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    """
+    Mide la etapa si hay una medición en curso en este hilo (record_stages);
+    si no, no hace nada. Las etapas repetidas se suman.
+    """
+    timings: Optional[dict[str, float]] = getattr(_local, "timings", None)
+    if timings is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[name] = timings.get(name, 0.0) + time.perf_counter() - start
+
+
+def record_stages(fn: Callable[..., Any], *args: Any) -> tuple[Any, dict[str, float]]:
+    """
+    Ejecuta fn(*args) midiendo sus etapas. Se puede enviar al pool de
+    procesos: resultado y tiempos vuelven juntos al proceso principal.
+    """
+    previous = getattr(_local, "timings", None)
+    _local.timings = timings = {}
+    try:
+        return fn(*args), timings
+    finally:
+        _local.timings = previous
+
+
+# Etapas de la petición en curso (las fija ServerTimingMiddleware)
+request_timings: ContextVar[Optional[dict[str, float]]] = ContextVar(
+    "request_timings", default=None
+)
+
+
+def observe_stages(operation: str, timings: dict[str, float]) -> None:
+    """Registra los tiempos devueltos por record_stages"""
+    current = request_timings.get()
+    for name, seconds in timings.items():
+        STAGE_LATENCY.observe(seconds, operation=operation, stage=name)
+        if current is not None:
+            current[name] = current.get(name, 0.0) + seconds
+
+
+def format_server_timing(timings: dict[str, float], total: float) -> str:
+    """Valor de la cabecera Server-Timing (duraciones en milisegundos)"""
+    entries = [f"{name};dur={seconds * 1000:.2f}" for name, seconds in timings.items()]
+    entries.append(f"total;dur={total * 1000:.2f}")
+    return ", ".join(entries)
+
+
+def observe_request(method: str, route: str, status: int, seconds: float) -> None:
+    HTTP_REQUESTS.inc(method=method, route=route, status=str(status))
+    HTTP_LATENCY.observe(seconds, method=method, route=route)
+
+
+def observe_upload(route: str, size: int) -> None:
+    UPLOAD_SIZE.observe(size, route=route)
+    LAST_UPLOAD_SIZE.set(size, route=route)
+
+
+def _collect_runtime() -> None:
+    # Importación diferida: validator (y con él result_cache) usa este módulo
+    from .export_cache import get_export_cache
+    from .result_cache import get_validation_cache
+    from .worker_pool import get_worker_pool
+
+    pool = get_worker_pool().stats()
+    for state in ("workers", "in_flight", "queue_depth", "stuck"):
+        POOL_GAUGE.set(pool[state], state=state)
+    cache = get_validation_cache().stats()
+    for field in ("entries", "hit_ratio"):
+        CACHE_GAUGE.set(cache[field], cache="validation", field=field)
+    export = get_export_cache().stats()
+    for field in (
+        "entries", "disk_entries", "bytes", "disk_bytes", "hit_ratio", "bytes_saved", "not_modified"
+    ):
+        CACHE_GAUGE.set(export[field], cache="export", field=field)
+
+
+REGISTRY.add_collector(_collect_runtime)
+
+
+def render_metrics() -> str:
+    """Texto de exposición de todas las métricas"""
+    return REGISTRY.render()
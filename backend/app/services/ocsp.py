@@ -0,0 +1,354 @@
+"""
+Cliente OCSP con sesión HTTP compartida y caché hasta nextUpdate
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Any, Optional
+
+import requests
+from cryptography import x509
+from cryptography.exceptions import InvalidSignature
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import ec, ed448, ed25519, padding, rsa
+from cryptography.x509 import ocsp
+from cryptography.x509.oid import ExtendedKeyUsageOID
+
+from .. import config
+from .http_client import FetchError, fetch, get_http_session
+
+
+# Tamaño máximo de una respuesta OCSP o de un certificado descargado
+MAX_RESPONSE_SIZE = 1024 * 1024
+# Tolerancia de reloj al comprobar thisUpdate/nextUpdate
+CLOCK_SKEW = timedelta(minutes=5)
+
+
+class RevocationError(Exception):
+    """No se pudo determinar el estado de revocación"""
+
+
+class OCSPError(RevocationError):
+    """No se pudo obtener una respuesta OCSP válida"""
+
+
+@dataclass(frozen=True)
+class OCSPResult:
+    """Estado de un certificado según el servidor OCSP"""
+    status: str  # "good", "revoked" o "unknown"
+    this_update: datetime
+    next_update: Optional[datetime] = None
+    revocation_time: Optional[datetime] = None
+
+    @property
+    def revoked(self) -> Optional[bool]:
+        """True/False si el servidor conoce el certificado, None si no"""
+        if self.status == "unknown":
+            return None
+        return self.status == "revoked"
+
+
+@dataclass
+class _CachedResult:
+    result: OCSPResult
+    # Momento (time.time) hasta el que la respuesta es reutilizable
+    expires_at: float
+
+
+class OCSPClient:
+    """
+    Cliente OCSP compartido por todas las validaciones del proceso.
+
+    - Una sesión de requests con pool de conexiones: las consultas al mismo
+      responder reutilizan la conexión TCP/TLS.
+    - Cada consulta tiene un plazo máximo total (conexión + respuesta).
+    - Las respuestas se cachean por (hash de la clave del emisor, serial)
+      hasta su nextUpdate.
+    - Consultas simultáneas por el mismo certificado comparten una única
+      petición en curso, así un lote de facturas del mismo firmante hace una
+      sola consulta.
+    """
+
+    def __init__(
+        self,
+        timeout: float = 5.0,
+        max_entries: int = 1024,
+        default_ttl: float = 3600.0,
+        session: Optional[requests.Session] = None,
+    ):
+        self.timeout = timeout
+        self.max_entries = max_entries
+        self.default_ttl = default_ttl
+        self.session = session or get_http_session()
+        self._entries: OrderedDict[tuple[bytes, int], _CachedResult] = OrderedDict()
+        self._in_flight: dict[tuple[bytes, int], Future] = {}
+        self._issuers: dict[str, Optional[x509.Certificate]] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.requests = 0
+        self.errors = 0
+
+    def check(self, cert: x509.Certificate, issuer: x509.Certificate, url: str) -> OCSPResult:
+        """
+        Estado de revocación de cert (emitido por issuer) según el responder.
+
+        Raises:
+            OCSPError: si no hay respuesta válida dentro del plazo
+        """
+        key = (issuer_key_hash(issuer), cert.serial_number)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.time() < entry.expires_at:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry.result
+            future = self._in_flight.get(key)
+            if future is not None:
+                self.coalesced += 1
+                owner = False
+            else:
+                self.misses += 1
+                future = self._in_flight[key] = Future()
+                owner = True
+
+        if not owner:
+            # Otra validación ya está consultando este certificado
+            try:
+                return future.result(timeout=self.timeout * 2)
+            except FutureTimeoutError:
+                raise OCSPError(f"Tiempo agotado esperando la respuesta OCSP de {url}")
+
+        try:
+            result = self._query(cert, issuer, url)
+        except Exception as e:
+            with self._lock:
+                self.errors += 1
+                del self._in_flight[key]
+            error = e if isinstance(e, OCSPError) else OCSPError(str(e))
+            future.set_exception(error)
+            raise error
+
+        with self._lock:
+            if self.max_entries > 0:
+                self._entries[key] = _CachedResult(result, self._expires_at(result))
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+            del self._in_flight[key]
+        future.set_result(result)
+        return result
+
+    def fetch_issuer(self, cert: x509.Certificate) -> Optional[x509.Certificate]:
+        """
+        Descarga el certificado emisor de la URL caIssuers del AIA (cacheado
+        por URL). Devuelve None si el certificado no la declara.
+        """
+        url = _access_location(cert, x509.oid.AuthorityInformationAccessOID.CA_ISSUERS)
+        if url is None:
+            return None
+        with self._lock:
+            if url in self._issuers:
+                return self._issuers[url]
+
+        body = self._get(url)
+        try:
+            issuer = x509.load_der_x509_certificate(body)
+        except ValueError:
+            try:
+                issuer = x509.load_pem_x509_certificate(body)
+            except ValueError:
+                issuer = None
+
+        with self._lock:
+            self._issuers[url] = issuer
+        return issuer
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._issuers.clear()
+
+    def stats(self) -> dict[str, Any]:
+        """Contadores para monitorización"""
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "coalesced": self.coalesced,
+                "requests": self.requests,
+                "errors": self.errors,
+            }
+
+    def _expires_at(self, result: OCSPResult) -> float:
+        if result.next_update is None:
+            return time.time() + self.default_ttl
+        return result.next_update.timestamp()
+
+    def _query(self, cert: x509.Certificate, issuer: x509.Certificate, url: str) -> OCSPResult:
+        request = ocsp.OCSPRequestBuilder().add_certificate(cert, issuer, hashes.SHA1()).build()
+        body = self._post(url, request.public_bytes(serialization.Encoding.DER))
+
+        try:
+            response = ocsp.load_der_ocsp_response(body)
+        except ValueError as e:
+            raise OCSPError(f"Respuesta OCSP no válida: {e}")
+        if response.response_status != ocsp.OCSPResponseStatus.SUCCESSFUL:
+            raise OCSPError(f"El servidor OCSP respondió {response.response_status.name}")
+
+        _verify_response(response, cert, issuer)
+
+        status = {
+            ocsp.OCSPCertStatus.GOOD: "good",
+            ocsp.OCSPCertStatus.REVOKED: "revoked",
+        }.get(response.certificate_status, "unknown")
+        return OCSPResult(
+            status=status,
+            this_update=response.this_update_utc,
+            next_update=response.next_update_utc,
+            revocation_time=response.revocation_time_utc,
+        )
+
+    def _post(self, url: str, data: bytes) -> bytes:
+        return self._fetch(
+            "POST",
+            url,
+            data=data,
+            headers={
+                "Content-Type": "application/ocsp-request",
+                "Accept": "application/ocsp-response",
+            },
+        )
+
+    def _get(self, url: str) -> bytes:
+        return self._fetch("GET", url)
+
+    def _fetch(self, method: str, url: str, **kwargs) -> bytes:
+        with self._lock:
+            self.requests += 1
+        try:
+            return fetch(self.session, method, url, self.timeout, MAX_RESPONSE_SIZE, **kwargs)
+        except FetchError as e:
+            raise OCSPError(str(e))
+
+
+def issuer_key_hash(issuer: x509.Certificate) -> bytes:
+    """SHA-1 de la clave pública del emisor (el issuerKeyHash de OCSP)"""
+    return x509.SubjectKeyIdentifier.from_public_key(issuer.public_key()).digest
+
+
+def _access_location(cert: x509.Certificate, method: x509.ObjectIdentifier) -> Optional[str]:
+    """Primera URL del AIA para el método indicado (OCSP o caIssuers)"""
+    try:
+        aia = cert.extensions.get_extension_for_class(x509.AuthorityInformationAccess)
+    except x509.ExtensionNotFound:
+        return None
+    for access in aia.value:
+        if access.access_method == method and isinstance(
+            access.access_location, x509.UniformResourceIdentifier
+        ):
+            return access.access_location.value
+    return None
+
+
+def ocsp_url(cert: x509.Certificate) -> Optional[str]:
+    """URL del servidor OCSP declarada en el certificado"""
+    return _access_location(cert, x509.oid.AuthorityInformationAccessOID.OCSP)
+
+
+def _verify_response(
+    response: ocsp.OCSPResponse, cert: x509.Certificate, issuer: x509.Certificate
+) -> None:
+    """Comprueba que la respuesta es para cert, está firmada y es vigente"""
+    expected = ocsp.OCSPRequestBuilder().add_certificate(
+        cert, issuer, response.hash_algorithm
+    ).build()
+    if (
+        response.serial_number != cert.serial_number
+        or response.issuer_key_hash != expected.issuer_key_hash
+        or response.issuer_name_hash != expected.issuer_name_hash
+    ):
+        raise OCSPError("La respuesta OCSP no corresponde al certificado consultado")
+
+    responder = _responder_certificate(response, issuer)
+    try:
+        _verify_signature(
+            responder.public_key(),
+            response.signature,
+            response.tbs_response_bytes,
+            response.signature_hash_algorithm,
+        )
+    except InvalidSignature:
+        raise OCSPError("Firma de la respuesta OCSP no válida")
+
+    now = datetime.now(timezone.utc)
+    if response.this_update_utc > now + CLOCK_SKEW:
+        raise OCSPError("Respuesta OCSP con fecha futura")
+    if response.next_update_utc is not None and response.next_update_utc < now - CLOCK_SKEW:
+        raise OCSPError("Respuesta OCSP caducada")
+
+
+def _responder_certificate(
+    response: ocsp.OCSPResponse, issuer: x509.Certificate
+) -> x509.Certificate:
+    """
+    Certificado que firma la respuesta: el propio emisor o un responder
+    delegado emitido por él con uso extendido OCSPSigning.
+    """
+    def is_responder(candidate: x509.Certificate) -> bool:
+        if response.responder_key_hash is not None:
+            return response.responder_key_hash == issuer_key_hash(candidate)
+        return response.responder_name == candidate.subject
+
+    if is_responder(issuer):
+        return issuer
+
+    for candidate in response.certificates:
+        if not is_responder(candidate):
+            continue
+        try:
+            candidate.verify_directly_issued_by(issuer)
+            usage = candidate.extensions.get_extension_for_class(x509.ExtendedKeyUsage).value
+        except (ValueError, TypeError, InvalidSignature, x509.ExtensionNotFound):
+            continue
+        if ExtendedKeyUsageOID.OCSP_SIGNING in usage:
+            return candidate
+
+    raise OCSPError(
+        "La respuesta OCSP no está firmada por el emisor ni por un responder autorizado"
+    )
+
+
+def _verify_signature(public_key, signature: bytes, data: bytes, hash_alg) -> None:
+    if isinstance(public_key, rsa.RSAPublicKey):
+        public_key.verify(signature, data, padding.PKCS1v15(), hash_alg)
+    elif isinstance(public_key, ec.EllipticCurvePublicKey):
+        public_key.verify(signature, data, ec.ECDSA(hash_alg))
+    elif isinstance(public_key, (ed25519.Ed25519PublicKey, ed448.Ed448PublicKey)):
+        public_key.verify(signature, data)
+    else:
+        raise OCSPError("Tipo de clave del responder OCSP no soportado")
+
+
+_client: Optional[OCSPClient] = None
+_client_lock = threading.Lock()
+
+
+def get_ocsp_client() -> OCSPClient:
+    """Devuelve el cliente OCSP del proceso actual"""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = OCSPClient(
+                timeout=config.OCSP_TIMEOUT,
+                max_entries=config.OCSP_CACHE_SIZE,
+                default_ttl=config.REVOCATION_CACHE_TTL,
+            )
+        return _client
@@ -0,0 +1,132 @@
+"""
+Perfilado bajo demanda de peticiones individuales (cProfile)
+
+Cada perfil se guarda en dos archivos: el .pstats para abrirlo con pstats o
+snakeviz y un .collapsed (una pila por línea, «a;b;c microsegundos») que
+aceptan flamegraph.pl y speedscope.
+"""
+
+import asyncio
+import cProfile
+import os
+import pstats
+import re
+import time
+from contextvars import ContextVar
+from typing import Any, Callable, Optional
+
+
+# Perfiles de los hilos que trabajan para la petición perfilada en curso
+# (los fija ProfilerMiddleware; to_thread los va añadiendo)
+thread_profiles: ContextVar[Optional[list[cProfile.Profile]]] = ContextVar(
+    "thread_profiles", default=None
+)
+
+
+def profile_name(method: str, path: str) -> str:
+    """Nombre base del perfil: fecha, método y ruta saneada"""
+    slug = re.sub(r"[^A-Za-z0-9]+", "-", path).strip("-") or "root"
+    now = time.time()
+    stamp = time.strftime("%Y%m%d-%H%M%S", time.localtime(now))
+    return f"{stamp}-{int(now * 1_000_000) % 1_000_000:06d}-{method.lower()}-{slug}"
+
+
+async def to_thread(fn: Callable[..., Any], *args: Any) -> Any:
+    """
+    Como asyncio.to_thread, pero si la petición se está perfilando el
+    trabajo del hilo también se perfila y se suma al perfil de la petición
+    (cProfile solo ve el hilo en el que se activa).
+    """
+    return await asyncio.to_thread(_run_profiled, thread_profiles.get(), fn, *args)
+
+
+def _run_profiled(
+    profiles: Optional[list[cProfile.Profile]], fn: Callable[..., Any], *args: Any
+) -> Any:
+    if profiles is None:
+        return fn(*args)
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError:
+        # Desde Python 3.12 el perfil de la petición ya ve todos los hilos
+        return fn(*args)
+    try:
+        return fn(*args)
+    finally:
+        profiler.disable()
+        profiles.append(profiler)
+
+
+def write_profile(
+    profiler: cProfile.Profile, directory: str, name: str, retain: int,
+    threads: tuple[cProfile.Profile, ...] = (),
+) -> str:
+    """
+    Escribe el perfil (.pstats y .collapsed), sumando el de los hilos de la
+    petición, y borra los más antiguos para conservar como mucho retain.
+    Devuelve la ruta del .pstats.
+    """
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, name + ".pstats")
+    stats = pstats.Stats(profiler)
+    for thread_profiler in threads:
+        stats.add(thread_profiler)
+    stats.dump_stats(path)
+    with open(os.path.join(directory, name + ".collapsed"), "w") as f:
+        f.writelines(f"{stack} {value}\n" for stack, value in collapsed_stacks(stats))
+    prune_profiles(directory, retain)
+    return path
+
+
+def prune_profiles(directory: str, retain: int) -> None:
+    """Conserva los retain perfiles más recientes (con su .collapsed)"""
+    profiles = sorted(
+        (entry for entry in os.scandir(directory) if entry.name.endswith(".pstats")),
+        key=lambda entry: entry.stat().st_mtime,
+    )
+    for entry in profiles[:max(0, len(profiles) - retain)]:
+        for path in (entry.path, entry.path[:-len(".pstats")] + ".collapsed"):
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+
+
+def collapsed_stacks(stats: pstats.Stats) -> list[tuple[str, int]]:
+    """
+    Pilas colapsadas aproximadas a partir del grafo de llamadas.
+
+    cProfile solo guarda aristas llamador→llamado, no pilas completas: el
+    tiempo propio de cada función se atribuye a la cadena formada por su
+    llamador más costoso, recursivamente hasta la raíz.
+    """
+    entries = stats.stats  # func -> (cc, nc, tt, ct, callers)
+    heaviest: dict[tuple, Optional[tuple]] = {}
+    for func, (_, _, _, _, callers) in entries.items():
+        heaviest[func] = max(callers, key=lambda c: callers[c][3]) if callers else None
+
+    lines = []
+    for func, (_, _, own_time, _, _) in entries.items():
+        micros = int(own_time * 1_000_000)
+        if micros <= 0:
+            continue
+        stack = [func]
+        seen = {func}
+        caller = heaviest.get(func)
+        while caller is not None and caller not in seen:
+            stack.append(caller)
+            seen.add(caller)
+            caller = heaviest.get(caller)
+        lines.append((";".join(_frame(f) for f in reversed(stack)), micros))
+    return sorted(lines)
+
+
+def _frame(func: tuple) -> str:
+    filename, line, name = func
+    if filename == "~":
+        frame = name  # funciones de C: "<built-in method ...>"
+    else:
+        frame = f"{name} ({os.path.basename(filename)}:{line})"
+    # ";" separa marcos en el formato colapsado
+    return frame.replace(";", ",")
@@ -0,0 +1,126 @@
+"""
+Caché de resultados de validación direccionada por contenido (SHA-256)
+"""
+
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Optional
+
+from .. import config
+from ..models.response import SignatureResponse
+from .validator import apply_time_checks
+
+
+@dataclass
+class CachedValidation:
+    """Resultado cacheado y hasta cuándo se puede reutilizar"""
+    response: SignatureResponse
+    # Momento (time.monotonic) a partir del cual hay que revalidar, p.ej.
+    # porque el estado de revocación consultado ha caducado
+    revalidate_after: Optional[float] = None
+
+
+class ValidationCache:
+    """
+    LRU acotada de SignatureResponse indexada por el SHA-256 del archivo.
+
+    Los campos que dependen de la fecha (vigencia del certificado) se
+    recalculan en cada acierto; el resto del trabajo (parseo, certificado,
+    verificación criptográfica) no se repite.
+    """
+
+    def __init__(self, max_entries: int = 256):
+        self.max_entries = max_entries
+        self._entries: OrderedDict[str, CachedValidation] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: str) -> Optional[SignatureResponse]:
+        """Devuelve una copia actualizada del resultado o None si no está"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.revalidate_after is not None \
+                    and time.monotonic() >= entry.revalidate_after:
+                del self._entries[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            response = entry.response.model_copy(deep=True)
+        return apply_time_checks(response)
+
+    def put(self, key: str, response: SignatureResponse, ttl: Optional[float] = None) -> None:
+        """Guarda un resultado (ttl en segundos si caduca antes que el propio archivo)"""
+        if self.max_entries <= 0:
+            return
+        entry = CachedValidation(
+            response=response.model_copy(deep=True),
+            revalidate_after=time.monotonic() + ttl if ttl is not None else None,
+        )
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict[str, Any]:
+        """Contadores para monitorización"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+            }
+
+
+def content_digest(content: bytes) -> str:
+    """Clave de caché: SHA-256 del contenido subido"""
+    return hashlib.sha256(content).hexdigest()
+
+
+def validation_etag(digest: str, response: SignatureResponse) -> str:
+    """
+    ETag del resultado: depende del archivo y del propio resultado, de modo
+    que cambia si lo hace algún campo dependiente de la fecha.
+    """
+    state = hashlib.sha256(response.model_dump_json().encode()).hexdigest()[:16]
+    return f'"{digest[:32]}-{state}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Comprueba la cabecera If-None-Match (comparación débil)"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    candidates = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+    return etag in candidates
+
+
+_cache: Optional[ValidationCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_validation_cache() -> ValidationCache:
+    """Devuelve la caché compartida de la aplicación"""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = ValidationCache(max_entries=config.RESULT_CACHE_SIZE)
+        return _cache
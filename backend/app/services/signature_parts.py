@@ -0,0 +1,146 @@
+"""
+Extracción en una sola pasada de los elementos de una firma XMLDSig/XAdES
+"""
+
+from typing import Optional
+
+from lxml import etree
+
+
+DS_NS = "http://www.w3.org/2000/09/xmldsig#"
+XADES_NS = "http://uri.etsi.org/01903/v1.3.2#"
+
+DS_SIGNATURE = f"{{{DS_NS}}}Signature"
+
+
+class SignatureParts:
+    """
+    Elementos de un ds:Signature que usa la validación.
+
+    Se rellena recorriendo el subárbol de la firma una única vez; para cada
+    elemento se guarda la primera aparición en orden de documento, igual
+    que haría un find(".//...").
+    """
+
+    __slots__ = (
+        "signature",
+        "signed_info",
+        "canonicalization_method",
+        "signature_method",
+        "references",
+        "signature_value",
+        "certificates",
+        "qualifying_properties",
+        "signed_properties",
+        "signing_time",
+        "signature_timestamp",
+        "encapsulated_timestamp",
+        "complete_certificate_refs",
+        "complete_revocation_refs",
+        "document_digests",
+        "streamed",
+    )
+
+    def __init__(self, signature: etree._Element):
+        self.signature = signature
+        self.signed_info: Optional[etree._Element] = None
+        # Atributo Algorithm de los métodos declarados en SignedInfo
+        self.canonicalization_method: Optional[str] = None
+        self.signature_method: Optional[str] = None
+        self.references: list[etree._Element] = []
+        self.signature_value: Optional[str] = None
+        # Contenido base64 de cada ds:X509Certificate (el primero es el firmante)
+        self.certificates: list[str] = []
+        self.qualifying_properties: Optional[etree._Element] = None
+        self.signed_properties: Optional[etree._Element] = None
+        self.signing_time: Optional[str] = None
+        self.signature_timestamp: Optional[etree._Element] = None
+        self.encapsulated_timestamp: Optional[str] = None
+        self.complete_certificate_refs: Optional[etree._Element] = None
+        self.complete_revocation_refs: Optional[etree._Element] = None
+        # Digests del documento sin la firma calculados al parsear en
+        # streaming (URI de DigestMethod -> digest); None en modo árbol
+        self.document_digests: Optional[dict[str, bytes]] = None
+        # True si el árbol es parcial (parseo en streaming): fuera de la
+        # firma solo se conservan sus ancestros
+        self.streamed = False
+
+    @property
+    def certificate(self) -> Optional[str]:
+        """Certificado del firmante (base64)"""
+        return self.certificates[0] if self.certificates else None
+
+
+def _first(slot: str):
+    def handler(parts: SignatureParts, el: etree._Element) -> None:
+        if getattr(parts, slot) is None:
+            setattr(parts, slot, el)
+    return handler
+
+
+def _first_text(slot: str):
+    def handler(parts: SignatureParts, el: etree._Element) -> None:
+        if getattr(parts, slot) is None:
+            setattr(parts, slot, el.text)
+    return handler
+
+
+def _first_algorithm(slot: str):
+    def handler(parts: SignatureParts, el: etree._Element) -> None:
+        if getattr(parts, slot) is None:
+            setattr(parts, slot, el.get("Algorithm") or "")
+    return handler
+
+
+def _reference(parts: SignatureParts, el: etree._Element) -> None:
+    # Solo las referencias de la firma principal (no de contrafirmas)
+    if el.getparent() is parts.signed_info:
+        parts.references.append(el)
+
+
+def _certificate(parts: SignatureParts, el: etree._Element) -> None:
+    if el.text:
+        parts.certificates.append(el.text)
+
+
+# Tag (notación Clark) -> cómo guardarlo en el registro
+_HANDLERS = {
+    f"{{{DS_NS}}}SignedInfo": _first("signed_info"),
+    f"{{{DS_NS}}}CanonicalizationMethod": _first_algorithm("canonicalization_method"),
+    f"{{{DS_NS}}}SignatureMethod": _first_algorithm("signature_method"),
+    f"{{{DS_NS}}}Reference": _reference,
+    f"{{{DS_NS}}}SignatureValue": _first_text("signature_value"),
+    f"{{{DS_NS}}}X509Certificate": _certificate,
+    f"{{{XADES_NS}}}QualifyingProperties": _first("qualifying_properties"),
+    f"{{{XADES_NS}}}SignedProperties": _first("signed_properties"),
+    f"{{{XADES_NS}}}SigningTime": _first_text("signing_time"),
+    f"{{{XADES_NS}}}SignatureTimeStamp": _first("signature_timestamp"),
+    f"{{{XADES_NS}}}EncapsulatedTimeStamp": _first_text("encapsulated_timestamp"),
+    f"{{{XADES_NS}}}CompleteCertificateRefs": _first("complete_certificate_refs"),
+    f"{{{XADES_NS}}}CompleteRevocationRefs": _first("complete_revocation_refs"),
+}
+
+
+def find_signature(doc: etree._Element) -> Optional[etree._Element]:
+    """
+    Localiza el ds:Signature del documento.
+
+    Las firmas enveloped de Facturae cuelgan directamente de la raíz, así que
+    se miran primero sus hijos y solo si no está ahí se recorre el documento
+    (el cuerpo de la factura puede ser mucho mayor que la firma).
+    """
+    for child in doc:
+        if child.tag == DS_SIGNATURE:
+            return child
+    return next(doc.iterdescendants(DS_SIGNATURE), None)
+
+
+def extract_signature_parts(signature: etree._Element) -> SignatureParts:
+    """Recorre una vez el subárbol de la firma y rellena el registro"""
+    parts = SignatureParts(signature)
+    handlers = _HANDLERS
+    for el in signature.iterdescendants():
+        handler = handlers.get(el.tag)
+        if handler is not None:
+            handler(parts, el)
+    return parts
@@ -0,0 +1,400 @@
+"""
+Modo de parseo en streaming (iterparse) para documentos firmados grandes
+
+En lugar de construir el árbol completo, se recorre el documento una vez:
+se conserva solo el subárbol de ds:Signature, se liberan los elementos ya
+procesados y a la vez se calcula el digest de la referencia enveloped
+(documento completo sin la firma) canonicalizando en streaming.
+
+Compromiso: la memoria no crece con el tamaño del documento, pero la
+canonicalización en Python es varias veces más lenta que el modo árbol
+(que delega en libxml2), así que solo compensa en documentos grandes.
+"""
+
+import tempfile
+from typing import IO, Iterable, Optional, Union
+
+from lxml import etree
+
+from .. import config
+from .signature_parts import DS_NS, DS_SIGNATURE
+from .xmldsig import C14N_INCLUSIVE, DIGEST_METHODS
+from .xml_parser import parser_options as default_parser_options, reject_doctype
+
+XML_NS = "http://www.w3.org/XML/1998/namespace"
+
+_DS_SIGNED_INFO = f"{{{DS_NS}}}SignedInfo"
+_DS_REFERENCE = f"{{{DS_NS}}}Reference"
+_DS_DIGEST_METHOD = f"{{{DS_NS}}}DigestMethod"
+
+# Fragmentos acumulados antes de volcar la salida canonicalizada a los hashes
+_FLUSH_PIECES = 4096
+# Tamaño de bloque al releer la salida guardada mientras no se conocía el algoritmo
+_REPLAY_BLOCK = 1024 * 1024
+
+
+class StreamedDocument:
+    """Resultado del parseo en streaming"""
+
+    __slots__ = ("root", "signature", "document_digests", "document_c14n")
+
+    def __init__(self):
+        # Raíz del árbol parcial: solo conserva la firma y sus ancestros
+        self.root: Optional[etree._Element] = None
+        self.signature: Optional[etree._Element] = None
+        # Digest del documento sin la firma por URI de DigestMethod
+        # (None si no se pudo calcular en streaming)
+        self.document_digests: Optional[dict[str, bytes]] = None
+        self.document_c14n = C14N_INCLUSIVE
+
+
+def _escape_text(text: str) -> str:
+    return (
+        text.replace("&", "&amp;")
+        .replace("<", "&lt;")
+        .replace(">", "&gt;")
+        .replace("\r", "&#xD;")
+    )
+
+
+def _escape_attr(value: str) -> str:
+    return (
+        value.replace("&", "&amp;")
+        .replace("<", "&lt;")
+        .replace('"', "&quot;")
+        .replace("\t", "&#x9;")
+        .replace("\n", "&#xA;")
+        .replace("\r", "&#xD;")
+    )
+
+
+class _DigestSink:
+    """
+    Destino de la salida canonicalizada.
+
+    En Facturae la firma suele ir al final, así que el documento llega antes
+    que su DigestMethod. Hasta conocerlo la salida se guarda en un fichero
+    temporal (en memoria hasta STREAM_SPOOL_BYTES) y al conocerlo se vuelca
+    solo a los hashes de los algoritmos declarados; a partir de ahí se
+    hashea directamente.
+    """
+
+    def __init__(self):
+        self._spool: Optional[IO[bytes]] = tempfile.SpooledTemporaryFile(
+            max_size=config.STREAM_SPOOL_BYTES
+        )
+        self._hashers: Optional[dict] = None
+
+    def update(self, chunk: bytes) -> None:
+        if self._hashers is None:
+            self._spool.write(chunk)
+            return
+        for hasher in self._hashers.values():
+            hasher.update(chunk)
+
+    def select(self, uris: Iterable[str]) -> None:
+        """Fija los algoritmos a calcular y hashea lo guardado hasta ahora"""
+        self._hashers = {uri: DIGEST_METHODS[uri].new() for uri in uris if uri in DIGEST_METHODS}
+        spool, self._spool = self._spool, None
+        if self._hashers:
+            spool.seek(0)
+            while block := spool.read(_REPLAY_BLOCK):
+                for hasher in self._hashers.values():
+                    hasher.update(block)
+        spool.close()
+
+    def digests(self) -> dict[str, bytes]:
+        if self._hashers is None:
+            # Sin firma no hay ninguna referencia que comprobar
+            self.select(())
+        return {uri: hasher.digest() for uri, hasher in self._hashers.items()}
+
+    def close(self) -> None:
+        if self._spool is not None:
+            self._spool.close()
+            self._spool = None
+
+
+class _C14NStream:
+    """
+    Canonicalización XML 1.0 inclusiva (sin comentarios) dirigida por los
+    eventos de iterparse. La salida se acumula y se vuelca por bloques al
+    destino, sin construir nunca el documento canonicalizado completo.
+    """
+
+    def __init__(self, sink: _DigestSink):
+        self._sink = sink
+        self._buffer: list[str] = []
+        # Ruta caliente: un fragmento por etiqueta y texto
+        self._write = self._buffer.append
+        self._qnames: dict[tuple, str] = {}
+        # Espacios de nombres en ámbito de cada elemento abierto
+        self._ns_stack: list[dict] = []
+        self.root_done = False
+
+    def flush(self) -> None:
+        if not self._buffer:
+            return
+        self._sink.update("".join(self._buffer).encode("utf-8"))
+        self._buffer.clear()
+
+    def before_child(self, node) -> None:
+        """Emite el texto que precede a un nodo hijo (texto del padre o cola del hermano)"""
+        parent = node.getparent()
+        if parent is None:
+            return
+        previous = node.getprevious()
+        if previous is None:
+            text = parent.text
+        else:
+            if isinstance(previous, etree._Entity):
+                raise ValueError("Referencias a entidades no soportadas en streaming")
+            text = previous.tail
+        if text:
+            self._write(_escape_text(text))
+
+    def start(self, el: etree._Element, declared: list[tuple[str, str]]) -> None:
+        """
+        Emite la etiqueta de apertura.
+
+        Args:
+            el: elemento recién abierto
+            declared: declaraciones de espacio de nombres del propio elemento
+                (eventos start-ns de iterparse), para no consultar el nsmap
+                completo en cada elemento
+        """
+        self.before_child(el)
+
+        parent_ns = self._ns_stack[-1] if self._ns_stack else {}
+        nsmap = parent_ns
+        decls = None
+        if declared:
+            # Declaraciones nuevas respecto al padre
+            nsmap = dict(parent_ns)
+            decls = []
+            for prefix, uri in declared:
+                key = prefix or None
+                if uri:
+                    nsmap[key] = uri
+                else:
+                    nsmap.pop(key, None)
+                if parent_ns.get(key) == uri or (not uri and key not in parent_ns):
+                    continue
+                if prefix:
+                    decls.append((prefix, f' xmlns:{prefix}="{_escape_attr(uri)}"'))
+                else:
+                    decls.append(("", f' xmlns="{_escape_attr(uri)}"'))
+            decls.sort()
+        self._ns_stack.append(nsmap)
+
+        key = (el.tag, el.prefix)
+        qname = self._qnames.get(key)
+        if qname is None:
+            qname = self._qnames[key] = _qname(*key)
+
+        if not decls and not el.attrib:
+            self._write(f"<{qname}>")
+            return
+
+        parts = ["<", qname]
+        if decls:
+            parts.extend(d for _, d in decls)
+
+        # Atributos ordenados por (URI del espacio de nombres, nombre local)
+        if el.attrib:
+            attrs = []
+            for key, value in el.attrib.items():
+                if key[0] == "{":
+                    uri, local = key[1:].split("}", 1)
+                    if uri == XML_NS:
+                        name = f"xml:{local}"
+                    else:
+                        prefix = next(p for p, u in nsmap.items() if u == uri and p)
+                        name = f"{prefix}:{local}"
+                else:
+                    uri, local, name = "", key, key
+                attrs.append((uri, local, f' {name}="{_escape_attr(value)}"'))
+            attrs.sort()
+            parts.extend(a for _, _, a in attrs)
+
+        parts.append(">")
+        self._write("".join(parts))
+
+    def end(self, el: etree._Element) -> None:
+        if len(el):
+            last = el[-1]
+            if isinstance(last, etree._Entity):
+                raise ValueError("Referencias a entidades no soportadas en streaming")
+            text = last.tail
+        else:
+            text = el.text
+        if text:
+            self._write(_escape_text(text))
+        self._write(f"</{self._qnames[(el.tag, el.prefix)]}>")
+        self._ns_stack.pop()
+        if not self._ns_stack:
+            self.root_done = True
+        if len(self._buffer) >= _FLUSH_PIECES:
+            self.flush()
+
+    def processing_instruction(self, pi) -> None:
+        data = f"<?{pi.target}{' ' + pi.text if pi.text else ''}?>"
+        if pi.getparent() is not None:
+            self.before_child(pi)
+            self._write(data)
+        elif self.root_done:
+            self._write("\n" + data)
+        else:
+            self._write(data + "\n")
+
+    def comment(self, comment) -> None:
+        # Los comentarios no se canonicalizan, pero su cola sí
+        if comment.getparent() is not None:
+            self.before_child(comment)
+
+
+def _qname(tag: str, prefix: Optional[str]) -> str:
+    local = tag.rsplit("}", 1)[-1]
+    return f"{prefix}:{local}" if prefix else local
+
+
+def _enveloped_digest_methods(signature: etree._Element) -> set[str]:
+    """DigestMethod de las referencias de la firma al documento completo (URI="")"""
+    signed_info = signature.find(_DS_SIGNED_INFO)
+    if signed_info is None:
+        return set()
+    uris = set()
+    for reference in signed_info.iterfind(_DS_REFERENCE):
+        method = reference.find(_DS_DIGEST_METHOD)
+        if reference.get("URI") == "" and method is not None:
+            uris.add(method.get("Algorithm", ""))
+    return uris
+
+
+def parse_streaming(
+    source: Union[bytes, str, IO[bytes]], compute_digests: bool = True, **parser_options
+) -> StreamedDocument:
+    """
+    Parsea el documento en streaming localizando la firma y calculando el
+    digest de la referencia enveloped.
+
+    Solo se calculan los DigestMethod que declaran las referencias URI=""
+    de la firma; si el documento no está firmado document_digests queda vacío.
+
+    Args:
+        source: ruta del archivo o file-like binario
+        compute_digests: calcular el digest del documento; sin él solo se
+            extrae la firma (document_digests queda a None)
+        parser_options: opciones de iterparse que sustituyen a las endurecidas
+            por defecto (p.ej. huge_tree)
+
+    Raises:
+        etree.XMLSyntaxError: si el XML no está bien formado
+        UnsafeXMLError: si declara un DOCTYPE
+    """
+    result = StreamedDocument()
+    sink = _DigestSink() if compute_digests else None
+    try:
+        canonical = _parse_into(result, source, sink, parser_options)
+        if canonical:
+            result.document_digests = sink.digests()
+    finally:
+        if sink is not None:
+            sink.close()
+    return result
+
+
+def _parse_into(
+    result: StreamedDocument,
+    source: Union[bytes, str, IO[bytes]],
+    sink: Optional[_DigestSink],
+    parser_options: dict,
+) -> bool:
+    """
+    Recorre los eventos de iterparse canonicalizando hacia sink.
+
+    Returns:
+        True si el documento se canonicalizó completo (sink tiene el digest)
+    """
+    c14n: Optional[_C14NStream] = _C14NStream(sink) if sink is not None else None
+
+    # Elementos que no se pueden liberar: la firma y sus ancestros
+    protected: set = set()
+    signature = None
+    inside_signature = 0
+    declared: list[tuple[str, str]] = []
+
+    events = etree.iterparse(
+        source,
+        events=("start-ns", "start", "end", "comment", "pi"),
+        **{**default_parser_options(), **parser_options},
+    )
+    for event, node in events:
+        if event == "start-ns":
+            # Llega antes del "start" del elemento que lo declara
+            if not inside_signature:
+                declared.append(node)
+            continue
+
+        if inside_signature:
+            # Subárbol de la firma: se conserva entero y se excluye del digest
+            if event == "start":
+                inside_signature += 1
+            elif event == "end":
+                inside_signature -= 1
+                if not inside_signature and c14n is not None:
+                    # Firma completa: ya se sabe qué algoritmos hacen falta
+                    sink.select(_enveloped_digest_methods(node))
+            continue
+
+        if event == "start":
+            if result.root is None:
+                # El DOCTYPE ya se ha leído al llegar el primer elemento
+                reject_doctype(node)
+                result.root = node
+            if signature is None and node.tag == DS_SIGNATURE:
+                signature = node
+                protected.update(node.iterancestors())
+                protected.add(node)
+                inside_signature = 1
+                declared = []
+                if c14n is not None:
+                    c14n.before_child(node)
+                continue
+            if c14n is not None:
+                try:
+                    c14n.start(node, declared)
+                except (StopIteration, ValueError):
+                    c14n = None
+            declared = []
+            continue
+
+        if event == "end":
+            if c14n is not None:
+                try:
+                    c14n.end(node)
+                except ValueError:
+                    c14n = None
+            if node in protected:
+                continue
+            # Liberar el elemento y los hermanos anteriores ya procesados
+            node.clear(keep_tail=True)
+            parent = node.getparent()
+            if parent is not None:
+                previous = node.getprevious()
+                while previous is not None and previous not in protected:
+                    parent.remove(previous)
+                    previous = node.getprevious()
+            continue
+
+        if c14n is not None:
+            if event == "pi":
+                c14n.processing_instruction(node)
+            else:
+                c14n.comment(node)
+
+    result.signature = signature
+    if c14n is None:
+        return False
+    c14n.flush()
+    return True
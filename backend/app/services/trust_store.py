@@ -0,0 +1,364 @@
+"""
+Almacén de confianza indexado y validación de cadenas de certificados
+"""
+
+import base64
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Optional
+
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes
+from lxml import etree
+
+from .. import config
+from .xml_parser import parse_xml
+
+
+# Longitud máxima de una cadena (hoja incluida)
+MAX_CHAIN_LENGTH = 10
+# Segundos que se reutiliza una cadena no válida: la causa (una CA aún no
+# vigente, un emisor que falta en el almacén...) puede dejar de serlo
+FAILED_CHAIN_TTL = 300.0
+
+PEM_SUFFIXES = (".pem", ".crt", ".cer", ".der")
+TSL_SUFFIXES = (".xml",)
+
+# Servicios de una TSL cuyos certificados son anclas: CA que emiten
+# certificados cualificados, con estado «granted» (ETSI TS 119 612)
+TSL_CA_SERVICE_TYPES = {"http://uri.etsi.org/TrstSvc/Svctype/CA/QC"}
+TSL_GRANTED_STATUSES = {"http://uri.etsi.org/TrstSvc/TrustedList/Svcstatus/granted"}
+
+
+@dataclass
+class ChainResult:
+    """Resultado de construir y verificar la cadena de un certificado"""
+    valid: bool
+    # Hoja, intermedios y el certificado de confianza en que termina
+    chain: list[x509.Certificate] = field(default_factory=list)
+    error: Optional[str] = None
+    # Momento (epoch) a partir del cual hay que volver a validarla, p.ej.
+    # porque caduca alguno de los certificados de la cadena
+    expires_at: float = float("inf")
+
+    @property
+    def issuer(self) -> Optional[x509.Certificate]:
+        """Emisor del certificado hoja (si se encontró)"""
+        return self.chain[1] if len(self.chain) > 1 else None
+
+
+def fingerprint(cert: x509.Certificate) -> bytes:
+    """SHA-256 del DER del certificado"""
+    return cert.fingerprint(hashes.SHA256())
+
+
+def _key_identifier(cert: x509.Certificate) -> Optional[bytes]:
+    """Subject Key Identifier (o el que se deriva de la clave si no lo declara)"""
+    try:
+        return cert.extensions.get_extension_for_class(x509.SubjectKeyIdentifier).value.digest
+    except x509.ExtensionNotFound:
+        try:
+            return x509.SubjectKeyIdentifier.from_public_key(cert.public_key()).digest
+        except (ValueError, TypeError):
+            return None
+
+
+def _authority_key_identifier(cert: x509.Certificate) -> Optional[bytes]:
+    try:
+        extension = cert.extensions.get_extension_for_class(x509.AuthorityKeyIdentifier)
+    except x509.ExtensionNotFound:
+        return None
+    return extension.value.key_identifier
+
+
+def _can_issue(cert: x509.Certificate, intermediates_below: int) -> bool:
+    """
+    Si cert puede emitir el siguiente certificado de la cadena: es una CA
+    (basicConstraints), su keyUsage incluye keyCertSign y su pathLen admite
+    los intermedios que ya cuelgan de él (RFC 5280, 4.2.1.3 y 4.2.1.9)
+    """
+    try:
+        constraints = cert.extensions.get_extension_for_class(x509.BasicConstraints).value
+    except x509.ExtensionNotFound:
+        # Certificados v1 sin extensiones (raíces antiguas)
+        return cert.version == x509.Version.v1
+    if not constraints.ca:
+        return False
+    if constraints.path_length is not None and intermediates_below > constraints.path_length:
+        return False
+    try:
+        return cert.extensions.get_extension_for_class(x509.KeyUsage).value.key_cert_sign
+    except x509.ExtensionNotFound:
+        return False
+
+
+class _CertificateIndex:
+    """Certificados indexados por DN del sujeto y por Subject Key Identifier"""
+
+    def __init__(self, certificates: list[x509.Certificate] = ()):
+        self.by_subject: dict[x509.Name, list[x509.Certificate]] = {}
+        self.by_key_id: dict[bytes, list[x509.Certificate]] = {}
+        self.fingerprints: set[bytes] = set()
+        for cert in certificates:
+            self.add(cert)
+
+    def add(self, cert: x509.Certificate) -> None:
+        fp = fingerprint(cert)
+        if fp in self.fingerprints:
+            return
+        self.fingerprints.add(fp)
+        self.by_subject.setdefault(cert.subject, []).append(cert)
+        key_id = _key_identifier(cert)
+        if key_id is not None:
+            self.by_key_id.setdefault(key_id, []).append(cert)
+
+    def issuers_of(self, cert: x509.Certificate) -> list[x509.Certificate]:
+        """
+        Candidatos a emisor: por Authority Key Identifier si el certificado
+        lo declara (O(1) y sin ambigüedad entre CAs renovadas con el mismo
+        DN) y si no por DN del emisor.
+        """
+        aki = _authority_key_identifier(cert)
+        if aki is not None:
+            candidates = self.by_key_id.get(aki)
+            if candidates:
+                return [c for c in candidates if c.subject == cert.issuer]
+        return self.by_subject.get(cert.issuer, [])
+
+    def __len__(self) -> int:
+        return len(self.fingerprints)
+
+
+class TrustStore:
+    """
+    Certificados de confianza cargados de un directorio (PEM/DER y listas
+    TSL en XML, como la de prestadores cualificados españoles).
+
+    Todo certificado del almacén es un ancla de confianza: una cadena es
+    válida en cuanto llega a uno de ellos (de una TSL solo se cargan las CA
+    cualificadas vigentes). Cada emisor de la cadena debe ser una CA con
+    keyCertSign y respetar su pathLen. Las cadenas ya validadas se
+    memorizan por huella del certificado hoja, así que un lote de facturas
+    de los mismos pocos firmantes solo paga la verificación una vez; las
+    no válidas, solo FAILED_CHAIN_TTL segundos. Recargar el almacén (load,
+    add) descarta todo lo memorizado.
+    """
+
+    def __init__(self, directory: Optional[str] = None, max_entries: int = 1024):
+        self.directory = directory
+        self.max_entries = max_entries
+        self._anchors = _CertificateIndex()
+        self._chains: OrderedDict[tuple, ChainResult] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        if directory:
+            self.load(directory)
+
+    @property
+    def configured(self) -> bool:
+        return self.directory is not None
+
+    def load(self, directory: str) -> int:
+        """Indexa los certificados del directorio (recursivo); devuelve cuántos"""
+        anchors = _CertificateIndex()
+        for path in sorted(Path(directory).rglob("*")):
+            if not path.is_file():
+                continue
+            suffix = path.suffix.lower()
+            try:
+                if suffix in PEM_SUFFIXES:
+                    certificates = _load_certificate_file(path.read_bytes())
+                elif suffix in TSL_SUFFIXES:
+                    certificates = _load_tsl(path.read_bytes())
+                else:
+                    continue
+            except (ValueError, etree.XMLSyntaxError):  # incluye UnsafeXMLError
+                continue
+            for cert in certificates:
+                anchors.add(cert)
+
+        with self._lock:
+            self.directory = directory
+            self._anchors = anchors
+            self._chains.clear()
+        return len(anchors)
+
+    def add(self, cert: x509.Certificate) -> None:
+        """Añade un certificado de confianza"""
+        with self._lock:
+            self._anchors.add(cert)
+            self._chains.clear()
+
+    def validate(
+        self,
+        leaf: x509.Certificate,
+        intermediates: list[x509.Certificate] = (),
+    ) -> ChainResult:
+        """
+        Construye y verifica la cadena de leaf hasta un certificado del
+        almacén, usando además los intermedios que traiga la firma.
+        """
+        leaf_fp = fingerprint(leaf)
+        key = (leaf_fp, frozenset(fingerprint(c) for c in intermediates))
+        now = time.time()
+        with self._lock:
+            cached = self._chains.get(key)
+            if cached is not None and now < cached.expires_at:
+                self._chains.move_to_end(key)
+                self.hits += 1
+                return cached
+            self.misses += 1
+            anchors = self._anchors
+
+        result = _build_chain(leaf, leaf_fp, anchors, _CertificateIndex(intermediates))
+        if not result.valid:
+            result.expires_at = min(result.expires_at, now + FAILED_CHAIN_TTL)
+
+        if self.max_entries > 0:
+            with self._lock:
+                self._chains[key] = result
+                self._chains.move_to_end(key)
+                while len(self._chains) > self.max_entries:
+                    self._chains.popitem(last=False)
+        return result
+
+    def stats(self) -> dict[str, Any]:
+        """Contadores para monitorización"""
+        with self._lock:
+            return {
+                "anchors": len(self._anchors),
+                "chains": len(self._chains),
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+
+def _build_chain(
+    leaf: x509.Certificate,
+    leaf_fp: bytes,
+    anchors: _CertificateIndex,
+    intermediates: _CertificateIndex,
+) -> ChainResult:
+    """Recorre emisores (primero el almacén, luego los de la firma) hasta un ancla"""
+    chain = [leaf]
+    seen = {leaf_fp}
+    current = leaf
+    current_fp = leaf_fp
+    now = time.time()
+    expires_at = float("inf")
+
+    while True:
+        if current_fp in anchors.fingerprints:
+            return ChainResult(valid=True, chain=chain, expires_at=expires_at)
+        if len(chain) >= MAX_CHAIN_LENGTH:
+            return ChainResult(
+                valid=False, chain=chain, error="Cadena de certificados demasiado larga"
+            )
+
+        # Intermedios (sin contar los autoemitidos) entre la hoja y el emisor
+        intermediates_below = sum(1 for cert in chain[1:] if cert.subject != cert.issuer)
+        issuer = None
+        unauthorized = None
+        for candidate in anchors.issuers_of(current) + intermediates.issuers_of(current):
+            if fingerprint(candidate) in seen:
+                continue
+            try:
+                current.verify_directly_issued_by(candidate)
+            except Exception:
+                continue
+            if not _can_issue(candidate, intermediates_below):
+                unauthorized = candidate
+                continue
+            issuer = candidate
+            break
+
+        if issuer is None and unauthorized is not None:
+            return ChainResult(
+                valid=False,
+                chain=chain,
+                error=(
+                    f"«{_common_name(unauthorized)}» no está autorizado a emitir certificados "
+                    "(basicConstraints, keyUsage o pathLen)"
+                ),
+            )
+        if issuer is None:
+            # Autofirmado o emisor desconocido: no llega a una CA de confianza
+            return ChainResult(
+                valid=False,
+                chain=chain,
+                error=(
+                    "No se encontró en el almacén de confianza el emisor de "
+                    f"«{_common_name(current)}»"
+                ),
+            )
+
+        valid_from = issuer.not_valid_before_utc.timestamp()
+        valid_until = issuer.not_valid_after_utc.timestamp()
+        if valid_from > now or valid_until < now:
+            return ChainResult(
+                valid=False,
+                chain=chain + [issuer],
+                error=f"El certificado de la CA «{_common_name(issuer)}» no está vigente",
+            )
+        expires_at = min(expires_at, valid_until)
+
+        chain.append(issuer)
+        current = issuer
+        current_fp = fingerprint(issuer)
+        seen.add(current_fp)
+
+
+def _common_name(cert: x509.Certificate) -> str:
+    names = cert.subject.get_attributes_for_oid(x509.oid.NameOID.COMMON_NAME)
+    return str(names[0].value) if names else cert.subject.rfc4514_string()
+
+
+def _load_certificate_file(data: bytes) -> list[x509.Certificate]:
+    if b"-----BEGIN" in data:
+        return x509.load_pem_x509_certificates(data)
+    return [x509.load_der_x509_certificate(data)]
+
+
+def _load_tsl(data: bytes) -> list[x509.Certificate]:
+    """
+    Certificados de una Trusted Service List (ETSI TS 119 612): solo la
+    ServiceDigitalIdentity de los servicios de CA cualificada con estado
+    vigente. Ni el certificado que firma la lista (ds:KeyInfo) ni los de
+    servicios retirados o de otro tipo (sellado de tiempo, OCSP...) son
+    anclas de confianza.
+    """
+    root = parse_xml(data, strip_comments=True)
+    certificates = []
+    # La historia de cada servicio va en ServiceHistoryInstance: aquí solo
+    # se mira el estado actual
+    for info in root.iter("{*}ServiceInformation"):
+        service_type = (info.findtext("{*}ServiceTypeIdentifier") or "").strip()
+        status = (info.findtext("{*}ServiceStatus") or "").strip()
+        if service_type not in TSL_CA_SERVICE_TYPES or status not in TSL_GRANTED_STATUSES:
+            continue
+        for el in info.iterfind("{*}ServiceDigitalIdentity/{*}DigitalId/{*}X509Certificate"):
+            if el.text:
+                try:
+                    certificates.append(
+                        x509.load_der_x509_certificate(base64.b64decode("".join(el.text.split())))
+                    )
+                except ValueError:
+                    continue
+    return certificates
+
+
+_store: Optional[TrustStore] = None
+_store_lock = threading.Lock()
+
+
+def get_trust_store() -> TrustStore:
+    """Devuelve el almacén del proceso actual (se indexa la primera vez)"""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = TrustStore(config.TRUST_STORE_DIR or None, max_entries=config.CHAIN_CACHE_SIZE)
+        return _store
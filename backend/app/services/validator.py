@@ -2,18 +2,28 @@
 Servicio de validación de firmas XAdES para Facturae
 """
 
+import os
 from datetime import datetime, timezone
-from typing import Optional
-import re
+from io import BytesIO
+from typing import Optional, Union
 
 from lxml import etree
 from cryptography import x509
-from cryptography.hazmat.primitives import hashes
 from cryptography.hazmat.primitives.asymmetric import padding, rsa, ec
-from cryptography.x509.oid import NameOID
+from cryptography.hazmat.primitives.asymmetric.utils import Prehashed, encode_dss_signature
 import requests
 
-from ..models.response import SignatureResponse, SignerInfo, CertificateInfo
+from .. import config
+from ..models.response import SignatureResponse
+from .certificates import ParsedCertificate, find_issuer, get_certificate_registry
+from .crl import CRLError, crl_distribution_points, get_crl_store
+from .metrics import stage
+from .ocsp import OCSPError, RevocationError, get_ocsp_client, ocsp_url
+from .signature_parts import SignatureParts, extract_signature_parts, find_signature
+from .streaming import parse_streaming
+from .trust_store import get_trust_store
+from .xml_parser import UnsafeXMLError, parse_xml, parse_xml_file
+from .xmldsig import SIGNATURE_METHODS, ReferenceUnavailable, signed_info_digest, verify_references
 
 
 # Namespaces comunes en Facturae firmadas
@@ -23,195 +33,292 @@ NAMESPACES = {
     "fe": "http://www.facturae.gob.es/formato/Versiones/Facturaev3_2_2.xml",
 }
 
-
-def validate_xades_signature(xml_content: bytes) -> SignatureResponse:
+# Errores que dependen de la fecha en que se valida
+ERROR_CERT_NOT_YET_VALID = "El certificado aún no es válido"
+ERROR_CERT_EXPIRED = "El certificado ha expirado"
+TIME_DEPENDENT_ERRORS = (ERROR_CERT_NOT_YET_VALID, ERROR_CERT_EXPIRED)
+
+# Niveles de validación: cada uno ejecuta las etapas del anterior y más
+LEVEL_INSPECT = "inspect"
+LEVEL_CRYPTO = "crypto"
+LEVEL_FULL = "full"
+VALIDATION_LEVELS = (LEVEL_INSPECT, LEVEL_CRYPTO, LEVEL_FULL)
+
+# Etapas que se informan en SignatureResponse.stages
+STAGE_PARSE = "parse"
+STAGE_INSPECT = "inspect"
+STAGE_SIGNATURE = "signature"
+STAGE_REFERENCES = "references"
+STAGE_CHAIN = "chain"
+STAGE_REVOCATION = "revocation"
+
+
+def validate_xades_signature(
+    xml_content: Union[bytes, str],
+    parse_mode: Optional[str] = None,
+    level: str = LEVEL_FULL,
+) -> SignatureResponse:
     """
     Valida una firma XAdES en un documento XML.
 
     Args:
-        xml_content: Contenido del archivo XML en bytes
+        xml_content: Contenido del archivo XML en bytes, o ruta del archivo
+            (las subidas grandes se vuelcan a disco y se parsean por ruta)
+        parse_mode: "tree", "stream" o "auto" (por defecto, según configuración:
+            en "auto" los archivos grandes se parsean en streaming)
+        level: hasta qué etapa se valida:
+            - "inspect": firmante, certificado y tipo XAdES, sin verificar
+              nada (valid queda a None)
+            - "crypto": además la firma y los digests de las referencias
+            - "full": además la cadena de confianza y la revocación
 
     Returns:
-        SignatureResponse con los resultados de la validación
+        SignatureResponse con los resultados de la validación; stages
+        indica las etapas ejecutadas
     """
+    if level not in VALIDATION_LEVELS:
+        raise ValueError(f"Nivel de validación desconocido: {level}")
     errors: list[str] = []
     warnings: list[str] = []
+    stages: list[str] = []
 
     try:
-        # Parsear XML
+        # Parsear XML y buscar elemento Signature
+        document_digests = None
+        inspect_only = level == LEVEL_INSPECT
+        # Para inspeccionar basta un parseo parcial: en streaming solo se
+        # conserva el subárbol de la firma y no se calcula ningún digest
+        streaming = inspect_only or _use_streaming(xml_content, parse_mode)
         try:
-            doc = etree.fromstring(xml_content)
-        except etree.XMLSyntaxError as e:
+            is_path = isinstance(xml_content, str)
+            if streaming:
+                with stage("parse"):
+                    streamed = parse_streaming(
+                        xml_content if is_path else BytesIO(xml_content),
+                        compute_digests=not inspect_only,
+                    )
+                signature = streamed.signature
+                document_digests = streamed.document_digests
+            else:
+                # Comentarios e instrucciones se conservan: entran en el c14n
+                with stage("parse"):
+                    doc = parse_xml_file(xml_content) if is_path else parse_xml(xml_content)
+                    signature = find_signature(doc)
+        except (etree.XMLSyntaxError, UnsafeXMLError) as e:
             return SignatureResponse(
                 valid=False,
-                errors=[f"XML inválido: {str(e)}"]
+                errors=[f"XML inválido: {str(e)}"],
+                level=level,
+                stages=[STAGE_PARSE],
             )
+        stages.append(STAGE_PARSE)
 
-        # Buscar elemento Signature
-        signature = doc.find(".//ds:Signature", namespaces=NAMESPACES)
         if signature is None:
             return SignatureResponse(
                 valid=None,
                 errors=["No se encontró firma digital en el documento"],
-                warnings=["El documento no está firmado"]
+                warnings=["El documento no está firmado"],
+                level=level,
+                stages=stages,
             )
 
+        # Extraer en una pasada los elementos de la firma
+        parts = extract_signature_parts(signature)
+        parts.document_digests = document_digests
+        parts.streamed = streaming
+
         # Extraer certificado
-        cert_b64 = signature.findtext(".//ds:X509Certificate", namespaces=NAMESPACES)
+        cert_b64 = parts.certificate
         if not cert_b64:
             return SignatureResponse(
                 valid=False,
-                errors=["No se encontró certificado X509 en la firma"]
+                errors=["No se encontró certificado X509 en la firma"],
+                level=level,
+                stages=stages,
             )
 
-        # Decodificar y parsear certificado
+        # Decodificar y parsear certificado (o reutilizarlo si ya se vio)
         try:
-            import base64
-            cert_der = base64.b64decode(cert_b64)
-            cert = x509.load_der_x509_certificate(cert_der)
+            with stage("certificate"):
+                parsed_cert = get_certificate_registry().load(cert_b64)
         except Exception as e:
             return SignatureResponse(
                 valid=False,
-                errors=[f"Error al parsear certificado: {str(e)}"]
+                errors=[f"Error al parsear certificado: {str(e)}"],
+                level=level,
+                stages=stages,
             )
+        cert = parsed_cert.certificate
 
-        # Extraer información del certificado
-        cert_info = extract_certificate_info(cert)
-        signer_info = extract_signer_info(cert)
-
-        # Verificar validez temporal del certificado
-        now = datetime.now(timezone.utc)
-        if cert.not_valid_before_utc > now:
-            errors.append("El certificado aún no es válido")
-            cert_info.is_expired = True
-        elif cert.not_valid_after_utc < now:
-            errors.append("El certificado ha expirado")
-            cert_info.is_expired = True
+        # Información del certificado (copias: la respuesta se modifica)
+        cert_info = parsed_cert.info.model_copy()
+        signer_info = parsed_cert.signer.model_copy()
 
         # Detectar tipo de firma XAdES
-        signature_type = detect_xades_type(signature)
+        signature_type = detect_xades_type(parts)
+        stages.append(STAGE_INSPECT)
+
+        if inspect_only:
+            response = SignatureResponse(
+                valid=None,
+                signer=signer_info,
+                certificate=cert_info,
+                signature_type=signature_type,
+                warnings=["Firma no verificada (nivel inspect)"],
+                level=level,
+                stages=stages,
+            )
+            return apply_time_checks(response)
 
         # Verificar firma matemáticamente
-        signature_valid = verify_signature_value(doc, signature, cert)
+        signature_valid = verify_signature_value(parts, parsed_cert)
+        stages.append(STAGE_SIGNATURE)
 
         if not signature_valid:
             errors.append("La firma digital no es válida matemáticamente")
 
-        # Intentar verificar revocación (OCSP)
+        # Verificar que el contenido firmado (factura y SignedProperties) no
+        # ha cambiado: digest de cada ds:Reference
+        try:
+            with stage("c14n"):
+                reference_errors = verify_references(parts)
+        except ReferenceUnavailable:
+            # Referencia a contenido que el parseo en streaming no conserva
+            # (poco habitual): se repite la validación sobre el árbol completo
+            return validate_xades_signature(xml_content, parse_mode="tree", level=level)
+        errors.extend(reference_errors)
+        stages.append(STAGE_REFERENCES)
+
+        chain_valid = None
         revoked = None
         revocation_checked = False
-        try:
-            revoked, revocation_checked = check_revocation_status(cert)
-            if revoked:
-                errors.append("El certificado ha sido revocado")
-        except Exception as e:
-            warnings.append(f"No se pudo verificar revocación: {str(e)}")
+        if level == LEVEL_FULL:
+            # Intermedios incluidos en el KeyInfo de la firma
+            intermediates = _load_intermediates(parts)
+
+            # Verificar la cadena hasta una CA de confianza (si hay almacén)
+            issuer = None
+            trust_store = get_trust_store()
+            if trust_store.configured:
+                with stage("chain"):
+                    chain = trust_store.validate(cert, intermediates)
+                chain_valid = chain.valid
+                issuer = chain.issuer
+                if not chain.valid:
+                    warnings.append(f"Cadena de certificados no válida: {chain.error}")
+                stages.append(STAGE_CHAIN)
+            if issuer is None:
+                issuer = find_issuer(cert, intermediates)
+
+            # Intentar verificar revocación (OCSP o CRL)
+            try:
+                with stage("revocation"):
+                    revoked, revocation_checked = check_revocation_status(cert, issuer)
+                if revoked:
+                    errors.append("El certificado ha sido revocado")
+            except Exception as e:
+                warnings.append(f"No se pudo verificar revocación: {str(e)}")
+            stages.append(STAGE_REVOCATION)
 
         # Extraer timestamp si existe
-        timestamp = extract_timestamp(signature)
-
-        # Determinar validez final
-        is_valid = signature_valid and not cert_info.is_expired and not revoked
+        timestamp = extract_timestamp(parts)
 
-        return SignatureResponse(
-            valid=is_valid,
+        response = SignatureResponse(
+            valid=signature_valid and not reference_errors and not revoked,
             signer=signer_info,
             certificate=cert_info,
-            chain_valid=None,  # Requiere trust store completo
+            chain_valid=chain_valid,
             revoked=revoked,
             revocation_checked=revocation_checked,
             timestamp=timestamp,
             signature_type=signature_type,
             errors=errors,
-            warnings=warnings
+            warnings=warnings,
+            level=level,
+            stages=stages,
         )
 
+        # Verificar validez temporal del certificado y determinar validez final
+        return apply_time_checks(response)
+
     except Exception as e:
         return SignatureResponse(
             valid=False,
-            errors=[f"Error inesperado: {str(e)}"]
+            errors=[f"Error inesperado: {str(e)}"],
+            level=level,
+            stages=stages,
         )
 
 
-def extract_certificate_info(cert: x509.Certificate) -> CertificateInfo:
-    """Extrae información del certificado X509"""
-    try:
-        issuer = cert.issuer.get_attributes_for_oid(NameOID.COMMON_NAME)
-        issuer_name = issuer[0].value if issuer else str(cert.issuer)
-
-        subject = cert.subject.get_attributes_for_oid(NameOID.COMMON_NAME)
-        subject_name = subject[0].value if subject else str(cert.subject)
-
-        return CertificateInfo(
-            issuer=issuer_name,
-            subject=subject_name,
-            serial=str(cert.serial_number),
-            valid_from=cert.not_valid_before_utc,
-            valid_to=cert.not_valid_after_utc,
-            is_expired=False
-        )
-    except Exception:
-        return CertificateInfo()
+def _load_intermediates(parts: SignatureParts) -> list[x509.Certificate]:
+    """Resto de certificados del KeyInfo (los que no se pueden parsear se ignoran)"""
+    registry = get_certificate_registry()
+    intermediates = []
+    for cert_b64 in parts.certificates[1:]:
+        try:
+            intermediates.append(registry.load(cert_b64).certificate)
+        except Exception:
+            continue
+    return intermediates
 
 
-def extract_signer_info(cert: x509.Certificate) -> SignerInfo:
-    """Extrae información del firmante del certificado"""
-    try:
-        # Nombre común
-        cn = cert.subject.get_attributes_for_oid(NameOID.COMMON_NAME)
-        name = cn[0].value if cn else None
-
-        # Organización
-        org = cert.subject.get_attributes_for_oid(NameOID.ORGANIZATION_NAME)
-        organization = org[0].value if org else None
-
-        # NIF/CIF - buscar en varios campos
-        tax_id = None
-        serial_number = cert.subject.get_attributes_for_oid(NameOID.SERIAL_NUMBER)
-        if serial_number:
-            # El serialNumber suele contener el NIF en certificados españoles
-            sn = serial_number[0].value
-            # Extraer NIF (formato: IDCES-12345678A o similar)
-            nif_match = re.search(r"[A-Z]?\d{7,8}[A-Z]", sn)
-            if nif_match:
-                tax_id = nif_match.group()
-            else:
-                tax_id = sn
+def _use_streaming(xml_content: Union[bytes, str], parse_mode: Optional[str]) -> bool:
+    """Decide si el documento se parsea en streaming o como árbol completo"""
+    mode = (parse_mode or config.PARSE_MODE).lower()
+    if mode == "stream":
+        return True
+    if mode == "tree":
+        return False
+    size = os.path.getsize(xml_content) if isinstance(xml_content, str) else len(xml_content)
+    return size >= config.STREAM_THRESHOLD
 
-        # Email
-        email = None
-        try:
-            san = cert.extensions.get_extension_for_oid(x509.oid.ExtensionOID.SUBJECT_ALTERNATIVE_NAME)
-            for name_entry in san.value:
-                if isinstance(name_entry, x509.RFC822Name):
-                    email = name_entry.value
-                    break
-        except x509.ExtensionNotFound:
-            pass
-
-        return SignerInfo(
-            name=name,
-            tax_id=tax_id,
-            organization=organization,
-            email=email
-        )
-    except Exception:
-        return SignerInfo()
 
+def apply_time_checks(
+    response: SignatureResponse, now: Optional[datetime] = None
+) -> SignatureResponse:
+    """
+    Evalúa los campos que dependen de la fecha actual (vigencia del
+    certificado) y recalcula la validez final.
 
-def detect_xades_type(signature: etree._Element) -> Optional[str]:
+    Es idempotente, así que sirve también para refrescar un resultado
+    cacheado sin repetir la validación criptográfica. Si la firma no se
+    verificó (valid a None, nivel inspect) no hay validez que recalcular y
+    la vigencia se avisa en warnings.
+    """
+    cert_info = response.certificate
+    if cert_info is None or cert_info.valid_from is None or cert_info.valid_to is None:
+        return response
+
+    now = now or datetime.now(timezone.utc)
+    time_errors = []
+    if cert_info.valid_from > now:
+        time_errors.append(ERROR_CERT_NOT_YET_VALID)
+    elif cert_info.valid_to < now:
+        time_errors.append(ERROR_CERT_EXPIRED)
+    cert_info.is_expired = bool(time_errors)
+
+    if response.valid is None:
+        warnings = [w for w in response.warnings if w not in TIME_DEPENDENT_ERRORS]
+        response.warnings = warnings + time_errors
+        return response
+
+    # Una firma completa es válida si y solo si no hay errores
+    errors = [e for e in response.errors if e not in TIME_DEPENDENT_ERRORS]
+    response.errors = errors + time_errors
+    response.valid = not response.errors
+    return response
+
+
+def detect_xades_type(parts: SignatureParts) -> Optional[str]:
     """Detecta el tipo de firma XAdES"""
     # Buscar elementos XAdES
-    qualifying_props = signature.find(".//xades:QualifyingProperties", namespaces=NAMESPACES)
-    if qualifying_props is None:
+    if parts.qualifying_properties is None:
         return "XMLDSig"  # Firma básica sin XAdES
 
-    # Buscar timestamp
-    signature_timestamp = signature.find(".//xades:SignatureTimeStamp", namespaces=NAMESPACES)
-
-    # Buscar referencias de validación
-    complete_cert_refs = signature.find(".//xades:CompleteCertificateRefs", namespaces=NAMESPACES)
-    complete_revoc_refs = signature.find(".//xades:CompleteRevocationRefs", namespaces=NAMESPACES)
+    # Timestamp y referencias de validación
+    signature_timestamp = parts.signature_timestamp
+    complete_cert_refs = parts.complete_certificate_refs
+    complete_revoc_refs = parts.complete_revocation_refs
 
     if complete_cert_refs is not None and complete_revoc_refs is not None:
         if signature_timestamp is not None:
@@ -223,77 +330,60 @@ def detect_xades_type(signature: etree._Element) -> Optional[str]:
         return "XAdES-BES"
 
 
-def verify_signature_value(
-    doc: etree._Element,
-    signature: etree._Element,
-    cert: x509.Certificate
-) -> bool:
+def verify_signature_value(parts: SignatureParts, parsed_cert: ParsedCertificate) -> bool:
     """
-    Verifica la firma digital matemáticamente.
+    Verifica matemáticamente SignatureValue sobre SignedInfo.
 
-    Nota: Esta es una verificación simplificada.
-    Para producción, usar signxml o librería similar.
+    SignedInfo se canonicaliza con el CanonicalizationMethod declarado y su
+    salida alimenta directamente el hash del SignatureMethod; la clave
+    pública verifica ese digest (Prehashed). Los digests de las referencias
+    se comprueban aparte, en verify_references.
     """
     try:
         # Obtener SignatureValue
-        sig_value_b64 = signature.findtext(".//ds:SignatureValue", namespaces=NAMESPACES)
+        sig_value_b64 = parts.signature_value
         if not sig_value_b64:
             return False
 
         import base64
-        signature_bytes = base64.b64decode(sig_value_b64.replace("\n", "").replace(" ", ""))
+        signature_bytes = base64.b64decode("".join(sig_value_b64.split()))
 
-        # Obtener SignedInfo (lo que se firma)
-        signed_info = signature.find(".//ds:SignedInfo", namespaces=NAMESPACES)
-        if signed_info is None:
+        # Algoritmo de firma declarado (tabla de URIs soportados)
+        method = SIGNATURE_METHODS.get(parts.signature_method or "")
+        if method is None:
             return False
 
-        # Canonicalizar SignedInfo
-        signed_info_c14n = etree.tostring(signed_info, method="c14n", exclusive=True)
-
-        # Obtener clave pública
-        public_key = cert.public_key()
+        # Canonicalizar SignedInfo (lo que se firma) y calcular su digest
+        with stage("c14n"):
+            digest = signed_info_digest(parts, method.digest)
+        if digest is None:
+            return False
+        hash_alg = Prehashed(method.digest.hash_algorithm())
 
-        # Determinar algoritmo de firma
-        sig_method = signature.find(".//ds:SignatureMethod", namespaces=NAMESPACES)
-        algorithm = sig_method.get("Algorithm") if sig_method is not None else ""
+        # Clave pública (ya cargada en el registro de certificados)
+        public_key = parsed_cert.public_key
 
         # Verificar según tipo de clave
         try:
-            if isinstance(public_key, rsa.RSAPublicKey):
-                # RSA con PKCS1v15
-                if "sha256" in algorithm.lower():
-                    hash_alg = hashes.SHA256()
-                elif "sha512" in algorithm.lower():
-                    hash_alg = hashes.SHA512()
+            with stage("verify"):
+                if method.key_type == "rsa" and isinstance(public_key, rsa.RSAPublicKey):
+                    # RSA con PKCS1v15
+                    public_key.verify(signature_bytes, digest, padding.PKCS1v15(), hash_alg)
+                    return True
+                elif method.key_type == "ecdsa" and isinstance(
+                    public_key, ec.EllipticCurvePublicKey
+                ):
+                    # ECDSA: XMLDSig codifica la firma como r || s, no en DER
+                    half = len(signature_bytes) // 2
+                    der_signature = encode_dss_signature(
+                        int.from_bytes(signature_bytes[:half], "big"),
+                        int.from_bytes(signature_bytes[half:], "big"),
+                    )
+                    public_key.verify(der_signature, digest, ec.ECDSA(hash_alg))
+                    return True
                 else:
-                    hash_alg = hashes.SHA1()
-
-                public_key.verify(
-                    signature_bytes,
-                    signed_info_c14n,
-                    padding.PKCS1v15(),
-                    hash_alg
-                )
-                return True
-            elif isinstance(public_key, ec.EllipticCurvePublicKey):
-                # ECDSA
-                if "sha256" in algorithm.lower():
-                    hash_alg = hashes.SHA256()
-                elif "sha512" in algorithm.lower():
-                    hash_alg = hashes.SHA512()
-                else:
-                    hash_alg = hashes.SHA1()
-
-                public_key.verify(
-                    signature_bytes,
-                    signed_info_c14n,
-                    ec.ECDSA(hash_alg)
-                )
-                return True
-            else:
-                # Tipo de clave no soportado
-                return False
+                    # Tipo de clave no soportado o distinto del declarado
+                    return False
         except Exception:
             return False
 
@@ -301,54 +391,67 @@ def verify_signature_value(
         return False
 
 
-def check_revocation_status(cert: x509.Certificate) -> tuple[Optional[bool], bool]:
+def check_revocation_status(
+    cert: x509.Certificate, issuer: Optional[x509.Certificate] = None
+) -> tuple[Optional[bool], bool]:
     """
-    Verifica el estado de revocación del certificado via OCSP.
+    Verifica el estado de revocación del certificado via OCSP y, si el
+    certificado no declara servidor OCSP o este no responde, via CRL.
+
+    Args:
+        cert: certificado del firmante
+        issuer: certificado emisor (si no se conoce, se descarga de la URL
+            caIssuers del propio certificado)
 
     Returns:
         Tuple de (revoked: bool | None, checked: bool)
-    """
-    try:
-        # Buscar URL de OCSP en el certificado
-        try:
-            aia = cert.extensions.get_extension_for_oid(
-                x509.oid.ExtensionOID.AUTHORITY_INFORMATION_ACCESS
-            )
-            ocsp_url = None
-            for access in aia.value:
-                if access.access_method == x509.oid.AuthorityInformationAccessOID.OCSP:
-                    ocsp_url = access.access_location.value
-                    break
 
-            if not ocsp_url:
-                return None, False
-
-            # Por simplicidad, no implementamos la petición OCSP completa aquí
-            # En producción, usar una librería como ocspbuilder
-            return None, False
+    Raises:
+        RevocationError: si el certificado declara OCSP o CRL pero no se
+            pudo obtener una respuesta válida a tiempo
+    """
+    # Buscar URLs de OCSP y CRL en el certificado
+    url = ocsp_url(cert)
+    crl_urls = crl_distribution_points(cert)
+    if not url and not crl_urls:
+        return None, False
 
-        except x509.ExtensionNotFound:
-            return None, False
+    if issuer is None:
+        issuer = get_ocsp_client().fetch_issuer(cert)
+    if issuer is None:
+        raise RevocationError("No se encontró el certificado emisor para verificar la revocación")
 
-    except Exception:
-        return None, False
+    ocsp_error = None
+    if url:
+        try:
+            result = get_ocsp_client().check(cert, issuer, url)
+            if result.revoked is not None or not crl_urls:
+                return result.revoked, result.revoked is not None
+        except OCSPError as e:
+            if not crl_urls:
+                raise
+            ocsp_error = e
+
+    # Alternativa: CRL (índice local compartido entre workers)
+    try:
+        return get_crl_store().is_revoked(cert, issuer, crl_urls), True
+    except CRLError as e:
+        if ocsp_error is not None:
+            raise RevocationError(f"{ocsp_error}; {e}")
+        raise
 
 
-def extract_timestamp(signature: etree._Element) -> Optional[datetime]:
+def extract_timestamp(parts: SignatureParts) -> Optional[datetime]:
     """Extrae el timestamp de la firma si existe"""
     try:
-        # Buscar SigningTime en XAdES
-        signing_time = signature.findtext(
-            ".//xades:SigningTime",
-            namespaces=NAMESPACES
-        )
+        # SigningTime en XAdES
+        signing_time = parts.signing_time
         if signing_time:
             return datetime.fromisoformat(signing_time.replace("Z", "+00:00"))
 
-        # Buscar en SignatureTimeStamp
-        timestamp = signature.find(".//xades:SignatureTimeStamp", namespaces=NAMESPACES)
-        if timestamp is not None:
-            encapsulated = timestamp.findtext(".//xades:EncapsulatedTimeStamp", namespaces=NAMESPACES)
+        # SignatureTimeStamp
+        if parts.signature_timestamp is not None:
+            encapsulated = parts.encapsulated_timestamp
             if encapsulated:
                 # El timestamp está en formato ASN.1, necesitaría parsing adicional
                 pass
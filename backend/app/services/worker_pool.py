@@ -0,0 +1,357 @@
+"""
+Pool de workers para ejecutar trabajos CPU-bound fuera del event loop
+"""
+
+import asyncio
+import itertools
+import multiprocessing
+import os
+import queue
+import signal
+import threading
+import time
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Optional
+
+from .. import config
+
+
+# Veces que se envía un trabajo: si otro trabajo agota su tiempo y se
+# recicla el executor, los que compartían executor se reenvían una vez
+MAX_ATTEMPTS = 2
+
+# Cada cuánto comprueba el hilo de avisos si su executor se ha retirado
+LISTENER_POLL_INTERVAL = 0.5
+
+# Estado de cada worker (proceso o hilo): la cola por la que avisa al pool
+# de que empieza un trabajo
+_worker_state = threading.local()
+
+
+class JobTimeoutError(TimeoutError):
+    """El trabajo superó el tiempo máximo permitido"""
+
+
+def _warm_worker() -> None:
+    """
+    Importa de antemano las librerías pesadas para que el primer trabajo
+    no pague el coste de importación.
+    """
+    import lxml.etree  # noqa: F401
+    from cryptography import x509  # noqa: F401
+    from cryptography.hazmat.primitives.asymmetric import ec, rsa  # noqa: F401
+
+    from . import validator  # noqa: F401
+    from .trust_store import get_trust_store
+
+    # Indexar el almacén de confianza antes de la primera validación
+    get_trust_store()
+
+
+def _init_worker(started: Any) -> None:
+    """Inicializador de cada worker"""
+    _worker_state.started = started
+    _warm_worker()
+
+
+def _run_job(job_id: int, fn: Callable[..., Any], args: tuple) -> Any:
+    """Avisa al pool de que el trabajo empieza (y en qué proceso) y lo ejecuta"""
+    _worker_state.started.put((job_id, os.getpid()))
+    return fn(*args)
+
+
+def _ping(delay: float) -> None:
+    """Trabajo vacío usado para arrancar los workers"""
+    time.sleep(delay)
+
+
+class _Generation:
+    """Un executor, su cola de avisos de inicio y el hilo que la lee"""
+
+    def __init__(self, executor: Executor, started: Any):
+        self.executor = executor
+        self.started = started
+        # Retirado porque un trabajo agotó su tiempo: sus trabajos se reenvían
+        self.recycled = False
+        self.closed = False
+
+
+class _Job:
+    """Trabajo enviado al pool; pid es None mientras espera en la cola"""
+
+    def __init__(self, loop: asyncio.AbstractEventLoop):
+        self.loop = loop
+        self.started = asyncio.Event()
+        self.pid: Optional[int] = None
+
+
+class _Resubmit(Exception):
+    """El executor del trabajo se recicló antes de que terminara"""
+
+
+class WorkerPool:
+    """
+    Ejecuta funciones síncronas en un pool de procesos (o de hilos si los
+    procesos no están disponibles) y lleva la cuenta de los trabajos en curso.
+
+    El tiempo máximo de un trabajo empieza a contar cuando un worker lo
+    toma, no mientras espera en la cola. Si se agota, el worker no queda
+    ocupado: en modo proceso se termina su proceso y se crea un executor
+    nuevo (los trabajos que compartían el anterior se reenvían); en modo
+    hilo, que no se puede interrumpir, el hilo se abandona con su executor
+    y se cuenta en «stuck» hasta que termina.
+    """
+
+    def __init__(
+        self,
+        mode: str = "process",
+        size: int = 1,
+        timeout: Optional[float] = None,
+        start_method: Optional[str] = None,
+    ):
+        self.mode = mode
+        self.size = max(1, size)
+        self.timeout = timeout
+        self.start_method = start_method
+        self._generation: Optional[_Generation] = None
+        self._lock = threading.Lock()
+        self._ids = itertools.count()
+        self._jobs: dict[int, _Job] = {}
+        self._in_flight = 0
+        self._stuck = 0
+        self._completed = 0
+        self._failed = 0
+        self._timed_out = 0
+        self._recycled = 0
+
+    def _get_generation(self) -> _Generation:
+        """Crea el executor la primera vez que se necesita (o tras retirarlo)"""
+        with self._lock:
+            if self._generation is None:
+                self._generation = self._create_generation()
+            return self._generation
+
+    def _create_generation(self) -> _Generation:
+        if self.mode == "process":
+            try:
+                context = multiprocessing.get_context(self.start_method)
+                started = context.Queue()
+                executor: Executor = ProcessPoolExecutor(
+                    max_workers=self.size,
+                    mp_context=context,
+                    initializer=_init_worker,
+                    initargs=(started,),
+                )
+                return self._start_listener(_Generation(executor, started))
+            except (OSError, ValueError, NotImplementedError, ImportError):
+                # Entornos sin soporte de multiprocessing: usar hilos
+                self.mode = "thread"
+        started = queue.SimpleQueue()
+        executor = ThreadPoolExecutor(
+            max_workers=self.size,
+            thread_name_prefix="facturaview-worker",
+            initializer=_init_worker,
+            initargs=(started,),
+        )
+        return self._start_listener(_Generation(executor, started))
+
+    def _start_listener(self, generation: _Generation) -> _Generation:
+        """Hilo que marca como iniciados los trabajos según avisan los workers"""
+
+        def listen() -> None:
+            while not generation.closed:
+                try:
+                    job_id, pid = generation.started.get(timeout=LISTENER_POLL_INTERVAL)
+                except queue.Empty:
+                    continue
+                except Exception:
+                    # Cola dañada por un worker terminado a mitad de escribir
+                    break
+                with self._lock:
+                    job = self._jobs.get(job_id)
+                    if job is not None:
+                        job.pid = pid
+                if job is not None:
+                    try:
+                        job.loop.call_soon_threadsafe(job.started.set)
+                    except RuntimeError:
+                        pass  # Event loop ya cerrado
+
+        threading.Thread(target=listen, name="facturaview-worker-listener", daemon=True).start()
+        return generation
+
+    def _retire(self, generation: _Generation, wait: bool = False) -> None:
+        """Descarta un executor (roto, reciclado o al parar) para que se cree uno nuevo"""
+        with self._lock:
+            if self._generation is generation:
+                self._generation = None
+        generation.executor.shutdown(wait=wait, cancel_futures=True)
+        generation.closed = True
+
+    def _recycle(self, generation: _Generation, job: _Job) -> None:
+        """Libera el worker de un trabajo que agotó su tiempo"""
+        with self._lock:
+            if generation.recycled:
+                return
+            generation.recycled = True
+            self._recycled += 1
+        if isinstance(generation.executor, ProcessPoolExecutor) and job.pid is not None:
+            # El executor queda roto: el resto de sus trabajos se reenvían
+            try:
+                os.kill(job.pid, getattr(signal, "SIGKILL", signal.SIGTERM))
+            except OSError:
+                pass
+        self._retire(generation)
+
+    def _track_stuck(self, future: Future) -> None:
+        """Cuenta el trabajo abandonado hasta que su worker termina de verdad"""
+        with self._lock:
+            self._stuck += 1
+
+        def release(_: Future) -> None:
+            with self._lock:
+                self._stuck -= 1
+
+        future.add_done_callback(release)
+
+    async def run(self, fn: Callable[..., Any], *args: Any, timeout: Optional[float] = None) -> Any:
+        """
+        Ejecuta fn(*args) en el pool sin bloquear el event loop.
+
+        Raises:
+            JobTimeoutError: si el trabajo supera el tiempo máximo desde que
+                un worker lo empieza a ejecutar
+        """
+        timeout = self.timeout if timeout is None else timeout
+
+        with self._lock:
+            self._in_flight += 1
+        try:
+            for attempt in range(1, MAX_ATTEMPTS + 1):
+                generation = self._get_generation()
+                try:
+                    result = await self._run_once(generation, fn, args, timeout)
+                except _Resubmit as e:
+                    if attempt < MAX_ATTEMPTS:
+                        continue
+                    with self._lock:
+                        self._failed += 1
+                    raise BrokenProcessPool(
+                        "El executor se recicló varias veces durante el trabajo"
+                    ) from e
+                except JobTimeoutError:
+                    with self._lock:
+                        self._timed_out += 1
+                    raise
+                except BrokenProcessPool:
+                    with self._lock:
+                        self._failed += 1
+                    self._retire(generation)
+                    raise
+                except Exception:
+                    with self._lock:
+                        self._failed += 1
+                    raise
+                with self._lock:
+                    self._completed += 1
+                return result
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+
+    async def _run_once(
+        self, generation: _Generation, fn: Callable[..., Any], args: tuple, timeout: Optional[float]
+    ) -> Any:
+        job = _Job(asyncio.get_running_loop())
+        with self._lock:
+            job_id = next(self._ids)
+            self._jobs[job_id] = job
+        future: Optional[Future] = None
+        started: Optional[asyncio.Future] = None
+        try:
+            try:
+                future = generation.executor.submit(_run_job, job_id, fn, args)
+            except (BrokenProcessPool, RuntimeError):
+                # Executor retirado entre que se eligió y el envío
+                if generation.recycled or self._generation is not generation:
+                    raise _Resubmit() from None
+                raise
+            result = asyncio.wrap_future(future)
+            started = asyncio.ensure_future(job.started.wait())
+
+            # La espera en la cola no cuenta para el tiempo máximo
+            await asyncio.wait((result, started), return_when=asyncio.FIRST_COMPLETED)
+            if not result.done():
+                done, _ = await asyncio.wait((result,), timeout=timeout)
+                if not done:
+                    # Nadie esperará ya su resultado (o el error al terminar el proceso)
+                    result.add_done_callback(lambda f: f.cancelled() or f.exception())
+                    self._track_stuck(future)
+                    self._recycle(generation, job)
+                    raise JobTimeoutError(f"El trabajo superó el límite de {timeout} s")
+
+            if result.cancelled() or isinstance(result.exception(), BrokenProcessPool):
+                if generation.recycled:
+                    raise _Resubmit()
+            return result.result()
+        finally:
+            if started is not None:
+                started.cancel()
+            # Cancelado desde fuera (cliente desconectado): si aún no ha
+            # empezado, el trabajo no llega a ejecutarse
+            if future is not None and not future.done() and job.pid is None:
+                future.cancel()
+            with self._lock:
+                del self._jobs[job_id]
+
+    async def warm_up(self) -> None:
+        """Arranca todos los workers para que estén listos antes del primer trabajo"""
+        executor = self._get_generation().executor
+        futures = [asyncio.wrap_future(executor.submit(_ping, 0.05)) for _ in range(self.size)]
+        await asyncio.gather(*futures, return_exceptions=True)
+
+    def shutdown(self) -> None:
+        """Detiene el pool (los trabajos en cola se cancelan)"""
+        with self._lock:
+            generation = self._generation
+        if generation is not None:
+            self._retire(generation, wait=True)
+
+    @property
+    def queue_depth(self) -> int:
+        """Trabajos esperando un worker libre"""
+        return sum(1 for job in self._jobs.values() if job.pid is None)
+
+    def stats(self) -> dict[str, Any]:
+        """Estado del pool para monitorización"""
+        with self._lock:
+            return {
+                "mode": self.mode,
+                "workers": self.size,
+                "in_flight": self._in_flight,
+                "queue_depth": self.queue_depth,
+                "stuck": self._stuck,
+                "completed": self._completed,
+                "failed": self._failed,
+                "timed_out": self._timed_out,
+                "recycled": self._recycled,
+            }
+
+
+_pool: Optional[WorkerPool] = None
+_pool_lock = threading.Lock()
+
+
+def get_worker_pool() -> WorkerPool:
+    """Devuelve el pool compartido de la aplicación"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = WorkerPool(
+                mode=config.POOL_MODE,
+                size=config.POOL_SIZE,
+                timeout=config.JOB_TIMEOUT,
+                start_method=config.POOL_START_METHOD,
+            )
+        return _pool
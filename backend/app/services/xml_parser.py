@@ -0,0 +1,99 @@
+"""
+Parsers XML endurecidos y reutilizables
+
+Crear un etree.XMLParser por documento cuesta una asignación y su
+configuración cada vez, y los valores por defecto de lxml resuelven
+entidades internas. Aquí cada hilo mantiene sus parsers ya configurados
+(sin red, sin resolver entidades, sin DTD) y todos los caminos del backend
+que parsean XML los comparten.
+
+Facturae no usa DOCTYPE, así que cualquier documento que lo declare se
+rechaza: las entidades no se expanden nunca, de modo que un «billion
+laughs» o una entidad externa se descartan sin coste proporcional a la
+expansión.
+"""
+
+import threading
+from typing import Any, Optional
+
+from lxml import etree
+
+from .. import config
+
+
+class UnsafeXMLError(ValueError):
+    """El documento declara un DOCTYPE (entidades, DTD externas...)"""
+
+
+def parser_options(
+    strip_comments: bool = False, huge_tree: Optional[bool] = None
+) -> dict[str, Any]:
+    """
+    Opciones comunes a XMLParser e iterparse.
+
+    Args:
+        strip_comments: descartar comentarios e instrucciones de
+            procesamiento. No debe usarse al verificar firmas: forman parte
+            de la canonicalización de los datos firmados.
+        huge_tree: desactivar los límites de libxml2 (profundidad, tamaño de
+            nodos de texto); por defecto según configuración
+    """
+    return {
+        "resolve_entities": False,
+        "no_network": True,
+        "load_dtd": False,
+        "dtd_validation": False,
+        "remove_comments": strip_comments,
+        "remove_pis": strip_comments,
+        "huge_tree": config.XML_HUGE_TREE if huge_tree is None else huge_tree,
+    }
+
+
+_local = threading.local()
+
+
+def get_parser(strip_comments: bool = False, huge_tree: Optional[bool] = None) -> etree.XMLParser:
+    """
+    Devuelve el parser del hilo actual para esas opciones (se crea la
+    primera vez). Un XMLParser no puede usarse desde dos hilos a la vez,
+    pero sí reutilizarse documento tras documento en el mismo.
+    """
+    huge_tree = config.XML_HUGE_TREE if huge_tree is None else huge_tree
+    parsers = getattr(_local, "parsers", None)
+    if parsers is None:
+        parsers = _local.parsers = {}
+    key = (strip_comments, huge_tree)
+    parser = parsers.get(key)
+    if parser is None:
+        parser = parsers[key] = etree.XMLParser(**parser_options(strip_comments, huge_tree))
+    return parser
+
+
+def reject_doctype(node: etree._Element) -> None:
+    """
+    Raises:
+        UnsafeXMLError: si el documento de node declara un DOCTYPE
+    """
+    docinfo = node.getroottree().docinfo
+    if docinfo.doctype or docinfo.internalDTD is not None or docinfo.externalDTD is not None:
+        raise UnsafeXMLError("El documento declara un DOCTYPE (no permitido)")
+
+
+def parse_xml(source: bytes, strip_comments: bool = False) -> etree._Element:
+    """
+    Parsea bytes con el parser del hilo y devuelve la raíz.
+
+    Raises:
+        etree.XMLSyntaxError: si el XML no está bien formado
+        UnsafeXMLError: si declara un DOCTYPE
+    """
+    root = etree.fromstring(source, get_parser(strip_comments))
+    reject_doctype(root)
+    return root
+
+
+def parse_xml_file(path: str, strip_comments: bool = False) -> etree._Element:
+    """Como parse_xml, leyendo el documento de disco por ruta"""
+    root = etree.parse(path, get_parser(strip_comments)).getroot()
+    reject_doctype(root)
+    return root
@@ -0,0 +1,396 @@
+"""
+Verificación XMLDSig: tablas de algoritmos y digests de las ds:Reference
+"""
+
+import base64
+import hashlib
+import hmac
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Callable, Iterator, Optional, Union
+
+from cryptography.hazmat.primitives import hashes
+from lxml import etree
+
+from .signature_parts import DS_NS, SignatureParts
+
+
+@dataclass(frozen=True)
+class DigestMethod:
+    """Algoritmo de DigestMethod"""
+    uri: str
+    # Constructor de hashlib (digests de las referencias)
+    new: Callable[[], "hashlib._Hash"]
+    # Algoritmo equivalente de cryptography (verificación de SignatureValue)
+    hash_algorithm: Callable[[], hashes.HashAlgorithm]
+
+
+@dataclass(frozen=True)
+class SignatureMethod:
+    """Algoritmo de SignatureMethod"""
+    uri: str
+    key_type: str  # "rsa" o "ecdsa"
+    digest: DigestMethod
+
+
+@dataclass(frozen=True)
+class C14NMethod:
+    """Algoritmo de canonicalización (CanonicalizationMethod o Transform)"""
+    uri: str
+    exclusive: bool
+    with_comments: bool
+
+
+XMLDSIG_URI = "http://www.w3.org/2000/09/xmldsig#"
+XMLDSIG_MORE_URI = "http://www.w3.org/2001/04/xmldsig-more#"
+
+DIGEST_SHA1 = "http://www.w3.org/2000/09/xmldsig#sha1"
+DIGEST_SHA224 = "http://www.w3.org/2001/04/xmldsig-more#sha224"
+DIGEST_SHA256 = "http://www.w3.org/2001/04/xmlenc#sha256"
+DIGEST_SHA384 = "http://www.w3.org/2001/04/xmldsig-more#sha384"
+DIGEST_SHA512 = "http://www.w3.org/2001/04/xmlenc#sha512"
+
+C14N_INCLUSIVE = "http://www.w3.org/TR/2001/REC-xml-c14n-20010315"
+C14N_INCLUSIVE_WITH_COMMENTS = C14N_INCLUSIVE + "#WithComments"
+C14N_EXCLUSIVE = "http://www.w3.org/2001/10/xml-exc-c14n#"
+C14N_EXCLUSIVE_WITH_COMMENTS = C14N_EXCLUSIVE + "WithComments"
+
+TRANSFORM_ENVELOPED = "http://www.w3.org/2000/09/xmldsig#enveloped-signature"
+
+EXC_C14N_NS = "http://www.w3.org/2001/10/xml-exc-c14n#"
+
+# URI -> algoritmo. Se resuelven con una búsqueda exacta: un URI que no está
+# en la tabla no está soportado (nada de adivinar por subcadenas).
+DIGEST_METHODS: dict[str, DigestMethod] = {
+    method.uri: method
+    for method in (
+        DigestMethod(DIGEST_SHA1, hashlib.sha1, hashes.SHA1),
+        DigestMethod(DIGEST_SHA224, hashlib.sha224, hashes.SHA224),
+        DigestMethod(DIGEST_SHA256, hashlib.sha256, hashes.SHA256),
+        DigestMethod(DIGEST_SHA384, hashlib.sha384, hashes.SHA384),
+        DigestMethod(DIGEST_SHA512, hashlib.sha512, hashes.SHA512),
+    )
+}
+
+SIGNATURE_METHODS: dict[str, SignatureMethod] = {
+    method.uri: method
+    for method in (
+        SignatureMethod(XMLDSIG_URI + "rsa-sha1", "rsa", DIGEST_METHODS[DIGEST_SHA1]),
+        SignatureMethod(XMLDSIG_MORE_URI + "rsa-sha224", "rsa", DIGEST_METHODS[DIGEST_SHA224]),
+        SignatureMethod(XMLDSIG_MORE_URI + "rsa-sha256", "rsa", DIGEST_METHODS[DIGEST_SHA256]),
+        SignatureMethod(XMLDSIG_MORE_URI + "rsa-sha384", "rsa", DIGEST_METHODS[DIGEST_SHA384]),
+        SignatureMethod(XMLDSIG_MORE_URI + "rsa-sha512", "rsa", DIGEST_METHODS[DIGEST_SHA512]),
+        SignatureMethod(XMLDSIG_MORE_URI + "ecdsa-sha1", "ecdsa", DIGEST_METHODS[DIGEST_SHA1]),
+        SignatureMethod(XMLDSIG_MORE_URI + "ecdsa-sha224", "ecdsa", DIGEST_METHODS[DIGEST_SHA224]),
+        SignatureMethod(XMLDSIG_MORE_URI + "ecdsa-sha256", "ecdsa", DIGEST_METHODS[DIGEST_SHA256]),
+        SignatureMethod(XMLDSIG_MORE_URI + "ecdsa-sha384", "ecdsa", DIGEST_METHODS[DIGEST_SHA384]),
+        SignatureMethod(XMLDSIG_MORE_URI + "ecdsa-sha512", "ecdsa", DIGEST_METHODS[DIGEST_SHA512]),
+    )
+}
+
+C14N_METHODS: dict[str, C14NMethod] = {
+    method.uri: method
+    for method in (
+        C14NMethod(C14N_INCLUSIVE, exclusive=False, with_comments=False),
+        C14NMethod(C14N_INCLUSIVE_WITH_COMMENTS, exclusive=False, with_comments=True),
+        C14NMethod(C14N_EXCLUSIVE, exclusive=True, with_comments=False),
+        C14NMethod(C14N_EXCLUSIVE_WITH_COMMENTS, exclusive=True, with_comments=True),
+    )
+}
+
+# Conversión por defecto de un conjunto de nodos a octetos (XMLDSig 4.3.3.2)
+DEFAULT_C14N = C14N_METHODS[C14N_INCLUSIVE]
+
+_DS_TRANSFORM = f"{{{DS_NS}}}Transform"
+_DS_DIGEST_METHOD = f"{{{DS_NS}}}DigestMethod"
+_DS_DIGEST_VALUE = f"{{{DS_NS}}}DigestValue"
+_DS_CANONICALIZATION_METHOD = f"{{{DS_NS}}}CanonicalizationMethod"
+_INCLUSIVE_NAMESPACES = f"{{{EXC_C14N_NS}}}InclusiveNamespaces"
+
+_ID_ATTRIBUTES = ("Id", "ID", "id")
+
+# Referencia al documento completo
+_DOCUMENT = "document"
+
+
+class ReferenceUnavailable(Exception):
+    """
+    La referencia apunta a contenido que no se conserva al parsear en
+    streaming; hay que verificarla sobre el árbol completo.
+    """
+
+
+class _DigestWriter:
+    """File-like que vuelca la salida de write_c14n directamente en los hashes"""
+
+    __slots__ = ("_hashers",)
+
+    def __init__(self, hashers: list):
+        self._hashers = hashers
+
+    def write(self, data: bytes) -> None:
+        for hasher in self._hashers:
+            hasher.update(data)
+
+
+def canonicalize_into(
+    node: Union[etree._Element, etree._ElementTree],
+    method: C14NMethod,
+    hashers: list,
+    inclusive_prefixes: Optional[list[str]] = None,
+) -> None:
+    """
+    Canonicaliza un elemento (o el documento) alimentando los hashes por
+    bloques, sin construir el resultado completo en memoria.
+    """
+    tree = node if isinstance(node, etree._ElementTree) else etree.ElementTree(node)
+    tree.write_c14n(
+        _DigestWriter(hashers),
+        exclusive=method.exclusive,
+        with_comments=method.with_comments,
+        inclusive_ns_prefixes=inclusive_prefixes if method.exclusive else None,
+    )
+
+
+def inclusive_prefixes(method_element: Optional[etree._Element]) -> Optional[list[str]]:
+    """PrefixList de ec:InclusiveNamespaces (solo C14N exclusiva)"""
+    if method_element is None:
+        return None
+    inclusive = method_element.find(_INCLUSIVE_NAMESPACES)
+    if inclusive is None:
+        return None
+    return inclusive.get("PrefixList", "").split() or None
+
+
+def signed_info_digest(parts: SignatureParts, digest: DigestMethod) -> Optional[bytes]:
+    """
+    Digest de SignedInfo canonicalizado con el CanonicalizationMethod
+    declarado, o None si el método no está soportado.
+    """
+    c14n = C14N_METHODS.get(parts.canonicalization_method or "")
+    if c14n is None or parts.signed_info is None:
+        return None
+    hasher = digest.new()
+    prefixes = inclusive_prefixes(parts.signed_info.find(_DS_CANONICALIZATION_METHOD))
+    canonicalize_into(parts.signed_info, c14n, [hasher], prefixes)
+    return hasher.digest()
+
+
+@dataclass
+class _ReferenceCheck:
+    """Una ds:Reference ya interpretada"""
+    uri: str
+    target: Union[str, etree._Element]
+    enveloped: bool
+    c14n: C14NMethod
+    prefixes: Optional[tuple[str, ...]]
+    digest: DigestMethod
+    expected: bytes
+
+    @property
+    def group(self) -> tuple:
+        """Referencias con la misma clave producen la misma salida canonicalizada"""
+        target = self.target if isinstance(self.target, str) else id(self.target)
+        return (target, self.enveloped, self.c14n.uri, self.prefixes)
+
+
+def verify_references(parts: SignatureParts) -> list[str]:
+    """
+    Recalcula el digest de cada ds:Reference de SignedInfo.
+
+    Cada nodo referenciado se canonicaliza una sola vez (aunque lo usen
+    varias referencias o algoritmos) y la salida va directa a los hashes.
+
+    Returns:
+        Lista de errores (vacía si todas las referencias coinciden)
+
+    Raises:
+        ReferenceUnavailable: en modo streaming, si alguna referencia apunta
+            a contenido que no se ha conservado
+    """
+    if not parts.references:
+        return ["La firma no contiene referencias (ds:Reference)"]
+
+    errors: list[str] = []
+    checks: list[_ReferenceCheck] = []
+    ids: Optional[dict[str, etree._Element]] = None
+
+    for reference in parts.references:
+        uri = reference.get("URI")
+        label = uri if uri is not None else "(sin URI)"
+
+        method_element = reference.find(_DS_DIGEST_METHOD)
+        digest_uri = method_element.get("Algorithm", "") if method_element is not None else ""
+        digest = DIGEST_METHODS.get(digest_uri)
+        if digest is None:
+            errors.append(f"Referencia {label}: algoritmo de digest no soportado")
+            continue
+
+        try:
+            digest_value = reference.findtext(_DS_DIGEST_VALUE) or ""
+            expected = base64.b64decode("".join(digest_value.split()))
+        except ValueError:
+            errors.append(f"Referencia {label}: DigestValue no es base64 válido")
+            continue
+
+        # Transformaciones: enveloped-signature y canonicalización
+        enveloped = False
+        c14n = DEFAULT_C14N
+        prefixes = None
+        unsupported = None
+        for transform in reference.iter(_DS_TRANSFORM):
+            algorithm = transform.get("Algorithm", "")
+            if algorithm == TRANSFORM_ENVELOPED:
+                enveloped = True
+            elif algorithm in C14N_METHODS:
+                c14n = C14N_METHODS[algorithm]
+                prefixes = inclusive_prefixes(transform)
+            else:
+                unsupported = algorithm
+                break
+        if unsupported is not None:
+            errors.append(f"Referencia {label}: transformación no soportada ({unsupported})")
+            continue
+
+        if uri is None or (uri and not uri.startswith("#")) or uri.startswith("#xpointer("):
+            errors.append(f"Referencia {label}: solo se soportan referencias al propio documento")
+            continue
+
+        # URI="" y "#id" excluyen los comentarios aunque la C14N los admita
+        if c14n.with_comments:
+            c14n = C14N_METHODS[C14N_EXCLUSIVE if c14n.exclusive else C14N_INCLUSIVE]
+
+        if uri == "":
+            target: Union[str, etree._Element] = _DOCUMENT
+        else:
+            if ids is None:
+                ids = _index_ids(parts.signature)
+            target = ids.get(uri[1:])
+            if target is None:
+                if parts.streamed:
+                    raise ReferenceUnavailable(uri)
+                target = _find_by_id(parts.signature, uri[1:])
+            if target is None:
+                errors.append(f"Referencia {label}: no se encontró el elemento referenciado")
+                continue
+
+        checks.append(_ReferenceCheck(
+            uri=label,
+            target=target,
+            enveloped=enveloped,
+            c14n=c14n,
+            prefixes=tuple(prefixes) if prefixes else None,
+            digest=digest,
+            expected=expected,
+        ))
+
+    # Agrupar por salida canonicalizada: un recorrido por nodo y todos los
+    # algoritmos de digest que necesite
+    groups: dict[tuple, list[_ReferenceCheck]] = {}
+    for check in checks:
+        groups.setdefault(check.group, []).append(check)
+
+    for group in groups.values():
+        digests = _group_digests(parts, group)
+        for check in group:
+            if not hmac.compare_digest(digests[check.digest.uri], check.expected):
+                errors.append(
+                    f"Referencia {check.uri}: el digest no coincide (contenido firmado modificado)"
+                )
+
+    return errors
+
+
+def _group_digests(parts: SignatureParts, group: list[_ReferenceCheck]) -> dict[str, bytes]:
+    """Canonicaliza una vez el nodo del grupo y devuelve su digest por algoritmo"""
+    first = group[0]
+    uris = {check.digest.uri for check in group}
+
+    if parts.streamed and first.target is _DOCUMENT:
+        # Solo está disponible el digest calculado durante el propio parseo
+        if (
+            first.enveloped
+            and first.c14n.uri == C14N_INCLUSIVE
+            and parts.document_digests is not None
+            and uris <= parts.document_digests.keys()
+        ):
+            return {uri: parts.document_digests[uri] for uri in uris}
+        raise ReferenceUnavailable(first.uri)
+
+    hashers = {uri: DIGEST_METHODS[uri].new() for uri in uris}
+    prefixes = list(first.prefixes) if first.prefixes else None
+
+    if first.target is _DOCUMENT:
+        node: Union[etree._Element, etree._ElementTree] = parts.signature.getroottree()
+        contains_signature = True
+    else:
+        node = first.target
+        contains_signature = _is_inside(parts.signature, first.target)
+
+    if first.enveloped and contains_signature:
+        with _without_signature(parts.signature):
+            canonicalize_into(node, first.c14n, list(hashers.values()), prefixes)
+    else:
+        canonicalize_into(node, first.c14n, list(hashers.values()), prefixes)
+
+    return {uri: hasher.digest() for uri, hasher in hashers.items()}
+
+
+def _index_ids(signature: etree._Element) -> dict[str, etree._Element]:
+    """Índice Id -> elemento del subárbol de la firma (una pasada)"""
+    ids: dict[str, etree._Element] = {}
+    for el in signature.iter():
+        for name in _ID_ATTRIBUTES:
+            value = el.get(name)
+            if value is not None:
+                ids.setdefault(value, el)
+    return ids
+
+
+def _find_by_id(signature: etree._Element, value: str) -> Optional[etree._Element]:
+    """Busca un elemento por Id en el resto del documento"""
+    found = signature.getroottree().xpath(
+        "//*[@Id=$v or @ID=$v or @id=$v]", v=value
+    )
+    return found[0] if found else None
+
+
+def _is_inside(node: etree._Element, ancestor: etree._Element) -> bool:
+    """node es ancestor o uno de sus descendientes"""
+    while node is not None:
+        if node is ancestor:
+            return True
+        node = node.getparent()
+    return False
+
+
+@contextmanager
+def _without_signature(signature: etree._Element) -> Iterator[None]:
+    """
+    Transformación enveloped-signature: retira temporalmente la firma del
+    árbol (conservando el texto que la sigue) y la repone al terminar.
+    """
+    parent = signature.getparent()
+    if parent is None:
+        yield
+        return
+
+    index = parent.index(signature)
+    previous = signature.getprevious()
+    tail = signature.tail
+    saved = previous.tail if previous is not None else parent.text
+    if tail:
+        if previous is not None:
+            previous.tail = (saved or "") + tail
+        else:
+            parent.text = (saved or "") + tail
+    parent.remove(signature)
+    try:
+        yield
+    finally:
+        parent.insert(index, signature)
+        signature.tail = tail
+        if previous is not None:
+            previous.tail = saved
+        else:
+            parent.text = saved
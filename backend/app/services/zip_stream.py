@@ -0,0 +1,56 @@
+"""
+ZIP escrito en streaming, entrada a entrada
+
+zipfile admite destinos no posicionables: escribe cada entrada con un data
+descriptor en vez de volver atrás a corregir la cabecera. Aquí el destino
+solo acumula lo escrito hasta que se recoge, de modo que el archivo se
+puede enviar por trozos según se añaden entradas, sin tenerlo nunca
+entero en memoria (solo el directorio central, que es pequeño).
+"""
+
+import time
+import zipfile
+from typing import Union
+
+
+class _ChunkSink:
+    """Destino de escritura no posicionable que guarda los trozos escritos"""
+
+    def __init__(self):
+        self._chunks: list[bytes] = []
+
+    def write(self, data: Union[bytes, memoryview]) -> int:
+        self._chunks.append(data)
+        return len(data)
+
+    def flush(self) -> None:
+        pass
+
+    def drain(self) -> list[bytes]:
+        chunks, self._chunks = self._chunks, []
+        return chunks
+
+
+class ZipStreamWriter:
+    """
+    Cada add() devuelve los trozos del archivo producidos por esa entrada
+    (cabecera, datos y descriptor) y close() los del directorio central.
+
+    Por defecto las entradas se almacenan sin comprimir: los .xlsx ya son
+    ZIP comprimidos y volver a comprimirlos solo gasta CPU.
+    """
+
+    def __init__(self, compression: int = zipfile.ZIP_STORED):
+        self._sink = _ChunkSink()
+        self._zip = zipfile.ZipFile(self._sink, "w", compression)
+        self._compression = compression
+
+    def add(self, name: str, data: bytes) -> list[bytes]:
+        info = zipfile.ZipInfo(name, date_time=time.localtime()[:6])
+        info.compress_type = self._compression
+        self._zip.writestr(info, data)
+        return self._sink.drain()
+
+    def close(self) -> list[bytes]:
+        self._zip.close()
+        return self._sink.drain()
@@ -0,0 +1,8 @@
+"""
+Benchmarks reproducibles de la validación de firmas y la exportación a Excel
+
+    uv run python -m backend.benchmarks.run --output resultados.json
+    uv run python -m backend.benchmarks.run --baseline baseline.json --threshold 0.25
+
+Ver backend/benchmarks/run.py para todas las opciones.
+"""
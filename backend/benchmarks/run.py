@@ -0,0 +1,369 @@
+"""
+Ejecuta los benchmarks y los compara con una línea base
+
+    uv run python -m backend.benchmarks.run [opciones]
+
+Casos:
+- validate/{signed,unsigned}/lines=N/invoices=M: validate_xades_signature
+  sobre un Facturae sintético (parse_mode según configuración)
+- validate/parse_mode/{tree,stream}/lines=N: el Facturae firmado, leído
+  desde disco, con cada modo de parseo; además de los tiempos, rss_growth_mb
+  es el crecimiento del pico de RSS al validarlo una vez en un proceso nuevo
+  (el ru_maxrss del proceso del benchmark solo crece y no los distingue)
+- parse/stream/{signature,digest}/lines=N: solo el parseo en streaming del
+  mismo archivo, localizando la firma o además canonicalizando y hasheando
+  el documento (la diferencia es el coste en latencia del digest en Python)
+- excel/{standard,write_only,xlsxwriter,xlsxwriter_constant_memory}/lines=N/invoices=M:
+  generate_excel de cada factura del lote con cada motor (los de XlsxWriter,
+  solo si está instalado)
+- excel/delivery/{bytes,stream}/lines=N: un Excel completo en bytes frente
+  a un temporal leído por trozos (memoria pico de cada forma de entrega)
+- parser/{default,pooled}: parseo con un XMLParser nuevo o el del pool
+
+Por caso se mide latencia (p50/p95/p99), throughput y memoria: el pico de
+asignaciones de Python en una ejecución aparte con tracemalloc (que
+ralentiza) y el ru_maxrss del proceso al terminar el caso.
+
+Con --baseline, sale con código 1 si el p50 de algún caso empeora más que
+--threshold respecto a la línea base; --save-baseline la (re)escribe.
+"""
+
+import argparse
+import gc
+import json
+import math
+import multiprocessing
+import os
+import platform
+import resource
+import sys
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, BinaryIO, Callable, Optional
+
+from lxml import etree
+
+try:
+    from backend.app.services.excel_generator import engine_available, generate_excel, write_excel
+    from backend.app.services.streaming import parse_streaming
+    from backend.app.services.validator import validate_xades_signature
+    from backend.app.services.xml_parser import parse_xml
+except ImportError:
+    from app.services.excel_generator import engine_available, generate_excel, write_excel
+    from app.services.streaming import parse_streaming
+    from app.services.validator import validate_xades_signature
+    from app.services.xml_parser import parse_xml
+
+from .synthetic import facturae_xml, invoice_data, signed_facturae_xml
+
+
+DEFAULT_LINES = (10, 1000, 10000, 50000)
+QUICK_LINES = (10, 1000)
+DEFAULT_INVOICES = (1, 10)
+# Los lotes más grandes se omiten (50.000 líneas x 10 facturas firmadas son
+# cientos de MB y minutos solo de generación)
+MAX_TOTAL_LINES = 100_000
+# Métrica que se compara con la línea base
+REGRESSION_METRIC = "p50_ms"
+# Casos de exportación a Excel: (nombre, write_only, motor)
+EXCEL_MODES = (
+    ("standard", False, "openpyxl"),
+    ("write_only", True, "openpyxl"),
+    ("xlsxwriter", False, "xlsxwriter"),
+    ("xlsxwriter_constant_memory", True, "xlsxwriter"),
+)
+# Modos de parseo que se comparan en validate/parse_mode
+PARSE_MODES = ("tree", "stream")
+
+
+def percentile(samples: list[float], pct: float) -> float:
+    """Percentil por rango más cercano (samples ordenadas)"""
+    if not samples:
+        return 0.0
+    rank = max(0, min(len(samples) - 1, math.ceil(pct / 100 * len(samples)) - 1))
+    return samples[rank]
+
+
+def _max_rss_mb() -> float:
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux lo da en KiB y macOS en bytes
+    return rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024
+
+
+def _peak_rss_mb() -> float:
+    """
+    Pico de RSS de este proceso. En Linux, VmHWM: el ru_maxrss de un
+    proceso lanzado con spawn arrastra el del padre cuando hizo fork
+    """
+    try:
+        with open("/proc/self/status") as status:
+            for line in status:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return _max_rss_mb()
+
+
+def measure(
+    fn: Callable[[], Any],
+    iterations: int,
+    min_iterations: int = 3,
+    time_budget: float = 10.0,
+    items: int = 1,
+) -> dict[str, Any]:
+    """
+    Ejecuta fn tras un calentamiento hasta completar iterations o agotar
+    time_budget (con al menos min_iterations) y resume los tiempos.
+    """
+    fn()  # calentamiento: imports, cachés por proceso, parsers del hilo
+    samples = []
+    deadline = time.perf_counter() + time_budget
+    while len(samples) < iterations and (
+        len(samples) < min_iterations or time.perf_counter() < deadline
+    ):
+        gc.collect()
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    samples.sort()
+    mean = sum(samples) / len(samples)
+
+    gc.collect()
+    tracemalloc.start()
+    try:
+        fn()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {
+        "iterations": len(samples),
+        "mean_ms": mean * 1000,
+        "p50_ms": percentile(samples, 50) * 1000,
+        "p95_ms": percentile(samples, 95) * 1000,
+        "p99_ms": percentile(samples, 99) * 1000,
+        "ops_per_s": 1 / mean if mean else 0.0,
+        "items_per_s": items / mean if mean else 0.0,
+        "peak_alloc_mb": peak / (1024 * 1024),
+        "max_rss_mb": _max_rss_mb(),
+    }
+
+
+def _sizes(lines: tuple[int, ...], invoices: tuple[int, ...]):
+    for n_lines in lines:
+        for n_invoices in invoices:
+            if n_lines * n_invoices <= MAX_TOTAL_LINES:
+                yield n_lines, n_invoices
+
+
+def validation_cases(lines: tuple[int, ...], invoices: tuple[int, ...]):
+    """(nombre, líneas totales, función que genera el documento) por caso"""
+    for n_lines, n_invoices in _sizes(lines, invoices):
+        for signed in (True, False):
+            kind = "signed" if signed else "unsigned"
+            name = f"validate/{kind}/lines={n_lines}/invoices={n_invoices}"
+            build = signed_facturae_xml if signed else facturae_xml
+            yield name, n_lines * n_invoices, (lambda b=build, n=n_lines, m=n_invoices: b(n, m))
+
+
+def _validation_rss_growth(path: str, parse_mode: str, warmup: bytes) -> float:
+    """
+    Crecimiento del pico de RSS (MB) al validar path una vez. Se ejecuta en
+    un proceso nuevo: tras validar warmup (imports y cachés), el pico de
+    partida es el del proceso en reposo
+    """
+    validate_xades_signature(warmup, parse_mode=parse_mode)
+    gc.collect()
+    before = _peak_rss_mb()
+    validate_xades_signature(path, parse_mode=parse_mode)
+    return _peak_rss_mb() - before
+
+
+def rss_growth(path: str, parse_mode: str, warmup: bytes) -> float:
+    """Crecimiento del pico de RSS de una validación, medido en un proceso aparte"""
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+        return executor.submit(_validation_rss_growth, path, parse_mode, warmup).result()
+
+
+def _drain(file: BinaryIO, chunk_size: int = 64 * 1024) -> None:
+    """Lee el archivo por trozos, como la respuesta en streaming"""
+    with file:
+        while file.read(chunk_size):
+            pass
+
+
+def run(
+    lines: tuple[int, ...],
+    invoices: tuple[int, ...],
+    iterations: int,
+    time_budget: float,
+    only: Optional[str] = None,
+    log: Callable[[str], None] = print,
+) -> dict[str, Any]:
+    """Ejecuta todos los casos (o los que contengan only) y devuelve el informe"""
+    results: dict[str, Any] = {}
+
+    def record(name: str, fn: Callable[[], Any], items: int = 1) -> None:
+        if only and only not in name:
+            return
+        results[name] = measure(fn, iterations, time_budget=time_budget, items=items)
+        r = results[name]
+        log(f"{name:<50} p50 {r['p50_ms']:9.2f} ms  p99 {r['p99_ms']:9.2f} ms  "
+            f"{r['ops_per_s']:9.1f} op/s  pico {r['peak_alloc_mb']:8.2f} MB")
+
+    for name, items, build in validation_cases(lines, invoices):
+        if only and only not in name:
+            continue
+        content = build()
+        record(name, lambda c=content: validate_xades_signature(c), items)
+
+    # Árbol completo frente a streaming sobre el mismo archivo en disco (como
+    # las subidas grandes): la diferencia está sobre todo en la memoria
+    warmup = None
+    for n_lines in lines:
+        names = {mode: f"validate/parse_mode/{mode}/lines={n_lines}" for mode in PARSE_MODES}
+        stream_names = {
+            digests: f"parse/stream/{'digest' if digests else 'signature'}/lines={n_lines}"
+            for digests in (False, True)
+        }
+        if only and not any(only in name for name in [*names.values(), *stream_names.values()]):
+            continue
+        warmup = warmup or signed_facturae_xml(10, 1)
+        with tempfile.NamedTemporaryFile(suffix=".xml", delete=False) as f:
+            f.write(signed_facturae_xml(n_lines, 1))
+        try:
+            for mode, name in names.items():
+                record(name, lambda p=f.name, m=mode: validate_xades_signature(p, m), n_lines)
+                if name in results:
+                    growth = rss_growth(f.name, mode, warmup)
+                    results[name]["rss_growth_mb"] = growth
+                    log(f"{name:<50} crecimiento de RSS {growth:8.2f} MB")
+            for digests, name in stream_names.items():
+                record(name, lambda p=f.name, d=digests: parse_streaming(p, d), n_lines)
+        finally:
+            os.unlink(f.name)
+
+    for n_lines, n_invoices in _sizes(lines, invoices):
+        data = invoice_data(n_lines, n_invoices)
+        for mode, write_only, engine in EXCEL_MODES:
+            if not engine_available(engine):
+                continue
+
+            def export_batch(d=data, m=n_invoices, w=write_only, e=engine):
+                for index in range(m):
+                    generate_excel(d, index, write_only=w, engine=e)
+
+            name = f"excel/{mode}/lines={n_lines}/invoices={n_invoices}"
+            record(name, export_batch, n_lines * n_invoices)
+
+    # Entrega de un Excel: bytes completos (generate_excel) frente a enviarlo
+    # por trozos desde el temporal (write_excel, como /api/export/excel)
+    for n_lines in lines:
+        data = invoice_data(n_lines)
+        name = f"excel/delivery/{{}}/lines={n_lines}"
+        record(name.format("bytes"), lambda d=data: bytes(generate_excel(d)), n_lines)
+        record(name.format("stream"), lambda d=data: _drain(write_excel(d)), n_lines)
+
+    # Parser nuevo por documento frente al del pool por hilo
+    small = facturae_xml(10, 1)
+    record("parser/default", lambda: etree.fromstring(small, etree.XMLParser()))
+    record("parser/pooled", lambda: parse_xml(small))
+
+    return {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "lxml": ".".join(map(str, etree.LXML_VERSION)),
+            "platform": platform.platform(),
+            "lines": list(lines),
+            "invoices": list(invoices),
+        },
+        "results": results,
+    }
+
+
+def compare(
+    current: dict[str, Any], baseline: dict[str, Any], threshold: float
+) -> list[str]:
+    """Casos cuyo p50 supera el de la línea base en más de threshold (0.25 = 25 %)"""
+    regressions = []
+    for name, result in current["results"].items():
+        reference = baseline.get("results", {}).get(name)
+        if not reference or not reference.get(REGRESSION_METRIC):
+            continue
+        ratio = result[REGRESSION_METRIC] / reference[REGRESSION_METRIC]
+        if ratio > 1 + threshold:
+            regressions.append(
+                f"{name}: {REGRESSION_METRIC} {reference[REGRESSION_METRIC]:.2f} → "
+                f"{result[REGRESSION_METRIC]:.2f} ms ({(ratio - 1) * 100:+.0f} %)"
+            )
+    return regressions
+
+
+def _int_list(value: str) -> tuple[int, ...]:
+    return tuple(int(v) for v in value.split(",") if v)
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    parser = argparse.ArgumentParser(
+        description="Benchmarks de validación y exportación a Excel"
+    )
+    parser.add_argument(
+        "--lines", type=_int_list, help="líneas por factura (p.ej. 10,1000,50000)"
+    )
+    parser.add_argument(
+        "--invoices", type=_int_list, default=DEFAULT_INVOICES, help="facturas por lote"
+    )
+    parser.add_argument("--quick", action="store_true", help=f"solo {QUICK_LINES} líneas")
+    parser.add_argument(
+        "--iterations", type=int, default=30, help="iteraciones máximas por caso"
+    )
+    parser.add_argument(
+        "--time-budget", type=float, default=10.0, help="segundos máximos por caso"
+    )
+    parser.add_argument(
+        "--only", help="ejecutar solo los casos cuyo nombre contenga este texto"
+    )
+    parser.add_argument("--output", type=Path, help="guardar los resultados en este JSON")
+    parser.add_argument(
+        "--baseline", type=Path, help="JSON de referencia para detectar regresiones"
+    )
+    parser.add_argument(
+        "--threshold", type=float, default=0.25, help="empeoramiento tolerado (0.25 = 25 %%)"
+    )
+    parser.add_argument(
+        "--save-baseline", action="store_true", help="escribir los resultados en --baseline"
+    )
+    args = parser.parse_args(argv)
+
+    lines = args.lines or (QUICK_LINES if args.quick else DEFAULT_LINES)
+    report = run(lines, args.invoices, args.iterations, args.time_budget, args.only)
+
+    if args.output:
+        args.output.write_text(json.dumps(report, indent=2))
+    if args.baseline and args.save_baseline:
+        args.baseline.write_text(json.dumps(report, indent=2))
+        print(f"Línea base guardada en {args.baseline}")
+        return 0
+    if args.baseline:
+        if not args.baseline.exists():
+            print(f"No existe la línea base {args.baseline} (usa --save-baseline)")
+            return 0
+        regressions = compare(report, json.loads(args.baseline.read_text()), args.threshold)
+        if regressions:
+            print(f"\nRegresiones (umbral {args.threshold:.0%}):")
+            for line in regressions:
+                print(f"  {line}")
+            return 1
+        print(f"\nSin regresiones respecto a {args.baseline} (umbral {args.threshold:.0%})")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,245 @@
+"""
+Facturas Facturae sintéticas para los benchmarks
+
+Se generan a la vez el XML (entrada de la validación de firmas) y los datos
+con el formato del parser del frontend (entrada de generate_excel), con el
+número de líneas y de facturas por lote que se pida.
+"""
+
+import functools
+import sys
+from pathlib import Path
+from typing import Any
+from xml.sax.saxutils import escape
+
+ROOT_DIR = Path(__file__).parent.parent.parent
+SCRIPTS_DIR = ROOT_DIR / "scripts"
+
+FACTURAE_NS = "http://www.facturae.gob.es/formato/Versiones/Facturaev3_2_2"
+
+DESCRIPTIONS = (
+    "Servicio de consultoría",
+    "Desarrollo de software a medida",
+    "Licencia anual de mantenimiento",
+    "Horas de soporte técnico",
+    "Material de oficina",
+)
+
+
+def _line(index: int) -> dict[str, Any]:
+    quantity = index % 7 + 1
+    unit_price = round(10 + (index * 37) % 500 + 0.25, 2)
+    gross = round(quantity * unit_price, 2)
+    return {
+        "description": f"{DESCRIPTIONS[index % len(DESCRIPTIONS)]} #{index + 1}",
+        "quantity": quantity,
+        "unitPrice": unit_price,
+        "taxRate": 21,
+        "grossAmount": gross,
+    }
+
+
+def _invoice(number: int, lines: int) -> dict[str, Any]:
+    items = [_line(i) for i in range(lines)]
+    base = round(sum(item["grossAmount"] for item in items), 2)
+    tax = round(base * 0.21, 2)
+    total = round(base + tax, 2)
+    return {
+        "series": "BENCH",
+        "number": f"{number:06d}",
+        "issueDate": "2024-01-15",
+        "lines": items,
+        "taxes": [{"type": "01", "rate": 21, "base": base, "amount": tax}],
+        "totals": {
+            "grossAmount": base,
+            "taxOutputs": tax,
+            "taxesWithheld": 0,
+            "invoiceTotal": total,
+            "totalToPay": total,
+        },
+        "payment": {
+            "paymentMeans": "04",
+            "dueDate": "2024-02-15",
+            "iban": "ES9121000418450200051332",
+        },
+    }
+
+
+def invoice_data(lines: int = 10, invoices: int = 1) -> dict[str, Any]:
+    """Lote con el formato del parser del frontend (lo que recibe /api/export/excel)"""
+    return {
+        "version": "3.2.2",
+        "fileHeader": {"currencyCode": "EUR"},
+        "seller": {
+            "name": "Empresa Ejemplo S.L.",
+            "taxId": "A12345678",
+            "address": {
+                "street": "Calle Mayor 123",
+                "postCode": "28001",
+                "town": "Madrid",
+                "province": "Madrid",
+            },
+        },
+        "buyer": {
+            "name": "Cliente Ejemplo S.A.",
+            "taxId": "B87654321",
+            "address": {
+                "street": "Avenida Principal 456",
+                "postCode": "08001",
+                "town": "Barcelona",
+                "province": "Barcelona",
+            },
+        },
+        "invoices": [_invoice(n + 1, lines) for n in range(invoices)],
+    }
+
+
+def _amount(value: float) -> str:
+    return f"{value:.2f}"
+
+
+def _tax_xml(rate: float, base: float, amount: float, indent: str) -> str:
+    return (
+        f"{indent}<Tax>\n"
+        f"{indent}  <TaxTypeCode>01</TaxTypeCode>\n"
+        f"{indent}  <TaxRate>{_amount(rate)}</TaxRate>\n"
+        f"{indent}  <TaxableBase>\n"
+        f"{indent}    <TotalAmount>{_amount(base)}</TotalAmount>\n"
+        f"{indent}  </TaxableBase>\n"
+        f"{indent}  <TaxAmount>\n"
+        f"{indent}    <TotalAmount>{_amount(amount)}</TotalAmount>\n"
+        f"{indent}  </TaxAmount>\n"
+        f"{indent}</Tax>\n"
+    )
+
+
+def _invoice_xml(invoice: dict[str, Any]) -> str:
+    totals = invoice["totals"]
+    tax = invoice["taxes"][0]
+    parts = [
+        "    <Invoice>\n",
+        "      <InvoiceHeader>\n",
+        f"        <InvoiceNumber>{invoice['number']}</InvoiceNumber>\n",
+        f"        <InvoiceSeriesCode>{invoice['series']}</InvoiceSeriesCode>\n",
+        "        <InvoiceDocumentType>FC</InvoiceDocumentType>\n",
+        "        <InvoiceClass>OO</InvoiceClass>\n",
+        "      </InvoiceHeader>\n",
+        "      <InvoiceIssueData>\n",
+        f"        <IssueDate>{invoice['issueDate']}</IssueDate>\n",
+        "        <InvoiceCurrencyCode>EUR</InvoiceCurrencyCode>\n",
+        "        <TaxCurrencyCode>EUR</TaxCurrencyCode>\n",
+        "        <LanguageName>es</LanguageName>\n",
+        "      </InvoiceIssueData>\n",
+        "      <TaxesOutputs>\n",
+        _tax_xml(tax["rate"], tax["base"], tax["amount"], "        "),
+        "      </TaxesOutputs>\n",
+        "      <InvoiceTotals>\n",
+        f"        <TotalGrossAmount>{_amount(totals['grossAmount'])}</TotalGrossAmount>\n",
+        "        <TotalGrossAmountBeforeTaxes>",
+        f"{_amount(totals['grossAmount'])}</TotalGrossAmountBeforeTaxes>\n",
+        f"        <TotalTaxOutputs>{_amount(totals['taxOutputs'])}</TotalTaxOutputs>\n",
+        "        <TotalTaxesWithheld>0.00</TotalTaxesWithheld>\n",
+        f"        <InvoiceTotal>{_amount(totals['invoiceTotal'])}</InvoiceTotal>\n",
+        "        <TotalOutstandingAmount>",
+        f"{_amount(totals['totalToPay'])}</TotalOutstandingAmount>\n",
+        f"        <TotalExecutableAmount>{_amount(totals['totalToPay'])}</TotalExecutableAmount>\n",
+        "      </InvoiceTotals>\n",
+        "      <Items>\n",
+    ]
+    for line in invoice["lines"]:
+        gross = line["grossAmount"]
+        parts.extend((
+            "        <InvoiceLine>\n",
+            f"          <ItemDescription>{escape(line['description'])}</ItemDescription>\n",
+            f"          <Quantity>{_amount(line['quantity'])}</Quantity>\n",
+            "          <UnitOfMeasure>01</UnitOfMeasure>\n",
+            f"          <UnitPriceWithoutTax>{_amount(line['unitPrice'])}</UnitPriceWithoutTax>\n",
+            f"          <TotalCost>{_amount(gross)}</TotalCost>\n",
+            f"          <GrossAmount>{_amount(gross)}</GrossAmount>\n",
+            "          <TaxesOutputs>\n",
+            _tax_xml(21, gross, round(gross * 0.21, 2), "            "),
+            "          </TaxesOutputs>\n",
+            "        </InvoiceLine>\n",
+        ))
+    parts.append("      </Items>\n    </Invoice>\n")
+    return "".join(parts)
+
+
+def facturae_xml(lines: int = 10, invoices: int = 1) -> bytes:
+    """Documento Facturae 3.2.2 sin firmar con las mismas facturas que invoice_data"""
+    data = invoice_data(lines, invoices)
+    total = sum(invoice["totals"]["totalToPay"] for invoice in data["invoices"])
+    header = (
+        '<?xml version="1.0" encoding="UTF-8"?>\n'
+        f'<fe:Facturae xmlns:fe="{FACTURAE_NS}">\n'
+        "  <FileHeader>\n"
+        "    <SchemaVersion>3.2.2</SchemaVersion>\n"
+        f"    <Modality>{'L' if invoices > 1 else 'I'}</Modality>\n"
+        "    <InvoiceIssuerType>EM</InvoiceIssuerType>\n"
+        "    <Batch>\n"
+        "      <BatchIdentifier>A12345678BENCH</BatchIdentifier>\n"
+        f"      <InvoicesCount>{invoices}</InvoicesCount>\n"
+        f"      <TotalInvoicesAmount>\n"
+        f"        <TotalAmount>{_amount(total)}</TotalAmount>\n"
+        f"      </TotalInvoicesAmount>\n"
+        f"      <TotalOutstandingAmount>\n"
+        f"        <TotalAmount>{_amount(total)}</TotalAmount>\n"
+        f"      </TotalOutstandingAmount>\n"
+        f"      <TotalExecutableAmount>\n"
+        f"        <TotalAmount>{_amount(total)}</TotalAmount>\n"
+        f"      </TotalExecutableAmount>\n"
+        "      <InvoiceCurrencyCode>EUR</InvoiceCurrencyCode>\n"
+        "    </Batch>\n"
+        "  </FileHeader>\n"
+        "  <Parties>\n"
+        + _party_xml("SellerParty", data["seller"])
+        + _party_xml("BuyerParty", data["buyer"])
+        + "  </Parties>\n"
+        "  <Invoices>\n"
+    )
+    body = "".join(_invoice_xml(invoice) for invoice in data["invoices"])
+    return (header + body + "  </Invoices>\n</fe:Facturae>\n").encode("utf-8")
+
+
+def _party_xml(tag: str, party: dict[str, Any]) -> str:
+    address = party["address"]
+    return (
+        f"    <{tag}>\n"
+        "      <TaxIdentification>\n"
+        "        <PersonTypeCode>J</PersonTypeCode>\n"
+        "        <ResidenceTypeCode>R</ResidenceTypeCode>\n"
+        f"        <TaxIdentificationNumber>{party['taxId']}</TaxIdentificationNumber>\n"
+        "      </TaxIdentification>\n"
+        "      <LegalEntity>\n"
+        f"        <CorporateName>{escape(party['name'])}</CorporateName>\n"
+        "        <AddressInSpain>\n"
+        f"          <Address>{escape(address['street'])}</Address>\n"
+        f"          <PostCode>{address['postCode']}</PostCode>\n"
+        f"          <Town>{address['town']}</Town>\n"
+        f"          <Province>{address['province']}</Province>\n"
+        "          <CountryCode>ESP</CountryCode>\n"
+        "        </AddressInSpain>\n"
+        "      </LegalEntity>\n"
+        f"    </{tag}>\n"
+    )
+
+
+def _sign_fixtures():
+    """Módulo scripts/sign_fixtures.py (scripts/ no es un paquete)"""
+    if str(SCRIPTS_DIR) not in sys.path:
+        sys.path.insert(0, str(SCRIPTS_DIR))
+    import sign_fixtures
+
+    return sign_fixtures
+
+
+@functools.lru_cache(maxsize=1)
+def signing_identity():
+    """Clave y certificado autofirmado (el mismo flujo que scripts/sign_fixtures.py)"""
+    return _sign_fixtures().generate_test_certificate()
+
+
+def signed_facturae_xml(lines: int = 10, invoices: int = 1) -> bytes:
+    """Como facturae_xml, firmado con el certificado de signing_identity()"""
+    private_key, cert = signing_identity()
+    return _sign_fixtures().sign_xml(facturae_xml(lines, invoices), private_key, cert)
@@ -2,19 +2,41 @@
 FacturaView API - Validación de firmas digitales
 """
 
+from contextlib import asynccontextmanager
 from pathlib import Path
 
 from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse, JSONResponse
+from fastapi.responses import FileResponse, JSONResponse, PlainTextResponse
 from fastapi.staticfiles import StaticFiles
 
 try:
     # Production: running from root with 'backend.main:app'
+    from backend.app.middleware import MetricsMiddleware, ProfilerMiddleware, ServerTimingMiddleware
     from backend.app.routes import signature_router, export_router
+    from backend.app.services.excel_generator import warm_up_templates
+    from backend.app.services.metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, render_metrics
+    from backend.app.services.result_cache import get_validation_cache
+    from backend.app.services.worker_pool import get_worker_pool
 except ImportError:
     # Development: running from backend/ with 'main:app'
+    from app.middleware import MetricsMiddleware, ProfilerMiddleware, ServerTimingMiddleware
     from app.routes import signature_router, export_router
+    from app.services.excel_generator import warm_up_templates
+    from app.services.metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, render_metrics
+    from app.services.result_cache import get_validation_cache
+    from app.services.worker_pool import get_worker_pool
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Arranca el pool de workers al iniciar y lo detiene al apagar"""
+    warm_up_templates()
+    pool = get_worker_pool()
+    await pool.warm_up()
+    yield
+    pool.shutdown()
+
 
 app = FastAPI(
     title="FacturaView API",
@@ -22,6 +44,7 @@ app = FastAPI(
     version="0.1.0",
     docs_url="/docs",
     redoc_url="/redoc",
+    lifespan=lifespan,
 )
 
 # CORS - permitir frontend en desarrollo
@@ -36,6 +59,13 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Perfilado bajo demanda (X-Profile), tiempos por etapa en Server-Timing y
+# métricas de peticiones por ruta (expuestas en /metrics). El último
+# añadido es el más externo.
+app.add_middleware(ProfilerMiddleware)
+app.add_middleware(ServerTimingMiddleware)
+app.add_middleware(MetricsMiddleware)
+
 # Registrar rutas API
 app.include_router(signature_router)
 app.include_router(export_router)
@@ -44,7 +74,18 @@ app.include_router(export_router)
 @app.get("/health")
 async def health_check():
     """Health check endpoint"""
-    return {"status": "ok", "service": "facturaview-api"}
+    return {
+        "status": "ok",
+        "service": "facturaview-api",
+        "worker_pool": get_worker_pool().stats(),
+        "validation_cache": get_validation_cache().stats(),
+    }
+
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    """Métricas en formato de exposición de Prometheus"""
+    return PlainTextResponse(render_metrics(), media_type=METRICS_CONTENT_TYPE)
 
 
 # Montar frontend estático (en producción)
@@ -55,7 +96,7 @@ frontend_dist = Path(__file__).parent.parent / "frontend" / "dist"
 if frontend_dist.exists():
     @app.exception_handler(404)
     async def spa_fallback(request: Request, exc):
-        api_prefixes = ("/api/", "/health", "/docs", "/redoc", "/openapi.json")
+        api_prefixes = ("/api/", "/health", "/metrics", "/docs", "/redoc", "/openapi.json")
         if not request.url.path.startswith(api_prefixes):
             return FileResponse(frontend_dist / "index.html")
         return JSONResponse({"detail": "Not Found"}, status_code=404)
@@ -0,0 +1,84 @@
+"""
+Tests del harness de benchmarks (generador sintético y detección de regresiones)
+"""
+
+import os
+from io import BytesIO
+
+import pytest
+from openpyxl import load_workbook
+
+try:
+    from backend.app.services.excel_generator import generate_excel
+    from backend.app.services.validator import validate_xades_signature
+    from backend.benchmarks.run import compare, percentile, rss_growth, run
+    from backend.benchmarks.synthetic import facturae_xml, invoice_data, signed_facturae_xml
+except ImportError:
+    from app.services.excel_generator import generate_excel
+    from app.services.validator import validate_xades_signature
+    from benchmarks.run import compare, percentile, rss_growth, run
+    from benchmarks.synthetic import facturae_xml, invoice_data, signed_facturae_xml
+
+
+def test_synthetic_signed_document_is_valid():
+    """El Facturae sintético firmado verifica en ambos modos de parseo"""
+    content = signed_facturae_xml(lines=25, invoices=2)
+
+    assert content.count(b"<InvoiceLine>") == 50
+    assert validate_xades_signature(content, parse_mode="tree").valid is True
+    assert validate_xades_signature(content, parse_mode="stream").valid is True
+
+
+@pytest.mark.skipif(not os.path.exists("/proc/self/status"), reason="sin VmHWM")
+def test_stream_parse_mode_grows_rss_less_than_tree(tmp_path):
+    """El caso validate/parse_mode mide la memoria de cada modo en un proceso nuevo"""
+    path = tmp_path / "firmada.xml"
+    path.write_bytes(signed_facturae_xml(lines=3000))
+    warmup = signed_facturae_xml(lines=1)
+
+    tree = rss_growth(str(path), "tree", warmup)
+    stream = rss_growth(str(path), "stream", warmup)
+
+    assert stream < tree
+
+
+def test_stream_parse_cases_measure_digest_latency():
+    """parse/stream separa el coste del digest en streaming del de localizar la firma"""
+    report = run((5,), (1,), iterations=1, time_budget=0, only="parse/stream", log=lambda _: None)
+
+    assert set(report["results"]) == {
+        "parse/stream/signature/lines=5",
+        "parse/stream/digest/lines=5",
+    }
+
+
+def test_synthetic_unsigned_document():
+    result = validate_xades_signature(facturae_xml(lines=5))
+
+    assert result.valid is None
+
+
+def test_synthetic_invoice_data_exports():
+    data = invoice_data(lines=30, invoices=3)
+    workbook = load_workbook(BytesIO(generate_excel(data, 2)))
+
+    assert len(data["invoices"]) == 3
+    assert workbook.active.max_row > 30
+
+
+def test_percentile_nearest_rank():
+    samples = [float(i) for i in range(1, 101)]
+
+    assert percentile(samples, 50) == 50.0
+    assert percentile(samples, 99) == 99.0
+    assert percentile([3.0], 95) == 3.0
+
+
+def test_compare_flags_regressions_past_threshold():
+    baseline = {"results": {"a": {"p50_ms": 10.0}, "b": {"p50_ms": 10.0}}}
+    current = {"results": {"a": {"p50_ms": 12.0}, "b": {"p50_ms": 13.0}, "nuevo": {"p50_ms": 1.0}}}
+
+    regressions = compare(current, baseline, threshold=0.25)
+
+    assert len(regressions) == 1
+    assert regressions[0].startswith("b:")
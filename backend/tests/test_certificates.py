@@ -0,0 +1,62 @@
+"""
+Tests para el registro de certificados parseados
+"""
+
+from pathlib import Path
+
+from lxml import etree
+
+try:
+    from backend.app.services.certificates import CertificateRegistry, get_certificate_registry
+    from backend.app.services.validator import NAMESPACES, validate_xades_signature
+except ImportError:
+    from app.services.certificates import CertificateRegistry, get_certificate_registry
+    from app.services.validator import NAMESPACES, validate_xades_signature
+
+
+FIXTURES_DIR = Path(__file__).parent.parent.parent / "frontend" / "tests" / "fixtures"
+
+
+def _certificate_b64(fixture: str) -> str:
+    doc = etree.parse(str(FIXTURES_DIR / fixture))
+    return doc.findtext(".//ds:X509Certificate", namespaces=NAMESPACES)
+
+
+def test_registry_parses_certificate_once():
+    """El segundo acceso al mismo certificado reutiliza el parseado"""
+    registry = CertificateRegistry()
+    cert_b64 = _certificate_b64("simple-322-signed.xsig.xml")
+
+    first = registry.load(cert_b64)
+    # Mismo contenido con distinto formato de líneas
+    second = registry.load(cert_b64.replace("\n", "") + "\n")
+
+    assert first is second
+    assert first.info.subject == "Certificado de Prueba FacturaView"
+    assert registry.stats()["hits"] == 1
+    assert registry.stats()["misses"] == 1
+
+
+def test_registry_evicts_least_recently_used():
+    """El registro no crece por encima de su tamaño máximo"""
+    registry = CertificateRegistry(max_entries=1)
+    registry.load(_certificate_b64("simple-322-signed.xsig.xml"))
+    registry.load(_certificate_b64("signed-sample-32.xsig.xml"))
+
+    assert registry.stats()["entries"] == 1
+    assert registry.stats()["evictions"] == 1
+
+
+def test_validation_reuses_registered_certificate():
+    """Validar dos veces una factura del mismo firmante no vuelve a parsear el certificado"""
+    content = (FIXTURES_DIR / "simple-321-signed.xsig.xml").read_bytes()
+    registry = get_certificate_registry()
+    registry.clear()
+
+    first = validate_xades_signature(content)
+    misses = registry.stats()["misses"]
+    second = validate_xades_signature(content)
+
+    assert registry.stats()["misses"] == misses
+    assert first.signer == second.signer
+    assert first.certificate == second.certificate
@@ -0,0 +1,247 @@
+"""
+Tests para las CRL: índice binario en disco, descarga única y renovación
+"""
+
+import random
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+
+import pytest
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import ec
+from cryptography.x509.oid import NameOID
+
+try:
+    from backend.app.services import crl as crl_service
+    from backend.app.services.crl import CRLError, CRLIndex, CRLStore, build_index
+    from backend.app.services.validator import check_revocation_status
+except ImportError:
+    from app.services import crl as crl_service
+    from app.services.crl import CRLError, CRLIndex, CRLStore, build_index
+    from app.services.validator import check_revocation_status
+
+
+def _name(cn: str) -> x509.Name:
+    return x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, cn)])
+
+
+def _ca_key_usage(crl_sign: bool) -> x509.KeyUsage:
+    return x509.KeyUsage(
+        digital_signature=False, content_commitment=False, key_encipherment=False,
+        data_encipherment=False, key_agreement=False, key_cert_sign=True,
+        crl_sign=crl_sign, encipher_only=False, decipher_only=False,
+    )
+
+
+class CRLServer:
+    """Sirve la CRL de una CA de pruebas y cuenta las descargas"""
+
+    def __init__(self, revoked_count: int = 1000, crl_sign: Optional[bool] = True):
+        """crl_sign=None: la CA no lleva la extensión keyUsage"""
+        now = datetime.now(timezone.utc)
+        self.ca_key = ec.generate_private_key(ec.SECP256R1())
+        builder = (
+            x509.CertificateBuilder()
+            .subject_name(_name("CA Pruebas"))
+            .issuer_name(_name("CA Pruebas"))
+            .public_key(self.ca_key.public_key())
+            .serial_number(1)
+            .not_valid_before(now - timedelta(days=1))
+            .not_valid_after(now + timedelta(days=30))
+            .add_extension(x509.BasicConstraints(ca=True, path_length=None), critical=True)
+        )
+        if crl_sign is not None:
+            builder = builder.add_extension(_ca_key_usage(crl_sign=crl_sign), critical=True)
+        self.ca = builder.sign(self.ca_key, hashes.SHA256())
+        self.revoked = {random.getrandbits(128) for _ in range(revoked_count)}
+        self.signing_key = self.ca_key
+        self.validity = timedelta(days=7)
+        self.downloads = 0
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                server.downloads += 1
+                data = server.crl()
+                self.send_response(200)
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}/ca.crl"
+
+    def crl(self) -> bytes:
+        now = datetime.now(timezone.utc)
+        builder = (
+            x509.CertificateRevocationListBuilder()
+            .issuer_name(self.ca.subject)
+            .last_update(now - timedelta(hours=1))
+            .next_update(now + self.validity)
+        )
+        for serial in self.revoked:
+            builder = builder.add_revoked_certificate(
+                x509.RevokedCertificateBuilder().serial_number(serial).revocation_date(now).build()
+            )
+        crl = builder.sign(self.signing_key, hashes.SHA256())
+        return crl.public_bytes(serialization.Encoding.DER)
+
+    def issue(self, serial: int, ocsp_url: str = None) -> x509.Certificate:
+        now = datetime.now(timezone.utc)
+        builder = (
+            x509.CertificateBuilder()
+            .subject_name(_name(f"Firmante {serial}"))
+            .issuer_name(self.ca.subject)
+            .public_key(ec.generate_private_key(ec.SECP256R1()).public_key())
+            .serial_number(serial)
+            .not_valid_before(now - timedelta(days=1))
+            .not_valid_after(now + timedelta(days=30))
+            .add_extension(
+                x509.CRLDistributionPoints([
+                    x509.DistributionPoint(
+                        [x509.UniformResourceIdentifier(self.url)], None, None, None
+                    )
+                ]),
+                critical=False,
+            )
+        )
+        if ocsp_url:
+            builder = builder.add_extension(
+                x509.AuthorityInformationAccess([
+                    x509.AccessDescription(
+                        x509.oid.AuthorityInformationAccessOID.OCSP,
+                        x509.UniformResourceIdentifier(ocsp_url),
+                    )
+                ]),
+                critical=False,
+            )
+        return builder.sign(self.ca_key, hashes.SHA256())
+
+
+@pytest.fixture
+def crl_server():
+    server = CRLServer()
+    thread = threading.Thread(target=server.server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.server.shutdown()
+    server.server.server_close()
+
+
+def test_index_lookup(tmp_path):
+    """Búsqueda binaria sobre el índice mapeado"""
+    serials = [random.getrandbits(random.randint(1, 159)) for _ in range(5000)]
+    revoked = set(serials)
+    path = str(tmp_path / "a.crlidx")
+    build_index(path, serials, 0.0, 1.0, b"\x00" * 20)
+    index = CRLIndex(path)
+
+    assert len(index) == len(revoked)
+    assert all(serial in index for serial in serials[:500])
+    assert 2 ** 200 not in index
+    assert not any(serial in index for serial in range(-3, 0))
+    missing = [s + 1 for s in serials if s + 1 not in revoked][:500]
+    assert not any(serial in index for serial in missing)
+
+
+def test_empty_index(tmp_path):
+    """Una CRL sin entradas da un índice válido y vacío"""
+    path = str(tmp_path / "vacio.crlidx")
+    build_index(path, [], 0.0, 1.0, b"\x00" * 20)
+
+    assert 12345 not in CRLIndex(path)
+
+
+def test_store_downloads_once(crl_server, tmp_path):
+    """La CRL se descarga y compila una vez; después solo se consulta el índice"""
+    store = CRLStore(str(tmp_path))
+    revoked = crl_server.issue(next(iter(crl_server.revoked)))
+    good = crl_server.issue(7)
+
+    assert store.is_revoked(revoked, crl_server.ca, [crl_server.url]) is True
+    assert store.is_revoked(good, crl_server.ca, [crl_server.url]) is False
+    assert crl_server.downloads == 1
+
+
+def test_index_shared_between_processes(crl_server, tmp_path):
+    """Otro proceso (otro CRLStore sobre el mismo directorio) reutiliza el índice"""
+    cert = crl_server.issue(next(iter(crl_server.revoked)))
+    CRLStore(str(tmp_path)).is_revoked(cert, crl_server.ca, [crl_server.url])
+
+    other = CRLStore(str(tmp_path))
+    assert other.is_revoked(cert, crl_server.ca, [crl_server.url]) is True
+    assert crl_server.downloads == 1
+    assert other.stats()["downloads"] == 0
+
+
+def test_forged_crl_is_rejected(crl_server, tmp_path):
+    """Una CRL no firmada por el emisor no se compila"""
+    crl_server.signing_key = ec.generate_private_key(ec.SECP256R1())
+    store = CRLStore(str(tmp_path))
+
+    with pytest.raises(CRLError, match="Firma"):
+        store.is_revoked(crl_server.issue(7), crl_server.ca, [crl_server.url])
+    assert not list(tmp_path.glob("*.crlidx"))
+
+
+def test_crl_issuer_needs_crl_sign(tmp_path):
+    """Una CA sin cRLSign en su keyUsage no puede firmar la CRL"""
+    server = CRLServer(revoked_count=1, crl_sign=False)
+    crl = x509.load_der_x509_crl(server.crl())
+
+    with pytest.raises(CRLError, match="cRLSign"):
+        crl_service._verify_crl(crl, server.ca)
+
+
+def test_crl_issuer_without_key_usage_is_unrestricted():
+    """Sin extensión keyUsage la CA puede firmar CRL (RFC 5280)"""
+    server = CRLServer(revoked_count=1, crl_sign=None)
+    crl = x509.load_der_x509_crl(server.crl())
+
+    crl_service._verify_crl(crl, server.ca)
+
+
+def test_refreshes_in_background_before_next_update(crl_server, tmp_path):
+    """Cerca de nextUpdate se renueva sin bloquear las consultas"""
+    crl_server.validity = timedelta(minutes=10)
+    store = CRLStore(str(tmp_path), refresh_margin=3600.0, retry_interval=0.0)
+    cert = crl_server.issue(7)
+
+    store.is_revoked(cert, crl_server.ca, [crl_server.url])
+    # Dentro del margen: responde con el índice actual y renueva aparte
+    assert store.is_revoked(cert, crl_server.ca, [crl_server.url]) is False
+
+    deadline = time.monotonic() + 5
+    while store.refresh_pending() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert crl_server.downloads == 2
+    assert store.stats()["background_refreshes"] >= 1
+
+
+def test_background_refresh_is_rate_limited(crl_server, tmp_path):
+    """Si la CA aún no publicó otra CRL, no se descarga en cada consulta"""
+    crl_server.validity = timedelta(minutes=10)
+    store = CRLStore(str(tmp_path), refresh_margin=3600.0, retry_interval=300.0)
+    cert = crl_server.issue(7)
+
+    for _ in range(5):
+        store.is_revoked(cert, crl_server.ca, [crl_server.url])
+
+    assert crl_server.downloads == 1
+
+
+def test_revocation_falls_back_to_crl(crl_server, tmp_path, monkeypatch):
+    """Si el servidor OCSP no responde, se consulta la CRL"""
+    monkeypatch.setattr(crl_service, "_store", CRLStore(str(tmp_path)))
+    # Puerto cerrado: el OCSP falla de inmediato
+    cert = crl_server.issue(next(iter(crl_server.revoked)), ocsp_url="http://127.0.0.1:9/ocsp")
+
+    assert check_revocation_status(cert, crl_server.ca) == (True, True)
+    assert check_revocation_status(crl_server.issue(7), crl_server.ca) == (False, True)
@@ -0,0 +1,190 @@
+"""
+Tests de la exportación de lotes a un único libro de Excel
+"""
+
+import threading
+from io import BytesIO
+
+import pytest
+from httpx import AsyncClient, ASGITransport
+from openpyxl import load_workbook
+from openpyxl.styles import Font
+
+try:
+    from backend.main import app
+    from backend.app import config
+    from backend.app.routes import export as export_route
+    from backend.app.services.excel_batch import (
+        ExcelStyleError,
+        RenderedSheet,
+        assemble_batch_workbook,
+        generate_batch_excel,
+        render_invoice_sheet,
+        style_signature,
+        unique_sheet_names,
+    )
+    from backend.app.services.excel_generator import build_invoice_workbook, generate_excel
+    from backend.app.services.worker_pool import get_worker_pool
+    from backend.benchmarks.synthetic import invoice_data
+    from backend.tests.test_excel_generator import sheet_snapshot
+except ImportError:
+    from main import app
+    from app import config
+    from app.routes import export as export_route
+    from app.services.excel_batch import (
+        ExcelStyleError,
+        RenderedSheet,
+        assemble_batch_workbook,
+        generate_batch_excel,
+        render_invoice_sheet,
+        style_signature,
+        unique_sheet_names,
+    )
+    from app.services.excel_generator import build_invoice_workbook, generate_excel
+    from app.services.worker_pool import get_worker_pool
+    from benchmarks.synthetic import invoice_data
+    from tests.test_excel_generator import sheet_snapshot
+
+
+def test_unique_sheet_names_follow_excel_rules():
+    invoices = [
+        {"series": "A", "number": "1"},
+        {"series": "a", "number": "1"},
+        {"series": "2024/01", "number": "[7]"},
+        {"series": "X" * 40, "number": "1"},
+        {"series": "X" * 40, "number": "2"},
+        {"number": "History"},
+        {},
+    ]
+
+    names = unique_sheet_names(invoices, reserved=("Resumen",))
+
+    assert names[:3] == ["A-1", "a-1 (2)", "2024_01-_7_"]
+    assert names[3] == "X" * 31
+    assert names[4] == "X" * 27 + " (2)"
+    assert names[5] == "History (2)"
+    assert names[6] == "7"
+    assert all(len(name) <= 31 for name in names)
+    assert len({name.lower() for name in names}) == len(names)
+
+
+def test_batch_sheets_match_single_exports():
+    """Cada hoja de detalle es idéntica a la exportación individual"""
+    data = invoice_data(lines=20, invoices=3)
+    data["invoices"][2]["lines"] *= 3
+
+    batch = sheet_snapshot(generate_batch_excel(data, "en"))
+
+    assert list(batch) == ["Summary", "BENCH-000001", "BENCH-000002", "BENCH-000003"]
+    for index, name in enumerate(list(batch)[1:]):
+        single = sheet_snapshot(generate_excel(data, index, "en"))
+        assert batch[name] == single["Invoice"]
+
+
+def test_sheets_with_other_styles_are_rejected(monkeypatch):
+    """Una hoja cuyo libro registró otro estilo no se mezcla con índices erróneos"""
+    data = invoice_data(lines=5, invoices=2)
+    names = unique_sheet_names(data["invoices"])
+    # Write-only: la hoja se extrae del libro guardado, no de la plantilla
+    monkeypatch.setattr(config, "EXCEL_WRITE_ONLY_LINES", 1)
+    sheets = [render_invoice_sheet(data, 0, "es")]
+
+    wb = build_invoice_workbook(data, 1, "es", write_only=False)
+    wb.active["A1"].font = Font(italic=True)
+    sheets.append(RenderedSheet(b"", style_signature(wb)))
+
+    with pytest.raises(ExcelStyleError, match=names[1]):
+        assemble_batch_workbook(data, "es", names, sheets, BytesIO())
+    assemble_batch_workbook(data, "es", names[:1], sheets[:1], BytesIO())
+
+
+def test_batch_summary_sheet():
+    data = invoice_data(lines=5, invoices=2)
+
+    ws = load_workbook(BytesIO(generate_batch_excel(data, "es")))["Resumen"]
+
+    assert ws["A4"].value == "Factura"
+    assert ws["A5"].value == "BENCH/000001"
+    assert ws["D5"].value == data["invoices"][0]["totals"]["invoiceTotal"]
+    assert ws["E6"].value == "BENCH-000002"
+    total = sum(invoice["totals"]["invoiceTotal"] for invoice in data["invoices"])
+    assert ws["D8"].value == pytest.approx(total)
+    assert ws["D8"].number_format == "#,##0.00"
+
+
+@pytest.mark.asyncio
+async def test_batch_export_endpoint():
+    data = invoice_data(lines=10, invoices=4)
+
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as client:
+        response = await client.post(
+            "/api/export/excel/batch", json={"data": data, "filename": "lote"}
+        )
+
+    assert response.status_code == 200
+    assert 'filename="lote.xlsx"' in response.headers["content-disposition"]
+    assert response.headers["content-length"] == str(len(response.content))
+    workbook = load_workbook(BytesIO(response.content))
+    assert len(workbook.sheetnames) == 5
+    assert workbook["BENCH-000004"]["A1"].value == "FACTURA BENCH/000004"
+
+
+@pytest.mark.asyncio
+async def test_batch_export_opens_workbook_off_the_event_loop(monkeypatch):
+    """Abrir y borrar el temporal del libro no bloquea el event loop"""
+    open_spooled = export_route._open_spooled
+    threads = []
+
+    def recording_open(path):
+        threads.append(threading.current_thread())
+        return open_spooled(path)
+
+    monkeypatch.setattr(export_route, "_open_spooled", recording_open)
+
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as client:
+        response = await client.post(
+            "/api/export/excel/batch", json={"data": invoice_data(lines=2, invoices=2)}
+        )
+
+    assert response.status_code == 200
+    assert threads and threads[0] is not threading.main_thread()
+
+
+@pytest.mark.asyncio
+async def test_batch_export_keeps_at_most_pool_size_jobs(monkeypatch):
+    pool = get_worker_pool()
+    run = pool.run
+    running = peak = 0
+
+    async def counting_run(fn, *args, **kwargs):
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        try:
+            return await run(fn, *args, **kwargs)
+        finally:
+            running -= 1
+
+    monkeypatch.setattr(pool, "run", counting_run)
+    data = invoice_data(lines=2, invoices=pool.size * 3)
+
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as client:
+        response = await client.post("/api/export/excel/batch", json={"data": data})
+
+    assert response.status_code == 200
+    assert peak == pool.size
+    assert len(load_workbook(BytesIO(response.content)).sheetnames) == pool.size * 3 + 1
+
+
+@pytest.mark.asyncio
+async def test_batch_export_rejects_oversized_batches(monkeypatch):
+    monkeypatch.setattr(config, "EXCEL_BATCH_MAX_INVOICES", 2)
+
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as client:
+        response = await client.post(
+            "/api/export/excel/batch", json={"data": invoice_data(invoices=3)}
+        )
+        empty = await client.post("/api/export/excel/batch", json={"data": {"invoices": []}})
+
+    assert response.status_code == 400
+    assert empty.status_code == 400
@@ -0,0 +1,111 @@
+"""
+Tests de los motores de Excel: openpyxl (referencia) frente a XlsxWriter
+"""
+
+from io import BytesIO
+
+import pytest
+from httpx import AsyncClient, ASGITransport
+from openpyxl import load_workbook
+
+try:
+    from backend.main import app
+    from backend.app import config
+    from backend.app.services.excel_generator import (
+        ExcelEngineError,
+        generate_excel,
+        resolve_engine,
+    )
+    from backend.benchmarks.synthetic import invoice_data
+    from backend.tests.test_excel_generator import _with_retention
+    from backend.tests.test_export import SAMPLE_INVOICE_DATA
+except ImportError:
+    from main import app
+    from app import config
+    from app.services.excel_generator import ExcelEngineError, generate_excel, resolve_engine
+    from benchmarks.synthetic import invoice_data
+    from tests.test_excel_generator import _with_retention
+    from tests.test_export import SAMPLE_INVOICE_DATA
+
+
+def engine_snapshot(content: bytes) -> dict:
+    """
+    Lo que ambos motores deben escribir igual: valores, formatos numéricos,
+    negritas, alineación y bordes de cada celda con valor, combinaciones,
+    anchos y altos (los colores difieren solo en el canal alfa)
+    """
+    ws = load_workbook(BytesIO(content)).active
+    cells = {}
+    for row in ws.iter_rows():
+        for cell in row:
+            if cell.value is None:
+                continue
+            cells[cell.coordinate] = (
+                cell.value,
+                cell.number_format,
+                bool(cell.font.b),
+                cell.alignment.horizontal,
+                bool(cell.alignment.wrap_text),
+                cell.border.left.style,
+            )
+    return {
+        "title": ws.title,
+        "cells": cells,
+        "merged": sorted(str(r) for r in ws.merged_cells.ranges),
+        "widths": {k: d.width for k, d in ws.column_dimensions.items() if d.width},
+        "heights": {k: d.height for k, d in ws.row_dimensions.items() if d.height},
+    }
+
+
+@pytest.mark.parametrize("data, index, lang, write_only", [
+    (SAMPLE_INVOICE_DATA, 0, "es", False),
+    (SAMPLE_INVOICE_DATA, 0, "en", False),
+    (_with_retention(), 0, "es", False),
+    ({"invoices": [{"number": "1"}]}, 0, "es", False),
+    (invoice_data(lines=120, invoices=2), 1, "en", True),
+])
+def test_xlsxwriter_matches_openpyxl_reference(data, index, lang, write_only):
+    pytest.importorskip("xlsxwriter")
+
+    reference = engine_snapshot(generate_excel(data, index, lang, write_only, engine="openpyxl"))
+    candidate = engine_snapshot(generate_excel(data, index, lang, write_only, engine="xlsxwriter"))
+
+    # XlsxWriter guarda los anchos en píxeles: difieren menos de un píxel
+    assert candidate["widths"] == pytest.approx(reference["widths"], abs=1 / 7)
+    del candidate["widths"], reference["widths"]
+    assert candidate == reference
+
+
+def test_resolve_engine(monkeypatch):
+    assert resolve_engine() == "openpyxl"
+    assert resolve_engine("OpenPyXL") == "openpyxl"
+
+    monkeypatch.setattr(config, "EXCEL_ENGINE", "docx")
+    with pytest.raises(ExcelEngineError, match="desconocido"):
+        resolve_engine()
+
+
+def test_missing_engine_is_reported(monkeypatch):
+    monkeypatch.setattr("importlib.util.find_spec", lambda name: None)
+
+    with pytest.raises(ExcelEngineError, match="no está instalado"):
+        generate_excel(SAMPLE_INVOICE_DATA, engine="xlsxwriter")
+
+
+@pytest.mark.asyncio
+async def test_export_endpoint_selects_engine():
+    pytest.importorskip("xlsxwriter")
+
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as client:
+        response = await client.post(
+            "/api/export/excel", json={"data": SAMPLE_INVOICE_DATA, "engine": "xlsxwriter"}
+        )
+        unknown = await client.post(
+            "/api/export/excel", json={"data": SAMPLE_INVOICE_DATA, "engine": "csv"}
+        )
+
+    assert response.status_code == 200
+    # XlsxWriter guarda los textos en sharedStrings; openpyxl, en línea
+    assert b"xl/sharedStrings.xml" in response.content
+    assert load_workbook(BytesIO(response.content)).active["A1"].value == "FACTURA 2024/001"
+    assert unknown.status_code == 400
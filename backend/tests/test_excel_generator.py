@@ -0,0 +1,220 @@
+"""
+Tests del generador de Excel (motor normal y write-only)
+"""
+
+import copy
+import zipfile
+from io import BytesIO
+
+import pytest
+from openpyxl import Workbook, load_workbook
+
+try:
+    from backend.app import config
+    from backend.app.services import excel_generator
+    from backend.app.services.excel_generator import generate_excel, write_excel
+    from backend.benchmarks.synthetic import invoice_data
+    from backend.tests.test_export import SAMPLE_INVOICE_DATA
+except ImportError:
+    from app import config
+    from app.services import excel_generator
+    from app.services.excel_generator import generate_excel, write_excel
+    from benchmarks.synthetic import invoice_data
+    from tests.test_export import SAMPLE_INVOICE_DATA
+
+
+def sheet_snapshot(content: bytes) -> dict:
+    """Valores, formatos, combinaciones, anchos y altos de cada hoja"""
+    workbook = load_workbook(BytesIO(content))
+    snapshot = {}
+    for ws in workbook.worksheets:
+        cells = {}
+        for row in ws.iter_rows():
+            for cell in row:
+                if cell.value is None and not cell.has_style:
+                    continue
+                cells[cell.coordinate] = (
+                    cell.value,
+                    cell.font.b,
+                    cell.font.sz,
+                    cell.fill.fgColor.rgb if cell.fill.fill_type else None,
+                    cell.border.left.style,
+                    cell.alignment.horizontal,
+                    cell.alignment.wrap_text,
+                    cell.number_format,
+                )
+        snapshot[ws.title] = {
+            "cells": cells,
+            "merged": sorted(str(r) for r in ws.merged_cells.ranges),
+            "widths": {k: d.width for k, d in ws.column_dimensions.items() if d.width},
+            "heights": {k: d.height for k, d in ws.row_dimensions.items() if d.height},
+        }
+    return snapshot
+
+
+def _with_retention() -> dict:
+    data = copy.deepcopy(SAMPLE_INVOICE_DATA)
+    invoice = data["invoices"][0]
+    invoice["totals"]["taxesWithheld"] = 150
+    invoice["taxes"].append({"type": "04", "rate": 15, "base": 1000, "amount": 150})
+    return data
+
+
+def test_write_only_matches_standard_layout():
+    """Misma hoja celda a celda: valores, estilos, combinaciones y anchos"""
+    cases = [
+        (SAMPLE_INVOICE_DATA, 0, "es"),
+        (SAMPLE_INVOICE_DATA, 0, "en"),
+        (_with_retention(), 0, "es"),
+        ({"invoices": [{"number": "1"}]}, 0, "es"),
+        (invoice_data(lines=120, invoices=2), 1, "en"),
+    ]
+    for data, index, lang in cases:
+        standard = sheet_snapshot(generate_excel(data, index, lang, write_only=False))
+        streamed = sheet_snapshot(generate_excel(data, index, lang, write_only=True))
+
+        assert streamed == standard
+
+
+def test_write_only_keeps_line_formats():
+    snapshot = sheet_snapshot(generate_excel(invoice_data(lines=50), write_only=True))["Factura"]
+
+    # Tras cabecera, emisor/receptor y cabecera de la tabla
+    first_line = snapshot["cells"]["F11"]
+    assert first_line[4] == "thin"
+    assert first_line[7] == "#,##0.00"
+    assert "A1:F1" in snapshot["merged"]
+    assert snapshot["heights"] == {1: 30, 2: 22}
+
+
+def test_write_only_switches_on_by_line_count(monkeypatch):
+    calls = []
+    build = excel_generator._build_write_only_workbook
+
+    def spy(*args):
+        calls.append(args)
+        return build(*args)
+
+    monkeypatch.setattr(excel_generator, "_build_write_only_workbook", spy)
+    monkeypatch.setattr(config, "EXCEL_WRITE_ONLY_LINES", 10)
+
+    generate_excel(invoice_data(lines=9))
+    assert calls == []
+
+    generate_excel(invoice_data(lines=10))
+    assert len(calls) == 1
+
+
+def test_column_widths_match_previous_full_scan():
+    """Mismos anchos que el antiguo recorrido completo de la hoja (_auto_fit_columns)"""
+    expected = {
+        "es": {"A": 50, "B": 44, "C": 11, "D": 15.4, "E": 50, "F": 9.9},
+        "en": {"A": 50, "B": 44, "C": 11, "D": 14, "E": 50, "F": 8.8},
+    }
+    for lang, widths in expected.items():
+        for write_only in (False, True):
+            content = generate_excel(SAMPLE_INVOICE_DATA, 0, lang, write_only=write_only)
+            snapshot = sheet_snapshot(content)
+            sheet = next(iter(snapshot.values()))
+
+            assert sheet["widths"] == pytest.approx(widths)
+
+
+def test_column_widths_rules():
+    widths = excel_generator.ColumnWidths()
+    widths.add(1, "x")
+    widths.add(3, "línea corta\nuna línea bastante más larga", excel_generator.LABEL_STYLE)
+    widths.add(6, "x" * 80)
+    widths.add(4, None)
+
+    # Mínimo propio de la columna 1, negrita en la 3 y máximo en la 6
+    assert widths.final() == pytest.approx({1: 16, 3: 33, 6: excel_generator.MAX_COL_WIDTH})
+
+
+@pytest.mark.parametrize("threshold, on_disk", [(1024 * 1024, False), (1024, True)])
+def test_write_excel_spools_to_disk_above_threshold(monkeypatch, threshold, on_disk):
+    monkeypatch.setattr(config, "EXCEL_SPOOL_THRESHOLD", threshold)
+
+    with write_excel(SAMPLE_INVOICE_DATA) as excel_file:
+        assert excel_file._rolled is on_disk
+        assert excel_file.tell() == 0
+        content = excel_file.read()
+
+    assert sheet_snapshot(content) == sheet_snapshot(generate_excel(SAMPLE_INVOICE_DATA))
+
+
+def test_template_export_matches_full_save():
+    """La plantilla del idioma da la misma hoja que guardar el libro entero"""
+    for lang in ("es", "en", "fr"):
+        wb = excel_generator.build_invoice_workbook(SAMPLE_INVOICE_DATA, 0, lang, write_only=False)
+        full = BytesIO()
+        wb.save(full)
+
+        content = generate_excel(SAMPLE_INVOICE_DATA, 0, lang)
+        assert sheet_snapshot(content) == sheet_snapshot(full.getvalue())
+
+
+def _cell_format(cell) -> tuple:
+    font, fill, alignment = cell.font, cell.fill, cell.alignment
+    return (
+        bool(font.b), font.sz, font.color.rgb if font.color is not None else None,
+        fill.fill_type, fill.fgColor.rgb,
+        tuple(getattr(cell.border, side).style for side in ("left", "right", "top", "bottom")),
+        alignment.horizontal, alignment.vertical, bool(alignment.wrap_text),
+        cell.number_format,
+    )
+
+
+def _public_format(style) -> tuple:
+    """Formato de style aplicado con la API pública de openpyxl (la referencia)"""
+    cell = Workbook().active["A1"]
+    for name in ("font", "fill", "border", "alignment", "number_format"):
+        if getattr(style, name) is not None:
+            setattr(cell, name, getattr(style, name))
+    return _cell_format(cell)
+
+
+@pytest.mark.parametrize("write_only", [False, True])
+def test_generated_workbook_round_trips_through_load_workbook(write_only):
+    """
+    Las partes que se escriben con internos de openpyxl (tablas de estilos,
+    plantilla) dan un .xlsx que openpyxl vuelve a leer con el formato de
+    cada celda tal como lo fija su API pública
+    """
+    data = _with_retention()
+    content = generate_excel(data, 0, "en", write_only=write_only)
+
+    with zipfile.ZipFile(BytesIO(content)) as archive:
+        assert archive.testzip() is None
+    ws = load_workbook(BytesIO(content)).active
+    layout = excel_generator.invoice_layout(data, 0, "en")
+    for row, layout_row in enumerate(layout, start=1):
+        # openpyxl lee las celdas cubiertas por una combinación sin formato
+        covered = {col for start, end in layout_row.merges for col in range(start + 1, end + 1)}
+        for col, value, style in layout_row.cells:
+            if col in covered:
+                continue
+            cell = ws.cell(row=row, column=col)
+            assert cell.value == value, cell.coordinate
+            if style is not None:
+                assert _cell_format(cell) == _public_format(style), cell.coordinate
+
+
+def test_template_is_built_once_per_language():
+    template = excel_generator.get_workbook_template("en")
+
+    assert excel_generator.get_workbook_template("en") is template
+    fallback = excel_generator.get_workbook_template("es")
+    assert excel_generator.get_workbook_template("xx") is fallback
+
+
+def test_template_falls_back_when_styles_are_added():
+    """Un estilo fuera de CELL_STYLES invalida las partes fijas: se guarda con openpyxl"""
+    wb = excel_generator.build_invoice_workbook(SAMPLE_INVOICE_DATA, 0, "es", write_only=False)
+    wb.active["A30"].font = excel_generator.Font(italic=True, color="FF0000")
+    output = BytesIO()
+
+    assert not excel_generator.get_workbook_template("es").matches(wb)
+    excel_generator.save_workbook(wb, output, "es")
+
+    assert load_workbook(output).active["A30"].font.i
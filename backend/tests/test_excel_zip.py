@@ -0,0 +1,128 @@
+"""
+Tests de la exportación de lotes a ZIP en streaming
+"""
+
+import zipfile
+from io import BytesIO
+
+import pytest
+from httpx import AsyncClient, ASGITransport
+
+try:
+    from backend.main import app
+    from backend.app.routes.export import unique_filenames
+    from backend.app.services.excel_generator import generate_excel
+    from backend.app.services.worker_pool import JobTimeoutError, get_worker_pool
+    from backend.app.services.zip_stream import ZipStreamWriter
+    from backend.benchmarks.synthetic import invoice_data
+    from backend.tests.test_excel_generator import sheet_snapshot
+except ImportError:
+    from main import app
+    from app.routes.export import unique_filenames
+    from app.services.excel_generator import generate_excel
+    from app.services.worker_pool import JobTimeoutError, get_worker_pool
+    from app.services.zip_stream import ZipStreamWriter
+    from benchmarks.synthetic import invoice_data
+    from tests.test_excel_generator import sheet_snapshot
+
+
+def test_zip_stream_writer_emits_each_entry():
+    writer = ZipStreamWriter()
+    payload = b"x" * 100_000
+
+    first = writer.add("a.txt", payload)
+    second = writer.add("b.txt", b"hola")
+    tail = writer.close()
+
+    # Los datos de la entrada se emiten tal cual, sin copias intermedias
+    assert any(chunk is payload for chunk in first)
+    archive = zipfile.ZipFile(BytesIO(b"".join(first + second + tail)))
+    assert archive.testzip() is None
+    assert archive.read("a.txt") == payload
+    assert archive.read("b.txt") == b"hola"
+
+
+def test_unique_filenames():
+    names = unique_filenames([
+        "factura-A-1.xlsx",
+        "factura-a-1.xlsx",
+        "factura-A/1.xlsx",
+        "factura-A-1.xlsx",
+        "factura-B 2.xlsx",
+    ])
+
+    assert names == [
+        "factura-A-1.xlsx",
+        "factura-a-1-2.xlsx",
+        "factura-A1.xlsx",
+        "factura-A-1-3.xlsx",
+        "factura-B2.xlsx",
+    ]
+
+
+@pytest.mark.asyncio
+async def test_export_zip_streams_one_workbook_per_invoice():
+    data = invoice_data(lines=15, invoices=5)
+    data["invoices"][4]["number"] = data["invoices"][3]["number"]
+
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as client:
+        response = await client.post("/api/export/excel/zip", json={"data": data, "lang": "en"})
+
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/zip"
+    assert 'filename="facturas.zip"' in response.headers["content-disposition"]
+
+    archive = zipfile.ZipFile(BytesIO(response.content))
+    assert archive.namelist() == [
+        "factura-BENCH-000001.xlsx",
+        "factura-BENCH-000002.xlsx",
+        "factura-BENCH-000003.xlsx",
+        "factura-BENCH-000004.xlsx",
+        "factura-BENCH-000004-2.xlsx",
+    ]
+    for index, name in enumerate(archive.namelist()):
+        expected = sheet_snapshot(generate_excel(data, index, "en"))
+        assert sheet_snapshot(archive.read(name)) == expected
+
+
+@pytest.mark.asyncio
+async def test_export_zip_reports_failed_entries(monkeypatch):
+    """Un fallo con la respuesta ya empezada no trunca el ZIP: queda como entrada de error"""
+    pool = get_worker_pool()
+    run = pool.run
+    calls = 0
+
+    async def failing_run(fn, *args, **kwargs):
+        nonlocal calls
+        calls += 1
+        if calls == 2:
+            raise JobTimeoutError()
+        if calls == 3:
+            raise RuntimeError("pool roto")
+        return await run(fn, *args, **kwargs)
+
+    monkeypatch.setattr(pool, "run", failing_run)
+    data = invoice_data(lines=2, invoices=4)
+
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as client:
+        response = await client.post("/api/export/excel/zip", json={"data": data})
+
+    assert response.status_code == 200
+    archive = zipfile.ZipFile(BytesIO(response.content))
+    assert archive.testzip() is None
+    assert archive.namelist() == [
+        "factura-BENCH-000001.xlsx",
+        "factura-BENCH-000002.error.txt",
+        "factura-BENCH-000003.error.txt",
+        "factura-BENCH-000004.xlsx",
+    ]
+    assert archive.read("factura-BENCH-000002.error.txt").decode() == "Tiempo de generación agotado"
+    assert "pool roto" in archive.read("factura-BENCH-000003.error.txt").decode()
+
+
+@pytest.mark.asyncio
+async def test_export_zip_validates_before_streaming():
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as client:
+        response = await client.post("/api/export/excel/zip", json={"data": {"invoices": []}})
+
+    assert response.status_code == 400
@@ -96,6 +96,18 @@ def test_export_excel_success():
     assert len(response.content) > 0
 
 
+def test_export_excel_streams_with_content_length():
+    """El Excel se envía por trozos pero con su tamaño exacto"""
+    response = client.post(
+        "/api/export/excel",
+        json={"data": SAMPLE_INVOICE_DATA},
+    )
+
+    assert response.status_code == 200
+    assert int(response.headers["content-length"]) == len(response.content)
+    assert response.content[:2] == b"PK"
+
+
 def test_export_excel_with_lang_en():
     """Test exportación en inglés"""
     response = client.post(
@@ -0,0 +1,174 @@
+"""
+Tests de la caché de Excel generados (memoria y disco) y del ETag de la exportación
+"""
+
+import asyncio
+import copy
+from io import BytesIO
+
+import pytest
+from httpx import AsyncClient, ASGITransport
+
+try:
+    from backend.main import app
+    from backend.app.services.export_cache import ExportCache, export_cache_key, get_export_cache
+    from backend.benchmarks.synthetic import invoice_data
+    from backend.tests.test_export import SAMPLE_INVOICE_DATA
+except ImportError:
+    from main import app
+    from app.services.export_cache import ExportCache, export_cache_key, get_export_cache
+    from benchmarks.synthetic import invoice_data
+    from tests.test_export import SAMPLE_INVOICE_DATA
+
+
+def _read(found) -> bytes:
+    file, size = found
+    with file:
+        content = file.read()
+    assert len(content) == size
+    return content
+
+
+def test_key_is_canonical_and_scoped_to_the_invoice():
+    key = export_cache_key(SAMPLE_INVOICE_DATA, 0, "es", "f.xlsx", "openpyxl")
+
+    reordered = dict(reversed(list(copy.deepcopy(SAMPLE_INVOICE_DATA).items())))
+    reordered["seller"] = dict(reversed(list(reordered["seller"].items())))
+    assert export_cache_key(reordered, 0, "es", "f.xlsx", "openpyxl") == key
+
+    # Otras facturas del lote no cuentan; idioma, nombre y motor sí
+    batch = {**SAMPLE_INVOICE_DATA, "invoices": [{"number": "X"}, *SAMPLE_INVOICE_DATA["invoices"]]}
+    assert export_cache_key(batch, 1, "es", "f.xlsx", "openpyxl") == key
+    assert export_cache_key(SAMPLE_INVOICE_DATA, 0, "en", "f.xlsx", "openpyxl") != key
+    assert export_cache_key(SAMPLE_INVOICE_DATA, 0, "es", "g.xlsx", "openpyxl") != key
+    assert export_cache_key(SAMPLE_INVOICE_DATA, 0, "es", "f.xlsx", "xlsxwriter") != key
+
+
+def test_memory_tier_evicts_by_size(tmp_path):
+    cache = ExportCache(max_memory=400, max_disk=0, directory=str(tmp_path), ttl=60)
+    for key in "abcde":
+        cache.put(key, BytesIO(key.encode() * 100))
+    # Mayor que la cuarta parte del nivel: no entra en memoria
+    cache.put("big", BytesIO(b"x" * 101))
+
+    assert cache.get("a") is None
+    assert _read(cache.get("e")) == b"e" * 100
+    assert cache.get("big") is None
+    stats = cache.stats()
+    assert stats["entries"] == 4
+    assert stats["bytes"] == 400
+    assert stats["evictions"] == 1
+
+
+def test_disk_tier_survives_restart_and_is_promoted(tmp_path):
+    cache = ExportCache(max_memory=1024, max_disk=1024, directory=str(tmp_path), ttl=60)
+    cache.put("k", BytesIO(b"xlsx" * 10))
+
+    restarted = ExportCache(max_memory=1024, max_disk=1024, directory=str(tmp_path), ttl=60)
+    assert _read(restarted.get("k")) == b"xlsx" * 10
+    assert _read(restarted.get("k")) == b"xlsx" * 10
+
+    stats = restarted.stats()
+    assert (stats["disk_hits"], stats["memory_hits"], stats["bytes_saved"]) == (1, 1, 80)
+    assert stats["hit_ratio"] == 1.0
+
+
+def test_large_disk_hit_is_streamed_from_the_file(tmp_path):
+    cache = ExportCache(max_memory=64, max_disk=1024, directory=str(tmp_path), ttl=60)
+    cache.put("k", BytesIO(b"x" * 100))
+
+    file, size = cache.get("k")
+    # Se sustituye mientras se envía: el archivo abierto sigue completo
+    cache.put("k", BytesIO(b"y" * 10))
+    with file:
+        assert not isinstance(file, BytesIO)
+        assert (file.read(), size) == (b"x" * 100, 100)
+    assert cache.stats()["entries"] == 1
+    assert _read(cache.get("k")) == b"y" * 10
+
+
+def test_disk_tier_evicts_by_size_and_age(tmp_path):
+    cache = ExportCache(max_memory=0, max_disk=250, directory=str(tmp_path), ttl=60)
+    for key in ("a", "b", "c"):
+        cache.put(key, BytesIO(b"." * 100))
+
+    assert sorted(p.stem for p in tmp_path.glob("*.xlsx")) == ["b", "c"]
+    assert cache.get("a") is None
+    assert cache.get("b") is not None
+
+    expired = ExportCache(max_memory=1024, max_disk=1024, directory=str(tmp_path), ttl=0)
+    assert expired.get("b") is None
+    assert not (tmp_path / "b.xlsx").exists()
+
+
+def test_put_leaves_file_at_start(tmp_path):
+    cache = ExportCache(max_memory=1024, max_disk=1024, directory=str(tmp_path), ttl=60)
+    file = BytesIO(b"contenido")
+    file.seek(4)
+
+    cache.put("k", file)
+
+    assert file.read() == b"contenido"
+
+
+@pytest.mark.asyncio
+async def test_export_reuses_cached_file_and_honours_etag():
+    cache = get_export_cache()
+    cache.clear()
+
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as client:
+        first = await client.post("/api/export/excel", json={"data": SAMPLE_INVOICE_DATA})
+        hits_before = cache.stats()["hits"]
+        second = await client.post("/api/export/excel", json={"data": SAMPLE_INVOICE_DATA})
+        etag = first.headers["etag"]
+        not_modified = await client.post(
+            "/api/export/excel", json={"data": SAMPLE_INVOICE_DATA}, headers={"If-None-Match": etag}
+        )
+        other_lang = await client.post(
+            "/api/export/excel", json={"data": SAMPLE_INVOICE_DATA, "lang": "en"}
+        )
+
+    assert first.status_code == second.status_code == 200
+    assert second.content == first.content
+    assert second.headers["etag"] == etag
+    assert "server-timing" in second.headers and "build" not in second.headers["server-timing"]
+    assert cache.stats()["hits"] == hits_before + 1
+    assert not_modified.status_code == 304
+    assert not_modified.headers["etag"] == etag
+    assert not_modified.content == b""
+    assert other_lang.headers["etag"] != etag
+
+
+@pytest.mark.asyncio
+async def test_export_generates_off_the_event_loop():
+    """Mientras se genera un Excel grande, el event loop sigue atendiendo"""
+    get_export_cache().clear()
+    ticks = 0
+
+    async def ticker():
+        nonlocal ticks
+        while True:
+            await asyncio.sleep(0.005)
+            ticks += 1
+
+    task = asyncio.create_task(ticker())
+    try:
+        async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as client:
+            response = await client.post(
+                "/api/export/excel", json={"data": invoice_data(lines=3000)}
+            )
+    finally:
+        task.cancel()
+
+    assert response.status_code == 200
+    assert ticks >= 10
+
+
+@pytest.mark.asyncio
+async def test_export_cache_metrics():
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as client:
+        await client.post("/api/export/excel", json={"data": SAMPLE_INVOICE_DATA})
+        body = (await client.get("/metrics")).text
+
+    for field in ("hit_ratio", "bytes_saved", "entries", "disk_bytes"):
+        assert f'facturaview_cache{{cache="export",field="{field}"}}' in body
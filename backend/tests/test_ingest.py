@@ -0,0 +1,159 @@
+"""
+Tests para la ingesta en streaming de archivos subidos
+"""
+
+import hashlib
+import os
+from pathlib import Path
+
+import pytest
+from httpx import AsyncClient, ASGITransport
+from starlette.requests import Request
+
+try:
+    from backend.main import app
+    from backend.app import config
+    from backend.app.services.ingest import (
+        FileTooLargeError,
+        MissingFileError,
+        UnsupportedFileError,
+        ingest_upload,
+    )
+    from backend.app.services.result_cache import get_validation_cache
+except ImportError:
+    from main import app
+    from app import config
+    from app.services.ingest import (
+        FileTooLargeError,
+        MissingFileError,
+        UnsupportedFileError,
+        ingest_upload,
+    )
+    from app.services.result_cache import get_validation_cache
+
+
+FIXTURES_DIR = Path(__file__).parent.parent.parent / "frontend" / "tests" / "fixtures"
+BOUNDARY = "facturaviewboundary"
+
+
+def _multipart(content: bytes, filename: str = "factura.xml", field: str = "file") -> bytes:
+    return (
+        f"--{BOUNDARY}\r\n"
+        f'Content-Disposition: form-data; name="{field}"; filename="{filename}"\r\n'
+        "Content-Type: application/xml\r\n\r\n"
+    ).encode() + content + f"\r\n--{BOUNDARY}--\r\n".encode()
+
+
+def _request(chunks, content_length=None) -> Request:
+    """Request ASGI que entrega el cuerpo en los bloques indicados"""
+    headers = [(b"content-type", f"multipart/form-data; boundary={BOUNDARY}".encode())]
+    if content_length is not None:
+        headers.append((b"content-length", str(content_length).encode()))
+    pending = list(chunks)
+    state = {"consumed": 0}
+
+    async def receive():
+        if not pending:
+            return {"type": "http.request", "body": b"", "more_body": False}
+        chunk = pending.pop(0)
+        state["consumed"] += len(chunk)
+        return {"type": "http.request", "body": chunk, "more_body": bool(pending)}
+
+    request = Request({"type": "http", "method": "POST", "headers": headers}, receive)
+    request.consumed = state
+    return request
+
+
+def _split(data: bytes, size: int = 64 * 1024) -> list[bytes]:
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+
+@pytest.mark.asyncio
+async def test_small_file_stays_in_memory():
+    """Un archivo pequeño se devuelve en memoria con su SHA-256"""
+    content = b"<Facturae/>"
+    upload = await ingest_upload(_request(_split(_multipart(content), 3)), "file", (".xml",))
+
+    assert upload.source == content
+    assert upload.digest == hashlib.sha256(content).hexdigest()
+    assert upload.filename == "factura.xml"
+    upload.close()
+
+
+@pytest.mark.asyncio
+async def test_large_file_spools_to_disk(tmp_path, monkeypatch):
+    """Por encima del umbral se vuelca a un temporal que close() borra"""
+    monkeypatch.setattr(config, "UPLOAD_SPOOL_DIR", str(tmp_path))
+    content = os.urandom(300 * 1024)
+    upload = await ingest_upload(_request(_split(_multipart(content))), spool_threshold=64 * 1024)
+
+    assert isinstance(upload.source, str)
+    assert Path(upload.source).read_bytes() == content
+    assert upload.size == len(content)
+    assert upload.digest == hashlib.sha256(content).hexdigest()
+    upload.close()
+    assert not list(tmp_path.iterdir())
+
+
+@pytest.mark.asyncio
+async def test_content_length_rejected_before_reading():
+    """Si Content-Length ya supera el límite no se lee el cuerpo"""
+    request = _request([b"x" * 1024], content_length=config.MAX_UPLOAD_SIZE * 2)
+
+    with pytest.raises(FileTooLargeError):
+        await ingest_upload(request)
+    assert request.consumed["consumed"] == 0
+
+
+@pytest.mark.asyncio
+async def test_oversized_stream_aborts_early(tmp_path, monkeypatch):
+    """Sin Content-Length se corta al superar el límite, sin leer el resto"""
+    monkeypatch.setattr(config, "UPLOAD_SPOOL_DIR", str(tmp_path))
+    body = _multipart(b"x" * (4 * 1024 * 1024))
+    request = _request(_split(body))
+
+    with pytest.raises(FileTooLargeError):
+        await ingest_upload(request, max_size=1024 * 1024, spool_threshold=256 * 1024)
+    assert request.consumed["consumed"] < 2 * 1024 * 1024
+    assert not list(tmp_path.iterdir())
+
+
+@pytest.mark.asyncio
+async def test_extension_checked_from_headers():
+    """La extensión se rechaza al llegar las cabeceras de la parte"""
+    request = _request(_split(_multipart(b"x" * (1024 * 1024), "factura.pdf"), 1024))
+
+    with pytest.raises(UnsupportedFileError):
+        await ingest_upload(request, "file", (".xml", ".xsig"))
+    assert request.consumed["consumed"] < 4096
+
+
+@pytest.mark.asyncio
+async def test_missing_field():
+    """Un formulario sin el campo del archivo"""
+    with pytest.raises(MissingFileError):
+        await ingest_upload(_request([_multipart(b"<a/>", field="otro")]))
+
+
+@pytest.mark.asyncio
+async def test_spooled_signature_matches_in_memory(monkeypatch):
+    """La validación desde el temporal da el mismo resultado que en memoria"""
+    content = (FIXTURES_DIR / "simple-321-signed.xsig.xml").read_bytes()
+    transport = ASGITransport(app=app)
+    async with AsyncClient(transport=transport, base_url="http://test") as client:
+        in_memory = await client.post(
+            "/api/validate-signature",
+            files={"file": ("factura.xsig", content, "application/xml")},
+        )
+        # Sin caché, para que el worker parsee el temporal
+        get_validation_cache().clear()
+        monkeypatch.setattr(config, "UPLOAD_SPOOL_THRESHOLD", 0)
+        spooled = await client.post(
+            "/api/validate-signature",
+            files={"file": ("factura.xsig", content, "application/xml")},
+        )
+
+    assert in_memory.status_code == spooled.status_code == 200
+    assert spooled.json()["valid"] is True
+    assert spooled.json() == in_memory.json()
+    assert spooled.headers["etag"] == in_memory.headers["etag"]
@@ -0,0 +1,104 @@
+"""
+Tests para las métricas Prometheus y el endpoint /metrics
+"""
+
+from pathlib import Path
+
+import pytest
+from httpx import AsyncClient, ASGITransport
+
+try:
+    from backend.main import app
+    from backend.app.services.metrics import Histogram, record_stages
+    from backend.app.services.export_cache import get_export_cache
+    from backend.app.services.result_cache import get_validation_cache
+    from backend.app.services.validator import validate_xades_signature
+    from backend.tests.test_export import SAMPLE_INVOICE_DATA
+except ImportError:
+    from main import app
+    from app.services.metrics import Histogram, record_stages
+    from app.services.export_cache import get_export_cache
+    from app.services.result_cache import get_validation_cache
+    from app.services.validator import validate_xades_signature
+    from tests.test_export import SAMPLE_INVOICE_DATA
+
+
+FIXTURES_DIR = Path(__file__).parent.parent.parent / "frontend" / "tests" / "fixtures"
+
+
+def test_histogram_exposition_format():
+    """Buckets acumulados, +Inf, suma y recuento por serie"""
+    histogram = Histogram("prueba_seconds", "Ayuda", ("ruta",), buckets=(0.1, 1.0))
+    histogram.observe(0.05, ruta="/a")
+    histogram.observe(0.5, ruta="/a")
+    histogram.observe(5, ruta="/a")
+
+    lines = histogram.render()
+
+    assert lines[:2] == ["# HELP prueba_seconds Ayuda", "# TYPE prueba_seconds histogram"]
+    assert 'prueba_seconds_bucket{ruta="/a",le="0.1"} 1' in lines
+    assert 'prueba_seconds_bucket{ruta="/a",le="1"} 2' in lines
+    assert 'prueba_seconds_bucket{ruta="/a",le="+Inf"} 3' in lines
+    assert 'prueba_seconds_sum{ruta="/a"} 5.55' in lines
+    assert 'prueba_seconds_count{ruta="/a"} 3' in lines
+
+
+def test_histogram_rejects_wrong_labels():
+    with pytest.raises(ValueError):
+        Histogram("x", "y", ("ruta",)).observe(1.0, otra="a")
+
+
+def test_validation_stages_are_recorded():
+    """record_stages devuelve la duración de cada etapa de la validación"""
+    content = (FIXTURES_DIR / "simple-321-signed.xsig.xml").read_bytes()
+
+    result, timings = record_stages(validate_xades_signature, content)
+
+    assert result.valid is True
+    assert {"parse", "certificate", "c14n", "verify", "revocation"} <= set(timings)
+    assert all(seconds >= 0 for seconds in timings.values())
+
+
+def test_stages_are_not_recorded_outside_record_stages():
+    """Fuera de record_stages las etapas no acumulan nada"""
+    content = (FIXTURES_DIR / "simple-321-signed.xsig.xml").read_bytes()
+    validate_xades_signature(content)
+
+    _, timings = record_stages(lambda: None)
+    assert timings == {}
+
+
+@pytest.mark.asyncio
+async def test_metrics_endpoint():
+    """Expone peticiones por ruta, etapas internas y gauges"""
+    content = (FIXTURES_DIR / "simple-322-signed.xsig.xml").read_bytes()
+    get_validation_cache().clear()
+    get_export_cache().clear()
+
+    transport = ASGITransport(app=app)
+    async with AsyncClient(transport=transport, base_url="http://test") as client:
+        await client.get("/health")
+        await client.post(
+            "/api/validate-signature",
+            files={"file": ("factura.xsig", content, "application/xml")},
+        )
+        await client.post("/api/export/excel", json={"data": SAMPLE_INVOICE_DATA})
+        response = await client.get("/metrics")
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    body = response.text
+    assert 'facturaview_http_requests_total{method="GET",route="/health",status="200"}' in body
+    assert (
+        'facturaview_http_request_duration_seconds_count'
+        '{method="POST",route="/api/validate-signature"}'
+    ) in body
+    stage_count = 'facturaview_stage_duration_seconds_count{{operation="{}",stage="{}"}}'
+    for stage in ("parse", "certificate", "c14n", "verify", "revocation"):
+        assert stage_count.format("validation", stage) in body
+    for stage in ("build", "auto_fit", "save"):
+        assert stage_count.format("excel", stage) in body
+    upload_size = 'facturaview_upload_last_size_bytes{route="/api/validate-signature"}'
+    assert f"{upload_size} {len(content)}" in body
+    assert 'facturaview_worker_pool{state="queue_depth"}' in body
+    assert 'facturaview_cache{cache="validation",field="hit_ratio"}' in body
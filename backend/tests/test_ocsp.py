@@ -0,0 +1,217 @@
+"""
+Tests para el cliente OCSP contra un responder local
+"""
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import ec
+from cryptography.x509 import ocsp
+from cryptography.x509.oid import NameOID
+
+try:
+    from backend.app.services import ocsp as ocsp_service
+    from backend.app.services.ocsp import OCSPClient, OCSPError
+    from backend.app.services.validator import check_revocation_status
+except ImportError:
+    from app.services import ocsp as ocsp_service
+    from app.services.ocsp import OCSPClient, OCSPError
+    from app.services.validator import check_revocation_status
+
+
+def _name(cn: str) -> x509.Name:
+    return x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, cn)])
+
+
+def _certificate(subject, issuer, public_key, signing_key, ca=False, ocsp_url=None):
+    now = datetime.now(timezone.utc)
+    builder = (
+        x509.CertificateBuilder()
+        .subject_name(_name(subject))
+        .issuer_name(_name(issuer))
+        .public_key(public_key)
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(now - timedelta(days=1))
+        .not_valid_after(now + timedelta(days=30))
+        .add_extension(x509.BasicConstraints(ca=ca, path_length=None), critical=True)
+    )
+    if ocsp_url:
+        builder = builder.add_extension(
+            x509.AuthorityInformationAccess([
+                x509.AccessDescription(
+                    x509.oid.AuthorityInformationAccessOID.OCSP,
+                    x509.UniformResourceIdentifier(ocsp_url),
+                )
+            ]),
+            critical=False,
+        )
+    return builder.sign(signing_key, hashes.SHA256())
+
+
+class Responder:
+    """Responder OCSP mínimo: estado configurable, retardo y contador"""
+
+    def __init__(self):
+        self.ca_key = ec.generate_private_key(ec.SECP256R1())
+        self.ca = _certificate(
+            "CA Pruebas", "CA Pruebas", self.ca_key.public_key(), self.ca_key, ca=True
+        )
+        self.signing_key = self.ca_key
+        self.responder_cert = self.ca
+        self.responder_encoding = ocsp.OCSPResponderEncoding.HASH
+        self.revoked: set[int] = set()
+        self.delay = 0.0
+        self.requests = 0
+        responder = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers["Content-Length"]))
+                responder.requests += 1
+                time.sleep(responder.delay)
+                data = responder.respond(ocsp.load_der_ocsp_request(body))
+                self.send_response(200)
+                self.send_header("Content-Type", "application/ocsp-response")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}/ocsp"
+        self.leaf_key = ec.generate_private_key(ec.SECP256R1())
+        self.leaf = self.issue("Firmante")
+
+    def issue(self, subject: str) -> x509.Certificate:
+        return _certificate(
+            subject, "CA Pruebas", self.leaf_key.public_key(), self.ca_key, ocsp_url=self.url
+        )
+
+    def respond(self, request: ocsp.OCSPRequest) -> bytes:
+        leaf = self.leaf if request.serial_number == self.leaf.serial_number else None
+        if leaf is None:
+            return ocsp.OCSPResponseBuilder.build_unsuccessful(
+                ocsp.OCSPResponseStatus.UNAUTHORIZED
+            ).public_bytes(serialization.Encoding.DER)
+        now = datetime.now(timezone.utc)
+        revoked = leaf.serial_number in self.revoked
+        builder = ocsp.OCSPResponseBuilder().add_response(
+            cert=leaf,
+            issuer=self.ca,
+            algorithm=hashes.SHA1(),
+            cert_status=ocsp.OCSPCertStatus.REVOKED if revoked else ocsp.OCSPCertStatus.GOOD,
+            this_update=now,
+            next_update=now + timedelta(hours=1),
+            revocation_time=now - timedelta(days=1) if revoked else None,
+            revocation_reason=None,
+        ).responder_id(self.responder_encoding, self.responder_cert)
+        response = builder.sign(self.signing_key, hashes.SHA256())
+        return response.public_bytes(serialization.Encoding.DER)
+
+
+@pytest.fixture
+def responder():
+    responder = Responder()
+    thread = threading.Thread(target=responder.server.serve_forever, daemon=True)
+    thread.start()
+    yield responder
+    responder.server.shutdown()
+    responder.server.server_close()
+
+
+@pytest.fixture
+def client(monkeypatch):
+    client = OCSPClient(timeout=2.0)
+    monkeypatch.setattr(ocsp_service, "_client", client)
+    return client
+
+
+def test_good_certificate(responder, client):
+    """Un certificado vigente queda comprobado y no revocado"""
+    assert check_revocation_status(responder.leaf, responder.ca) == (False, True)
+
+
+def test_revoked_certificate(responder, client):
+    """El estado revocado del responder se refleja en la validación"""
+    responder.revoked.add(responder.leaf.serial_number)
+    assert check_revocation_status(responder.leaf, responder.ca) == (True, True)
+
+
+def test_response_cached_until_next_update(responder, client):
+    """La segunda consulta del mismo certificado no llega al responder"""
+    first = client.check(responder.leaf, responder.ca, responder.url)
+    second = client.check(responder.leaf, responder.ca, responder.url)
+
+    assert first is second
+    assert responder.requests == 1
+    assert client.stats()["hits"] == 1
+
+
+def test_concurrent_checks_are_coalesced(responder, client):
+    """Un lote de validaciones simultáneas del mismo firmante hace una sola consulta"""
+    responder.delay = 0.3
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        results = list(executor.map(
+            lambda _: client.check(responder.leaf, responder.ca, responder.url), range(8)
+        ))
+
+    assert {r.status for r in results} == {"good"}
+    assert responder.requests == 1
+    assert client.stats()["coalesced"] == 7
+
+
+def test_deadline_is_enforced(responder):
+    """Un responder lento no bloquea la validación más allá del plazo"""
+    responder.delay = 2.0
+    client = OCSPClient(timeout=0.3)
+
+    start = time.monotonic()
+    with pytest.raises(OCSPError):
+        client.check(responder.leaf, responder.ca, responder.url)
+    assert time.monotonic() - start < 1.5
+
+
+def test_coalesced_waiter_timeout_is_an_ocsp_error(responder, monkeypatch):
+    """Quien espera la consulta de otra validación también recibe OCSPError al agotar el plazo"""
+    client = OCSPClient(timeout=0.1)
+    release = threading.Event()
+    query = client._query
+    monkeypatch.setattr(client, "_query", lambda *args: release.wait(5) and query(*args))
+
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        owner = executor.submit(client.check, responder.leaf, responder.ca, responder.url)
+        while not client._in_flight:
+            time.sleep(0.01)
+        with pytest.raises(OCSPError, match="Tiempo agotado"):
+            client.check(responder.leaf, responder.ca, responder.url)
+        release.set()
+        assert owner.result().status == "good"
+
+
+def test_forged_response_is_rejected(responder, client):
+    """Una respuesta no firmada por el emisor no se acepta"""
+    # Misma identidad (nombre) que la CA, pero otra clave
+    rogue_key = ec.generate_private_key(ec.SECP256R1())
+    responder.signing_key = rogue_key
+    responder.responder_cert = _certificate(
+        "CA Pruebas", "CA Pruebas", rogue_key.public_key(), rogue_key, ca=True
+    )
+    responder.responder_encoding = ocsp.OCSPResponderEncoding.NAME
+
+    with pytest.raises(OCSPError, match="Firma"):
+        client.check(responder.leaf, responder.ca, responder.url)
+    assert client.stats()["entries"] == 0
+
+
+def test_certificate_without_ocsp_is_not_checked(responder, client):
+    """Sin URL OCSP en el certificado no se consulta nada"""
+    assert check_revocation_status(responder.ca, responder.ca) == (None, False)
+    assert responder.requests == 0
@@ -0,0 +1,146 @@
+"""
+Tests para la caché de resultados de validación
+"""
+
+import time
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+import pytest
+from httpx import AsyncClient, ASGITransport
+
+try:
+    from backend.main import app
+    from backend.app import config
+    from backend.app.models.response import SignatureResponse, CertificateInfo
+    from backend.app.routes.signature import _cache_ttl
+    from backend.app.services.result_cache import ValidationCache, get_validation_cache
+    from backend.app.services.validator import ERROR_CERT_EXPIRED, LEVEL_FULL, LEVEL_INSPECT
+except ImportError:
+    from main import app
+    from app import config
+    from app.models.response import SignatureResponse, CertificateInfo
+    from app.routes.signature import _cache_ttl
+    from app.services.result_cache import ValidationCache, get_validation_cache
+    from app.services.validator import ERROR_CERT_EXPIRED, LEVEL_FULL, LEVEL_INSPECT
+
+
+FIXTURES_DIR = Path(__file__).parent.parent.parent / "frontend" / "tests" / "fixtures"
+
+
+def _signed_response(valid_to: datetime) -> SignatureResponse:
+    return SignatureResponse(
+        valid=True,
+        certificate=CertificateInfo(
+            subject="Test",
+            valid_from=valid_to - timedelta(days=365),
+            valid_to=valid_to,
+        ),
+    )
+
+
+def test_cache_hit_and_miss_counters():
+    """Cuenta aciertos y fallos"""
+    cache = ValidationCache(max_entries=4)
+    assert cache.get("a") is None
+    cache.put("a", SignatureResponse(valid=None))
+    assert cache.get("a") is not None
+
+    stats = cache.stats()
+    assert stats["hits"] == 1
+    assert stats["misses"] == 1
+
+
+def test_cache_evicts_least_recently_used():
+    """Al superar el tamaño máximo se descarta la entrada menos usada"""
+    cache = ValidationCache(max_entries=2)
+    cache.put("a", SignatureResponse(valid=None))
+    cache.put("b", SignatureResponse(valid=None))
+    cache.get("a")
+    cache.put("c", SignatureResponse(valid=None))
+
+    assert cache.get("b") is None
+    assert cache.get("a") is not None
+    assert cache.stats()["evictions"] == 1
+
+
+def test_cache_reevaluates_expiry_on_hit():
+    """Un certificado que caduca después de cachear se marca como expirado"""
+    cache = ValidationCache()
+    # Caduca dentro de un instante: al cachearlo todavía es válido
+    expiring = datetime.now(timezone.utc) + timedelta(milliseconds=50)
+    cache.put("a", _signed_response(expiring))
+
+    time.sleep(0.1)
+    result = cache.get("a")
+
+    assert result.valid is False
+    assert result.certificate.is_expired is True
+    assert ERROR_CERT_EXPIRED in result.errors
+
+
+def test_cache_ttl_forces_revalidation():
+    """Las entradas con ttl vencido cuentan como fallo"""
+    cache = ValidationCache()
+    cache.put("a", SignatureResponse(valid=None), ttl=0)
+
+    assert cache.get("a") is None
+
+
+def test_unchecked_revocation_is_retried_soon():
+    """Si OCSP/CRL no respondió, el resultado no se reutiliza indefinidamente"""
+    checked = SignatureResponse(valid=True, revocation_checked=True)
+    unchecked = SignatureResponse(
+        valid=True, warnings=["No se pudo verificar revocación: timeout"]
+    )
+
+    assert _cache_ttl(checked, LEVEL_FULL) == config.REVOCATION_CACHE_TTL
+    assert _cache_ttl(unchecked, LEVEL_FULL) == config.REVOCATION_RETRY_TTL
+    assert config.REVOCATION_RETRY_TTL < config.REVOCATION_CACHE_TTL
+    # Sin etapa de revocación no hay nada que volver a consultar
+    assert _cache_ttl(SignatureResponse(valid=None), LEVEL_INSPECT) is None
+
+
+@pytest.mark.asyncio
+async def test_validate_signature_etag_and_not_modified():
+    """La segunda petición con If-None-Match devuelve 304 desde la caché"""
+    content = (FIXTURES_DIR / "simple-322-signed.xsig.xml").read_bytes()
+    cache = get_validation_cache()
+    cache.clear()
+
+    transport = ASGITransport(app=app)
+    async with AsyncClient(transport=transport, base_url="http://test") as client:
+        first = await client.post(
+            "/api/validate-signature",
+            files={"file": ("factura.xsig", content, "application/xml")},
+        )
+        etag = first.headers["etag"]
+        hits_before = cache.stats()["hits"]
+
+        second = await client.post(
+            "/api/validate-signature",
+            files={"file": ("factura.xsig", content, "application/xml")},
+            headers={"If-None-Match": etag},
+        )
+
+    assert first.status_code == 200
+    assert second.status_code == 304
+    assert second.headers["etag"] == etag
+    assert cache.stats()["hits"] == hits_before + 1
+
+
+@pytest.mark.asyncio
+async def test_validate_signature_etag_mismatch_returns_body():
+    """Un ETag distinto devuelve el resultado completo"""
+    content = (FIXTURES_DIR / "simple-322-signed.xsig.xml").read_bytes()
+
+    transport = ASGITransport(app=app)
+    async with AsyncClient(transport=transport, base_url="http://test") as client:
+        response = await client.post(
+            "/api/validate-signature",
+            files={"file": ("factura.xsig", content, "application/xml")},
+            headers={"If-None-Match": '"otro"'},
+        )
+
+    assert response.status_code == 200
+    assert response.json()["signer"] is not None
@@ -0,0 +1,116 @@
+"""
+Tests para la cabecera Server-Timing y el perfilado bajo demanda
+"""
+
+import pstats
+from pathlib import Path
+
+import pytest
+from httpx import AsyncClient, ASGITransport
+
+try:
+    from backend.main import app
+    from backend.app import config
+    from backend.app.services.export_cache import get_export_cache
+    from backend.app.services.result_cache import get_validation_cache
+    from backend.tests.test_export import SAMPLE_INVOICE_DATA
+except ImportError:
+    from main import app
+    from app import config
+    from app.services.export_cache import get_export_cache
+    from app.services.result_cache import get_validation_cache
+    from tests.test_export import SAMPLE_INVOICE_DATA
+
+
+FIXTURES_DIR = Path(__file__).parent.parent.parent / "frontend" / "tests" / "fixtures"
+
+
+def _timing_names(header: str) -> list[str]:
+    return [entry.split(";")[0].strip() for entry in header.split(",")]
+
+
+@pytest.fixture
+def profiling(tmp_path, monkeypatch):
+    monkeypatch.setattr(config, "PROFILE_TOKEN", "secreto")
+    monkeypatch.setattr(config, "PROFILE_DIR", str(tmp_path))
+    monkeypatch.setattr(config, "PROFILE_RETAIN", 2)
+    return tmp_path
+
+
+@pytest.mark.asyncio
+async def test_server_timing_stages():
+    """Validación y exportación desglosan sus etapas; el resto, solo el total"""
+    content = (FIXTURES_DIR / "simple-321-signed.xsig.xml").read_bytes()
+    get_validation_cache().clear()
+    get_export_cache().clear()
+
+    transport = ASGITransport(app=app)
+    async with AsyncClient(transport=transport, base_url="http://test") as client:
+        validation = await client.post(
+            "/api/validate-signature",
+            files={"file": ("factura.xsig", content, "application/xml")},
+        )
+        export = await client.post("/api/export/excel", json={"data": SAMPLE_INVOICE_DATA})
+        health = await client.get("/health")
+
+    names = _timing_names(validation.headers["server-timing"])
+    assert {"parse", "certificate", "c14n", "verify", "worker", "total"} <= set(names)
+    assert _timing_names(export.headers["server-timing"]) == ["build", "auto_fit", "save", "total"]
+    assert _timing_names(health.headers["server-timing"]) == ["total"]
+    assert "dur=" in health.headers["server-timing"]
+
+
+@pytest.mark.asyncio
+async def test_profiler_disabled_by_default(tmp_path, monkeypatch):
+    """Sin token configurado la cabecera X-Profile se ignora"""
+    monkeypatch.setattr(config, "PROFILE_DIR", str(tmp_path))
+
+    transport = ASGITransport(app=app)
+    async with AsyncClient(transport=transport, base_url="http://test") as client:
+        response = await client.get("/health", headers={"X-Profile": ""})
+
+    assert "x-profile-id" not in response.headers
+    assert not list(tmp_path.iterdir())
+
+
+@pytest.mark.asyncio
+async def test_profiler_requires_token(profiling):
+    transport = ASGITransport(app=app)
+    async with AsyncClient(transport=transport, base_url="http://test") as client:
+        response = await client.get("/health", headers={"X-Profile": "otro"})
+
+    assert "x-profile-id" not in response.headers
+    assert not list(profiling.iterdir())
+
+
+@pytest.mark.asyncio
+async def test_profiler_writes_pstats_and_collapsed(profiling):
+    """Con el token se guardan el .pstats y las pilas colapsadas"""
+    get_export_cache().clear()
+    transport = ASGITransport(app=app)
+    async with AsyncClient(transport=transport, base_url="http://test") as client:
+        response = await client.post(
+            "/api/export/excel",
+            json={"data": SAMPLE_INVOICE_DATA},
+            headers={"X-Profile": "secreto"},
+        )
+
+    name = response.headers["x-profile-id"]
+    stats = pstats.Stats(str(profiling / f"{name}.pstats"))
+    assert any(func[2] == "build_invoice_workbook" for func in stats.stats)
+    collapsed = (profiling / f"{name}.collapsed").read_text().splitlines()
+    assert collapsed
+    assert all(line.rsplit(" ", 1)[1].isdigit() for line in collapsed)
+    assert any("build_invoice_workbook" in line for line in collapsed)
+
+
+@pytest.mark.asyncio
+async def test_profiler_retention(profiling):
+    """Solo se conservan los PROFILE_RETAIN perfiles más recientes"""
+    transport = ASGITransport(app=app)
+    async with AsyncClient(transport=transport, base_url="http://test") as client:
+        for _ in range(4):
+            await client.get("/health", headers={"X-Profile": "secreto"})
+
+    assert len(list(profiling.glob("*.pstats"))) == 2
+    assert len(list(profiling.glob("*.collapsed"))) == 2
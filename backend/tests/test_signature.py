@@ -136,7 +136,7 @@ async def test_reject_large_file():
             files={"file": ("factura.xml", large_content, "application/xml")}
         )
 
-    assert response.status_code == 400
+    assert response.status_code == 413
     assert "demasiado grande" in response.json()["detail"]
 
 
@@ -272,4 +272,119 @@ async def test_signed_government_invoice_has_signature_info(signed_government_xm
     assert signer is not None
 
     # Debe tener algún nombre del firmante
-    assert signer["name"] is not None and len(signer["name"]) > 0
\ No newline at end of file
+    assert signer["name"] is not None and len(signer["name"]) > 0
+
+# =============================================================================
+# Tests de validación por lotes
+# =============================================================================
+
+def _parse_ndjson(text: str) -> list[dict]:
+    import json
+    return [json.loads(line) for line in text.splitlines() if line]
+
+
+@pytest.mark.asyncio
+async def test_validate_batch_multiple_files(unsigned_xml, invalid_xml, signed_government_xml):
+    """Valida varios archivos y emite una línea por archivo más el resumen"""
+    transport = ASGITransport(app=app)
+    async with AsyncClient(transport=transport, base_url="http://test") as client:
+        response = await client.post(
+            "/api/validate-signature/batch",
+            files=[
+                ("files", ("unsigned.xml", unsigned_xml, "application/xml")),
+                ("files", ("broken.xml", invalid_xml, "application/xml")),
+                ("files", ("signed.xsig", signed_government_xml, "application/xml")),
+            ],
+        )
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    lines = _parse_ndjson(response.text)
+
+    results = {line["filename"]: line for line in lines[:-1]}
+    assert set(results) == {"unsigned.xml", "broken.xml", "signed.xsig"}
+    assert results["unsigned.xml"]["valid"] is None
+    assert results["broken.xml"]["valid"] is False
+    assert results["signed.xsig"]["signer"] is not None
+
+    summary = lines[-1]["summary"]
+    assert summary == {"total": 3, "valid": 0, "invalid": 2, "unsigned": 1}
+
+
+@pytest.mark.asyncio
+async def test_validate_batch_zip(unsigned_xml):
+    """Acepta un ZIP y valida solo las entradas XML"""
+    import io
+    import zipfile
+
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as archive:
+        archive.writestr("lote/factura1.xml", unsigned_xml)
+        archive.writestr("lote/factura2.xsig", unsigned_xml)
+        archive.writestr("lote/notas.txt", b"no es xml")
+
+    transport = ASGITransport(app=app)
+    async with AsyncClient(transport=transport, base_url="http://test") as client:
+        response = await client.post(
+            "/api/validate-signature/batch",
+            files={"files": ("lote.zip", buffer.getvalue(), "application/zip")},
+        )
+
+    assert response.status_code == 200
+    lines = _parse_ndjson(response.text)
+    results = {line["filename"]: line for line in lines[:-1]}
+    assert results["lote/factura1.xml"]["valid"] is None
+    assert "Formato no soportado" in results["lote/notas.txt"]["errors"][0]
+    assert lines[-1]["summary"]["total"] == 3
+    assert lines[-1]["summary"]["unsigned"] == 2
+
+
+@pytest.mark.asyncio
+async def test_validate_batch_reports_unexpected_errors(unsigned_xml, monkeypatch):
+    """Un error inesperado en un archivo va en su línea y no corta la respuesta"""
+    from concurrent.futures.process import BrokenProcessPool
+
+    try:
+        from backend.app.routes import signature as signature_routes
+    except ImportError:
+        from app.routes import signature as signature_routes
+
+    validate = signature_routes._validate_cached
+
+    async def flaky_validate(digest, content, *args):
+        if b"002" in content:
+            raise BrokenProcessPool("worker terminado")
+        return await validate(digest, content, *args)
+
+    monkeypatch.setattr(signature_routes, "_validate_cached", flaky_validate)
+    transport = ASGITransport(app=app)
+    async with AsyncClient(transport=transport, base_url="http://test") as client:
+        response = await client.post(
+            "/api/validate-signature/batch",
+            files=[
+                ("files", ("a.xml", unsigned_xml, "application/xml")),
+                ("files", ("b.xml", unsigned_xml.replace(b"001", b"002"), "application/xml")),
+            ],
+        )
+
+    assert response.status_code == 200
+    lines = _parse_ndjson(response.text)
+    results = {line["filename"]: line for line in lines[:-1]}
+    assert results["a.xml"]["valid"] is None
+    assert results["b.xml"]["valid"] is False
+    assert "worker terminado" in results["b.xml"]["errors"][0]
+    assert lines[-1]["summary"] == {"total": 2, "valid": 0, "invalid": 1, "unsigned": 1}
+
+
+@pytest.mark.asyncio
+async def test_validate_batch_invalid_zip():
+    """Rechaza un ZIP corrupto"""
+    transport = ASGITransport(app=app)
+    async with AsyncClient(transport=transport, base_url="http://test") as client:
+        response = await client.post(
+            "/api/validate-signature/batch",
+            files={"files": ("lote.zip", b"not a zip", "application/zip")},
+        )
+
+    assert response.status_code == 400
+    assert "ZIP" in response.json()["detail"]
@@ -0,0 +1,51 @@
+"""
+Tests para la extracción en una pasada de los elementos de la firma
+"""
+
+from pathlib import Path
+
+from lxml import etree
+
+try:
+    from backend.app.services.signature_parts import extract_signature_parts, find_signature
+except ImportError:
+    from app.services.signature_parts import extract_signature_parts, find_signature
+
+
+FIXTURES_DIR = Path(__file__).parent.parent.parent / "frontend" / "tests" / "fixtures"
+
+
+def test_extracts_xades_elements():
+    """Rellena el registro con los elementos de una firma XAdES"""
+    doc = etree.parse(str(FIXTURES_DIR / "signed-sample-32.xsig.xml")).getroot()
+    parts = extract_signature_parts(find_signature(doc))
+
+    assert parts.signed_info is not None
+    assert parts.signature_method == "http://www.w3.org/2000/09/xmldsig#rsa-sha1"
+    assert parts.canonicalization_method == "http://www.w3.org/TR/2001/REC-xml-c14n-20010315"
+    assert len(parts.references) == 3
+    assert parts.signature_value
+    assert parts.certificate is not None
+    assert parts.qualifying_properties is not None
+    assert parts.signed_properties is not None
+    assert parts.signing_time is not None
+    assert parts.signature_timestamp is None
+
+
+def test_extracts_plain_xmldsig():
+    """Una firma XMLDSig sin propiedades XAdES deja esos campos vacíos"""
+    doc = etree.parse(str(FIXTURES_DIR / "simple-322-signed.xsig.xml")).getroot()
+    parts = extract_signature_parts(find_signature(doc))
+
+    assert parts.certificate is not None
+    assert parts.qualifying_properties is None
+    assert parts.signing_time is None
+
+
+def test_find_signature_nested():
+    """Encuentra firmas que no cuelgan directamente de la raíz"""
+    doc = etree.fromstring(
+        b'<root><a><b><ds:Signature xmlns:ds="http://www.w3.org/2000/09/xmldsig#"/></b></a></root>'
+    )
+    assert find_signature(doc) is not None
+    assert find_signature(etree.fromstring(b"<root><a/></root>")) is None
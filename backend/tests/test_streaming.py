@@ -0,0 +1,161 @@
+"""
+Tests para el parseo en streaming de documentos firmados
+"""
+
+import hashlib
+import io
+from pathlib import Path
+
+import pytest
+from lxml import etree
+
+try:
+    from backend.app.services import streaming as streaming_service
+    from backend.app.services.signature_parts import DS_SIGNATURE
+    from backend.app.services.streaming import parse_streaming
+    from backend.app.services.validator import validate_xades_signature
+    from backend.app.services.xmldsig import DIGEST_METHODS
+except ImportError:
+    from app.services import streaming as streaming_service
+    from app.services.signature_parts import DS_SIGNATURE
+    from app.services.streaming import parse_streaming
+    from app.services.validator import validate_xades_signature
+    from app.services.xmldsig import DIGEST_METHODS
+
+
+FIXTURES_DIR = Path(__file__).parent.parent.parent / "frontend" / "tests" / "fixtures"
+SHA256 = "http://www.w3.org/2001/04/xmlenc#sha256"
+SHA512 = "http://www.w3.org/2001/04/xmlenc#sha512"
+
+
+def _declared_document_digests(content: bytes) -> set[str]:
+    """DigestMethod de las referencias URI="" según el árbol completo"""
+    ns = {"ds": "http://www.w3.org/2000/09/xmldsig#"}
+    path = "//ds:Signature/ds:SignedInfo/ds:Reference[@URI='']/ds:DigestMethod/@Algorithm"
+    return set(etree.fromstring(content).xpath(path, namespaces=ns))
+
+
+def _signature(*digest_methods: str) -> bytes:
+    references = "".join(
+        f'<ds:Reference URI=""><ds:DigestMethod Algorithm="{uri}"/></ds:Reference>'
+        for uri in digest_methods
+    )
+    return (
+        b'<ds:Signature xmlns:ds="http://www.w3.org/2000/09/xmldsig#">'
+        + f"<ds:SignedInfo>{references}</ds:SignedInfo>".encode()
+        + b"<ds:X>1</ds:X></ds:Signature>"
+    )
+
+
+def _enveloped_c14n(content: bytes) -> bytes:
+    """C14N inclusiva del documento sin la firma, calculada sobre el árbol completo"""
+    tree = etree.ElementTree(etree.fromstring(content))
+    signature = next(tree.getroot().iter(DS_SIGNATURE), None)
+    if signature is not None:
+        previous, parent = signature.getprevious(), signature.getparent()
+        if signature.tail:
+            if previous is not None:
+                previous.tail = (previous.tail or "") + signature.tail
+            else:
+                parent.text = (parent.text or "") + signature.tail
+        parent.remove(signature)
+    return etree.tostring(tree, method="c14n", with_comments=False)
+
+
+@pytest.mark.parametrize("fixture", sorted(p.name for p in FIXTURES_DIR.glob("*.xml")))
+def test_streaming_digest_matches_tree_c14n(fixture):
+    """El digest calculado en streaming coincide con el del árbol completo"""
+    content = (FIXTURES_DIR / fixture).read_bytes()
+    streamed = parse_streaming(io.BytesIO(content))
+
+    c14n = _enveloped_c14n(content)
+    # Solo se calculan los algoritmos que declara la firma
+    assert streamed.document_digests.keys() == _declared_document_digests(content)
+    for uri, digest in streamed.document_digests.items():
+        assert digest == DIGEST_METHODS[uri].new(c14n).digest()
+
+
+def test_streaming_c14n_edge_cases():
+    """Espacios de nombres, atributos, PIs, comentarios y la cola de la firma"""
+    content = (
+        b'<?xml version="1.0"?>\n<?pi uno?>\n<!--c-->\n'
+        b'<r xmlns="http://u" xmlns:z="http://z" a="1" z:b="&quot;x&#10;">'
+        b"<!--x-->t&amp;<?p d?>u<b xmlns=\"\"><c xmlns:z=\"http://z\"/>  </b>v"
+        + _signature(SHA256)
+        + b'cola<q xml:lang="es" b="2" a="1">&#13;</q></r>\n<?pi dos?>'
+    )
+    streamed = parse_streaming(io.BytesIO(content))
+
+    expected = hashlib.sha256(_enveloped_c14n(content)).digest()
+    assert streamed.document_digests[SHA256] == expected
+    assert streamed.signature is not None
+
+
+@pytest.mark.parametrize("spool_bytes", [1, 1 << 20])
+def test_streaming_hashes_only_declared_digest_methods(monkeypatch, spool_bytes):
+    """Lo anterior a la firma se guarda (en memoria o en disco) hasta leer su DigestMethod"""
+    monkeypatch.setattr(streaming_service.config, "STREAM_SPOOL_BYTES", spool_bytes)
+    body = b"".join(b"<l>%d &amp; m\xc3\xa1s</l>" % i for i in range(5000))
+    content = b'<r xmlns="http://u">' + body + _signature(SHA512, SHA256) + b"</r>"
+
+    streamed = parse_streaming(io.BytesIO(content))
+
+    c14n = _enveloped_c14n(content)
+    assert streamed.document_digests == {
+        SHA256: hashlib.sha256(c14n).digest(),
+        SHA512: hashlib.sha512(c14n).digest(),
+    }
+
+
+def test_streaming_signature_before_document():
+    """Con la firma al principio el resto del documento se hashea directamente"""
+    content = b"<r>" + _signature(SHA256) + b"<a>1</a><b>2</b></r>"
+
+    streamed = parse_streaming(io.BytesIO(content))
+
+    expected = hashlib.sha256(_enveloped_c14n(content)).digest()
+    assert streamed.document_digests == {SHA256: expected}
+
+
+def test_streaming_unsigned_document_has_no_digests():
+    streamed = parse_streaming(io.BytesIO(b"<r><a>1</a></r>"))
+
+    assert streamed.signature is None
+    assert streamed.document_digests == {}
+
+
+def test_streaming_releases_processed_elements():
+    """Solo se conservan la firma y unos pocos elementos del cuerpo"""
+    content = (FIXTURES_DIR / "signed-sample-32.xsig.xml").read_bytes()
+    streamed = parse_streaming(io.BytesIO(content))
+
+    full_tree = etree.fromstring(content)
+    kept_outside = [
+        el for el in streamed.root.iter()
+        if el is not streamed.signature and streamed.signature not in el.iterancestors()
+    ]
+    signature_size = sum(1 for _ in streamed.signature.iter())
+    assert len(kept_outside) < 5
+    assert signature_size + len(kept_outside) < sum(1 for _ in full_tree.iter())
+
+
+@pytest.mark.parametrize(
+    "fixture",
+    ["signed-sample-32.xsig.xml", "simple-321-signed.xsig.xml", "simple-322.xml", "batch-322.xml"],
+)
+def test_stream_mode_matches_tree_mode(fixture):
+    """Validar en streaming da el mismo resultado que con el árbol completo"""
+    content = (FIXTURES_DIR / fixture).read_bytes()
+
+    tree_result = validate_xades_signature(content, parse_mode="tree")
+    stream_result = validate_xades_signature(content, parse_mode="stream")
+
+    assert stream_result == tree_result
+
+
+def test_stream_mode_invalid_xml():
+    """Un XML mal formado se reporta igual que en modo árbol"""
+    result = validate_xades_signature(b"<invalid><not-closed>", parse_mode="stream")
+
+    assert result.valid is False
+    assert any("XML inválido" in err for err in result.errors)
@@ -0,0 +1,259 @@
+"""
+Tests para el almacén de confianza y la validación de cadenas
+"""
+
+import base64
+import time
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+import pytest
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import ec
+from cryptography.x509.oid import NameOID
+
+try:
+    from backend.app.services import trust_store as trust_store_service
+    from backend.app.services.trust_store import TrustStore
+    from backend.app.services.validator import validate_xades_signature
+except ImportError:
+    from app.services import trust_store as trust_store_service
+    from app.services.trust_store import TrustStore
+    from app.services.validator import validate_xades_signature
+
+
+ROOT_DIR = Path(__file__).parent.parent.parent
+FIXTURES_DIR = ROOT_DIR / "frontend" / "tests" / "fixtures"
+TEST_CERT = ROOT_DIR / "scripts" / "certs" / "test_cert.pem"
+
+
+def _issue(
+    subject, issuer=None, issuer_key=None, ca=False, days=30, path_length=None, cert_sign=None
+):
+    """Certificado de subject firmado por issuer (autofirmado si no se indica)"""
+    key = ec.generate_private_key(ec.SECP256R1())
+    now = datetime.now(timezone.utc)
+    issuer_name = issuer.subject if issuer is not None else x509.Name(
+        [x509.NameAttribute(NameOID.COMMON_NAME, subject)]
+    )
+    signing_key = issuer_key or key
+    builder = (
+        x509.CertificateBuilder()
+        .subject_name(x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, subject)]))
+        .issuer_name(issuer_name)
+        .public_key(key.public_key())
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(now - timedelta(days=1))
+        .not_valid_after(now + timedelta(days=days))
+        .add_extension(x509.BasicConstraints(ca=ca, path_length=path_length), critical=True)
+        .add_extension(x509.SubjectKeyIdentifier.from_public_key(key.public_key()), critical=False)
+        .add_extension(
+            x509.AuthorityKeyIdentifier.from_issuer_public_key(signing_key.public_key()),
+            critical=False,
+        )
+    )
+    cert_sign = ca if cert_sign is None else cert_sign
+    builder = builder.add_extension(
+        x509.KeyUsage(
+            digital_signature=not ca, content_commitment=not ca, key_encipherment=False,
+            data_encipherment=False, key_agreement=False, key_cert_sign=cert_sign,
+            crl_sign=ca, encipher_only=False, decipher_only=False,
+        ),
+        critical=True,
+    )
+    return builder.sign(signing_key, hashes.SHA256()), key
+
+
+@pytest.fixture
+def pki():
+    root, root_key = _issue("Raíz Pruebas", ca=True)
+    intermediate, intermediate_key = _issue("Intermedia Pruebas", root, root_key, ca=True)
+    leaf, _ = _issue("Firmante", intermediate, intermediate_key)
+    return root, intermediate, leaf
+
+
+def _write_pem(path: Path, *certs: x509.Certificate) -> None:
+    path.write_bytes(b"".join(c.public_bytes(serialization.Encoding.PEM) for c in certs))
+
+
+def test_chain_through_signature_intermediate(pki, tmp_path):
+    """La cadena llega a la raíz usando el intermedio incluido en la firma"""
+    root, intermediate, leaf = pki
+    _write_pem(tmp_path / "raiz.pem", root)
+    store = TrustStore(str(tmp_path))
+
+    result = store.validate(leaf, [intermediate])
+
+    assert result.valid
+    assert result.chain == [leaf, intermediate, root]
+    assert result.issuer == intermediate
+
+
+def test_missing_intermediate_breaks_chain(pki, tmp_path):
+    """Sin el intermedio no hay cadena hasta la raíz"""
+    root, _, leaf = pki
+    _write_pem(tmp_path / "raiz.pem", root)
+
+    result = TrustStore(str(tmp_path)).validate(leaf)
+
+    assert not result.valid
+    assert "Firmante" in result.error
+
+
+def test_intermediate_in_store_is_an_anchor(pki, tmp_path):
+    """Un intermedio del almacén (p.ej. de la TSL) basta como ancla, en DER"""
+    _, intermediate, leaf = pki
+    (tmp_path / "intermedia.der").write_bytes(intermediate.public_bytes(serialization.Encoding.DER))
+
+    result = TrustStore(str(tmp_path)).validate(leaf)
+
+    assert result.valid
+    assert result.chain == [leaf, intermediate]
+
+
+def _tsl_service(cert, service_type="CA/QC", status="granted"):
+    der = base64.b64encode(cert.public_bytes(serialization.Encoding.DER)).decode()
+    return (
+        "<TSPService><ServiceInformation>"
+        f"<ServiceTypeIdentifier>http://uri.etsi.org/TrstSvc/Svctype/{service_type}</ServiceTypeIdentifier>"
+        "<ServiceDigitalIdentity><DigitalId>"
+        f"<X509Certificate>{der}</X509Certificate>"
+        "</DigitalId></ServiceDigitalIdentity>"
+        f"<ServiceStatus>http://uri.etsi.org/TrstSvc/TrustedList/Svcstatus/{status}</ServiceStatus>"
+        "</ServiceInformation></TSPService>"
+    )
+
+
+def test_loads_tsl_xml(pki, tmp_path):
+    """De una Trusted Service List solo son anclas las CA cualificadas vigentes"""
+    root, intermediate, leaf = pki
+    withdrawn, withdrawn_key = _issue("CA retirada", ca=True)
+    tsa, tsa_key = _issue("Sellado de tiempo", ca=True)
+    tsl_signer, tsl_signer_key = _issue("Firmante de la TSL", ca=True)
+    signer_der = base64.b64encode(tsl_signer.public_bytes(serialization.Encoding.DER)).decode()
+    (tmp_path / "tsl.xml").write_text(
+        '<TrustServiceStatusList xmlns="http://uri.etsi.org/02231/v2#"'
+        ' xmlns:ds="http://www.w3.org/2000/09/xmldsig#">'
+        "<TrustServiceProviderList><TrustServiceProvider><TSPServices>"
+        + _tsl_service(root)
+        + _tsl_service(withdrawn, status="withdrawn")
+        + _tsl_service(tsa, service_type="TSA/QTST")
+        + "</TSPServices></TrustServiceProvider></TrustServiceProviderList>"
+        f"<ds:Signature><ds:KeyInfo><ds:X509Data><ds:X509Certificate>{signer_der}"
+        "</ds:X509Certificate></ds:X509Data></ds:KeyInfo></ds:Signature>"
+        "</TrustServiceStatusList>"
+    )
+    store = TrustStore(str(tmp_path))
+
+    assert store.stats()["anchors"] == 1
+    assert store.validate(leaf, [intermediate]).valid
+    for ca, key in ((withdrawn, withdrawn_key), (tsa, tsa_key), (tsl_signer, tsl_signer_key)):
+        assert not store.validate(_issue("Firmante", ca, key)[0]).valid
+
+
+def test_issuer_without_key_cert_sign_is_rejected(tmp_path):
+    """Una CA cuyo keyUsage no incluye keyCertSign no puede emitir certificados"""
+    root, root_key = _issue("Raíz", ca=True, cert_sign=False)
+    leaf, _ = _issue("Firmante", root, root_key)
+    _write_pem(tmp_path / "raiz.pem", root)
+
+    result = TrustStore(str(tmp_path)).validate(leaf)
+
+    assert not result.valid
+    assert "no está autorizado" in result.error
+
+
+def test_path_length_is_enforced(tmp_path):
+    """pathLen=0 en la raíz: no admite una intermedia por debajo"""
+    root, root_key = _issue("Raíz", ca=True, path_length=0)
+    intermediate, intermediate_key = _issue("Intermedia", root, root_key, ca=True)
+    leaf, _ = _issue("Firmante", intermediate, intermediate_key)
+    direct_leaf, _ = _issue("Firmante directo", root, root_key)
+    _write_pem(tmp_path / "raiz.pem", root)
+    store = TrustStore(str(tmp_path))
+
+    assert not store.validate(leaf, [intermediate]).valid
+    assert store.validate(direct_leaf).valid
+
+
+def test_issuer_selected_by_key_identifier(tmp_path):
+    """Dos CAs con el mismo DN (renovación): se elige la de la clave correcta"""
+    old_ca, _ = _issue("CA", ca=True)
+    new_ca, new_key = _issue("CA", ca=True)
+    leaf, _ = _issue("Firmante", new_ca, new_key)
+    _write_pem(tmp_path / "cas.pem", old_ca, new_ca)
+
+    result = TrustStore(str(tmp_path)).validate(leaf)
+
+    assert result.valid
+    assert result.issuer == new_ca
+
+
+def test_expired_intermediate_is_rejected(tmp_path):
+    """Una CA intermedia caducada invalida la cadena"""
+    root, root_key = _issue("Raíz", ca=True)
+    intermediate, intermediate_key = _issue("Intermedia", root, root_key, ca=True, days=-1)
+    leaf, _ = _issue("Firmante", intermediate, intermediate_key)
+    _write_pem(tmp_path / "raiz.pem", root)
+
+    result = TrustStore(str(tmp_path)).validate(leaf, [intermediate])
+
+    assert not result.valid
+    assert "no está vigente" in result.error
+
+
+def test_chains_are_memoized_per_leaf(pki, tmp_path):
+    """La segunda validación del mismo firmante no reconstruye la cadena"""
+    root, intermediate, leaf = pki
+    _write_pem(tmp_path / "raiz.pem", root)
+    store = TrustStore(str(tmp_path))
+
+    first = store.validate(leaf, [intermediate])
+    second = store.validate(leaf, [intermediate])
+
+    assert first is second
+    assert store.stats()["hits"] == 1
+    assert store.stats()["misses"] == 1
+
+
+def test_failed_chains_are_retried(pki, tmp_path, monkeypatch):
+    """Un fallo solo se memoriza FAILED_CHAIN_TTL segundos y recargar el almacén lo descarta"""
+    root, intermediate, leaf = pki
+    _write_pem(tmp_path / "raiz.pem", root)
+    store = TrustStore(str(tmp_path))
+
+    assert not store.validate(leaf).valid
+    assert not store.validate(leaf).valid
+    assert (store.stats()["hits"], store.stats()["misses"]) == (1, 1)
+
+    later = time.time() + trust_store_service.FAILED_CHAIN_TTL + 1
+    monkeypatch.setattr(trust_store_service.time, "time", lambda: later)
+    store.validate(leaf)
+    assert store.stats()["misses"] == 2
+    monkeypatch.undo()
+
+    # El almacén recargado (p.ej. una TSL nueva) ya trae la CA que faltaba
+    _write_pem(tmp_path / "intermedia.pem", intermediate)
+    store.load(str(tmp_path))
+    assert store.validate(leaf).valid
+
+
+def test_validation_reports_chain(tmp_path, monkeypatch):
+    """chain_valid refleja si el firmante está en el almacén configurado"""
+    content = (FIXTURES_DIR / "simple-321-signed.xsig.xml").read_bytes()
+
+    # Sin almacén configurado no se valida la cadena
+    monkeypatch.setattr(trust_store_service, "_store", TrustStore())
+    assert validate_xades_signature(content).chain_valid is None
+
+    # Almacén vacío: el certificado autofirmado no es de confianza
+    monkeypatch.setattr(trust_store_service, "_store", TrustStore(str(tmp_path)))
+    result = validate_xades_signature(content)
+    assert result.chain_valid is False
+    assert any("Cadena de certificados" in w for w in result.warnings)
+
+    # Con el certificado de pruebas en el almacén
+    (tmp_path / "facturaview.pem").write_bytes(TEST_CERT.read_bytes())
+    monkeypatch.setattr(trust_store_service, "_store", TrustStore(str(tmp_path)))
+    assert validate_xades_signature(content).chain_valid is True
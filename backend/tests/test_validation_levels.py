@@ -0,0 +1,117 @@
+"""
+Tests para los niveles de validación (inspect, crypto, full)
+"""
+
+from pathlib import Path
+
+import pytest
+from httpx import AsyncClient, ASGITransport
+
+try:
+    from backend.main import app
+    from backend.app.services import validator
+    from backend.app.services.result_cache import get_validation_cache
+    from backend.app.services.validator import validate_xades_signature
+except ImportError:
+    from main import app
+    from app.services import validator
+    from app.services.result_cache import get_validation_cache
+    from app.services.validator import validate_xades_signature
+
+
+FIXTURES_DIR = Path(__file__).parent.parent.parent / "frontend" / "tests" / "fixtures"
+
+
+@pytest.fixture
+def signed_xml():
+    return (FIXTURES_DIR / "simple-321-signed.xsig.xml").read_bytes()
+
+
+def _forbid(monkeypatch, *names):
+    """Hace fallar el test si se llama a alguna de esas funciones del validador"""
+    for name in names:
+        def fail(*args, _name=name, **kwargs):
+            raise AssertionError(f"{_name} no debería ejecutarse")
+        monkeypatch.setattr(validator, name, fail)
+
+
+def test_inspect_skips_verification(signed_xml, monkeypatch):
+    """inspect extrae firmante y certificado sin verificar la firma"""
+    _forbid(monkeypatch, "verify_signature_value", "verify_references", "check_revocation_status")
+
+    result = validate_xades_signature(signed_xml, level="inspect")
+
+    assert result.valid is None
+    assert result.stages == ["parse", "inspect"]
+    assert result.signer.name
+    assert result.certificate.serial
+    assert result.signature_type is not None
+    assert not result.errors
+
+
+def test_inspect_does_not_detect_tampering(signed_xml):
+    """Sin verificación, un documento alterado se inspecciona igual"""
+    tampered = signed_xml.replace(b"<InvoiceNumber>", b"<InvoiceNumber>X", 1)
+
+    assert validate_xades_signature(tampered, level="inspect").valid is None
+    assert validate_xades_signature(tampered, level="crypto").valid is False
+
+
+def test_inspect_reports_expired_certificate():
+    """is_expired se calcula también sin veredicto y se avisa en warnings"""
+    content = (FIXTURES_DIR / "signed-sample-32.xsig.xml").read_bytes()
+
+    result = validate_xades_signature(content, level="inspect")
+
+    assert result.valid is None
+    assert result.certificate.is_expired is True
+    assert result.signature_type == "XAdES-BES"
+    assert not result.errors
+    assert result.warnings.count(validator.ERROR_CERT_EXPIRED) == 1
+
+    # Refrescar el resultado (como al servirlo de la caché) no duplica el aviso
+    refreshed = validator.apply_time_checks(result)
+    assert refreshed.valid is None
+    assert refreshed.warnings.count(validator.ERROR_CERT_EXPIRED) == 1
+
+
+def test_crypto_skips_revocation(signed_xml, monkeypatch):
+    """crypto verifica firma y referencias pero no consulta la revocación"""
+    _forbid(monkeypatch, "check_revocation_status")
+
+    result = validate_xades_signature(signed_xml, level="crypto")
+
+    assert result.valid is True
+    assert result.stages == ["parse", "inspect", "signature", "references"]
+    assert result.revocation_checked is False
+
+
+def test_full_runs_every_stage(signed_xml):
+    result = validate_xades_signature(signed_xml)
+
+    assert result.level == "full"
+    assert result.stages[-1] == "revocation"
+
+
+def test_unknown_level(signed_xml):
+    with pytest.raises(ValueError):
+        validate_xades_signature(signed_xml, level="rapido")
+
+
+@pytest.mark.asyncio
+async def test_endpoint_level_parameter(signed_xml):
+    """Cada nivel se cachea aparte y un nivel desconocido da 422"""
+    get_validation_cache().clear()
+    transport = ASGITransport(app=app)
+    async with AsyncClient(transport=transport, base_url="http://test") as client:
+        files = {"file": ("factura.xsig", signed_xml, "application/xml")}
+        inspect = await client.post("/api/validate-signature?level=inspect", files=files)
+        full = await client.post("/api/validate-signature", files=files)
+        wrong = await client.post("/api/validate-signature?level=rapido", files=files)
+
+    assert inspect.status_code == 200
+    assert inspect.json()["stages"] == ["parse", "inspect"]
+    assert full.json()["level"] == "full"
+    assert "revocation" in full.json()["stages"]
+    assert inspect.headers["etag"] != full.headers["etag"]
+    assert wrong.status_code == 422
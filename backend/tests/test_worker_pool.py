@@ -0,0 +1,135 @@
+"""
+Tests para el pool de workers de validación
+"""
+
+import asyncio
+import time
+
+import pytest
+from httpx import AsyncClient, ASGITransport
+
+try:
+    from backend.main import app
+    from backend.app.services.validator import validate_xades_signature
+    from backend.app.services.worker_pool import JobTimeoutError, WorkerPool
+except ImportError:
+    from main import app
+    from app.services.validator import validate_xades_signature
+    from app.services.worker_pool import JobTimeoutError, WorkerPool
+
+
+@pytest.mark.asyncio
+async def test_thread_pool_runs_job():
+    """El pool de hilos ejecuta el trabajo y devuelve el resultado"""
+    pool = WorkerPool(mode="thread", size=2)
+    try:
+        result = await pool.run(pow, 2, 10)
+    finally:
+        pool.shutdown()
+
+    assert result == 1024
+    assert pool.stats()["completed"] == 1
+
+
+@pytest.mark.asyncio
+async def test_process_pool_runs_validation():
+    """El pool de procesos ejecuta la validación en otro proceso"""
+    pool = WorkerPool(mode="process", size=1, start_method="forkserver")
+    try:
+        result = await pool.run(validate_xades_signature, b"<invalid><not-closed>")
+    finally:
+        pool.shutdown()
+
+    assert result.valid is False
+    assert any("XML inválido" in err for err in result.errors)
+
+
+@pytest.mark.asyncio
+async def test_job_timeout():
+    """Un trabajo que excede el límite lanza JobTimeoutError"""
+    pool = WorkerPool(mode="thread", size=1, timeout=0.05)
+    try:
+        with pytest.raises(JobTimeoutError):
+            await pool.run(time.sleep, 0.5)
+    finally:
+        pool.shutdown()
+
+    assert pool.stats()["timed_out"] == 1
+
+
+@pytest.mark.asyncio
+async def test_job_timeout_ignores_queue_wait():
+    """El tiempo máximo cuenta desde que un worker toma el trabajo"""
+    pool = WorkerPool(mode="thread", size=1, timeout=0.3)
+    try:
+        await asyncio.gather(*(pool.run(time.sleep, 0.1) for _ in range(5)))
+    finally:
+        pool.shutdown()
+
+    assert pool.stats()["completed"] == 5
+    assert pool.stats()["timed_out"] == 0
+
+
+@pytest.mark.asyncio
+async def test_thread_timeout_abandons_worker_and_resubmits_queue():
+    """Un hilo atascado no bloquea la cola: los trabajos pasan a otro executor"""
+    pool = WorkerPool(mode="thread", size=1, timeout=0.1)
+    try:
+        stuck = asyncio.create_task(pool.run(time.sleep, 0.5))
+        queued = [asyncio.create_task(pool.run(pow, 2, n)) for n in range(3)]
+        with pytest.raises(JobTimeoutError):
+            await stuck
+        assert await asyncio.gather(*queued) == [1, 2, 4]
+        stats = pool.stats()
+        assert (stats["stuck"], stats["recycled"], stats["in_flight"]) == (1, 1, 0)
+        await asyncio.sleep(0.5)
+        assert pool.stats()["stuck"] == 0
+    finally:
+        pool.shutdown()
+
+
+@pytest.mark.asyncio
+async def test_process_timeout_recycles_worker():
+    """Al agotar el tiempo se termina el proceso y los demás trabajos se reenvían"""
+    pool = WorkerPool(mode="process", size=2, start_method="forkserver", timeout=0.3)
+    try:
+        await pool.warm_up()
+        started = time.monotonic()
+        stuck = asyncio.create_task(pool.run(time.sleep, 30))
+        other = asyncio.create_task(pool.run(time.sleep, 0.5, timeout=10))
+        with pytest.raises(JobTimeoutError):
+            await stuck
+        await other
+        assert await pool.run(pow, 2, 10) == 1024
+        assert time.monotonic() - started < 20
+        stats = pool.stats()
+        assert (stats["recycled"], stats["timed_out"], stats["failed"]) == (1, 1, 0)
+        assert stats["stuck"] == 0
+    finally:
+        pool.shutdown()
+
+
+@pytest.mark.asyncio
+async def test_queue_depth_reports_waiting_jobs():
+    """Los trabajos que esperan un worker libre cuentan como cola"""
+    pool = WorkerPool(mode="thread", size=1)
+    try:
+        jobs = [asyncio.create_task(pool.run(time.sleep, 0.1)) for _ in range(3)]
+        await asyncio.sleep(0.02)
+        assert pool.stats()["queue_depth"] == 2
+        await asyncio.gather(*jobs)
+    finally:
+        pool.shutdown()
+
+    assert pool.stats()["queue_depth"] == 0
+
+
+@pytest.mark.asyncio
+async def test_health_reports_worker_pool():
+    """El health check incluye el estado del pool"""
+    transport = ASGITransport(app=app)
+    async with AsyncClient(transport=transport, base_url="http://test") as client:
+        response = await client.get("/health")
+
+    assert response.status_code == 200
+    assert "queue_depth" in response.json()["worker_pool"]
@@ -0,0 +1,95 @@
+"""
+Tests para los parsers XML endurecidos
+"""
+
+import threading
+import time
+from pathlib import Path
+
+import pytest
+from lxml import etree
+
+try:
+    from backend.app.services.validator import validate_xades_signature
+    from backend.app.services.xml_parser import UnsafeXMLError, get_parser, parse_xml
+except ImportError:
+    from app.services.validator import validate_xades_signature
+    from app.services.xml_parser import UnsafeXMLError, get_parser, parse_xml
+
+
+FIXTURES_DIR = Path(__file__).parent.parent.parent / "frontend" / "tests" / "fixtures"
+
+
+def _billion_laughs(levels: int) -> bytes:
+    """Cada entidad expande diez veces la anterior: 10^levels «lol»"""
+    entities = ['<!ENTITY lol0 "lol">']
+    entities += [
+        f'<!ENTITY lol{i} "{"".join(f"&lol{i - 1};" for _ in range(10))}">'
+        for i in range(1, levels + 1)
+    ]
+    return (
+        f'<?xml version="1.0"?><!DOCTYPE lolz [{"".join(entities)}]>'
+        f"<lolz>&lol{levels};</lolz>"
+    ).encode()
+
+
+XXE = b"""<?xml version="1.0"?>
+<!DOCTYPE factura [<!ENTITY xxe SYSTEM "file:///etc/passwd">]>
+<factura>&xxe;</factura>"""
+
+
+def test_parser_reused_per_thread():
+    """Cada hilo reutiliza su parser; hilos distintos no lo comparten"""
+    assert get_parser() is get_parser()
+    assert get_parser() is not get_parser(strip_comments=True)
+
+    other = []
+    thread = threading.Thread(target=lambda: other.append(get_parser()))
+    thread.start()
+    thread.join()
+    assert other[0] is not get_parser()
+
+
+def test_strip_comments_is_opt_in():
+    """Por defecto se conservan comentarios e instrucciones (entran en el c14n)"""
+    data = b"<a><!-- c --><?pi x?><b/></a>"
+
+    assert len(parse_xml(data)) == 3
+    assert len(parse_xml(data, strip_comments=True)) == 1
+
+
+@pytest.mark.parametrize(
+    "payload", [_billion_laughs(3), _billion_laughs(15), XXE], ids=["lol3", "lol15", "xxe"]
+)
+def test_doctype_rejected(payload):
+    """Entidades internas y externas se rechazan sin expandirse"""
+    start = time.perf_counter()
+    # libxml2 puede cortar antes por su límite de amplificación
+    with pytest.raises((UnsafeXMLError, etree.XMLSyntaxError)):
+        parse_xml(payload)
+    # 10^15 expansiones: solo es posible si no se llega a expandir nada
+    assert time.perf_counter() - start < 0.5
+
+
+@pytest.mark.parametrize("mode", ["tree", "stream"])
+@pytest.mark.parametrize("payload", [_billion_laughs(15), XXE], ids=["lol15", "xxe"])
+def test_validation_rejects_doctype(payload, mode):
+    """Ambos modos de parseo de la validación usan los parsers endurecidos"""
+    result = validate_xades_signature(payload, parse_mode=mode)
+
+    assert result.valid is False
+    assert result.errors[0].startswith("XML inválido")
+    assert "root:" not in "".join(result.errors)
+
+
+def test_signed_fixture_still_parses():
+    """Las facturas firmadas (sin DOCTYPE) siguen validándose"""
+    content = (FIXTURES_DIR / "simple-321-signed.xsig.xml").read_bytes()
+
+    assert validate_xades_signature(content, parse_mode="tree").valid is True
+    assert validate_xades_signature(content, parse_mode="stream").valid is True
+
+
+def test_malformed_xml_still_a_syntax_error():
+    with pytest.raises(etree.XMLSyntaxError):
+        parse_xml(b"<a><b></a>")
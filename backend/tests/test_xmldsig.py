@@ -0,0 +1,107 @@
+"""
+Tests para la verificación de ds:Reference y la tabla de algoritmos
+"""
+
+from pathlib import Path
+
+import pytest
+from lxml import etree
+
+try:
+    from backend.app.services.signature_parts import extract_signature_parts, find_signature
+    from backend.app.services.validator import validate_xades_signature
+    from backend.app.services.xmldsig import (
+        C14N_METHODS,
+        DIGEST_METHODS,
+        SIGNATURE_METHODS,
+        verify_references,
+    )
+except ImportError:
+    from app.services.signature_parts import extract_signature_parts, find_signature
+    from app.services.validator import validate_xades_signature
+    from app.services.xmldsig import (
+        C14N_METHODS,
+        DIGEST_METHODS,
+        SIGNATURE_METHODS,
+        verify_references,
+    )
+
+
+FIXTURES_DIR = Path(__file__).parent.parent.parent / "frontend" / "tests" / "fixtures"
+SIGNED_FIXTURES = [
+    "signed-sample-32.xsig.xml",
+    "simple-321-signed.xsig.xml",
+    "simple-322-signed.xsig.xml",
+]
+
+
+def test_algorithm_tables_resolve_exact_uris():
+    """Los algoritmos se resuelven por URI exacto, sin adivinar por subcadenas"""
+    rsa_sha256 = SIGNATURE_METHODS["http://www.w3.org/2001/04/xmldsig-more#rsa-sha256"]
+    assert rsa_sha256.key_type == "rsa"
+    assert rsa_sha256.digest is DIGEST_METHODS["http://www.w3.org/2001/04/xmlenc#sha256"]
+    assert rsa_sha256.digest.hash_algorithm().name == "sha256"
+
+    assert C14N_METHODS["http://www.w3.org/2001/10/xml-exc-c14n#"].exclusive
+    # Antes "sha512" en cualquier parte del URI bastaba para elegir el algoritmo
+    assert "urn:ejemplo:rsa-sha512-falso" not in SIGNATURE_METHODS
+
+
+@pytest.mark.parametrize("fixture", SIGNED_FIXTURES)
+@pytest.mark.parametrize("parse_mode", ["tree", "stream"])
+def test_signed_fixtures_references_match(fixture, parse_mode):
+    """Todas las referencias (documento, SignedProperties, KeyInfo) coinciden"""
+    content = (FIXTURES_DIR / fixture).read_bytes()
+    result = validate_xades_signature(content, parse_mode=parse_mode)
+
+    assert not [e for e in result.errors if "Referencia" in e or "matemáticamente" in e]
+
+
+def test_verify_references_restores_tree():
+    """La transformación enveloped no deja el árbol modificado"""
+    doc = etree.parse(str(FIXTURES_DIR / "signed-sample-32.xsig.xml")).getroot()
+    before = etree.tostring(doc)
+    parts = extract_signature_parts(find_signature(doc))
+
+    assert verify_references(parts) == []
+    assert etree.tostring(doc) == before
+
+
+@pytest.mark.parametrize("parse_mode", ["tree", "stream"])
+def test_modified_invoice_body_is_detected(parse_mode):
+    """Cambiar el importe de la factura invalida la referencia al documento"""
+    content = (FIXTURES_DIR / "simple-321-signed.xsig.xml").read_bytes()
+    tampered = content.replace(
+        b"<TotalAmount>484.00</TotalAmount>", b"<TotalAmount>4.00</TotalAmount>", 1
+    )
+
+    result = validate_xades_signature(tampered, parse_mode=parse_mode)
+
+    assert result.valid is False
+    assert any("el digest no coincide" in e for e in result.errors)
+    # SignedInfo no ha cambiado: la firma en sí sigue siendo correcta
+    assert "La firma digital no es válida matemáticamente" not in result.errors
+
+
+def test_modified_signed_properties_are_detected():
+    """Cambiar SigningTime invalida la referencia a SignedProperties"""
+    doc = etree.parse(str(FIXTURES_DIR / "signed-sample-32.xsig.xml")).getroot()
+    parts = extract_signature_parts(find_signature(doc))
+    signing_time = next(parts.signed_properties.iter("{*}SigningTime"))
+    signing_time.text = "2000-01-01T00:00:00Z"
+
+    errors = verify_references(parts)
+
+    assert len(errors) == 1
+    assert "SignedProperties" in errors[0]
+
+
+def test_streaming_falls_back_to_tree_for_unavailable_reference():
+    """Una referencia por Id fuera de la firma se verifica sobre el árbol completo"""
+    content = (FIXTURES_DIR / "simple-321-signed.xsig.xml").read_bytes()
+    # Apuntar la referencia a un elemento que el streaming no conserva
+    tampered = content.replace(b'<ds:Reference URI="">', b'<ds:Reference URI="#inexistente">', 1)
+
+    result = validate_xades_signature(tampered, parse_mode="stream")
+
+    assert any("no se encontró el elemento referenciado" in e for e in result.errors)
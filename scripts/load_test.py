@@ -0,0 +1,334 @@
+#!/usr/bin/env python3
+"""
+Prueba de carga HTTP de la API: validación de firmas y exportación a Excel.
+
+A diferencia de los microbenchmarks (backend/benchmarks), cada petición pasa
+por FastAPI completo: middlewares, multipart, pydantic y serialización. Se
+lanza contra la app ASGI en el mismo proceso o contra un uvicorn local.
+
+Informa por endpoint y por cuerpo de p50/p95/p99, throughput y tasa de
+errores, y de dos indicadores de bloqueo del event loop:
+
+- lag del loop: una tarea que duerme 10 ms y mide cuánto tarda de más en
+  despertar. En proceso comparte loop con la app, así que cualquier trabajo
+  síncrono en un handler (p.ej. generate_excel) aparece aquí entero.
+- sondeo /health: latencia de un endpoint trivial durante la carga. Es el
+  indicador útil contra un servidor externo (--url).
+
+Cuerpos: los XML de frontend/tests/fixtures más una factura firmada
+generada de --large-lines líneas; para la exportación, datos sintéticos
+pequeños y de --large-lines líneas.
+
+Uso:
+    cd facturaview
+    uv run python scripts/load_test.py                          # en proceso
+    uv run python scripts/load_test.py --mix export=1 --concurrency 16
+    uv run python scripts/load_test.py --url http://localhost:8000 --duration 30
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import sys
+import time
+import uuid
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Optional
+
+import httpx
+
+ROOT_DIR = Path(__file__).parent.parent
+FIXTURES_DIR = ROOT_DIR / "frontend" / "tests" / "fixtures"
+sys.path.insert(0, str(ROOT_DIR))
+
+from backend.benchmarks.run import percentile  # noqa: E402
+from backend.benchmarks.synthetic import invoice_data, signed_facturae_xml  # noqa: E402
+
+ENDPOINTS = {
+    "validate": "/api/validate-signature",
+    "export": "/api/export/excel",
+}
+LOOP_LAG_INTERVAL = 0.01
+PROBE_INTERVAL = 0.1
+
+
+@dataclass
+class Payload:
+    """Cuerpo ya codificado de una petición"""
+
+    name: str
+    kind: str
+    body: bytes
+    content_type: str
+    # Multipart: se puede variar el archivo para esquivar la caché de resultados
+    file_suffix: Optional[bytes] = None
+
+
+@dataclass
+class Stats:
+    latencies: list[float] = field(default_factory=list)
+    statuses: dict[str, int] = field(default_factory=dict)
+
+    def add(self, seconds: float, status: str) -> None:
+        self.latencies.append(seconds)
+        self.statuses[status] = self.statuses.get(status, 0) + 1
+
+    @property
+    def errors(self) -> int:
+        return sum(n for status, n in self.statuses.items() if not status.startswith(("2", "3")))
+
+    def summary(self, elapsed: float) -> dict:
+        samples = sorted(self.latencies)
+        count = len(samples)
+        return {
+            "requests": count,
+            "errors": self.errors,
+            "error_rate": self.errors / count if count else 0.0,
+            "throughput_rps": count / elapsed if elapsed else 0.0,
+            "p50_ms": percentile(samples, 50) * 1000,
+            "p95_ms": percentile(samples, 95) * 1000,
+            "p99_ms": percentile(samples, 99) * 1000,
+            "max_ms": (samples[-1] if samples else 0.0) * 1000,
+            "statuses": dict(sorted(self.statuses.items())),
+        }
+
+
+def _multipart(name: str, filename: str, content: bytes) -> tuple[bytes, bytes, str]:
+    """(cabecera, cierre, content-type) de un multipart con un único archivo"""
+    boundary = uuid.uuid4().hex
+    head = (
+        f"--{boundary}\r\n"
+        f'Content-Disposition: form-data; name="{name}"; filename="{filename}"\r\n'
+        "Content-Type: application/xml\r\n\r\n"
+    ).encode()
+    tail = f"\r\n--{boundary}--\r\n".encode()
+    return head + content, tail, f"multipart/form-data; boundary={boundary}"
+
+
+def build_payloads(large_lines: int) -> list[Payload]:
+    """Cuerpos de validación (fixtures y firmado generado) y de exportación"""
+    payloads = []
+    documents = [(path.name, path.read_bytes()) for path in sorted(FIXTURES_DIR.glob("*.xml"))]
+    if large_lines:
+        documents.append((f"generated-{large_lines}.xsig.xml", signed_facturae_xml(large_lines)))
+    for filename, content in documents:
+        body, tail, content_type = _multipart("file", filename, content)
+        payloads.append(Payload(f"validate/{filename}", "validate", body, content_type, tail))
+
+    for lines in sorted({10, large_lines} - {0}):
+        body = json.dumps({"data": invoice_data(lines), "lang": "es"}).encode()
+        payloads.append(Payload(f"export/lines={lines}", "export", body, "application/json"))
+    return payloads
+
+
+def parse_mix(value: str) -> dict[str, float]:
+    """'validate=3,export=1' -> pesos por tipo de petición"""
+    mix = {}
+    for part in value.split(","):
+        kind, _, weight = part.partition("=")
+        kind = kind.strip()
+        if kind not in ENDPOINTS:
+            known = ", ".join(ENDPOINTS)
+            raise argparse.ArgumentTypeError(f"tipo desconocido: {kind} (usa {known})")
+        mix[kind] = float(weight or 1)
+    return mix
+
+
+class LoadTest:
+    def __init__(
+        self,
+        client: httpx.AsyncClient,
+        payloads: list[Payload],
+        mix: dict[str, float],
+        concurrency: int,
+        duration: float,
+        max_requests: Optional[int],
+        reuse_bodies: bool,
+        seed: int,
+    ):
+        self.client = client
+        self.by_kind = {kind: [p for p in payloads if p.kind == kind] for kind in mix}
+        self.kinds = [kind for kind in mix if self.by_kind[kind]]
+        self.weights = [mix[kind] for kind in self.kinds]
+        self.concurrency = concurrency
+        self.duration = duration
+        self.max_requests = max_requests
+        self.reuse_bodies = reuse_bodies
+        self.random = random.Random(seed)
+        self.sent = 0
+        self.stats: dict[str, Stats] = {}
+        self.loop_lag: list[float] = []
+        self.probe = Stats()
+
+    def _next(self) -> tuple[Payload, bytes]:
+        kind = self.random.choices(self.kinds, self.weights)[0]
+        payload = self.random.choice(self.by_kind[kind])
+        body = payload.body
+        if payload.file_suffix is not None:
+            # Un comentario tras el elemento raíz cambia el SHA-256 del
+            # archivo sin afectar a la firma: cada petición valida de verdad
+            marker = b"" if self.reuse_bodies else f"\n<!-- {self.sent} -->".encode()
+            body = body + marker + payload.file_suffix
+        return payload, body
+
+    async def _worker(self, deadline: float) -> None:
+        while time.perf_counter() < deadline:
+            if self.max_requests is not None and self.sent >= self.max_requests:
+                return
+            payload, body = self._next()
+            self.sent += 1
+            start = time.perf_counter()
+            try:
+                response = await self.client.post(
+                    ENDPOINTS[payload.kind],
+                    content=body,
+                    headers={"Content-Type": payload.content_type},
+                )
+                await response.aread()
+                status = str(response.status_code)
+            except httpx.HTTPError as e:
+                status = type(e).__name__
+            elapsed = time.perf_counter() - start
+            for key in (payload.kind, payload.name):
+                self.stats.setdefault(key, Stats()).add(elapsed, status)
+
+    async def _monitor_loop(self) -> None:
+        while True:
+            start = time.perf_counter()
+            await asyncio.sleep(LOOP_LAG_INTERVAL)
+            self.loop_lag.append(max(0.0, time.perf_counter() - start - LOOP_LAG_INTERVAL))
+
+    async def _probe_health(self) -> None:
+        while True:
+            start = time.perf_counter()
+            try:
+                response = await self.client.get("/health")
+                status = str(response.status_code)
+            except httpx.HTTPError as e:
+                status = type(e).__name__
+            self.probe.add(time.perf_counter() - start, status)
+            await asyncio.sleep(PROBE_INTERVAL)
+
+    async def run(self) -> dict:
+        monitors = [
+            asyncio.create_task(self._monitor_loop()),
+            asyncio.create_task(self._probe_health()),
+        ]
+        start = time.perf_counter()
+        deadline = start + self.duration
+        try:
+            await asyncio.gather(*(self._worker(deadline) for _ in range(self.concurrency)))
+        finally:
+            for task in monitors:
+                task.cancel()
+            await asyncio.gather(*monitors, return_exceptions=True)
+        elapsed = time.perf_counter() - start
+
+        lag = sorted(self.loop_lag)
+        return {
+            "elapsed_s": elapsed,
+            "concurrency": self.concurrency,
+            "total": Stats(
+                [s for kind in self.kinds for s in self.stats.get(kind, Stats()).latencies],
+                _merge(self.stats.get(kind, Stats()).statuses for kind in self.kinds),
+            ).summary(elapsed),
+            "endpoints": {name: s.summary(elapsed) for name, s in sorted(self.stats.items())},
+            "loop_lag_ms": {
+                "p50": percentile(lag, 50) * 1000,
+                "p99": percentile(lag, 99) * 1000,
+                "max": (lag[-1] if lag else 0.0) * 1000,
+            },
+            "health_probe": self.probe.summary(elapsed),
+        }
+
+
+def _merge(counters) -> dict[str, int]:
+    merged: dict[str, int] = {}
+    for counter in counters:
+        for key, n in counter.items():
+            merged[key] = merged.get(key, 0) + n
+    return merged
+
+
+def print_report(report: dict) -> None:
+    def row(name: str, s: dict) -> str:
+        return (
+            f"{name:<45} {s['requests']:>6} {s['throughput_rps']:>8.1f} {s['error_rate']:>7.1%} "
+            f"{s['p50_ms']:>9.1f} {s['p95_ms']:>9.1f} {s['p99_ms']:>9.1f}"
+        )
+
+    print(
+        f"\n{'':<45} {'reqs':>6} {'req/s':>8} {'errores':>7} "
+        f"{'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}"
+    )
+    print(row("total", report["total"]))
+    for name, summary in report["endpoints"].items():
+        print(row(name, summary))
+    print(row("sondeo /health", report["health_probe"]))
+    lag = report["loop_lag_ms"]
+    print(
+        f"\nLag del event loop: p50 {lag['p50']:.1f} ms  p99 {lag['p99']:.1f} ms  "
+        f"máx {lag['max']:.1f} ms"
+    )
+    for name, summary in report["endpoints"].items():
+        failed = {k: v for k, v in summary["statuses"].items() if not k.startswith(("2", "3"))}
+        if failed and "/" not in name:
+            print(f"Errores en {name}: {failed}")
+
+
+async def main_async(args: argparse.Namespace) -> dict:
+    print(f"Preparando cuerpos (factura grande de {args.large_lines} líneas)...")
+    payloads = build_payloads(args.large_lines)
+    limits = httpx.Limits(max_connections=args.concurrency + 1)
+    timeout = httpx.Timeout(args.timeout)
+
+    if args.url:
+        async with httpx.AsyncClient(base_url=args.url, limits=limits, timeout=timeout) as client:
+            test = LoadTest(client, payloads, args.mix, args.concurrency, args.duration,
+                            args.requests, args.reuse_bodies, args.seed)
+            return await test.run()
+
+    from backend.main import app
+
+    # ASGITransport no ejecuta el lifespan: se arranca aquí (pool de workers)
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(
+            transport=transport, base_url="http://loadtest", timeout=timeout
+        ) as client:
+            test = LoadTest(client, payloads, args.mix, args.concurrency, args.duration,
+                            args.requests, args.reuse_bodies, args.seed)
+            return await test.run()
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Prueba de carga de la API de FacturaView")
+    parser.add_argument(
+        "--url", help="servidor a probar (p.ej. http://localhost:8000); sin él, en proceso"
+    )
+    parser.add_argument("--concurrency", type=int, default=8, help="peticiones simultáneas")
+    parser.add_argument("--duration", type=float, default=10.0, help="segundos de carga")
+    parser.add_argument("--requests", type=int, help="parar tras este número de peticiones")
+    parser.add_argument("--mix", type=parse_mix, default=parse_mix("validate=1,export=1"),
+                        help="pesos por tipo, p.ej. validate=3,export=1")
+    parser.add_argument("--large-lines", type=int, default=5000,
+                        help="líneas de la factura grande generada (0 para no generarla)")
+    parser.add_argument("--reuse-bodies", action="store_true",
+                        help="enviar archivos idénticos (mide la caché de resultados)")
+    parser.add_argument("--timeout", type=float, default=120.0, help="timeout por petición (s)")
+    parser.add_argument("--seed", type=int, default=0, help="semilla del reparto de peticiones")
+    parser.add_argument("--output", type=Path, help="guardar el informe en este JSON")
+    args = parser.parse_args(argv)
+
+    report = asyncio.run(main_async(args))
+    report["mode"] = args.url or "in-process"
+    print_report(report)
+    if args.output:
+        args.output.write_text(json.dumps(report, indent=2))
+    return 1 if report["total"]["errors"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
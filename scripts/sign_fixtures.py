@@ -85,14 +85,8 @@ def generate_test_certificate():
     return private_key, cert
 
 
-def sign_facturae(xml_path: Path, private_key, cert) -> bytes:
-    """Firma un archivo Facturae con XAdES-EPES."""
-    print(f"  Firmando {xml_path.name}...")
-
-    # Leer XML
-    with open(xml_path, "rb") as f:
-        xml_content = f.read()
-
+def sign_xml(xml_content: bytes, private_key, cert) -> bytes:
+    """Firma (enveloped, RSA-SHA256) un documento Facturae en memoria."""
     # Parsear XML
     root = etree.fromstring(xml_content)
 
@@ -129,6 +123,17 @@ def sign_facturae(xml_path: Path, private_key, cert) -> bytes:
     )
 
 
+def sign_facturae(xml_path: Path, private_key, cert) -> bytes:
+    """Firma un archivo Facturae con XAdES-EPES."""
+    print(f"  Firmando {xml_path.name}...")
+
+    # Leer XML
+    with open(xml_path, "rb") as f:
+        xml_content = f.read()
+
+    return sign_xml(xml_content, private_key, cert)
+
+
 def main():
     print("=" * 60)
     print("Firmador de facturas Facturae para pruebas")